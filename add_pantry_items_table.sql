@@ -0,0 +1,32 @@
+-- Migration to add the normalized pantry inventory table
+-- Run this in your Supabase SQL Editor
+
+-- One row per user and canonical ingredient (see pantry.canonical_ingredient_name)
+CREATE TABLE IF NOT EXISTS pantry_items (
+    id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+    user_email TEXT NOT NULL,
+    canonical_name TEXT NOT NULL,
+    name TEXT NOT NULL,
+    quantity TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT 'general',
+    freshness TEXT NOT NULL DEFAULT 'fresh'
+        CHECK (freshness IN ('fresh', 'good', 'needs_use_soon', 'expired')),
+    detected_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    UNIQUE (user_email, canonical_name)
+);
+
+-- Filtered listings ("which items need use soon") and newest-first keyset pagination
+CREATE INDEX IF NOT EXISTS idx_pantry_items_freshness
+    ON pantry_items(user_email, freshness, detected_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_pantry_items_detected_at
+    ON pantry_items(user_email, detected_at DESC, id DESC);
+
+-- The backend uses the service role key; keep the table private otherwise
+ALTER TABLE pantry_items ENABLE ROW LEVEL SECURITY;
+GRANT ALL ON pantry_items TO service_role;
+
+-- Verify the new table
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'pantry_items'
+ORDER BY ordinal_position;
@@ -0,0 +1,45 @@
+-- Migration for the recent-recipes ring buffer (/recent-recipes/*)
+-- Run this in your Supabase SQL Editor
+
+-- Holds up to 10 entries shaped {"key": ..., "recipe": {...}, "used_at": ...}, newest first
+ALTER TABLE "Users"
+ADD COLUMN IF NOT EXISTS recent_recipes JSONB NOT NULL DEFAULT '[]'::jsonb;
+
+-- Older schemas created the column as JSON
+ALTER TABLE "Users"
+ALTER COLUMN recent_recipes TYPE JSONB USING COALESCE(recent_recipes::jsonb, '[]'::jsonb);
+
+-- Push a recipe to the front, drop older entries with the same key and trim
+-- to p_capacity, in one statement (one round trip, atomic under concurrency)
+CREATE OR REPLACE FUNCTION push_recent_recipe(
+    p_email TEXT,
+    p_key TEXT,
+    p_recipe JSONB,
+    p_capacity INTEGER DEFAULT 10
+)
+RETURNS JSONB AS $$
+    INSERT INTO "Users" (email, recent_recipes)
+    VALUES (
+        p_email,
+        jsonb_build_array(jsonb_build_object('key', p_key, 'recipe', p_recipe, 'used_at', NOW()))
+    )
+    ON CONFLICT (email) DO UPDATE SET recent_recipes = (
+        SELECT COALESCE(jsonb_agg(kept.entry ORDER BY kept.position), '[]'::jsonb)
+        FROM (
+            SELECT candidates.entry, candidates.position
+            FROM (
+                SELECT jsonb_build_object('key', p_key, 'recipe', p_recipe, 'used_at', NOW()) AS entry,
+                       0::BIGINT AS position
+                UNION ALL
+                SELECT existing.entry, existing.position
+                FROM jsonb_array_elements("Users".recent_recipes) WITH ORDINALITY AS existing(entry, position)
+                WHERE existing.entry->>'key' IS DISTINCT FROM p_key
+            ) candidates
+            ORDER BY candidates.position
+            LIMIT p_capacity
+        ) kept
+    )
+    RETURNING recent_recipes;
+$$ LANGUAGE sql VOLATILE;
+
+GRANT EXECUTE ON FUNCTION push_recent_recipe(TEXT, TEXT, JSONB, INTEGER) TO service_role;
@@ -0,0 +1,28 @@
+-- Migration to support versioned delta updates (PATCH /update-data)
+-- Run this in your Supabase SQL Editor
+
+-- Monotonic version of the items/recipes document, used as a write precondition
+ALTER TABLE "Users"
+ADD COLUMN IF NOT EXISTS data_version INTEGER NOT NULL DEFAULT 0;
+
+-- Bump the version whenever items or recipes change, whichever endpoint wrote them
+CREATE OR REPLACE FUNCTION users_bump_data_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.items IS DISTINCT FROM OLD.items OR NEW.recipes IS DISTINCT FROM OLD.recipes THEN
+        NEW.data_version = OLD.data_version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS users_bump_data_version ON "Users";
+CREATE TRIGGER users_bump_data_version
+    BEFORE UPDATE ON "Users"
+    FOR EACH ROW
+    EXECUTE FUNCTION users_bump_data_version();
+
+-- Verify the new column
+SELECT column_name, data_type
+FROM information_schema.columns
+WHERE table_name = 'Users' AND column_name = 'data_version';
@@ -0,0 +1,10 @@
+-- Migration to back single-round-trip upserts on the Users table
+-- Run this in your Supabase SQL Editor
+
+-- save_user_data upserts with ON CONFLICT (email), which needs a unique constraint
+CREATE UNIQUE INDEX IF NOT EXISTS users_email_key ON "Users"(email);
+
+-- Verify the index
+SELECT indexname, indexdef
+FROM pg_indexes
+WHERE tablename = 'Users';
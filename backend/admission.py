@@ -0,0 +1,273 @@
+"""
+Admission control per route class, with CoDel-style load shedding
+
+When Bedrock slows down, /chat requests hold gthread threads for longer
+and longer until none are left, and cheap requests like /auth/verify then
+wait behind them. Every request is therefore admitted through the limiter
+of its route class before its view runs:
+
+- `model` (/chat): ADMISSION_MODEL_CONCURRENCY requests in flight and at
+  most ADMISSION_MODEL_QUEUE waiting, so /chat can never hold more than
+  their sum of a worker's threads
+- `data` (everything else routed through it: data, auth, email, jobs):
+  ADMISSION_DATA_CONCURRENCY in flight, ADMISSION_DATA_QUEUE waiting
+
+The model class only caps the threads /chat may hold: by default the
+ModelScheduler's MODEL_CONCURRENCY calls plus two waiting in its fair
+queue, with no admission queue of its own, so which model call runs next
+is decided in one place.
+
+A request that finds its class's queue full is shed at once. Waiting
+requests are timed the way CoDel times packets: while requests still get
+a slot without waiting now and then, a request may wait up to the class's
+interval (ADMISSION_<CLASS>_INTERVAL_MS); once every slot has been busy
+for a whole interval the queue is standing, and requests wait at most the
+target (ADMISSION_<CLASS>_TARGET_MS) before they are shed. Neither is
+allowed below what the class's requests take to serve (a moving average
+of how long each holds its slot; twice that for the interval), so a
+request is never shed for waiting less than one request's service time.
+Overload thus turns into quick 503s rather than slow timeouts, and the
+waits that remain stay short.
+
+A shed request gets 503 with Retry-After: the largest of the configured
+target, the time it takes a slot to free up and the recently observed
+queue wait, capped at ADMISSION_MAX_RETRY_AFTER.
+/health, /metrics and long-lived streams are not admission controlled.
+Limits are per gunicorn worker process.
+"""
+import os
+import math
+import time
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Mapping, Optional
+
+from flask import Flask, Response, g, jsonify, request
+
+from metrics import ADMISSION_WAIT_SECONDS, REQUESTS_SHED
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class ClassLimits:
+    """In-flight limit, queue size and CoDel timing of one route class"""
+
+    def __init__(self, concurrency: int, queue_size: int, target: float, interval: float):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.target = target
+        self.interval = interval
+
+
+class AdmissionSettings:
+    """Admission control configuration, read from environment variables"""
+
+    def __init__(self):
+        self.enabled = os.getenv('ADMISSION_ENABLED', 'true').lower() == 'true'
+        self.max_retry_after = _env_float('ADMISSION_MAX_RETRY_AFTER', 30.0)
+        self.classes = {
+            # Defaults keep /chat to 6 of gunicorn's 8 default threads, queueing in ModelScheduler only
+            'model': self._limits('MODEL', _env_int('MODEL_CONCURRENCY', 4) + 2, 0, 2000, 10000),
+            'data': self._limits('DATA', 16, 32, 50, 500),
+        }
+
+    @staticmethod
+    def _limits(name: str, concurrency: int, queue_size: int, target_ms: float, interval_ms: float) -> ClassLimits:
+        return ClassLimits(_env_int(f'ADMISSION_{name}_CONCURRENCY', concurrency),
+                           _env_int(f'ADMISSION_{name}_QUEUE', queue_size),
+                           _env_float(f'ADMISSION_{name}_TARGET_MS', target_ms) / 1000,
+                           _env_float(f'ADMISSION_{name}_INTERVAL_MS', interval_ms) / 1000)
+
+
+class RequestShed(Exception):
+    """A request was refused admission; retry_after is a whole number of seconds"""
+
+    def __init__(self, route_class: str, reason: str, retry_after: float):
+        self.route_class = route_class
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{route_class} requests {reason}; retry after {self.retry_after}s")
+
+
+class _Waiter:
+    __slots__ = ('granted', 'enqueued_at')
+
+    def __init__(self):
+        self.granted = threading.Event()
+        self.enqueued_at = time.perf_counter()
+
+
+class ClassLimiter:
+    """In-flight slots for one route class, with a bounded FIFO queue timed CoDel-style"""
+
+    def __init__(self, name: str, limits: ClassLimits, max_retry_after: float = 30.0):
+        self.name = name
+        self.limits = limits
+        self.max_retry_after = max_retry_after
+        self._lock = threading.Lock()
+        self._queue: Deque[_Waiter] = deque()
+        self._running = 0
+        # Last time a request could start without waiting; a backlog older than an interval is a standing queue
+        self._last_idle = time.perf_counter()
+        # Moving average of queue wait (0 for requests admitted straight away), for Retry-After
+        self._wait_seconds = 0.0
+        # Moving average of how long a request holds its slot, the floor of the target and interval
+        self._service_seconds = 0.0
+        self.stats = {'admitted': 0, 'queued': 0, 'shed_queue_full': 0, 'shed_queue_delay': 0,
+                      'wait_seconds_max': 0.0}
+
+    def acquire(self) -> float:
+        """
+        Take an in-flight slot, waiting in the queue if need be; returns the seconds waited
+
+        Raises:
+            RequestShed: If the queue is full or the wait runs out
+        """
+        limits = self.limits
+        with self._lock:
+            now = time.perf_counter()
+            if not self._queue and self._running < limits.concurrency:
+                self._running += 1
+                self._last_idle = now
+                self._admitted(0.0)
+                return 0.0
+            if len(self._queue) >= limits.queue_size:
+                self.stats['shed_queue_full'] += 1
+                raise RequestShed(self.name, "queue is full", self._retry_after())
+            # Backlogged for a whole interval: a standing queue, so only wait the target
+            target, interval = self._timing()
+            timeout = target if now - self._last_idle > interval else interval
+            waiter = _Waiter()
+            self._queue.append(waiter)
+            self.stats['queued'] += 1
+        if not waiter.granted.wait(timeout):
+            with self._lock:
+                if not waiter.granted.is_set():
+                    self._queue.remove(waiter)
+                    self.stats['shed_queue_delay'] += 1
+                    self._observe_wait(time.perf_counter() - waiter.enqueued_at)
+                    raise RequestShed(self.name, "waited too long", self._retry_after())
+        waited = time.perf_counter() - waiter.enqueued_at
+        with self._lock:
+            self._admitted(waited)
+        return waited
+
+    def release(self, held: Optional[float] = None):
+        """Give the slot back, to the longest-waiting request if any; held is how long it was used"""
+        with self._lock:
+            if held is not None:
+                self._service_seconds = held if not self._service_seconds else 0.9 * self._service_seconds + 0.1 * held
+            if self._queue:
+                # The slot passes straight on; _running is unchanged
+                self._queue.popleft().granted.set()
+            else:
+                self._running -= 1
+                self._last_idle = time.perf_counter()
+
+    def _admitted(self, waited: float):
+        """Count an admission (lock held)"""
+        self.stats['admitted'] += 1
+        self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+        self._observe_wait(waited)
+
+    def _observe_wait(self, waited: float):
+        self._wait_seconds = 0.9 * self._wait_seconds + 0.1 * waited
+
+    def _timing(self):
+        """(target, interval): the configured ones, raised to the observed service time (lock held)"""
+        service = self._service_seconds
+        return max(self.limits.target, service), max(self.limits.interval, 2 * service)
+
+    def _retry_after(self) -> float:
+        # With every slot busy, one frees up about every service time / concurrency
+        freed = self._service_seconds / max(1, self.limits.concurrency)
+        return min(self.max_retry_after, max(self.limits.target, freed, self._wait_seconds))
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+            running, queued = self._running, len(self._queue)
+            target, interval = self._timing()
+            standing = running >= self.limits.concurrency and time.perf_counter() - self._last_idle > interval
+            wait, service = self._wait_seconds, self._service_seconds
+        return {
+            'running': running, 'queued': queued, 'standing_queue': standing,
+            'concurrency': self.limits.concurrency, 'queue_size': self.limits.queue_size,
+            'admitted': stats['admitted'], 'queued_total': stats['queued'],
+            'shed_queue_full': stats['shed_queue_full'], 'shed_queue_delay': stats['shed_queue_delay'],
+            'wait_ms': {'average': round(wait * 1000, 2), 'max': round(stats['wait_seconds_max'] * 1000, 2)},
+            'service_ms': round(service * 1000, 2), 'target_ms': round(target * 1000, 2),
+            'interval_ms': round(interval * 1000, 2),
+        }
+
+
+class AdmissionControl:
+    """Routes each request to its class's limiter and sheds with 503 + Retry-After"""
+
+    def __init__(self, settings: Optional[AdmissionSettings] = None, route_classes: Optional[Mapping[str, str]] = None,
+                 exempt: Iterable[str] = (), default_class: str = 'data'):
+        self.settings = settings or AdmissionSettings()
+        self.limiters = {name: ClassLimiter(name, limits, self.settings.max_retry_after)
+                         for name, limits in self.settings.classes.items()}
+        self.route_classes = dict(route_classes or {})
+        self.exempt = frozenset(exempt)
+        self.default_class = default_class
+
+    def route_class(self, endpoint: Optional[str]) -> Optional[str]:
+        """Class of a Flask endpoint, or None if it is not admission controlled"""
+        if endpoint is None or endpoint in self.exempt or endpoint == 'static':
+            return None
+        return self.route_classes.get(endpoint, self.default_class)
+
+    def start_request(self) -> Optional[Response]:
+        """before_request hook: wait for a slot, or answer 503 without running the view"""
+        name = self.route_class(request.endpoint)
+        if name is None:
+            return None
+        limiter = self.limiters[name]
+        try:
+            waited = limiter.acquire()
+        except RequestShed as e:
+            REQUESTS_SHED.inc(route_class=name, reason=e.reason.replace(' ', '_'))
+            response = jsonify({"error": "Server is busy, please retry", "route_class": name,
+                                "retry_after": e.retry_after})
+            response.status_code = 503
+            response.headers['Retry-After'] = str(e.retry_after)
+            return response
+        ADMISSION_WAIT_SECONDS.observe(waited, route_class=name)
+        g.admission_limiter = limiter
+        g.admission_started = time.perf_counter()
+        return None
+
+    def teardown_request(self, error: Optional[BaseException] = None):
+        limiter = g.pop('admission_limiter', None)
+        if limiter is not None:
+            limiter.release(time.perf_counter() - g.pop('admission_started'))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {'enabled': self.settings.enabled,
+                'classes': {name: limiter.get_stats() for name, limiter in self.limiters.items()}}
+
+
+def configure_admission(app: Flask, route_classes: Optional[Mapping[str, str]] = None, exempt: Iterable[str] = (),
+                        settings: Optional[AdmissionSettings] = None) -> AdmissionControl:
+    """
+    Admit `app`'s requests per route class; returns the AdmissionControl for its stats
+
+    route_classes maps endpoint names to a class ('model'); other endpoints
+    are 'data' unless listed in exempt. Register after metrics and tracing
+    so shed requests are still counted and traced.
+    """
+    admission = AdmissionControl(settings, route_classes, exempt)
+    if admission.settings.enabled:
+        app.before_request(admission.start_request)
+        app.teardown_request(admission.teardown_request)
+    return admission
@@ -2,14 +2,20 @@
 """
 AWS Configuration Module for ChopChop Backend
 Render-safe version: supports lazy initialization and Bedrock (Nova) runtime client.
+
+boto3 is imported, and the client built, on the first Bedrock call rather
+than at startup: building the client loads botocore's service model, which
+is wasted on a worker (or a woken-up instance) that has not needed it yet.
+Set BEDROCK_EAGER_INIT=true to build it in setup_aws() instead.
 """
 
 import os
-import boto3
+import re
 import logging
-from botocore.exceptions import ClientError, NoCredentialsError
 from typing import Optional, Dict, Any
 
+from coldstart import lazy_import, first_use
+
 # -------------------------------------------------------------------
 # Logging setup
 # -------------------------------------------------------------------
@@ -17,6 +23,9 @@ logger = logging.getLogger(__name__)
 if not logger.handlers:
     logging.basicConfig(level=logging.INFO)
 
+# e.g. us-east-1, eu-central-2, us-gov-west-1
+REGION_PATTERN = re.compile(r"^[a-z]{2}(-[a-z]+)+-\d+$")
+
 # -------------------------------------------------------------------
 # AWS Configuration Class
 # -------------------------------------------------------------------
@@ -25,8 +34,9 @@ class AWSConfig:
 
     def __init__(self):
         self.region = os.getenv("AWS_REGION", "us-east-1")
-        self.bedrock_client: Optional[boto3.client] = None
+        self.bedrock_client: Optional[Any] = None
         self.is_configured: bool = False
+        self._client_pid = os.getpid()
 
     # ---------------------------------------------------------------
     # Internal helpers
@@ -39,8 +49,18 @@ class AWSConfig:
             logger.warning("⚠️ Missing AWS credentials in environment variables.")
         return has_id and has_secret
 
-    def _create_runtime_client(self) -> Optional[boto3.client]:
+    def _has_valid_region(self) -> bool:
+        """Check that the region at least looks like an AWS region name."""
+        if not REGION_PATTERN.match(self.region or ""):
+            logger.warning(f"⚠️ AWS_REGION {self.region!r} is not a valid region name.")
+            return False
+        return True
+
+    def _create_runtime_client(self) -> Optional[Any]:
         """Create and return a Bedrock Runtime client explicitly using env vars."""
+        boto3 = lazy_import("boto3")
+        from botocore.exceptions import ClientError, NoCredentialsError
+
         try:
             logger.info(f"🧠 Creating Bedrock Runtime client in region {self.region} ...")
             client = boto3.client(
@@ -73,7 +93,7 @@ class AWSConfig:
     # ---------------------------------------------------------------
     # Public interface
     # ---------------------------------------------------------------
-    def setup_bedrock_client(self) -> Optional[boto3.client]:
+    def setup_bedrock_client(self) -> Optional[Any]:
         """Initialize and store the Bedrock runtime client."""
         if not self._has_valid_env():
             logger.warning("⚠️ AWS credentials not available; skipping initial Bedrock setup.")
@@ -82,22 +102,26 @@ class AWSConfig:
         client = self._create_runtime_client()
         if client:
             self.bedrock_client = client
+            self._client_pid = os.getpid()
             self.is_configured = True
             return client
         else:
             logger.warning("⚠️ Bedrock client setup failed; will retry lazily later.")
             return None
 
-    def get_bedrock_client(self) -> Optional[boto3.client]:
+    def get_bedrock_client(self) -> Optional[Any]:
         """
         Return an initialized Bedrock client.
-        Lazily creates one if not yet available.
+        Lazily creates one if not yet available, or if the existing one was
+        inherited across fork (its connection pool belongs to the parent).
         """
-        if self.bedrock_client is not None:
+        if self.bedrock_client is not None and self._client_pid == os.getpid():
             return self.bedrock_client
 
         logger.info("🧠 Bedrock client not initialized — attempting lazy setup...")
-        self.bedrock_client = self._create_runtime_client()
+        with first_use("bedrock client"):
+            self.bedrock_client = self._create_runtime_client()
+        self._client_pid = os.getpid()
         if self.bedrock_client:
             self.is_configured = True
             logger.info("✅ Lazy Bedrock client initialization successful.")
@@ -105,6 +129,13 @@ class AWSConfig:
             logger.error("❌ Lazy Bedrock initialization failed — client still None.")
         return self.bedrock_client
 
+    def reinitialize_client(self):
+        """Rebuild the Bedrock client in a forked worker (gunicorn post_fork)"""
+        if self.bedrock_client is None or self._client_pid == os.getpid():
+            return
+        self.bedrock_client = self._create_runtime_client()
+        self._client_pid = os.getpid()
+
     def get_aws_info(self) -> Dict[str, Any]:
         """Return diagnostic info (never exposes secrets)."""
         return {
@@ -138,20 +169,32 @@ def get_bedrock_client():
         return None
 
 def setup_aws() -> bool:
-    """Initialize AWS configuration at startup (non-fatal for Render)."""
+    """
+    Initialize AWS configuration at startup (non-fatal for Render).
+
+    Returns False when Bedrock cannot work as configured: credentials or
+    region missing, or (with BEDROCK_EAGER_INIT) the client failed to build.
+    Without eager init only those settings are checked; whether AWS accepts
+    the credentials is only known at the first Bedrock call.
+    """
     logger.info("🚀 Setting up AWS configuration (non-fatal)...")
     aws_config.print_config_status()
+    has_credentials, has_region = aws_config._has_valid_env(), aws_config._has_valid_region()
+    if os.getenv("BEDROCK_EAGER_INIT", "false").lower() != "true":
+        if has_credentials and has_region:
+            logger.info("🧠 Credentials and region present; Bedrock client (and the credential check) deferred to first use.")
+        return has_credentials and has_region
     try:
-        client = aws_config.setup_bedrock_client()
+        client = aws_config.setup_bedrock_client() if has_region else None
         if client:
             logger.info("✅ AWS setup completed successfully.")
         else:
             logger.warning("⚠️ AWS setup incomplete; will retry later when credentials available.")
-        return True
+        return client is not None
     except Exception as e:
         logger.error(f"⚠️ AWS setup error: {e}", exc_info=True)
         logger.warning("Continuing without Bedrock until runtime credentials are available.")
-        return True  # Never fail deployment
+        return False  # Never fails deployment: the caller only logs
 
 def check_aws_status() -> Dict[str, Any]:
     """Return AWS configuration status for /health endpoint."""
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark the Flask JSON providers on realistic ChopChop payloads
+
+    python bench_json.py [--repeat 7]
+
+Times app.json.response() (what jsonify() does) and app.json.loads()
+(what request.get_json() does) with the stdlib provider and with
+FastJSONProvider. Payloads are shaped like production responses: a
+/get-data list, a /chat-history page with photos, a structured fridge
+analysis, and a /chat request carrying a photo.
+"""
+import sys
+import json
+import base64
+import random
+import argparse
+import statistics
+import timeit
+
+from flask import Flask
+
+from json_provider import FastJSONProvider, StdlibJSONProvider, ORJSON_AVAILABLE
+
+
+def make_payloads(seed: int = 7):
+    rng = random.Random(seed)
+    words = ["tomato", "basil", "crème fraîche", "jalapeño", "chicken thigh", "garlic", "rice", "lime",
+             "olive oil", "feta", "spinach", "paprika", "yogurt", "onion", "lentils", "coriander"]
+
+    def phrase(n):
+        return " ".join(rng.choice(words) for _ in range(n))
+
+    def recipe():
+        return {
+            "name": phrase(3).title(),
+            "difficulty": rng.choice(["Easy", "Medium", "Hard"]),
+            "prep_time": f"{rng.randint(5, 30)} minutes",
+            "cook_time": f"{rng.randint(10, 90)} minutes",
+            "servings": rng.randint(1, 6),
+            "ingredients": [f"{rng.randint(1, 500)} g {phrase(2)}" for _ in range(10)],
+            "instructions": [f"Step {i + 1}: {phrase(12)}" for i in range(8)],
+            "tips": phrase(20),
+        }
+
+    items = [{"item": phrase(2), "quantity": f"{rng.randint(1, 5)}", "category": rng.choice(["produce", "dairy", "meat"]),
+              "checked": rng.random() < 0.3} for _ in range(150)]
+    photo = base64.b64encode(rng.randbytes(150_000)).decode("ascii")
+    history = [{"id": f"msg-{i}", "text": phrase(60), "sender": "user" if i % 2 else "nova",
+                "timestamp": f"2026-10-19T08:{i % 60:02d}:00Z",
+                **({"image": photo, "imageFormat": "jpeg"} if i % 10 == 1 else {})} for i in range(50)]
+    fridge = {"type": "structured", "data": {
+        "ingredients": [{"name": phrase(2), "quantity": "1", "category": "produce", "freshness": "fresh"}
+                        for _ in range(25)],
+        "grocery_list": [{"item": phrase(2), "quantity": "1", "category": "produce"} for _ in range(15)],
+        "recipes": [recipe() for _ in range(4)],
+    }}
+    return {
+        "get-data (150 items, 25 recipes)": {"success": True, "data": {"items": items,
+                                                                         "recipes": [recipe() for _ in range(25)]}},
+        "chat-history (50 msgs, 5 photos)": {"success": True, "chat_history": history},
+        "fridge analysis (structured)": {"success": True, "response": fridge},
+        "chat request (1 photo)": {"message": "Analyze my fridge", "email": "cook@example.com",
+                                   "imageBase64": base64.b64encode(rng.randbytes(1_000_000)).decode("ascii"),
+                                   "imageFormat": "jpeg"},
+    }
+
+
+def best_us(func, repeat: int) -> float:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return statistics.median(t / number for t in timer.repeat(repeat, number)) * 1e6
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Flask JSON providers")
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+    if not ORJSON_AVAILABLE:
+        print("orjson is not installed; nothing to compare", file=sys.stderr)
+        return 1
+
+    app = Flask(__name__)
+    providers = {"stdlib": StdlibJSONProvider(app), "orjson": FastJSONProvider(app)}
+    print(f"{'payload':<36} {'size':>9}  {'op':<9} {'stdlib':>10} {'orjson':>10} {'speedup':>8}")
+    with app.app_context():
+        for name, payload in make_payloads().items():
+            body = json.dumps(payload).encode("utf-8")
+            for op in ("response", "loads"):
+                times = {}
+                for label, provider in providers.items():
+                    if op == "response":
+                        times[label] = best_us(lambda: provider.response(payload).get_data(), args.repeat)
+                    else:
+                        times[label] = best_us(lambda: provider.loads(body), args.repeat)
+                print(f"{name:<36} {len(body) / 1024:>7.0f}KB  {op:<9} {times['stdlib']:>8.0f}µs "
+                      f"{times['orjson']:>8.0f}µs {times['stdlib'] / times['orjson']:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
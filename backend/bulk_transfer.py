@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Streaming NDJSON export and import of every user's data
+
+One line per user:
+
+    {"email": ..., "items": [...], "recipes": [...], "chat_history": [...],
+     "recent_recipes": [...], "pantry": [...]}
+
+Export walks users with keyset pagination (email > last email), so memory
+stays bounded by one page however many users there are. Import reads the
+file lazily, upserts batches on a bounded thread pool and records a
+checkpoint (the number of input lines fully imported) so an interrupted
+run resumes where it stopped.
+
+Usage:
+    python bulk_transfer.py export users.ndjson [--batch-size 100]
+    python bulk_transfer.py import users.ndjson [--batch-size 200] [--workers 4] [--checkpoint users.ndjson.checkpoint]
+
+The storage backend is chosen by STORAGE_BACKEND, as for the API.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Any, Iterable, Iterator, IO, Tuple
+
+from storage_backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '100'))
+DEFAULT_IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '200'))
+DEFAULT_IMPORT_WORKERS = int(os.getenv('IMPORT_WORKERS', '4'))
+
+
+class BulkTransferError(Exception):
+    """Raised when an export page or import batch fails"""
+
+
+def iter_user_records(storage: StorageBackend, batch_size: int = DEFAULT_EXPORT_BATCH_SIZE,
+                      after_email: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield every user record, one keyset page at a time
+
+    Raises:
+        BulkTransferError: If a page cannot be read
+    """
+    while True:
+        page = storage.export_user_records(after_email, batch_size)
+        if page is None:
+            raise BulkTransferError(f"Export failed reading users after {after_email!r}")
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_email = page[-1]['email']
+
+
+def iter_ndjson(storage: StorageBackend, batch_size: int = DEFAULT_EXPORT_BATCH_SIZE) -> Iterator[str]:
+    """Yield the export as NDJSON lines (with trailing newlines)"""
+    for record in iter_user_records(storage, batch_size):
+        yield json.dumps(record, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def export_ndjson(storage: StorageBackend, out: IO[str], batch_size: int = DEFAULT_EXPORT_BATCH_SIZE) -> int:
+    """Write the export to a text stream; returns the number of records"""
+    count = 0
+    for line in iter_ndjson(storage, batch_size):
+        out.write(line)
+        count += 1
+    return count
+
+
+class ImportCheckpoint:
+    """Number of input lines already imported, kept in a small text file"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+    def load(self) -> int:
+        if not self.path or not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            return int(f.read().strip() or 0)
+
+    def save(self, lines_done: int):
+        if not self.path:
+            return
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(lines_done))
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def _batches(lines: Iterable[str], batch_size: int, skip: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """Yield (last line number, records) batches, skipping the first `skip` lines"""
+    batch: List[Dict[str, Any]] = []
+    line_number = 0
+    for line_number, line in enumerate(lines, start=1):
+        if line_number <= skip or not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BulkTransferError(f"Invalid JSON on line {line_number}: {e}")
+        if not isinstance(record, dict) or not isinstance(record.get('email'), str):
+            raise BulkTransferError(f"Line {line_number} is not a user record")
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield line_number, batch
+            batch = []
+    if batch or line_number > skip:
+        yield line_number, batch
+
+
+def import_ndjson(storage: StorageBackend, lines: Iterable[str], batch_size: int = DEFAULT_IMPORT_BATCH_SIZE,
+                  workers: int = DEFAULT_IMPORT_WORKERS, checkpoint_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Import NDJSON user records in parallel batches, resuming from a checkpoint
+
+    Batches may finish out of order; the checkpoint only advances past a line
+    once every batch up to it has been written. Batches after the checkpoint
+    that had already finished are re-imported on resume, which is safe
+    because imports are upserts.
+
+    Args:
+        storage: Backend to write to
+        lines: NDJSON lines (e.g. an open file)
+        batch_size: Records per import_user_records call
+        workers: Batches written concurrently
+        checkpoint_path: File recording progress; None disables resuming
+
+    Returns:
+        {'records': imported, 'skipped_lines': resumed past, 'seconds': elapsed}
+
+    Raises:
+        BulkTransferError: On malformed input or a failed batch; the
+            checkpoint is left at the last fully imported line
+    """
+    checkpoint = ImportCheckpoint(checkpoint_path)
+    skip = checkpoint.load()
+    if skip:
+        logger.info(f"Resuming import after line {skip}")
+    start = time.perf_counter()
+    imported = 0
+    pending: Dict[Any, int] = {}   # future -> last line of its batch
+    finished: List[int] = []       # last lines of completed batches not yet checkpointed
+    submitted: List[int] = []      # last lines of submitted batches, in order
+    done_through = skip
+
+    def collect(futures, strict=True):
+        nonlocal imported, done_through
+        for future in futures:
+            last_line = pending.pop(future)
+            count = future.result() if strict or not future.exception() else None
+            if count is None:
+                if strict:
+                    raise BulkTransferError(f"Import failed for the batch ending at line {last_line}")
+                continue
+            imported += count
+            finished.append(last_line)
+        # Advance the checkpoint over the contiguous prefix of finished batches
+        advanced = False
+        while submitted and submitted[0] in finished:
+            done_through = submitted.pop(0)
+            finished.remove(done_through)
+            advanced = True
+        if advanced:
+            checkpoint.save(done_through)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='import') as pool:
+        try:
+            for last_line, records in _batches(lines, max(1, batch_size), skip):
+                # Keep at most two batches per worker in memory
+                while len(pending) >= 2 * max(1, workers):
+                    completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(completed)
+                submitted.append(last_line)
+                if records:
+                    pending[pool.submit(storage.import_user_records, records)] = last_line
+                else:
+                    finished.append(last_line)
+            while pending:
+                completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(completed)
+            collect([])
+        except BaseException:
+            # Let in-flight batches finish so the checkpoint covers them
+            completed, _ = wait(pending)
+            collect(completed, strict=False)
+            raise
+
+    return {'records': imported, 'skipped_lines': skip, 'seconds': round(time.perf_counter() - start, 3)}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Export or import ChopChop user data as NDJSON")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export_parser = commands.add_parser('export', help="Write every user record to a file ('-' for stdout)")
+    export_parser.add_argument('path')
+    export_parser.add_argument('--batch-size', type=int, default=DEFAULT_EXPORT_BATCH_SIZE)
+    import_parser = commands.add_parser('import', help="Upsert user records from a file ('-' for stdin)")
+    import_parser.add_argument('path')
+    import_parser.add_argument('--batch-size', type=int, default=DEFAULT_IMPORT_BATCH_SIZE)
+    import_parser.add_argument('--workers', type=int, default=DEFAULT_IMPORT_WORKERS)
+    import_parser.add_argument('--checkpoint', help="Progress file (default: <path>.checkpoint)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    from storage_backend import get_storage
+    storage = get_storage()
+    if not storage.enabled:
+        print(f"❌ {storage.backend_name} storage is not configured", file=sys.stderr)
+        return 1
+
+    try:
+        if args.command == 'export':
+            start = time.perf_counter()
+            if args.path == '-':
+                count = export_ndjson(storage, sys.stdout, args.batch_size)
+            else:
+                with open(args.path, 'w', encoding='utf-8') as out:
+                    count = export_ndjson(storage, out, args.batch_size)
+            print(f"✅ Exported {count} users in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        else:
+            checkpoint_path = args.checkpoint or (None if args.path == '-' else f"{args.path}.checkpoint")
+            source = sys.stdin if args.path == '-' else open(args.path, encoding='utf-8')
+            with source:
+                result = import_ndjson(storage, source, args.batch_size, args.workers, checkpoint_path)
+            ImportCheckpoint(checkpoint_path).clear()
+            print(f"✅ Imported {result['records']} users in {result['seconds']}s"
+                  f" (resumed after line {result['skipped_lines']})", file=sys.stderr)
+    except BulkTransferError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Cold-start accounting for the ChopChop backend
+
+Render instances spin down when idle, so the first request after a wake-up
+pays for interpreter start, imports and client setup. Heavy dependencies
+(boto3, Pillow, supabase/httpx, python-dotenv) are therefore imported on
+first use through lazy_import(), and the Bedrock and Supabase clients are
+built on first use too. This module records what that costs:
+
+- milestones since process start (app loaded, listening)
+- the time each lazily imported module or client took on first use
+
+get_startup_report() returns both (served under /health "startup"), and
+
+    python nova_backend.py --profile-startup [--budget-ms 400] [--json]
+
+profiles a cold start in fresh interpreters: import time per package
+(self time, from python -X importtime), time until the server accepts connections and
+answers /health, and the deferred first-use costs. It exits non-zero if
+importing the app exceeds the budget or pulls in a module meant to be
+lazy, so a regression fails CI.
+"""
+import os
+import re
+import sys
+import json
+import time
+import socket
+import argparse
+import importlib
+import importlib.util
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Iterator, Tuple
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Imported on first use; importing nova_backend must not load any of them
+LAZY_MODULES = ('boto3', 'botocore', 'PIL', 'supabase', 'httpx', 'dotenv')
+# What a preloading gunicorn master imports before forking, so workers share it
+WARM_MODULES = ('boto3', 'botocore.exceptions', 'PIL.Image', 'httpx', 'supabase')
+
+_lock = threading.Lock()
+_milestones: Dict[str, float] = {}
+_first_use: Dict[str, float] = {}
+
+
+def _process_started() -> float:
+    """Wall-clock time this process started, from /proc when available"""
+    try:
+        with open('/proc/self/stat') as f:
+            # Field 22 (starttime) is in clock ticks since boot; the command name may contain spaces
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return time.time() - uptime + start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.time()
+
+
+PROCESS_STARTED = _process_started()
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 1)
+
+
+def mark(milestone: str) -> float:
+    """Record a startup milestone once; returns milliseconds since process start"""
+    elapsed = _ms(time.time() - PROCESS_STARTED)
+    with _lock:
+        return _milestones.setdefault(milestone, elapsed)
+
+
+@contextmanager
+def first_use(name: str) -> Iterator[None]:
+    """Time the block and record it as the first-use cost of `name` (later uses are not recorded)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _first_use.setdefault(name, _ms(time.perf_counter() - started))
+
+
+def lazy_import(module_name: str):
+    """Import a module on first use, recording how long the first import took"""
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    with first_use(f"import {module_name}"):
+        return importlib.import_module(module_name)
+
+
+def warm_imports(modules=WARM_MODULES) -> float:
+    """Import the heavy modules now (skipping any not installed); returns milliseconds taken"""
+    started = time.perf_counter()
+    for name in modules:
+        try:
+            lazy_import(name)
+        except ImportError:
+            pass
+    return _ms(time.perf_counter() - started)
+
+
+def load_env_file() -> bool:
+    """
+    Load a .env file the way python-dotenv's load_dotenv() finds one
+
+    Searches this directory and its parents. dotenv itself is only imported
+    when a file exists, which it does not on Render (variables come from
+    the dashboard).
+    """
+    directory = BACKEND_DIR
+    while True:
+        path = os.path.join(directory, '.env')
+        if os.path.isfile(path):
+            return lazy_import('dotenv').load_dotenv(path)
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return False
+        directory = parent
+
+
+def get_startup_report() -> Dict[str, Any]:
+    with _lock:
+        return {'pid': os.getpid(), 'milestones_ms': dict(_milestones), 'first_use_ms': dict(_first_use)}
+
+
+# ----------------------------------------------------------------------
+# --profile-startup
+# ----------------------------------------------------------------------
+_IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( +)(\S+)$')
+
+
+def parse_importtime(output: str, root: str) -> Tuple[Optional[float], List[Tuple[str, float]]]:
+    """
+    Summarize `python -X importtime` output for the import of `root`
+
+    Returns:
+        (total ms for root, [(package, ms)] slowest first), where a package's
+        time is the self time of all its modules imported under root, so the
+        packages add up to the total
+    """
+    entries = []
+    for line in output.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us = int(match.group(1)), int(match.group(2))
+            entries.append(((len(match.group(3)) - 1) // 2, match.group(4), self_us, cumulative_us))
+    # Children are printed before their parent, so a top-level entry ends its subtree
+    total = None
+    packages: Dict[str, float] = {}
+    subtree: List[Tuple[str, int]] = []
+    for level, name, self_us, cumulative_us in entries:
+        if level > 0:
+            subtree.append((name, self_us))
+            continue
+        if name == root:
+            total = cumulative_us / 1000
+            for module, us in subtree + [(name, self_us)]:
+                package = module.split('.')[0]
+                packages[package] = packages.get(package, 0.0) + us / 1000
+        subtree = []
+    return total, sorted(packages.items(), key=lambda item: item[1], reverse=True)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _server_command(port: int) -> List[str]:
+    if importlib.util.find_spec('gunicorn') is not None:
+        return [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+                '--workers', '1', 'nova_backend:app']
+    return [sys.executable, 'nova_backend.py']
+
+
+def _time_to_listening(env: Dict[str, str], timeout: float = 30.0) -> Dict[str, Any]:
+    """Start the server and time until it accepts a connection and until /health answers"""
+    port = _free_port()
+    command = _server_command(port)
+    env = dict(env, PORT=str(port))
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    result = {'server': os.path.basename(command[2] if command[1] == '-m' else command[1]),
+              'listening_ms': None, 'first_response_ms': None}
+    try:
+        while time.perf_counter() - started < timeout and process.poll() is None:
+            try:
+                with socket.create_connection(('127.0.0.1', port), timeout=timeout) as conn:
+                    if result['listening_ms'] is None:
+                        result['listening_ms'] = _ms(time.perf_counter() - started)
+                    conn.sendall(b'GET /health HTTP/1.0\r\nHost: localhost\r\n\r\n')
+                    if conn.recv(12).startswith(b'HTTP/1.'):
+                        result['first_response_ms'] = _ms(time.perf_counter() - started)
+                        break
+            except OSError:
+                time.sleep(0.005)
+    finally:
+        process.terminate()
+        try:
+            process.wait(10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    return result
+
+
+_FIRST_USE_SCRIPT = """
+import json, os, time
+import coldstart, nova_backend
+from aws_config import aws_config
+costs = {}
+for name in coldstart.WARM_MODULES:
+    started = time.perf_counter()
+    try:
+        coldstart.lazy_import(name)
+    except ImportError:
+        continue
+    costs['import ' + name] = round((time.perf_counter() - started) * 1000, 1)
+# Building a client reads the service model from disk; no request is made
+os.environ.setdefault('AWS_ACCESS_KEY_ID', 'profile')
+os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'profile')
+started = time.perf_counter()
+aws_config._create_runtime_client()
+costs['bedrock client'] = round((time.perf_counter() - started) * 1000, 1)
+print(json.dumps(costs))
+"""
+
+
+def profile_cold_start(measure_server: bool = True) -> Dict[str, Any]:
+    """Profile a cold start of nova_backend in fresh interpreters"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import nova_backend'], cwd=BACKEND_DIR,
+                               env=env, capture_output=True, text=True)
+    process_ms = _ms(time.perf_counter() - started)
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing nova_backend failed:\n{completed.stderr[-2000:]}")
+    import_ms, packages = parse_importtime(completed.stderr, 'nova_backend')
+    report: Dict[str, Any] = {
+        'python': sys.version.split()[0],
+        'process_ms': process_ms,
+        'import_ms': round(import_ms or 0.0, 1),
+        'packages_ms': [(name, round(ms, 1)) for name, ms in packages],
+        'eager_lazy_modules': sorted(name for name, _ in packages if name in LAZY_MODULES),
+    }
+    completed = subprocess.run([sys.executable, '-c', _FIRST_USE_SCRIPT], cwd=BACKEND_DIR, env=env,
+                               capture_output=True, text=True)
+    report['first_use_ms'] = json.loads(completed.stdout.strip().splitlines()[-1]) if completed.returncode == 0 else None
+    if measure_server:
+        report['startup'] = _time_to_listening(env)
+    return report
+
+
+def print_report(report: Dict[str, Any], top: int = 12):
+    print(f"Cold start (Python {report['python']})")
+    print(f"  interpreter + import nova_backend: {report['process_ms']:8.1f} ms")
+    print(f"  import nova_backend:               {report['import_ms']:8.1f} ms")
+    for name, ms in report['packages_ms'][:top]:
+        print(f"    {name:<30} {ms:8.1f} ms")
+    startup = report.get('startup')
+    if startup:
+        print(f"  {startup['server']} listening:                {startup['listening_ms'] or float('nan'):8.1f} ms")
+        print(f"  {startup['server']} first /health response:  {startup['first_response_ms'] or float('nan'):8.1f} ms")
+    if report['first_use_ms']:
+        print("  Deferred to first use:")
+        for name, ms in report['first_use_ms'].items():
+            print(f"    {name:<30} {ms:8.1f} ms")
+    if report['eager_lazy_modules']:
+        print(f"  ❌ Imported at startup but meant to be lazy: {', '.join(report['eager_lazy_modules'])}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Profile a cold start of the ChopChop backend")
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help="Fail if importing nova_backend takes longer than this")
+    parser.add_argument('--no-server', action='store_true', help="Skip starting the server to time listening")
+    parser.add_argument('--json', action='store_true', help="Print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = profile_cold_start(measure_server=not args.no_server)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    failed = bool(report['eager_lazy_modules'])
+    if args.budget_ms is not None and report['import_ms'] > args.budget_ms:
+        print(f"❌ import nova_backend took {report['import_ms']} ms, over the {args.budget_ms:g} ms budget",
+              file=sys.stderr)
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
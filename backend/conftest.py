@@ -0,0 +1,18 @@
+"""
+Shared test setup
+
+Tests that import nova_backend get SQLite storage and in-memory sessions in
+a scratch directory, so a test run neither needs Supabase nor leaves
+database files in the working directory. Running a test file directly
+(python test_x.py) imports this module for the same defaults.
+"""
+
+import os
+import tempfile
+
+_directory = tempfile.mkdtemp()
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", os.path.join(_directory, "app.sqlite3"))
+os.environ.setdefault("SESSION_STORE", "memory")
+os.environ.setdefault("SESSION_SQLITE_PATH", os.path.join(_directory, "sessions.sqlite3"))
+os.environ.setdefault("FRIDGE_JOBS_SQLITE_PATH", os.path.join(_directory, "jobs.sqlite3"))
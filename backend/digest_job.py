@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Weekly digest email: every user's open grocery list and saved recipes
+
+Users are walked in keyset-paginated batches (email > last email) and each
+digest is rendered with the grocery email templates, so recipes shared by
+many users are rendered once. Delivery goes through the pooled SMTP
+sessions of EmailService, a few senders at a time, under a global rate
+limit and a per-recipient-domain limit so no provider sees a burst.
+
+Progress is checkpointed to a small JSON file after every delivery: the
+email up to which every digest is done, plus the few finished past it while
+earlier ones were still sending. A crashed or interrupted run started again
+with the same run id (the ISO week by default) skips everything already
+sent; a finished run is not repeated.
+
+Usage:
+    python digest_job.py [--run-id 2026-W42] [--checkpoint digest.checkpoint.json]
+                         [--limit N] [--dry-run]
+
+Run it weekly from cron, from the backend directory so STORAGE_BACKEND and
+the SMTP_* settings apply, with the checkpoint on persistent disk.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from collections import deque
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, List, Optional, Any, Iterator
+
+from email_service import EmailService, is_transient_error
+from email_templates import render_grocery_email
+from rate_limit import TokenBucket, KeyedTokenBuckets
+from storage_backend import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class DigestSettings:
+    """Digest job configuration, read from environment variables"""
+
+    def __init__(self):
+        self.subject = os.getenv('DIGEST_SUBJECT', 'Your weekly ChopChop grocery list')
+        self.batch_size = _env_int('DIGEST_BATCH_SIZE', 200)
+        # Concurrent deliveries; each borrows a session from the SMTP pool
+        self.senders = _env_int('DIGEST_SENDERS', 2)
+        self.rate = _env_float('DIGEST_RATE_PER_SECOND', 10.0)
+        self.domain_rate = _env_float('DIGEST_DOMAIN_RATE_PER_SECOND', 2.0)
+        self.max_attempts = _env_int('DIGEST_MAX_ATTEMPTS', 3)
+        self.retry_backoff = _env_float('DIGEST_RETRY_BACKOFF', 2.0)
+        self.checkpoint_path = os.getenv('DIGEST_CHECKPOINT_PATH', 'digest.checkpoint.json')
+        self.progress_interval = _env_float('DIGEST_PROGRESS_INTERVAL', 10.0)
+
+
+class DigestError(Exception):
+    """Raised when a page of users cannot be read"""
+
+
+def current_run_id() -> str:
+    """ISO year and week, e.g. '2026-W42'"""
+    return datetime.now(timezone.utc).strftime('%G-W%V')
+
+
+class DigestCheckpoint:
+    """Progress of one digest run, kept in a small JSON file"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+
+    @staticmethod
+    def fresh(run_id: str) -> Dict[str, Any]:
+        return {'run_id': run_id, 'after_email': None, 'done': [],
+                'sent': 0, 'failed': 0, 'skipped': 0, 'completed': False}
+
+    def load(self, run_id: str) -> Dict[str, Any]:
+        """The saved state for run_id; a checkpoint from another run is ignored"""
+        if not self.path or not os.path.exists(self.path):
+            return self.fresh(run_id)
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('run_id') != run_id:
+            logger.info(f"Ignoring checkpoint of digest run {state.get('run_id')}")
+            return self.fresh(run_id)
+        return {**self.fresh(run_id), **state}
+
+    def save(self, state: Dict[str, Any]):
+        if not self.path:
+            return
+        # Write-then-rename so a crash never leaves a truncated checkpoint
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+
+def iter_user_lists(storage: StorageBackend, batch_size: int, after_email: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield {'email', 'items', 'recipes'} for every user, one keyset page at a time
+
+    Raises:
+        DigestError: If a page cannot be read
+    """
+    while True:
+        page = storage.list_user_lists(after_email, batch_size)
+        if page is None:
+            raise DigestError(f"Reading users after {after_email!r} failed")
+        yield from page
+        if len(page) < batch_size:
+            return
+        after_email = page[-1]['email']
+
+
+def render_digest(user: Dict[str, Any]) -> Optional[str]:
+    """The digest HTML for one user, or None if there is nothing to send"""
+    items = [item for item in user.get('items') or [] if isinstance(item, dict) and not item.get('checked')]
+    recipes = [recipe for recipe in user.get('recipes') or [] if isinstance(recipe, dict)]
+    if not items and not recipes:
+        return None
+    return render_grocery_email(items, recipes)
+
+
+class DigestJob:
+    """
+    One digest run over every user
+
+    At most `senders` digests are in flight at once, which also bounds how
+    many can be past the checkpoint's watermark.
+    """
+
+    def __init__(self, storage: StorageBackend, email_service: EmailService,
+                 settings: Optional[DigestSettings] = None, run_id: Optional[str] = None):
+        self.storage = storage
+        self.email_service = email_service
+        self.settings = settings or DigestSettings()
+        self.run_id = run_id or current_run_id()
+        self.rate_limit = TokenBucket(self.settings.rate)
+        self.domain_rate_limits = KeyedTokenBuckets(self.settings.domain_rate, burst=1)
+
+    def _deliver(self, email: str, body: str) -> str:
+        domain = email.rsplit('@', 1)[-1].lower()
+        service = self.email_service
+        for attempt in range(1, self.settings.max_attempts + 1):
+            # Domain first, so a slow domain does not hold a global token while it waits
+            self.domain_rate_limits.acquire(domain)
+            self.rate_limit.acquire()
+            try:
+                service.deliver(service.build_message(email, self.settings.subject, body, is_html=True))
+                return 'sent'
+            except Exception as e:
+                if not is_transient_error(e) or attempt == self.settings.max_attempts:
+                    logger.error(f"Digest to {email} failed: {e}")
+                    return 'failed'
+                delay = self.settings.retry_backoff * (2 ** (attempt - 1))
+                logger.warning(f"Digest to {email} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+        return 'failed'
+
+    def _process(self, user: Dict[str, Any], dry_run: bool) -> str:
+        body = render_digest(user)
+        if body is None:
+            return 'skipped'
+        if dry_run:
+            return 'sent'
+        return self._deliver(user['email'], body)
+
+    def run(self, dry_run: bool = False, limit: Optional[int] = None,
+            checkpoint_path: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Send (or with dry_run, only render) the digest to every user not yet done
+
+        Args:
+            dry_run: Render without sending or checkpointing
+            limit: Stop after this many users (the run stays resumable)
+            checkpoint_path: Progress file; defaults to DIGEST_CHECKPOINT_PATH
+
+        Returns:
+            This run's {'sent', 'failed', 'skipped'} counts, 'seconds',
+            'emails_per_second', 'resumed_after', 'completed' and SMTP pool stats
+
+        Raises:
+            DigestError: If reading users fails; progress so far is checkpointed
+        """
+        if not dry_run and not self.email_service.configured:
+            raise DigestError("SMTP is not configured")
+        checkpoint = DigestCheckpoint(None if dry_run else (checkpoint_path or self.settings.checkpoint_path))
+        state = checkpoint.load(self.run_id)
+        counts = {'sent': 0, 'failed': 0, 'skipped': 0}
+        result = {'run_id': self.run_id, 'dry_run': dry_run, 'resumed_after': state['after_email'], **counts}
+        if state['completed']:
+            logger.info(f"Digest run {self.run_id} already completed; nothing to send")
+            return {**result, 'completed': True, 'seconds': 0.0, 'emails_per_second': 0.0}
+
+        start = time.perf_counter()
+        last_report = start
+        pending: Dict[Any, str] = {}          # future -> email
+        submitted: 'deque[str]' = deque()     # emails past the watermark, in order
+        finished = set(state['done'])         # finished emails past the watermark
+
+        def report(now: float):
+            elapsed = max(now - start, 1e-9)
+            logger.info(f"Digest {self.run_id}: {counts['sent']} sent, {counts['failed']} failed, "
+                        f"{counts['skipped']} skipped ({counts['sent'] / elapsed:.1f} emails/s)")
+
+        def collect(futures):
+            nonlocal last_report
+            for future in futures:
+                email = pending.pop(future)
+                if future.exception():
+                    logger.error(f"Digest to {email} failed: {future.exception()}")
+                    status = 'failed'
+                else:
+                    status = future.result()
+                counts[status] += 1
+                state[status] += 1
+                finished.add(email)
+            while submitted and submitted[0] in finished:
+                state['after_email'] = submitted.popleft()
+                finished.discard(state['after_email'])
+            state['done'] = sorted(finished)
+            checkpoint.save(state)
+            now = time.perf_counter()
+            if now - last_report >= self.settings.progress_interval:
+                report(now)
+                last_report = now
+
+        senders = max(1, self.settings.senders)
+        taken = 0
+        with ThreadPoolExecutor(max_workers=senders, thread_name_prefix='digest') as pool:
+            try:
+                for user in iter_user_lists(self.storage, max(1, self.settings.batch_size), state['after_email']):
+                    email = user['email']
+                    submitted.append(email)
+                    if email in finished:
+                        # Sent before the interruption
+                        continue
+                    if limit is not None and taken >= limit:
+                        submitted.pop()
+                        break
+                    taken += 1
+                    while len(pending) >= senders:
+                        completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(completed)
+                    pending[pool.submit(self._process, user, dry_run)] = email
+                else:
+                    state['completed'] = True
+                while pending:
+                    completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(completed)
+                collect([])
+            except BaseException:
+                # Let in-flight deliveries finish so the checkpoint records them
+                completed, _ = wait(pending)
+                collect(completed)
+                raise
+
+        elapsed = time.perf_counter() - start
+        report(time.perf_counter())
+        return {
+            **result, **counts,
+            'completed': state['completed'],
+            'seconds': round(elapsed, 3),
+            'emails_per_second': round(counts['sent'] / elapsed, 2) if elapsed > 0 else 0.0,
+            'smtp': self.email_service.pool.get_stats(),
+        }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    settings = DigestSettings()
+    parser = argparse.ArgumentParser(description="Send the weekly ChopChop digest email to every user")
+    parser.add_argument('--run-id', help="Run identifier; a finished run is not repeated (default: ISO week)")
+    parser.add_argument('--checkpoint', default=settings.checkpoint_path, help="Progress file")
+    parser.add_argument('--limit', type=int, help="Stop after this many users; resume by running again")
+    parser.add_argument('--dry-run', action='store_true', help="Render every digest without sending")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stderr)
+    from storage_backend import get_storage
+    from email_service import get_email_service
+    storage = get_storage()
+    if not storage.enabled:
+        print(f"❌ {storage.backend_name} storage is not configured", file=sys.stderr)
+        return 1
+
+    job = DigestJob(storage, get_email_service(), settings, args.run_id)
+    try:
+        result = job.run(dry_run=args.dry_run, limit=args.limit, checkpoint_path=args.checkpoint)
+    except DigestError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    verb = 'Rendered' if args.dry_run else 'Sent'
+    print(f"✅ {verb} {result['sent']} digests ({result['failed']} failed, {result['skipped']} with nothing to send)"
+          f" in {result['seconds']}s: {result['emails_per_second']} emails/s"
+          f"{'' if result['completed'] else ' (incomplete; run again to resume)'}", file=sys.stderr)
+    return 0 if not result['failed'] else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
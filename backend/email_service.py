@@ -0,0 +1,543 @@
+"""
+Email delivery for ChopChop: pooled SMTP connections and a background queue
+
+Opening an SMTP session (TCP connect, EHLO, STARTTLS, AUTH) costs one to
+three seconds, so connections are kept in a small per-process pool and
+health-checked with NOOP before reuse. Request handlers enqueue messages
+and return a message id at once; worker threads deliver them, retrying
+transient failures with exponential backoff.
+
+Queued messages live in a WAL-mode SQLite file (EMAIL_QUEUE_SQLITE_PATH)
+that every gunicorn worker on the host opens, so any worker can report a
+message's status and queued mail survives a restart. A worker claims a
+message with a lease (EMAIL_LEASE_SECONDS); a message whose worker died
+mid-send is claimed again once the lease runs out.
+"""
+import os
+import time
+import uuid
+import atexit
+import sqlite3
+import smtplib
+import logging
+import threading
+from contextlib import contextmanager
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from typing import Dict, Any, Optional, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+EMAIL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS email_jobs (
+    id TEXT PRIMARY KEY,
+    to_email TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    body TEXT,
+    is_html INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    queued_at REAL NOT NULL,
+    run_after REAL NOT NULL,
+    sent_at REAL,
+    finished_at REAL,
+    lease_owner TEXT,
+    lease_expires_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_email_jobs_claim ON email_jobs(status, run_after, queued_at);
+"""
+INSERT_EMAIL = """
+    INSERT INTO email_jobs (id, to_email, subject, body, is_html, status, queued_at, run_after)
+    VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)
+"""
+SELECT_EMAIL = "SELECT id, to_email, status, attempts, error, queued_at, sent_at FROM email_jobs WHERE id = ?"
+COUNT_PENDING = "SELECT COUNT(*) FROM email_jobs WHERE status IN ('queued', 'sending', 'retrying')"
+# One statement, so two workers can never claim the same message
+CLAIM_EMAIL = """
+    UPDATE email_jobs
+    SET status = 'sending', attempts = attempts + 1, lease_owner = ?, lease_expires_at = ?
+    WHERE id = (
+        SELECT id FROM email_jobs
+        WHERE (status IN ('queued', 'retrying') AND run_after <= ?) OR (status = 'sending' AND lease_expires_at <= ?)
+        ORDER BY queued_at LIMIT 1
+    )
+    RETURNING id, to_email, subject, body, is_html, attempts
+"""
+FINISH_EMAIL = """
+    UPDATE email_jobs
+    SET status = ?, error = ?, sent_at = ?, finished_at = ?, body = NULL, lease_owner = NULL, lease_expires_at = NULL
+    WHERE id = ? AND lease_owner = ?
+"""
+RETRY_EMAIL = """
+    UPDATE email_jobs
+    SET status = 'retrying', error = ?, run_after = ?, lease_owner = NULL, lease_expires_at = NULL
+    WHERE id = ? AND lease_owner = ?
+"""
+SWEEP_EMAILS = "DELETE FROM email_jobs WHERE status IN ('sent', 'failed') AND finished_at <= ?"
+
+SWEEP_INTERVAL = 60.0
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class SmtpSettings:
+    """SMTP and queue configuration, read from environment variables"""
+
+    def __init__(self):
+        self.host = os.getenv('SMTP_HOST', 'smtp.gmail.com')
+        self.port = _env_int('SMTP_PORT', 587)
+        self.user = os.getenv('SMTP_USER')
+        self.password = os.getenv('SMTP_PASSWORD')
+        self.sender = os.getenv('EMAIL_FROM') or self.user
+        self.starttls = os.getenv('SMTP_STARTTLS', 'true').lower() == 'true'
+        self.timeout = _env_float('SMTP_TIMEOUT', 10.0)
+        self.pool_size = _env_int('SMTP_POOL_SIZE', 2)
+        # Recycle sessions before servers drop them (Gmail closes idle ones after a few minutes)
+        self.max_idle = _env_float('SMTP_MAX_IDLE_SECONDS', 60.0)
+        self.max_age = _env_float('SMTP_MAX_CONNECTION_AGE', 600.0)
+        self.max_messages = _env_int('SMTP_MAX_MESSAGES_PER_CONNECTION', 100)
+        self.workers = _env_int('EMAIL_WORKERS', self.pool_size)
+        self.queue_size = _env_int('EMAIL_QUEUE_SIZE', 1000)
+        self.max_attempts = _env_int('EMAIL_MAX_ATTEMPTS', 4)
+        self.retry_backoff = _env_float('EMAIL_RETRY_BACKOFF', 2.0)
+        self.queue_path = os.getenv('EMAIL_QUEUE_SQLITE_PATH', 'email_queue.sqlite3')
+        self.lease_seconds = _env_float('EMAIL_LEASE_SECONDS', 120.0)
+        self.poll_seconds = _env_float('EMAIL_POLL_SECONDS', 1.0)
+        # Sent and failed messages stay readable through GET /send-email/<id> this long
+        self.status_ttl = _env_float('EMAIL_STATUS_TTL_SECONDS', 86400.0)
+        self.busy_timeout_ms = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host and self.sender)
+
+
+class _PooledConnection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.messages_sent = 0
+
+
+class SmtpConnectionPool:
+    """
+    Bounded pool of logged-in SMTP sessions
+
+    At most `pool_size` sessions exist at once; callers wait for a free one.
+    A session idle for over a second is checked with NOOP before reuse, and
+    sessions are replaced after max_idle seconds idle, max_age seconds or
+    max_messages messages. The pool is emptied in a forked child, which
+    must not share its parent's sockets.
+    """
+
+    def __init__(self, settings: SmtpSettings):
+        self.settings = settings
+        self._idle: List[_PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(1, settings.pool_size))
+        self._pid = os.getpid()
+        self.stats = {'opened': 0, 'reused': 0, 'health_check_failures': 0, 'discarded': 0}
+
+    def _open(self) -> _PooledConnection:
+        s = self.settings
+        smtp = smtplib.SMTP(s.host, s.port, timeout=s.timeout)
+        try:
+            smtp.ehlo()
+            if s.starttls:
+                smtp.starttls()
+                smtp.ehlo()
+            if s.user and s.password:
+                smtp.login(s.user, s.password)
+        except Exception:
+            self._close(smtp)
+            raise
+        with self._lock:
+            self.stats['opened'] += 1
+        return _PooledConnection(smtp)
+
+    @staticmethod
+    def _close(smtp: smtplib.SMTP):
+        try:
+            smtp.quit()
+        except Exception:
+            try:
+                smtp.close()
+            except Exception:
+                pass
+
+    def _healthy(self, conn: _PooledConnection) -> bool:
+        now = time.monotonic()
+        if now - conn.created_at > self.settings.max_age or conn.messages_sent >= self.settings.max_messages:
+            return False
+        idle = now - conn.last_used
+        if idle > self.settings.max_idle:
+            return False
+        if idle < 1.0:
+            # Just used; a NOOP round trip would only add latency
+            return True
+        try:
+            return conn.smtp.noop()[0] == 250
+        except Exception:
+            with self._lock:
+                self.stats['health_check_failures'] += 1
+            return False
+
+    def _take_idle(self) -> Optional[_PooledConnection]:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sockets inherited across fork belong to the parent
+                self._idle = []
+                self._pid = os.getpid()
+            # LIFO: the most recently used session is the most likely to be alive
+            return self._idle.pop() if self._idle else None
+
+    @contextmanager
+    def connection(self) -> Iterator[smtplib.SMTP]:
+        """
+        Borrow a healthy session for the duration of the block
+
+        A session that raised inside the block is discarded, not returned.
+        """
+        if not self._slots.acquire(timeout=self.settings.timeout * 3):
+            raise TimeoutError("Timed out waiting for a free SMTP connection")
+        conn = None
+        try:
+            while conn is None:
+                conn = self._take_idle()
+                if conn is None:
+                    conn = self._open()
+                elif self._healthy(conn):
+                    with self._lock:
+                        self.stats['reused'] += 1
+                else:
+                    self._discard(conn)
+                    conn = None
+            try:
+                yield conn.smtp
+            except BaseException:
+                self._discard(conn)
+                raise
+            conn.messages_sent += 1
+            conn.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def _discard(self, conn: _PooledConnection):
+        with self._lock:
+            self.stats['discarded'] += 1
+        self._close(conn.smtp)
+
+    def close(self):
+        """Close every idle session"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            self._close(conn.smtp)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'idle': len(self._idle), 'size': self.settings.pool_size}
+
+
+def is_transient_error(error: Exception) -> bool:
+    """True for failures worth retrying: network errors and 4xx SMTP replies"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, OSError, TimeoutError))
+
+
+class EmailService:
+    """
+    Pooled, queued email delivery
+
+    send() delivers synchronously over a pooled session; enqueue() stores the
+    message for the background workers and returns its id, whose progress
+    get_status() reports until the record ages out (EMAIL_STATUS_TTL_SECONDS).
+    The queue is disabled, with an error logged, if its SQLite file cannot
+    be opened; send() still works.
+    """
+
+    def __init__(self, settings: Optional[SmtpSettings] = None):
+        self.settings = settings or SmtpSettings()
+        self.pool = SmtpConnectionPool(self.settings)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._stopping = threading.Event()
+        self._workers: List[threading.Thread] = []
+        self._workers_pid: Optional[int] = None
+        self._lease_owner: Optional[str] = None
+        self._last_sweep = 0.0
+        self.counters = {'queued': 0, 'sent': 0, 'failed': 0, 'retried': 0}
+        self.queue_enabled = False
+        if self.configured:
+            try:
+                self._connection().executescript(EMAIL_SCHEMA)
+                self.queue_enabled = True
+            except sqlite3.Error as e:
+                logger.error(f"Email queue disabled: cannot open {self.settings.queue_path}: {e}")
+
+    @property
+    def configured(self) -> bool:
+        return self.settings.configured
+
+    def build_message(self, to_email: str, subject: str, body: str, is_html: bool = False) -> MIMEMultipart:
+        msg = MIMEMultipart('alternative')
+        msg['From'] = self.settings.sender
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(body, 'html' if is_html else 'plain'))
+        return msg
+
+    def deliver(self, msg: MIMEMultipart, smtp: Optional[smtplib.SMTP] = None):
+        """Send a built message, over `smtp` if given or else a pooled session; raises on failure"""
+        if smtp is not None:
+            smtp.send_message(msg)
+            return
+        with self.pool.connection() as pooled:
+            pooled.send_message(msg)
+
+    def send(self, to_email: str, subject: str, body: str, is_html: bool = False) -> bool:
+        """Send synchronously over a pooled session"""
+        if not self.configured:
+            logger.error("SMTP is not configured")
+            return False
+        try:
+            self.deliver(self.build_message(to_email, subject, body, is_html))
+            logger.info(f"Email sent successfully to {to_email}")
+            return True
+        except Exception as e:
+            logger.error(f"Error sending email: {e}")
+            return False
+
+    # ------------------------------------------------------------------
+    # Background queue
+    # ------------------------------------------------------------------
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's queue connection, opening it on first use (and after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.settings.queue_path, timeout=self.settings.busy_timeout_ms / 1000,
+                               isolation_level=None, check_same_thread=True)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {self.settings.busy_timeout_ms}")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, to_email: str, subject: str, body: str, is_html: bool = False) -> Optional[str]:
+        """
+        Queue a message for background delivery
+
+        Returns:
+            The message id, or None if SMTP is not configured, the queue is
+            unavailable or EMAIL_QUEUE_SIZE messages are already pending
+        """
+        if not self.configured:
+            logger.error("SMTP is not configured")
+            return None
+        if not self.queue_enabled:
+            logger.error(f"Email queue is unavailable; not queueing message to {to_email}")
+            return None
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        try:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute(COUNT_PENDING).fetchone()[0] >= self.settings.queue_size:
+                    conn.execute("ROLLBACK")
+                    logger.error(f"Email queue is full; dropping message to {to_email}")
+                    return None
+                conn.execute(INSERT_EMAIL, (message_id, to_email, subject, body, int(is_html), now, now))
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.error(f"Error queueing email to {to_email}: {e}")
+            return None
+        self._count('queued')
+        self._ensure_workers()
+        self._notify()
+        return message_id
+
+    def get_status(self, message_id: str) -> Optional[Dict[str, Any]]:
+        """The message's delivery state, from whichever worker handled it; None if unknown or expired"""
+        if not self.queue_enabled:
+            return None
+        try:
+            row = self._connection().execute(SELECT_EMAIL, (message_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading email {message_id}: {e}")
+            return None
+        if row is None:
+            return None
+        keys = ('id', 'to', 'status', 'attempts', 'error', 'queued_at', 'sent_at')
+        return dict(zip(keys, row))
+
+    def _ensure_workers(self):
+        with self._lock:
+            # Threads do not survive fork; a gunicorn worker starts its own
+            if self._workers_pid == os.getpid() and all(t.is_alive() for t in self._workers):
+                return
+            if self._workers_pid != os.getpid():
+                self._lease_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+            self._stopping.clear()
+            self._workers = []
+            for i in range(max(1, self.settings.workers)):
+                thread = threading.Thread(target=self._worker, name=f'email-worker-{i}', daemon=True)
+                thread.start()
+                self._workers.append(thread)
+            self._workers_pid = os.getpid()
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            try:
+                self._maybe_sweep()
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming an email: {e}")
+                job = None
+            if job is None:
+                with self._changed:
+                    self._changed.wait(self.settings.poll_seconds)
+                continue
+            self._process(job)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        row = self._connection().execute(
+            CLAIM_EMAIL, (self._lease_owner, now + self.settings.lease_seconds, now, now)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('id', 'to_email', 'subject', 'body', 'is_html', 'attempts'), row))
+
+    def _process(self, job: Dict[str, Any]):
+        if job['attempts'] > self.settings.max_attempts:
+            # Claimed again after its lease ran out: the worker sending it died each time
+            self._finish(job, 'failed', 'Delivery was interrupted too many times')
+            return
+        try:
+            self.deliver(self.build_message(job['to_email'], job['subject'], job['body'] or '',
+                                            bool(job['is_html'])))
+        except Exception as e:
+            if is_transient_error(e) and job['attempts'] < self.settings.max_attempts:
+                delay = self.settings.retry_backoff * (2 ** (job['attempts'] - 1))
+                self._count('retried')
+                logger.warning(f"Email {job['id']} to {job['to_email']} failed ({e}); retrying in {delay:.1f}s")
+                self._retry(job, delay, str(e))
+            else:
+                logger.error(f"Email {job['id']} to {job['to_email']} failed permanently: {e}")
+                self._finish(job, 'failed', str(e))
+            return
+        logger.info(f"Email {job['id']} sent to {job['to_email']}")
+        self._finish(job, 'sent')
+
+    def _finish(self, job: Dict[str, Any], status: str, error: Optional[str] = None):
+        now = time.time()
+        try:
+            updated = self._connection().execute(
+                FINISH_EMAIL, (status, error, now if status == 'sent' else None, now, job['id'],
+                               self._lease_owner)).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error recording email {job['id']} as {status}: {e}")
+            return
+        if updated:
+            self._count(status)
+        else:
+            # The lease ran out and another worker took the message over; its outcome stands
+            logger.warning(f"Email {job['id']} finished after losing its lease")
+
+    def _retry(self, job: Dict[str, Any], delay: float, error: str):
+        try:
+            self._connection().execute(RETRY_EMAIL, (error, time.time() + delay, job['id'], self._lease_owner))
+        except sqlite3.Error as e:
+            logger.error(f"Error rescheduling email {job['id']}: {e}")
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        self._connection().execute(SWEEP_EMAILS, (now - self.settings.status_ttl,))
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _pending(self) -> int:
+        return self._connection().execute(COUNT_PENDING).fetchone()[0]
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until no message is queued, sending or awaiting a retry; True if drained"""
+        if not self.queue_enabled:
+            return True
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                if not self._pending():
+                    return True
+            except sqlite3.Error as e:
+                logger.error(f"Error reading the email queue: {e}")
+                return False
+            time.sleep(0.02)
+        return False
+
+    def shutdown(self, timeout: float = 10.0):
+        """
+        Deliver what is queued (within timeout), stop the workers and close the pool
+
+        Messages still pending stay in the queue file for the next worker.
+        """
+        if self._workers_pid == os.getpid():
+            self.flush(timeout)
+            self._stopping.set()
+            self._notify()
+        self.pool.close()
+
+    def get_stats(self) -> Dict[str, Any]:
+        try:
+            depth = self._pending() if self.queue_enabled else None
+        except sqlite3.Error as e:
+            logger.error(f"Error reading the email queue: {e}")
+            depth = None
+        with self._lock:
+            counters = dict(self.counters)
+        return {**counters, 'queue_depth': depth, 'pool': self.pool.get_stats()}
+
+
+_email_service: Optional[EmailService] = None
+_email_service_lock = threading.Lock()
+
+
+def get_email_service() -> EmailService:
+    """Return the process-wide email service, creating it on first use"""
+    global _email_service
+    if _email_service is None:
+        with _email_service_lock:
+            if _email_service is None:
+                _email_service = EmailService()
+                atexit.register(_email_service.shutdown)
+    return _email_service
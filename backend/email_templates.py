@@ -0,0 +1,181 @@
+"""
+HTML rendering for the grocery list email
+
+Templates are f-strings, compiled with the module rather than parsed per
+render; every field is HTML-escaped and output is assembled with list
+joins. A recipe's rendered
+fragment is cached by a hash of its content, so re-sending a list where
+only a few recipes changed renders only those.
+"""
+import os
+import json
+import html
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any
+
+PAGE_HEAD = """<!DOCTYPE html>
+<html>
+<head>
+    <meta charset="utf-8">
+    <style>
+        body { font-family: Arial, sans-serif; margin: 20px; }
+        .header { background-color: #3b82f6; color: white; padding: 20px; border-radius: 8px; }
+        .section { margin: 20px 0; }
+        .item { background-color: #f8fafc; padding: 10px; margin: 5px 0; border-radius: 4px; border-left: 4px solid #3b82f6; }
+        .recipe { background-color: #fef3c7; padding: 15px; margin: 10px 0; border-radius: 8px; }
+        .priority-high { border-left-color: #ef4444; }
+        .priority-medium { border-left-color: #f59e0b; }
+        .priority-low { border-left-color: #10b981; }
+        .checked { text-decoration: line-through; opacity: 0.6; }
+        .badge { float: right; background-color: #e5e7eb; padding: 2px 8px; border-radius: 12px; font-size: 12px; }
+    </style>
+</head>
+<body>
+    <div class="header">
+        <h1>🛒 Your ChopChop Grocery List & Recipes</h1>
+        <p>Generated by your Kitchen Assistant</p>
+    </div>
+"""
+
+PAGE_FOOT = """    <div style="margin-top: 30px; padding: 15px; background-color: #f3f4f6; border-radius: 8px; text-align: center;">
+        <p>Generated by <strong>ChopChop</strong> - Your Kitchen Assistant</p>
+        <p>Visit <a href="{app_url}">ChopChop App</a> to manage your lists and discover more recipes!</p>
+    </div>
+</body>
+</html>
+"""
+
+ITEMS_OPEN = '    <div class="section">\n        <h2>🛒 Grocery List</h2>\n'
+RECIPES_OPEN = '    <div class="section">\n        <h2>👨‍🍳 Recipes</h2>\n'
+SECTION_CLOSE = '    </div>\n'
+RECIPE_CLOSE = '        </div>\n'
+
+_PRIORITIES = frozenset(('high', 'medium', 'low'))
+
+_escape = html.escape
+
+
+def _text(value: Any, default: str = '') -> str:
+    """Escape a field for HTML text or attribute context"""
+    if value is None or value == '':
+        return _escape(default)
+    return _escape(value if isinstance(value, str) else str(value))
+
+
+def render_item(item: Dict[str, Any]) -> str:
+    """Render one grocery list entry"""
+    priority = str(item.get('priority') or 'medium').lower()
+    css_priority = priority if priority in _PRIORITIES else 'medium'
+    checked = ' checked' if item.get('checked') else ''
+    return (
+        f'        <div class="item priority-{css_priority}{checked}">\n'
+        f'            <strong>{_text(item.get("item"), "Unknown Item")}</strong> '
+        f'<span class="badge">{_escape(priority.upper())}</span><br>\n'
+        f'            <small>Category: {_text(item.get("category"), "general")} | '
+        f'Needed for: {_text(item.get("needed_for"), "General use")}</small>\n'
+        f'        </div>\n'
+    )
+
+
+def render_recipe(recipe: Dict[str, Any]) -> str:
+    """Render one recipe card"""
+    parts = [
+        f'        <div class="recipe">\n'
+        f'            <h3>{_text(recipe.get("name"), "Untitled Recipe")}</h3>\n'
+        f'            <p><strong>Description:</strong> {_text(recipe.get("description"), "No description")}</p>\n'
+        f'            <p><strong>Cooking Time:</strong> {_text(recipe.get("cooking_time"), "Not specified")} | '
+        f'<strong>Difficulty:</strong> {_text(recipe.get("difficulty"), "Not specified")} | '
+        f'<strong>Servings:</strong> {_text(recipe.get("servings"), "Not specified")}</p>\n'
+    ]
+    ingredients = recipe.get('ingredients_needed')
+    if ingredients:
+        parts.append('            <p><strong>Ingredients:</strong></p><ul>')
+        for ingredient in ingredients:
+            if not isinstance(ingredient, dict):
+                ingredient = {'name': ingredient}
+            available = '✅' if ingredient.get('available') else '❌'
+            parts.append(f'<li>{available} {_text(ingredient.get("amount"))} {_text(ingredient.get("name"))}</li>')
+        parts.append('</ul>\n')
+    instructions = recipe.get('instructions')
+    if instructions:
+        parts.append('            <p><strong>Instructions:</strong></p><ol>')
+        parts.extend([f'<li>{_text(step)}</li>' for step in instructions])
+        parts.append('</ol>\n')
+    if recipe.get('tips'):
+        parts.append(f'            <p><strong>Tips:</strong> {_text(recipe["tips"])}</p>\n')
+    parts.append(RECIPE_CLOSE)
+    return ''.join(parts)
+
+
+class FragmentCache:
+    """Thread-safe LRU of rendered fragments keyed by content hash"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[bytes, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(value: Any) -> bytes:
+        """
+        Content hash of a JSON-like value
+
+        pickle serializes several times faster than json.dumps. Equal values
+        can pickle differently (dict order, shared objects), which only costs
+        a cache miss; different values never pickle the same.
+        """
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            payload = json.dumps(value, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def get_or_render(self, value: Any, render) -> str:
+        if self.max_entries <= 0:
+            return render(value)
+        key = self.key(value)
+        with self._lock:
+            fragment = self._entries.get(key)
+            if fragment is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return fragment
+            self.misses += 1
+        fragment = render(value)
+        with self._lock:
+            self._entries[key] = fragment
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return fragment
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+recipe_fragments = FragmentCache(int(os.getenv('EMAIL_FRAGMENT_CACHE_SIZE', '512')))
+
+
+def render_grocery_email(items: List[Dict[str, Any]], recipes: List[Dict[str, Any]]) -> str:
+    """Render the grocery list and recipes email as an HTML document"""
+    parts = [PAGE_HEAD]
+    if items:
+        parts.append(ITEMS_OPEN)
+        parts.extend([render_item(item) for item in items if isinstance(item, dict)])
+        parts.append(SECTION_CLOSE)
+    if recipes:
+        parts.append(RECIPES_OPEN)
+        parts.extend(recipe_fragments.get_or_render(recipe, render_recipe) for recipe in recipes if isinstance(recipe, dict))
+        parts.append(SECTION_CLOSE)
+    parts.append(PAGE_FOOT.format(app_url=_escape(os.getenv('APP_URL', 'http://localhost:3000'))))
+    return ''.join(parts)
@@ -0,0 +1,155 @@
+"""
+In-process stand-in for the Bedrock runtime client, for load tests
+
+FakeBedrockRuntime.converse() answers the way Amazon Nova does for the
+calls nova_backend makes, after a realistic delay: a time to first token
+(log-normal around first_token_ms) plus ms_per_token for each output
+token. Output lengths are drawn per call kind from a normal distribution
+and capped at the request's maxTokens:
+
+    bedrock = FakeBedrockRuntime(tokens={'chat': TokenDistribution(250, 80)}, error_rate=0.01)
+    nova_backend.get_bedrock_client = lambda: bedrock
+
+A call carrying an image is a fridge analysis and gets the structured JSON
+the fridge prompt asks for; other calls get plain text. With error_rate
+set, that share of calls fails with a ThrottlingException ClientError, as
+Bedrock does when over quota.
+"""
+import json
+import math
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Output tokens per call kind: a short chat answer, a fridge analysis with recipes
+DEFAULT_TOKENS = {'chat': (250, 80), 'fridge': (1400, 300)}
+# Nova bills an image at roughly this many input tokens
+IMAGE_INPUT_TOKENS = 1300
+CHARS_PER_TOKEN = 4
+
+_WORDS = ('simmer', 'garlic', 'until', 'golden', 'then', 'add', 'the', 'tomatoes', 'and', 'season', 'with',
+          'salt', 'stir', 'in', 'spinach', 'serve', 'over', 'rice', 'a', 'squeeze', 'of', 'lime')
+_INGREDIENTS = ('eggs', 'milk', 'spinach', 'cheddar', 'tomatoes', 'chicken thighs', 'yogurt', 'butter', 'carrots',
+                'bell pepper', 'onion', 'lemons', 'tofu', 'feta', 'mushrooms', 'leftover rice')
+
+
+class TokenDistribution:
+    """Normal(mean, stddev) output length, at least one token"""
+
+    def __init__(self, mean: float, stddev: float = 0.0):
+        self.mean = mean
+        self.stddev = stddev
+
+    @classmethod
+    def parse(cls, text: str) -> 'TokenDistribution':
+        """'250:80' (mean:stddev) or '250'"""
+        mean, _, stddev = text.partition(':')
+        return cls(float(mean), float(stddev or 0))
+
+    def sample(self, rng: random.Random) -> int:
+        return max(1, round(rng.gauss(self.mean, self.stddev) if self.stddev else self.mean))
+
+    def __repr__(self):
+        return f"{self.mean:g}:{self.stddev:g}"
+
+
+class FakeBedrockRuntime:
+    """
+    Thread-safe replacement for a bedrock-runtime client's converse()
+
+    Attributes:
+        calls: Calls per kind ('chat', 'fridge')
+        errors: Calls that raised an injected error
+        output_tokens: Total output tokens returned
+    """
+
+    def __init__(self, first_token_ms: float = 600.0, first_token_sigma: float = 0.3, ms_per_token: float = 12.0,
+                 tokens: Optional[Dict[str, TokenDistribution]] = None, error_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.first_token_ms = first_token_ms
+        self.first_token_sigma = first_token_sigma
+        self.ms_per_token = ms_per_token
+        self.tokens = {kind: TokenDistribution(*spec) for kind, spec in DEFAULT_TOKENS.items()}
+        self.tokens.update(tokens or {})
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls: Dict[str, int] = {kind: 0 for kind in self.tokens}
+        self.errors = 0
+        self.output_tokens = 0
+
+    def converse(self, modelId: str, messages: List[Dict[str, Any]], inferenceConfig: Optional[Dict[str, Any]] = None,
+                 **_kwargs) -> Dict[str, Any]:
+        content = [block for message in messages for block in message.get('content', [])]
+        kind = 'fridge' if any('image' in block for block in content) else 'chat'
+        prompt_chars = sum(len(block.get('text', '')) for block in content)
+        input_tokens = prompt_chars // CHARS_PER_TOKEN + IMAGE_INPUT_TOKENS * sum('image' in b for b in content)
+        max_tokens = (inferenceConfig or {}).get('maxTokens', 4096)
+        with self.lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            throttled = self._rng.random() < self.error_rate
+            output_tokens = min(max_tokens, self.tokens[kind].sample(self._rng))
+            first_token = self.first_token_ms * math.exp(self._rng.gauss(0.0, self.first_token_sigma))
+            seed = self._rng.random()
+        if throttled:
+            time.sleep(first_token / 4000)
+            with self.lock:
+                self.errors += 1
+            from botocore.exceptions import ClientError
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests'},
+                               'ResponseMetadata': {'HTTPStatusCode': 429}}, 'Converse')
+        latency_ms = first_token + output_tokens * self.ms_per_token
+        time.sleep(latency_ms / 1000)
+        text = fridge_analysis(output_tokens, seed) if kind == 'fridge' else prose(output_tokens, seed)
+        with self.lock:
+            self.output_tokens += output_tokens
+        return {
+            'output': {'message': {'role': 'assistant', 'content': [{'text': text}]}},
+            'stopReason': 'max_tokens' if output_tokens == max_tokens else 'end_turn',
+            'usage': {'inputTokens': input_tokens, 'outputTokens': output_tokens,
+                      'totalTokens': input_tokens + output_tokens},
+            'metrics': {'latencyMs': round(latency_ms)},
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'calls': dict(self.calls), 'errors': self.errors, 'output_tokens': self.output_tokens}
+
+
+def prose(tokens: int, seed: float = 0.0) -> str:
+    """About `tokens` tokens of recipe-like text"""
+    rng = random.Random(seed)
+    words, chars = [], 0
+    while chars < tokens * CHARS_PER_TOKEN:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        chars += len(word) + 1
+    return ' '.join(words).capitalize() + '.'
+
+
+def fridge_analysis(tokens: int, seed: float = 0.0) -> str:
+    """The fridge prompt's JSON (ingredients, grocery list, recipes) at about `tokens` tokens"""
+    rng = random.Random(seed)
+    ingredients = [{'name': name, 'quantity': f"{rng.randint(1, 6)}", 'category': 'produce',
+                    'freshness': rng.choice(['fresh', 'good', 'needs_use_soon'])}
+                   for name in rng.sample(_INGREDIENTS, 8)]
+    analysis = {'ingredients': ingredients, 'grocery_list': [
+        {'item': name, 'category': 'pantry', 'needed_for': 'general use', 'priority': 'medium', 'checked': False}
+        for name in rng.sample(_INGREDIENTS, 4)], 'recipes': []}
+    budget = tokens * CHARS_PER_TOKEN - len(json.dumps(analysis))
+    while budget > 0 or not analysis['recipes']:
+        recipe = {
+            'name': f"{rng.choice(_INGREDIENTS).title()} skillet",
+            'description': prose(20, rng.random()),
+            'cooking_time': f"{rng.randint(10, 45)} minutes",
+            'difficulty': rng.choice(['Easy', 'Medium']),
+            'servings': f"{rng.randint(1, 4)} servings",
+            'ingredients_needed': [{'name': i['name'], 'amount': i['quantity'], 'available': True}
+                                   for i in ingredients[:4]],
+            'instructions': [f"Step {n}: {prose(15, rng.random())}" for n in range(1, 6)],
+            'tips': prose(15, rng.random()),
+        }
+        analysis['recipes'].append(recipe)
+        budget -= len(json.dumps(recipe))
+    return 'Here is the analysis of your fridge:\n' + json.dumps(analysis, indent=2)
@@ -0,0 +1,123 @@
+"""
+Local SMTP stand-in for tests and benchmarks
+
+A threaded, plaintext SMTP server that accepts EHLO/HELO, MAIL, RCPT, DATA,
+RSET, NOOP and QUIT, records every message and counts sessions, so email
+code can be exercised without a real mail server:
+
+    server = FakeSmtpServer()
+    server.start()
+    # SMTP_HOST=127.0.0.1 SMTP_PORT=<server.port> SMTP_STARTTLS=false
+    ...
+    server.stop()
+"""
+import socketserver
+import threading
+from email import message_from_bytes
+from typing import Any, Dict, List, Optional
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    server: '_SmtpTCPServer'
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode('ascii'))
+
+    def handle(self):
+        fake = self.server.fake
+        with fake.lock:
+            fake.sessions += 1
+        self.reply("220 fake-smtp ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode('utf-8', 'replace').strip()
+            verb = command.split(' ', 1)[0].upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply("250-fake-smtp")
+                self.reply("250 8BITMIME")
+            elif verb == 'NOOP':
+                self.reply("250 OK")
+            elif verb == 'RSET':
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == 'MAIL':
+                sender = command.split(':', 1)[1].strip().split(' ')[0].strip('<>')
+                self.reply("250 OK")
+            elif verb == 'RCPT':
+                recipient = command.split(':', 1)[1].strip().strip('<>')
+                code = fake.reject.get(recipient)
+                if code:
+                    self.reply(f"{code} Recipient rejected")
+                else:
+                    recipients.append(recipient)
+                    self.reply("250 OK")
+            elif verb == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = bytearray()
+                while True:
+                    chunk = self.rfile.readline()
+                    if not chunk or chunk in (b'.\r\n', b'.\n'):
+                        break
+                    data.extend(chunk[1:] if chunk.startswith(b'..') else chunk)
+                with fake.lock:
+                    failure = fake.fail_next.pop(0) if fake.fail_next else None
+                    if not failure:
+                        fake.messages.append({
+                            'from': sender, 'to': list(recipients), 'message': message_from_bytes(bytes(data))
+                        })
+                if failure:
+                    self.reply(f"{failure} Try again later")
+                else:
+                    self.reply("250 OK queued")
+                sender, recipients = None, []
+            elif verb == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class _SmtpTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    fake: 'FakeSmtpServer'
+
+
+class FakeSmtpServer:
+    """
+    Attributes:
+        messages: Delivered messages as {'from', 'to', 'message'} dicts
+        sessions: Number of SMTP connections accepted
+        reject: Recipient -> SMTP code to refuse RCPT with (e.g. 550)
+        fail_next: SMTP codes to answer the next DATA commands with (e.g. [451])
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.messages: List[Dict[str, Any]] = []
+        self.sessions = 0
+        self.reject: Dict[str, int] = {}
+        self.fail_next: List[int] = []
+        self.lock = threading.Lock()
+        self._server = _SmtpTCPServer((host, port), _SmtpHandler)
+        self._server.fake = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> 'FakeSmtpServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-smtp', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,217 @@
+"""
+In-memory stand-in for the supabase-py client used by tests and local benchmarks
+
+Implements the subset of the PostgREST query builder that SupabaseManager
+uses (select with column projection and JSON paths, eq, gt, in_, order,
+limit, update, insert, upsert) and counts the bytes each query would have returned over the wire.
+An optional per-query latency stands in for the network round trip.
+"""
+import copy
+import json
+import re
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+# Column defaults applied when a Users row is inserted
+USERS_DEFAULTS = {
+    'items': [],
+    'recipes': [],
+    'grocery_list': [],
+    'recent_recipes': [],
+    'chat_history': [],
+    'data_version': 0,
+}
+
+_JSON_PATH_RE = re.compile(r'(->>?)(-?\d+|[A-Za-z_][A-Za-z0-9_]*)')
+
+
+def bump_data_version(old: Dict[str, Any], new: Dict[str, Any]):
+    """Mirror of the users_bump_data_version trigger in add_users_data_version.sql"""
+    if new.get('items') != old.get('items') or new.get('recipes') != old.get('recipes'):
+        new['data_version'] = old.get('data_version', 0) + 1
+
+
+class FakeResponse:
+    """Mimics postgrest's APIResponse"""
+
+    def __init__(self, data: List[Dict[str, Any]]):
+        self.data = data
+        self.count = None
+
+
+class FakeQuery:
+    """Chainable query builder over one in-memory table"""
+
+    def __init__(self, client: 'FakeSupabaseClient', table_name: str):
+        self.client = client
+        self.table_name = table_name
+        self.method = 'select'
+        self.columns = '*'
+        self.payload: Any = None
+        self.on_conflict = ''
+        self.filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self.ordering: List[tuple] = []
+        self.row_limit: Optional[int] = None
+
+    # ---- verbs ----------------------------------------------------------
+    def select(self, *columns: str, **_kwargs):
+        self.columns = ','.join(columns) if columns else '*'
+        return self
+
+    def insert(self, json_data: Any, **_kwargs):
+        self.method = 'insert'
+        self.payload = json_data
+        return self
+
+    def update(self, json_data: Dict[str, Any], **_kwargs):
+        self.method = 'update'
+        self.payload = json_data
+        return self
+
+    def upsert(self, json_data: Any, on_conflict: str = '', **_kwargs):
+        self.method = 'upsert'
+        self.payload = json_data
+        self.on_conflict = on_conflict
+        return self
+
+    # ---- filters --------------------------------------------------------
+    def eq(self, column: str, value: Any):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gt(self, column: str, value: Any):
+        self.filters.append(lambda row: row.get(column) is not None and row.get(column) > value)
+        return self
+
+    def in_(self, column: str, values: List[Any]):
+        values = list(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    # ---- modifiers ------------------------------------------------------
+    def order(self, column: str, desc: bool = False, **_kwargs):
+        self.ordering.append((column, desc))
+        return self
+
+    def limit(self, size: int, **_kwargs):
+        self.row_limit = size
+        return self
+
+    # ---- execution ------------------------------------------------------
+    def execute(self) -> FakeResponse:
+        if self.client.latency:
+            time.sleep(self.client.latency)
+        with self.client.lock:
+            self.client.round_trips += 1
+            rows = self.client.tables.setdefault(self.table_name, [])
+            if self.method == 'select':
+                affected = [row for row in rows if all(f(row) for f in self.filters)]
+                for column, desc in reversed(self.ordering):
+                    affected.sort(key=lambda row: row.get(column), reverse=desc)
+                if self.row_limit is not None:
+                    affected = affected[:self.row_limit]
+            elif self.method == 'update':
+                affected = []
+                for row in rows:
+                    if all(f(row) for f in self.filters):
+                        self._write(row, self.payload)
+                        affected.append(row)
+            elif self.method == 'insert':
+                affected = [self._insert(rows, record) for record in self._records()]
+            else:
+                affected = [self._upsert(rows, record) for record in self._records()]
+            data = [self.client.project(row, self.columns) for row in affected]
+            self.client.record_bytes(data)
+            return FakeResponse(data)
+
+    def _records(self) -> List[Dict[str, Any]]:
+        return self.payload if isinstance(self.payload, list) else [self.payload]
+
+    def _insert(self, rows: List[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+        row = copy.deepcopy(self.client.defaults.get(self.table_name, {}))
+        row['id'] = str(uuid.uuid4())
+        row.update(copy.deepcopy(record))
+        rows.append(row)
+        return row
+
+    def _upsert(self, rows: List[Dict[str, Any]], record: Dict[str, Any]) -> Dict[str, Any]:
+        keys = [key.strip() for key in self.on_conflict.split(',') if key.strip()] or ['id']
+        for row in rows:
+            if all(row.get(key) == record.get(key) for key in keys):
+                self._write(row, record)
+                return row
+        return self._insert(rows, record)
+
+    def _write(self, row: Dict[str, Any], values: Dict[str, Any]):
+        new = dict(row)
+        new.update(copy.deepcopy(values))
+        trigger = self.client.triggers.get(self.table_name)
+        if trigger:
+            trigger(row, new)
+        row.clear()
+        row.update(new)
+
+
+class FakeSupabaseClient:
+    """
+    Thread-safe in-memory replacement for supabase.Client
+
+    Attributes:
+        tables: Table name -> list of row dicts
+        bytes_fetched: Total JSON bytes returned by every executed query
+        round_trips: Number of executed queries
+        latency: Seconds each query sleeps before running, outside the lock
+    """
+
+    def __init__(self, defaults: Optional[Dict[str, Dict[str, Any]]] = None,
+                 triggers: Optional[Dict[str, Callable]] = None, latency: float = 0.0):
+        self.tables: Dict[str, List[Dict[str, Any]]] = {}
+        self.defaults = defaults if defaults is not None else {'Users': USERS_DEFAULTS}
+        self.triggers = triggers if triggers is not None else {'Users': bump_data_version}
+        self.lock = threading.RLock()
+        self.bytes_fetched = 0
+        self.round_trips = 0
+        self.latency = latency
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def reset_counters(self):
+        with self.lock:
+            self.bytes_fetched = 0
+            self.round_trips = 0
+
+    def record_bytes(self, data: List[Dict[str, Any]]):
+        self.bytes_fetched += len(json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def project(row: Dict[str, Any], columns: str) -> Dict[str, Any]:
+        """Apply a PostgREST select list (aliases and ->/->> JSON paths) to a row"""
+        result: Dict[str, Any] = {}
+        for column in [c.strip() for c in columns.split(',') if c.strip()]:
+            if column == '*':
+                result.update(copy.deepcopy(row))
+                continue
+            alias = None
+            if ':' in column:
+                alias, column = column.split(':', 1)
+            base = re.split(r'->', column, maxsplit=1)[0]
+            value = row.get(base)
+            name = base
+            as_text = False
+            for arrow, key in _JSON_PATH_RE.findall(column[len(base):]):
+                name = key
+                as_text = arrow == '->>'
+                if isinstance(value, list) and re.fullmatch(r'-?\d+', key):
+                    index = int(key)
+                    value = value[index] if -len(value) <= index < len(value) else None
+                elif isinstance(value, dict):
+                    value = value.get(key)
+                else:
+                    value = None
+            if as_text and value is not None and not isinstance(value, str):
+                value = json.dumps(value)
+            result[alias or name] = copy.deepcopy(value)
+        return result
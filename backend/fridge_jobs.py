@@ -0,0 +1,478 @@
+"""
+Background fridge analysis jobs
+
+A fridge analysis takes 10-30 s on Bedrock, longer than some proxies keep
+a quiet connection open. POST /chat/jobs therefore stores the photo as a
+job and returns its id at once; a bounded pool of threads in each worker
+(FRIDGE_JOB_WORKERS) preprocesses the photo and calls the model, and the
+client polls GET /chat/jobs/<id> or follows /chat/jobs/<id>/events (SSE).
+
+Jobs live in a WAL-mode SQLite file (FRIDGE_JOBS_SQLITE_PATH) that every
+worker on the host opens, so any worker can report any job and jobs
+survive restarts. A worker claims the oldest queued job with a lease
+(FRIDGE_JOB_LEASE_SECONDS); a job whose worker died is claimed again when
+its lease runs out, and a worker exiting cleanly hands its running jobs
+back at once. Failed attempts are retried with exponential backoff up to
+FRIDGE_JOB_MAX_ATTEMPTS; a refused model call (fair-share limits) waits
+its Retry-After without using up an attempt.
+
+A photo the same user already submitted (same SHA-256 of the image
+bytes), whose job is queued, running or finished successfully within
+FRIDGE_JOB_TTL_SECONDS, returns that job instead of a new one. Finished
+jobs drop their photo at once and are deleted after the TTL.
+
+Submissions are refused with a retry-after hint when FRIDGE_JOB_MAX_QUEUED
+jobs are waiting (503) or the user already has FRIDGE_JOB_MAX_PER_USER
+unfinished jobs (429). If the job file cannot be opened at startup, jobs
+are disabled with a logged error and every submission gets 503.
+"""
+import os
+import math
+import json
+import time
+import uuid
+import atexit
+import base64
+import sqlite3
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from metrics import FRIDGE_JOBS, FRIDGE_JOB_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fridge_jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    email TEXT,
+    image_hash TEXT NOT NULL,
+    message TEXT NOT NULL,
+    image_base64 TEXT,
+    image_format TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 1,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    run_after REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_owner TEXT,
+    lease_expires_at REAL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_fridge_jobs_claim ON fridge_jobs(status, run_after, created_at);
+CREATE INDEX IF NOT EXISTS idx_fridge_jobs_owner ON fridge_jobs(owner, image_hash, created_at);
+"""
+JOB_COLUMNS = 'id, owner, email, message, image_format, status, attempts, version, result, error, created_at, ' \
+              'started_at, finished_at'
+INSERT_JOB = """
+    INSERT INTO fridge_jobs (id, owner, email, image_hash, message, image_base64, image_format, status,
+                             created_at, run_after)
+    VALUES (?, ?, ?, ?, ?, ?, ?, 'queued', ?, ?)
+"""
+SELECT_JOB = f"SELECT {JOB_COLUMNS} FROM fridge_jobs WHERE id = ?"
+SELECT_DUPLICATE = f"""
+    SELECT {JOB_COLUMNS} FROM fridge_jobs
+    WHERE owner = ? AND image_hash = ? AND status IN ('queued', 'running', 'succeeded') AND created_at > ?
+    ORDER BY created_at DESC LIMIT 1
+"""
+COUNT_QUEUED = "SELECT COUNT(*) FROM fridge_jobs WHERE status = 'queued'"
+COUNT_OWNER_ACTIVE = "SELECT COUNT(*) FROM fridge_jobs WHERE owner = ? AND status IN ('queued', 'running')"
+COUNT_BY_STATUS = "SELECT status, COUNT(*) FROM fridge_jobs GROUP BY status"
+# One statement, so two workers can never claim the same job
+CLAIM_JOB = """
+    UPDATE fridge_jobs
+    SET status = 'running', attempts = attempts + 1, version = version + 1, started_at = ?,
+        lease_owner = ?, lease_expires_at = ?
+    WHERE id = (
+        SELECT id FROM fridge_jobs
+        WHERE (status = 'queued' AND run_after <= ?) OR (status = 'running' AND lease_expires_at <= ?)
+        ORDER BY created_at LIMIT 1
+    )
+    RETURNING id, owner, email, message, image_base64, image_format, attempts, created_at
+"""
+FINISH_JOB = """
+    UPDATE fridge_jobs
+    SET status = ?, result = ?, error = ?, finished_at = ?, version = version + 1, image_base64 = NULL,
+        lease_owner = NULL, lease_expires_at = NULL
+    WHERE id = ? AND lease_owner = ?
+"""
+REQUEUE_JOB = """
+    UPDATE fridge_jobs
+    SET status = 'queued', run_after = ?, error = ?, attempts = attempts - ?, version = version + 1,
+        lease_owner = NULL, lease_expires_at = NULL
+    WHERE id = ? AND lease_owner = ?
+"""
+RELEASE_JOBS = """
+    UPDATE fridge_jobs
+    SET status = 'queued', attempts = attempts - 1, version = version + 1, lease_owner = NULL, lease_expires_at = NULL
+    WHERE status = 'running' AND lease_owner = ?
+"""
+SWEEP_JOBS = "DELETE FROM fridge_jobs WHERE status IN ('succeeded', 'failed') AND finished_at <= ?"
+
+FINISHED = ('succeeded', 'failed')
+SWEEP_INTERVAL = 60.0
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class JobSettings:
+    """Fridge job configuration, read from environment variables"""
+
+    def __init__(self):
+        self.path = os.getenv('FRIDGE_JOBS_SQLITE_PATH', 'fridge_jobs.sqlite3')
+        self.workers = _env_int('FRIDGE_JOB_WORKERS', 2)
+        self.max_queued = _env_int('FRIDGE_JOB_MAX_QUEUED', 100)
+        self.max_per_user = _env_int('FRIDGE_JOB_MAX_PER_USER', 3)
+        self.max_attempts = _env_int('FRIDGE_JOB_MAX_ATTEMPTS', 3)
+        self.lease_seconds = _env_float('FRIDGE_JOB_LEASE_SECONDS', 300.0)
+        self.retry_backoff = _env_float('FRIDGE_JOB_RETRY_BACKOFF', 5.0)
+        self.poll_seconds = _env_float('FRIDGE_JOB_POLL_SECONDS', 1.0)
+        self.ttl_seconds = _env_float('FRIDGE_JOB_TTL_SECONDS', 86400.0)
+        # SSE streams hold a request thread each; past the cap clients poll
+        self.max_streams = _env_int('FRIDGE_JOB_MAX_STREAMS', 4)
+        self.stream_seconds = _env_float('FRIDGE_JOB_STREAM_SECONDS', 55.0)
+        self.busy_timeout_ms = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+
+
+class JobRejected(Exception):
+    """A submission was refused; status is the HTTP status, retry_after whole seconds"""
+
+    def __init__(self, reason: str, retry_after: float, status: int = 503):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.status = status
+
+
+class JobFailed(Exception):
+    """Raised by a job runner for a failure that retrying cannot fix (e.g. an unreadable photo)"""
+
+
+class JobDeferred(Exception):
+    """Raised by a job runner to run the job again after retry_after seconds, without using an attempt"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+
+def image_hash(image_base64: str) -> str:
+    """SHA-256 of the decoded photo, so the same image deduplicates however it was encoded; ValueError if invalid"""
+    try:
+        data = base64.b64decode(image_base64, validate=True)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"imageBase64 is not valid base64: {e}")
+    return hashlib.sha256(data).hexdigest()
+
+
+class FridgeJobQueue:
+    """
+    Persistent queue of fridge analysis jobs and the worker threads that run them
+
+    runner(job) gets {'id', 'owner', 'email', 'message', 'image_base64',
+    'image_format', 'attempts'} and returns the JSON-serializable result,
+    or raises JobFailed, JobDeferred or any exception (retried).
+    """
+
+    def __init__(self, runner: Callable[[Dict[str, Any]], Any], settings: Optional[JobSettings] = None):
+        self.runner = runner
+        self.settings = settings or JobSettings()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition()
+        self._workers: List[threading.Thread] = []
+        self._workers_pid: Optional[int] = None
+        self._lease_owner: Optional[str] = None
+        self._last_sweep = 0.0
+        self._streams = 0
+        # Smoothed seconds per job, for the retry-after hint when the queue is full
+        self._run_seconds = 20.0
+        self.counters = {'submitted': 0, 'deduplicated': 0, 'rejected': 0, 'succeeded': 0, 'failed': 0,
+                         'retried': 0, 'deferred': 0, 'released': 0}
+        self._enabled: Optional[bool] = None
+        self._open_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """Whether the job database is usable; the file is opened on first use, not when the app is imported"""
+        if self._enabled is None:
+            with self._open_lock:
+                if self._enabled is None:
+                    try:
+                        self._connection().executescript(JOB_SCHEMA)
+                        self._enabled = True
+                    except sqlite3.Error as e:
+                        logger.error(f"Fridge jobs disabled: cannot open {self.settings.path}: {e}")
+                        self._enabled = False
+        return self._enabled
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use (and after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.settings.path, timeout=self.settings.busy_timeout_ms / 1000,
+                               isolation_level=None, check_same_thread=True)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {self.settings.busy_timeout_ms}")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _view(row: Tuple) -> Dict[str, Any]:
+        (job_id, _owner, _email, message, image_format, status, attempts, version, result, error, created_at,
+         started_at, finished_at) = row
+        job = {'id': job_id, 'status': status, 'message': message, 'attempts': attempts, 'version': version,
+               'created_at': created_at, 'started_at': started_at, 'finished_at': finished_at}
+        if status == 'succeeded':
+            job['result'] = json.loads(result)
+        elif error:
+            job['error'] = error
+        return job
+
+    # ------------------------------------------------------------------
+    # Submitting and reading jobs
+    # ------------------------------------------------------------------
+    def submit(self, owner: str, message: str, image_base64: str, image_format: Optional[str] = None,
+               email: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a fridge photo, or find the same photo's job from this owner
+
+        Returns:
+            (job, created); created is False for a deduplicated submission
+        Raises:
+            ValueError for a photo that is not base64, JobRejected when over a limit
+        """
+        digest = image_hash(image_base64)
+        if not self.enabled:
+            raise JobRejected("Fridge analysis jobs are unavailable", self.settings.retry_backoff)
+        now = time.time()
+        with self._transaction() as conn:
+            duplicate = conn.execute(SELECT_DUPLICATE, (owner, digest, now - self.settings.ttl_seconds)).fetchone()
+            if duplicate is not None:
+                self._count('deduplicated')
+                return self._view(duplicate), False
+            queued = conn.execute(COUNT_QUEUED).fetchone()[0]
+            if queued >= self.settings.max_queued:
+                self._count('rejected')
+                raise JobRejected("Too many fridge analyses are waiting",
+                                  queued * self._run_seconds / max(1, self.settings.workers))
+            if conn.execute(COUNT_OWNER_ACTIVE, (owner,)).fetchone()[0] >= self.settings.max_per_user:
+                self._count('rejected')
+                raise JobRejected("Too many unfinished fridge analyses for this user", self._run_seconds, 429)
+            job_id = uuid.uuid4().hex
+            conn.execute(INSERT_JOB, (job_id, owner, email, digest, message, image_base64, image_format, now, now))
+            row = conn.execute(SELECT_JOB, (job_id,)).fetchone()
+        self._count('submitted')
+        self.ensure_workers()
+        self._notify()
+        return self._view(row), True
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """The job's status (and result or error once finished), or None if unknown or expired"""
+        if not self.enabled:
+            return None
+        try:
+            row = self._connection().execute(SELECT_JOB, (job_id,)).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading fridge job {job_id}: {e}")
+            return None
+        return self._view(row) if row else None
+
+    def wait_for_change(self, job_id: str, version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        The job once its version differs from `version`, or as it is after
+        `timeout` seconds. Wakes at once for changes made in this process and
+        polls for changes made by other workers.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            remaining = deadline - time.monotonic()
+            if job is None or job['version'] != version or remaining <= 0:
+                return job
+            with self._changed:
+                self._changed.wait(min(remaining, self.settings.poll_seconds))
+
+    def open_stream(self) -> bool:
+        """Take one of max_streams SSE slots; False when none is free. Pair with close_stream()"""
+        with self._lock:
+            if self._streams >= self.settings.max_streams:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._lock:
+            self._streams -= 1
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    def ensure_workers(self):
+        """Start this process's worker threads (cheap when running); also picks up jobs left by a restart"""
+        if not self.enabled:
+            return
+        if self._workers_pid == os.getpid() and all(t.is_alive() for t in self._workers):
+            return
+        with self._lock:
+            # Threads do not survive fork; a gunicorn worker starts its own
+            if self._workers_pid == os.getpid() and all(t.is_alive() for t in self._workers):
+                return
+            if self._workers_pid != os.getpid():
+                self._lease_owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+                atexit.register(self.release)
+            self._workers = []
+            for i in range(max(1, self.settings.workers)):
+                thread = threading.Thread(target=self._worker, name=f'fridge-job-{i}', daemon=True)
+                thread.start()
+                self._workers.append(thread)
+            self._workers_pid = os.getpid()
+
+    def _worker(self):
+        while True:
+            try:
+                self._maybe_sweep()
+                job = self._claim()
+            except sqlite3.Error as e:
+                logger.error(f"Error claiming a fridge job: {e}")
+                job = None
+            if job is None:
+                with self._changed:
+                    self._changed.wait(self.settings.poll_seconds)
+                continue
+            self._execute(job)
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        row = self._connection().execute(
+            CLAIM_JOB, (now, self._lease_owner, now + self.settings.lease_seconds, now, now)).fetchone()
+        if row is None:
+            return None
+        keys = ('id', 'owner', 'email', 'message', 'image_base64', 'image_format', 'attempts', 'created_at')
+        return dict(zip(keys, row))
+
+    def _execute(self, job: Dict[str, Any]):
+        if job['attempts'] == 1:
+            FRIDGE_JOB_WAIT_SECONDS.observe(time.time() - job['created_at'])
+        elif job['attempts'] > self.settings.max_attempts:
+            # Claimed again after its lease ran out: the worker running it died each time
+            self._finish(job, 'failed', error='The job was interrupted too many times')
+            return
+        self._notify()
+        started = time.monotonic()
+        try:
+            result = self.runner(job)
+        except JobFailed as e:
+            self._finish(job, 'failed', error=str(e))
+        except JobDeferred as e:
+            self._count('deferred')
+            self._requeue(job, e.retry_after, str(e), refund=True)
+        except Exception as e:
+            if job['attempts'] < self.settings.max_attempts:
+                delay = self.settings.retry_backoff * (2 ** (job['attempts'] - 1))
+                logger.warning(f"Fridge job {job['id']} attempt {job['attempts']} failed ({e}); retrying in {delay:.0f}s")
+                self._count('retried')
+                self._requeue(job, delay, str(e))
+            else:
+                logger.error(f"Fridge job {job['id']} failed permanently: {e}")
+                self._finish(job, 'failed', error=str(e))
+        else:
+            with self._lock:
+                self._run_seconds = 0.8 * self._run_seconds + 0.2 * (time.monotonic() - started)
+            self._finish(job, 'succeeded', result=result)
+
+    def _finish(self, job: Dict[str, Any], status: str, result: Any = None, error: Optional[str] = None):
+        encoded = json.dumps(result) if status == 'succeeded' else None
+        try:
+            updated = self._connection().execute(
+                FINISH_JOB, (status, encoded, error, time.time(), job['id'], self._lease_owner)).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error finishing fridge job {job['id']}: {e}")
+            return
+        if not updated:
+            # The lease ran out and another worker took the job over; its outcome stands
+            logger.warning(f"Fridge job {job['id']} finished after losing its lease; result dropped")
+            return
+        self._count(status)
+        FRIDGE_JOBS.inc(outcome=status)
+        self._notify()
+
+    def _requeue(self, job: Dict[str, Any], delay: float, error: str, refund: bool = False):
+        try:
+            self._connection().execute(REQUEUE_JOB, (time.time() + delay, error, int(refund), job['id'],
+                                                     self._lease_owner))
+        except sqlite3.Error as e:
+            logger.error(f"Error requeueing fridge job {job['id']}: {e}")
+        self._notify()
+
+    def release(self) -> int:
+        """Hand this process's running jobs back to the queue (at exit), so another worker resumes them now"""
+        if self._lease_owner is None or self._workers_pid != os.getpid():
+            return 0
+        try:
+            released = self._connection().execute(RELEASE_JOBS, (self._lease_owner,)).rowcount
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing fridge jobs: {e}")
+            return 0
+        if released:
+            with self._lock:
+                self.counters['released'] += released
+            logger.info(f"Returned {released} running fridge jobs to the queue")
+        return released
+
+    def _maybe_sweep(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_sweep < SWEEP_INTERVAL:
+                return
+            self._last_sweep = now
+        self._connection().execute(SWEEP_JOBS, (now - self.settings.ttl_seconds,))
+
+    def _notify(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+        if key in ('submitted', 'deduplicated', 'rejected', 'retried', 'deferred'):
+            FRIDGE_JOBS.inc(outcome=key)
+
+    def get_stats(self) -> Dict[str, Any]:
+        jobs = None
+        if self.enabled:
+            try:
+                jobs = dict(self._connection().execute(COUNT_BY_STATUS).fetchall())
+            except sqlite3.Error as e:
+                logger.error(f"Error counting fridge jobs: {e}")
+        with self._lock:
+            return {**self.counters, 'enabled': self.enabled, 'jobs': jobs, 'workers': self.settings.workers, 'streams': self._streams,
+                    'avg_run_seconds': round(self._run_seconds, 2)}
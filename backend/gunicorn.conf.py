@@ -0,0 +1,174 @@
+"""
+Gunicorn configuration for the ChopChop backend
+
+    gunicorn -c gunicorn.conf.py nova_backend:app
+
+The app is preloaded: imports (boto3, Pillow, supabase), prompt templates
+and configuration are done once in the master and shared copy-on-write by
+the forked workers. Network clients cannot be shared across fork, so
+post_fork rebuilds the Bedrock and Supabase clients in each worker (the
+SMTP pool, SQLite connections and background threads already rebuild
+themselves on first use in a new process).
+
+The app itself imports boto3, Pillow and supabase lazily, so the master
+is listening sooner; with preload the master then imports them before the
+first fork (GUNICORN_WARM_IMPORTS, default on) so workers still share
+them instead of each paying for its own copy on first use.
+
+Workers share a METRICS_DIR (a fresh directory on /dev/shm unless set)
+where each writes its Prometheus metrics, so /metrics on any worker
+reports the whole server; child_exit keeps an exited worker's totals.
+
+Workers and threads are sized from the CPU and memory actually available
+to the container (cgroup limits, then the host). Every setting can be
+overridden with a GUNICORN_* environment variable; see the README for
+measured throughput.
+"""
+import gc
+import math
+import os
+import shutil
+import sys
+import tempfile
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _read_first_line(path):
+    try:
+        with open(path) as f:
+            return f.readline().strip()
+    except OSError:
+        return None
+
+
+def cpu_limit():
+    """CPUs available to this process, honouring a cgroup CPU quota"""
+    quota = _read_first_line('/sys/fs/cgroup/cpu.max')  # cgroup v2: "<quota> <period>" or "max <period>"
+    if quota and not quota.startswith('max'):
+        limit, period = (int(part) for part in quota.split()[:2])
+        return limit / period
+    limit = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')  # cgroup v1
+    period = _read_first_line('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+    if limit and period and int(limit) > 0:
+        return int(limit) / int(period)
+    try:
+        return float(len(os.sched_getaffinity(0)))
+    except AttributeError:
+        return float(os.cpu_count() or 1)
+
+
+def memory_limit_mb():
+    """Memory available to this process in MB, honouring a cgroup limit"""
+    for path in ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory/memory.limit_in_bytes'):
+        value = _read_first_line(path)
+        # v1 reports "no limit" as a huge number
+        if value and value.isdigit() and int(value) < 1 << 60:
+            return int(value) // (1024 * 1024)
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES') // (1024 * 1024)
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def default_workers(cpus, memory_mb, worker_memory_mb):
+    """
+    Two workers per (rounded-up) CPU, capped by how many fit in memory
+
+    Model calls spend seconds waiting on Bedrock, so threads supply most of
+    the concurrency; the second worker per CPU covers the GIL-bound work
+    (image preprocessing, JSON) and keeps serving while the other recycles.
+    """
+    workers = 2 * max(1, math.ceil(cpus))
+    if memory_mb:
+        workers = min(workers, max(1, memory_mb // worker_memory_mb))
+    return max(1, workers)
+
+
+CPUS = cpu_limit()
+MEMORY_MB = memory_limit_mb()
+# Preloaded app ~75 MB RSS plus headroom for decoding uploaded photos
+WORKER_MEMORY_MB = _env_int('GUNICORN_WORKER_MEMORY_MB', 256)
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '8000')}")
+worker_class = 'gthread'
+workers = _env_int('GUNICORN_WORKERS', 0) or default_workers(CPUS, MEMORY_MB, WORKER_MEMORY_MB)
+threads = _env_int('GUNICORN_THREADS', 8)
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+warm_imports = preload_app and os.getenv('GUNICORN_WARM_IMPORTS', 'true').lower() == 'true'
+
+# Recycle workers to bound slow leaks; jitter keeps them from restarting together
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+
+# A fridge analysis can take most of a minute on Bedrock
+timeout = _env_int('GUNICORN_TIMEOUT', 120)
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+# Worker heartbeat files on tmpfs, so a slow disk cannot stall them into timeouts
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+# Connection pools (Supabase HTTP) size themselves from the thread count
+os.environ.setdefault('GUNICORN_THREADS', str(threads))
+
+# Per-worker metric snapshots, added up by /metrics; set before the app is imported.
+# Only created here (and removed on exit) when not configured; a reload keeps it.
+if not (os.getenv('METRICS_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR')):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(
+        prefix='chopchop-metrics-', dir='/dev/shm' if os.path.isdir('/dev/shm') else None)
+    os.environ['CHOPCHOP_METRICS_DIR_OWNED'] = '1'
+
+
+def when_ready(server):
+    import coldstart
+    server.log.info(
+        f"ChopChop backend: {workers} workers x {threads} threads "
+        f"(cpus={CPUS:g}, memory={MEMORY_MB} MB, preload={preload_app}, max_requests={max_requests}); "
+        f"listening {coldstart.mark('listening')} ms after process start"
+    )
+
+
+def pre_fork(server, worker):
+    if warm_imports and not getattr(server, 'imports_warmed', False):
+        import coldstart
+        server.log.info(f"Imported heavy modules for the workers in {coldstart.warm_imports()} ms")
+        server.imports_warmed = True
+    # Move everything the master allocated into the permanent GC generation, so
+    # collections in a worker do not touch (and copy) the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # The final worker count (-w included): chat history is only cached by a lone worker
+    os.environ['GUNICORN_WORKERS'] = str(server.cfg.workers)
+    if 'nova_backend' not in sys.modules:
+        return
+    from aws_config import aws_config
+    from supabase_config import supabase_manager
+    aws_config.reinitialize_client()
+    supabase_manager.reinitialize_client()
+    supabase_manager.configure_read_cache()
+
+
+def worker_exit(server, worker):
+    # Last snapshot before the master folds this worker's totals into the archive
+    if 'metrics' in sys.modules:
+        sys.modules['metrics'].flush()
+
+
+def child_exit(server, worker):
+    import metrics
+    metrics.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    if os.getenv('CHOPCHOP_METRICS_DIR_OWNED'):
+        shutil.rmtree(os.environ['METRICS_DIR'], ignore_errors=True)
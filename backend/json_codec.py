@@ -0,0 +1,164 @@
+"""
+Compact encoding for the large JSON columns of the Users table
+
+items, recipes and chat_history are plain JSONB by default. With
+JSON_COLUMN_ENCODING=gzip (or zstd, when `zstandard` is installed) values
+above a size threshold are written as compact JSON, compressed and base64
+encoded into a tagged JSON string:
+
+    "gz1:H4sIAAAAAAAC/..."
+
+Decoding accepts every format ever written (native JSON, JSON text and both
+tagged encodings), so rows migrate lazily: each row is rewritten in the
+configured encoding the next time it is saved.
+"""
+import os
+import json
+import gzip
+import base64
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+# Users columns that may be stored encoded
+ENCODED_COLUMNS = ('items', 'recipes', 'chat_history')
+
+ENCODINGS = ('json', 'gzip', 'zstd')
+
+_PREFIXES = {'gzip': 'gz1:', 'zstd': 'zs1:'}
+_DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+
+def _compress(encoding: str, data: bytes, level: int) -> bytes:
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    # mtime=0 keeps the output deterministic, so unchanged data encodes identically
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def _decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise ValueError("zstd-encoded column found but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def decode_json_column(value: Any, default: Any) -> Any:
+    """
+    Decode a stored column value in any of the supported formats
+
+    Args:
+        value: Native JSON value, JSON text, or a tagged encoded string
+        default: Returned for NULL or empty values
+    """
+    if value is None or value == '':
+        return default
+    if not isinstance(value, str):
+        return value
+    raw = _encoded_payload(value)
+    return json.loads(raw if raw is not None else value)
+
+
+def _encoded_payload(value: str) -> Optional[bytes]:
+    """Decompressed JSON bytes of a tagged value, or None for anything else"""
+    for encoding, prefix in _PREFIXES.items():
+        if value.startswith(prefix):
+            return _decompress(encoding, base64.b64decode(value[len(prefix):]))
+    return None
+
+
+class JsonColumnCodec:
+    """
+    Encodes column values on write and decodes them on read, counting bytes
+
+    Configured with JSON_COLUMN_ENCODING (json, gzip or zstd; default json),
+    JSON_COLUMN_COMPRESSION_LEVEL and JSON_COLUMN_ENCODING_MIN_BYTES (values
+    whose compact JSON is smaller stay native; default 1024).
+    """
+
+    def __init__(self, encoding: str = None, level: int = None, min_bytes: int = None):
+        encoding = (encoding or os.getenv('JSON_COLUMN_ENCODING', 'json')).lower()
+        if encoding not in ENCODINGS:
+            logger.warning(f"Unknown JSON_COLUMN_ENCODING {encoding!r}; storing plain JSON")
+            encoding = 'json'
+        if encoding == 'zstd' and not ZSTD_AVAILABLE:
+            logger.warning("zstandard is not installed; falling back to gzip column encoding")
+            encoding = 'gzip'
+        self.encoding = encoding
+        level_env = os.getenv('JSON_COLUMN_COMPRESSION_LEVEL')
+        self.level = level if level is not None else int(level_env) if level_env else _DEFAULT_LEVELS.get(encoding, 0)
+        self.min_bytes = min_bytes if min_bytes is not None else int(os.getenv('JSON_COLUMN_ENCODING_MIN_BYTES', '1024'))
+        self._lock = threading.Lock()
+        self._stats = {
+            'encoded_writes': 0,
+            'plain_writes': 0,
+            'json_bytes_written': 0,
+            'stored_bytes_written': 0,
+            'encoded_reads': 0,
+            'plain_reads': 0,
+            'stored_bytes_read': 0,
+            'json_bytes_read': 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.encoding != 'json'
+
+    def encode(self, value: Any) -> Any:
+        """Return the value to store: the value itself, or its tagged encoding"""
+        if not self.enabled or value is None:
+            return value
+        raw = json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+        if len(raw) < self.min_bytes:
+            self._count(plain_writes=1, json_bytes_written=len(raw), stored_bytes_written=len(raw))
+            return value
+        encoded = _PREFIXES[self.encoding] + base64.b64encode(_compress(self.encoding, raw, self.level)).decode('ascii')
+        self._count(encoded_writes=1, json_bytes_written=len(raw), stored_bytes_written=len(encoded))
+        return encoded
+
+    def encode_columns(self, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """Encode the ENCODED_COLUMNS members of a row payload"""
+        if not self.enabled:
+            return fields
+        return {column: self.encode(value) if column in ENCODED_COLUMNS else value
+                for column, value in fields.items()}
+
+    def decode(self, value: Any, default: Any) -> Any:
+        """Decode a stored value in any supported format"""
+        raw = _encoded_payload(value) if isinstance(value, str) else None
+        if raw is None:
+            self._count(plain_reads=1)
+            return decode_json_column(value, default)
+        self._count(encoded_reads=1, stored_bytes_read=len(value), json_bytes_read=len(raw))
+        return json.loads(raw)
+
+    def _count(self, **increments: int):
+        with self._lock:
+            for key, amount in increments.items():
+                self._stats[key] += amount
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Encoding counters for /health
+
+        json_bytes_* is the size the values would have had as compact JSON,
+        stored_bytes_* what was actually written or transferred.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        written = stats['stored_bytes_written']
+        stats['write_ratio'] = round(stats['json_bytes_written'] / written, 2) if written else None
+        read = stats['stored_bytes_read']
+        stats['read_ratio'] = round(stats['json_bytes_read'] / read, 2) if read else None
+        stats.update(encoding=self.encoding, level=self.level, min_bytes=self.min_bytes)
+        return stats
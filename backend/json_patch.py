@@ -0,0 +1,211 @@
+"""
+Minimal RFC 6902 JSON Patch support for ChopChop delta updates
+"""
+import copy
+from typing import Any, Dict, List, Tuple
+
+
+class JsonPatchError(Exception):
+    """Raised when a patch document is malformed or cannot be applied"""
+
+
+def parse_pointer(pointer: str) -> List[str]:
+    """
+    Split an RFC 6901 JSON Pointer into unescaped reference tokens
+
+    Args:
+        pointer: Pointer such as "/items/0/checked"
+
+    Returns:
+        List of reference tokens ([] for the whole document)
+    """
+    if not isinstance(pointer, str):
+        raise JsonPatchError(f"Path must be a string, got {type(pointer).__name__}")
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError(f"Invalid JSON pointer: {pointer!r}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _array_index(container: List[Any], token: str, allow_end: bool) -> int:
+    """Resolve an array reference token to an index"""
+    if token == '-' and allow_end:
+        return len(container)
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise JsonPatchError(f"Invalid array index: {token!r}")
+    index = int(token)
+    upper = len(container) if allow_end else len(container) - 1
+    if index > upper:
+        raise JsonPatchError(f"Array index out of range: {index}")
+    return index
+
+
+def _resolve_parent(document: Any, tokens: List[str]) -> Tuple[Any, str]:
+    """Walk to the container holding the last token of a pointer"""
+    if not tokens:
+        raise JsonPatchError("Operation cannot target the document root")
+    node = document
+    for token in tokens[:-1]:
+        node = _get_child(node, token)
+    return node, tokens[-1]
+
+
+def _get_child(node: Any, token: str) -> Any:
+    """Return the child of a container for a reference token"""
+    if isinstance(node, dict):
+        if token not in node:
+            raise JsonPatchError(f"Path member not found: {token!r}")
+        return node[token]
+    if isinstance(node, list):
+        return node[_array_index(node, token, allow_end=False)]
+    raise JsonPatchError(f"Cannot traverse into {type(node).__name__} with {token!r}")
+
+
+def _get(document: Any, pointer: str) -> Any:
+    node = document
+    for token in parse_pointer(pointer):
+        node = _get_child(node, token)
+    return node
+
+
+def json_equal(left: Any, right: Any) -> bool:
+    """
+    Compare two JSON values the way RFC 6902 section 4.6 defines a 'test'
+
+    Python's == treats True as 1, so booleans are compared apart from
+    numbers; numbers are equal when numerically equal (1 and 1.0 are the
+    same JSON number), and arrays and objects are compared member by member.
+    """
+    if isinstance(left, bool) or isinstance(right, bool):
+        return isinstance(left, bool) and isinstance(right, bool) and left == right
+    if isinstance(left, (int, float)) or isinstance(right, (int, float)):
+        return isinstance(left, (int, float)) and isinstance(right, (int, float)) and left == right
+    if isinstance(left, list) or isinstance(right, list):
+        return (isinstance(left, list) and isinstance(right, list) and len(left) == len(right)
+                and all(json_equal(a, b) for a, b in zip(left, right)))
+    if isinstance(left, dict) or isinstance(right, dict):
+        return (isinstance(left, dict) and isinstance(right, dict) and left.keys() == right.keys()
+                and all(json_equal(value, right[key]) for key, value in left.items()))
+    return type(left) is type(right) and left == right
+
+
+def _add(document: Any, pointer: str, value: Any):
+    parent, token = _resolve_parent(document, parse_pointer(pointer))
+    if isinstance(parent, dict):
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent.insert(_array_index(parent, token, allow_end=True), value)
+    else:
+        raise JsonPatchError(f"Cannot add to {type(parent).__name__}")
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    parent, token = _resolve_parent(document, parse_pointer(pointer))
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f"Path member not found: {token!r}")
+        return parent.pop(token)
+    if isinstance(parent, list):
+        return parent.pop(_array_index(parent, token, allow_end=False))
+    raise JsonPatchError(f"Cannot remove from {type(parent).__name__}")
+
+
+def _replace(document: Any, pointer: str, value: Any):
+    parent, token = _resolve_parent(document, parse_pointer(pointer))
+    if isinstance(parent, dict):
+        if token not in parent:
+            raise JsonPatchError(f"Path member not found: {token!r}")
+        parent[token] = value
+    elif isinstance(parent, list):
+        parent[_array_index(parent, token, allow_end=False)] = value
+    else:
+        raise JsonPatchError(f"Cannot replace in {type(parent).__name__}")
+
+
+def validate_operations(operations: Any):
+    """
+    Check the shape of a patch before anything reads it: a list of objects,
+    each with a string 'op' and 'path', plus 'value' or a string 'from'
+    where the operation needs one
+    """
+    if not isinstance(operations, list):
+        raise JsonPatchError("Patch must be a list of operations")
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise JsonPatchError("Each patch operation must be an object")
+        op = operation.get('op')
+        if not isinstance(op, str):
+            raise JsonPatchError("Each patch operation needs a string 'op'")
+        if not isinstance(operation.get('path'), str):
+            raise JsonPatchError(f"Operation {op!r} is missing 'path'")
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JsonPatchError(f"Operation {op!r} is missing 'value'")
+        if op in ('move', 'copy') and not isinstance(operation.get('from'), str):
+            raise JsonPatchError(f"Operation {op!r} is missing 'from'")
+
+
+def apply_patch(document: Any, operations: List[Dict[str, Any]]) -> Any:
+    """
+    Apply a JSON Patch to a document
+
+    The patch is applied to a deep copy, so the input is left untouched and
+    a failing operation never leaves a partially patched result behind.
+
+    Args:
+        document: JSON-compatible document (dicts, lists, scalars)
+        operations: List of RFC 6902 operation objects
+
+    Returns:
+        The patched copy of the document
+    """
+    validate_operations(operations)
+
+    result = copy.deepcopy(document)
+    for operation in operations:
+        op = operation['op']
+        path = operation['path']
+
+        if op == 'add':
+            _add(result, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(result, path)
+        elif op == 'replace':
+            _replace(result, path, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            source = operation['from']
+            if path != source and path.startswith(source + '/'):
+                raise JsonPatchError("Cannot move a value into one of its children")
+            _add(result, path, _remove(result, source))
+        elif op == 'copy':
+            _add(result, path, copy.deepcopy(_get(result, operation['from'])))
+        elif op == 'test':
+            if not json_equal(_get(result, path), operation['value']):
+                raise JsonPatchError(f"Test failed at {path!r}")
+        else:
+            raise JsonPatchError(f"Unsupported patch operation: {op!r}")
+    return result
+
+
+def touched_roots(operations: List[Dict[str, Any]]) -> List[str]:
+    """
+    Return the top-level members a patch writes to, in first-seen order
+
+    'test' operations only read, so they do not count as writes.
+
+    Raises:
+        JsonPatchError: If the patch is not a list of well-formed operations
+    """
+    validate_operations(operations)
+    roots: List[str] = []
+    for operation in operations:
+        if operation.get('op') == 'test':
+            continue
+        for key in ('path', 'from'):
+            if key == 'from' and operation.get('op') == 'copy':
+                continue
+            if key in operation:
+                tokens = parse_pointer(operation[key])
+                if tokens and tokens[0] not in roots:
+                    roots.append(tokens[0])
+    return roots
@@ -0,0 +1,108 @@
+"""
+Fast JSON for Flask requests and responses
+
+Every request body parsed with request.get_json() and every jsonify()
+response goes through app.json. FastJSONProvider keeps Flask's
+DefaultJSONProvider behaviour (sorted keys, RFC 822 dates, dataclasses,
+UUIDs, __html__) but encodes and parses with orjson, and builds responses
+from bytes without an intermediate str.
+
+Differences from the stdlib provider, all still valid JSON: output is
+always compact UTF-8 (no \\u escapes for non-ASCII), and NaN/Infinity are
+written as null. Anything orjson refuses (integers beyond 64 bits, non-str
+keys, unknown dumps() arguments) falls back to the stdlib encoder, and
+input orjson rejects is re-parsed with the stdlib parser, so errors and
+edge cases match.
+
+JSON_PROVIDER selects `orjson` (default when installed) or `stdlib`.
+"""
+import os
+import json
+import logging
+from typing import Any, Dict, Optional
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+PROVIDERS = ('orjson', 'stdlib')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """DefaultJSONProvider encoded and parsed by orjson"""
+
+    name = 'orjson'
+    ensure_ascii = False
+
+    # dumps() arguments orjson can honour; anything else goes to the stdlib
+    _HANDLED_ARGS = frozenset(('default', 'sort_keys', 'indent', 'separators', 'ensure_ascii'))
+
+    def _option(self, kwargs: Dict[str, Any]) -> Optional[int]:
+        if not kwargs.keys() <= self._HANDLED_ARGS or kwargs.get('indent') not in (None, 2):
+            return None
+        # Let Flask's default() format dates and dataclasses as the stdlib provider does
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps_bytes(self, obj: Any, **kwargs: Any) -> bytes:
+        """Serialize to UTF-8 JSON bytes"""
+        option = self._option(kwargs)
+        if option is not None:
+            try:
+                return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option)
+            except TypeError:
+                pass
+        return super().dumps(obj, **kwargs).encode('utf-8')
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return self.dumps_bytes(obj, **kwargs).decode('utf-8')
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+        return json.loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        obj = self._prepare_response_obj(args, kwargs)
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            dump_args = {'indent': 2}
+        else:
+            dump_args = {'separators': (',', ':')}
+        return self._app.response_class(self.dumps_bytes(obj, **dump_args) + b'\n', mimetype=self.mimetype)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    name = 'stdlib'
+
+
+def configure_json(app: Flask, provider: Optional[str] = None) -> str:
+    """
+    Install the JSON provider named by `provider` or JSON_PROVIDER on `app`
+
+    Returns:
+        The name of the provider in use
+    """
+    provider = (provider or os.getenv('JSON_PROVIDER', 'orjson')).lower()
+    if provider not in PROVIDERS:
+        logger.warning(f"Unknown JSON_PROVIDER {provider!r}; using orjson if installed")
+        provider = 'orjson'
+    if provider == 'orjson' and not ORJSON_AVAILABLE:
+        logger.warning("orjson is not installed; using the stdlib JSON provider")
+        provider = 'stdlib'
+    app.json = FastJSONProvider(app) if provider == 'orjson' else StdlibJSONProvider(app)
+    return provider
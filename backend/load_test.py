@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+"""
+Load test nova_backend against fake Bedrock and in-memory Supabase
+
+    python load_test.py [--concurrency 32] [--duration 60] [--mix chat=20,fridge=5,...]
+                        [--save load_test_baseline.json] [--compare load_test_baseline.json]
+
+Boots the app in this process behind a threaded WSGI server, with
+get_bedrock_client() returning a FakeBedrockRuntime (--bedrock-* set its
+latency and output lengths) and storage replaced by a SupabaseManager over
+an in-memory FakeSupabaseClient (--supabase-latency-ms per query). Users
+are seeded with a saved list and some chat history, then --concurrency
+clients send a weighted mix of
+
+- chat: POST /chat, text only
+- fridge: POST /chat with a 1600x1200 JPEG photo ("Analyze my fridge")
+- get-data: POST /get-data
+- update-data: POST /update-data with an edited list
+- history: POST /chat-history, last 20 messages
+
+for --duration seconds after a --warmup. The report gives throughput and
+p50/p95/p99 latency per operation, and model goodput: chat and fridge
+requests answered 200 per minute, also weighted by ModelScheduler cost
+(a fridge analysis takes several chats' worth of model time, so the mix
+of the two sways the plain count). --save writes it as JSON (a baseline);
+--compare reads a baseline and exits 1 if any operation's p95 got worse
+than --tolerance (default 25%) or its throughput, or the weighted
+goodput, dropped by as much.
+
+Model calls still go through the app's admission control and
+ModelScheduler (MODEL_CONCURRENCY per process), so chat and fridge
+throughput reflect those limits; a client answered 429 or 503 waits out
+the Retry-After before its next request. Each synthetic user signs in
+first and sends its session_id, which is what the scheduler shares out
+by, and gets a generous per-user rate unless MODEL_USER_RATE_PER_MINUTE
+and MODEL_USER_BURST are set.
+"""
+import os
+import io
+import sys
+import json
+import time
+import base64
+import random
+import logging
+import argparse
+import platform
+import threading
+import subprocess
+import http.client
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from fake_bedrock import FakeBedrockRuntime, TokenDistribution
+from fake_supabase import FakeSupabaseClient
+
+OPERATIONS = ('chat', 'fridge', 'get-data', 'update-data', 'history')
+DEFAULT_MIX = 'chat=20,fridge=5,get-data=40,update-data=20,history=15'
+PERCENTILES = (50, 95, 99)
+# Operations that make a model call, with the ModelScheduler kind of that call
+MODEL_OPERATIONS = {'chat': 'chat', 'fridge': 'fridge'}
+
+CHAT_MESSAGES = ("What can I make with eggs and spinach?", "How long should I roast carrots?",
+                 "Give me a quick vegetarian dinner idea", "Can I freeze cooked rice?")
+
+
+def configure_environment():
+    """Defaults for the app's settings under load; call before importing nova_backend"""
+    os.environ.setdefault('SESSION_STORE', 'memory')
+    os.environ.setdefault('TRACE_EXPORTER', 'none')
+    os.environ.setdefault('MODEL_USER_RATE_PER_MINUTE', '600')
+    os.environ.setdefault('MODEL_USER_BURST', '60')
+
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """'chat=35,fridge=10' -> weights per operation"""
+    mix = {}
+    for part in (p.strip() for p in text.split(',') if p.strip()):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The mix needs at least one operation with a positive weight")
+    return mix
+
+
+def percentile(ordered: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def make_photo(seed: int = 7) -> str:
+    """A base64 1600x1200 JPEG about the size of a phone photo"""
+    from PIL import Image
+    rng = random.Random(seed)
+    small = Image.frombytes('RGB', (160, 120), rng.randbytes(160 * 120 * 3))
+    buffer = io.BytesIO()
+    small.resize((1600, 1200), Image.Resampling.BILINEAR).save(buffer, format='JPEG', quality=90)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+class Workload:
+    """Request bodies for each operation, over a fixed set of synthetic users"""
+
+    def __init__(self, users: int, seed: int = 7):
+        self.emails = [f"load-{n}@example.com" for n in range(users)]
+        self.sessions: Dict[str, str] = {}
+        self.photo = make_photo(seed)
+
+    @staticmethod
+    def items(rng: random.Random) -> List[Dict[str, Any]]:
+        return [{'item': f"Item {n}", 'quantity': str(rng.randint(1, 5)), 'category': 'produce',
+                 'checked': rng.random() < 0.3} for n in range(30)]
+
+    @staticmethod
+    def recipes() -> List[Dict[str, Any]]:
+        return [{'name': f"Recipe {n}", 'ingredients': ['eggs', 'spinach', 'feta'],
+                 'instructions': ['Whisk', 'Cook', 'Serve']} for n in range(5)]
+
+    def seed(self, storage, rng: random.Random):
+        for email in self.emails:
+            storage.save_user_data(email, self.items(rng), self.recipes())
+            for n in range(4):
+                storage.save_chat_message(email, CHAT_MESSAGES[n], 'user' if n % 2 == 0 else 'nova')
+
+    def sign_in(self, backend):
+        """Give every user a session: model calls are fair-shared per signed-in user, not per email sent"""
+        self.sessions = {email: backend.create_user_session(email) for email in self.emails}
+
+    def request(self, operation: str, rng: random.Random) -> Tuple[str, str, Dict[str, Any]]:
+        """(method, path, JSON body)"""
+        email = rng.choice(self.emails)
+        if operation == 'chat':
+            return 'POST', '/chat', {'message': rng.choice(CHAT_MESSAGES), 'email': email,
+                                     'session_id': self.sessions.get(email)}
+        if operation == 'fridge':
+            return 'POST', '/chat', {'message': 'Analyze my fridge', 'email': email,
+                                     'session_id': self.sessions.get(email),
+                                     'imageBase64': self.photo, 'imageFormat': 'jpeg'}
+        if operation == 'get-data':
+            return 'POST', '/get-data', {'email': email}
+        if operation == 'update-data':
+            return 'POST', '/update-data', {'email': email, 'items': self.items(rng), 'recipes': self.recipes()}
+        return 'POST', '/chat-history', {'email': email, 'limit': 20}
+
+
+@contextmanager
+def stubbed_app(bedrock: FakeBedrockRuntime, supabase: FakeSupabaseClient) -> Iterator[Any]:
+    """nova_backend's app with its Bedrock client and storage replaced by the fakes, for the block"""
+    configure_environment()
+    import nova_backend
+    from supabase_config import SupabaseManager
+    from model_scheduler import ModelScheduler
+    original = nova_backend.get_bedrock_client, nova_backend.storage, nova_backend.model_scheduler
+    nova_backend.get_bedrock_client = lambda: bedrock
+    nova_backend.storage = SupabaseManager(client=supabase)
+    # Fresh limits from the environment, even if the app was imported earlier
+    nova_backend.model_scheduler = ModelScheduler()
+    try:
+        yield nova_backend
+    finally:
+        nova_backend.get_bedrock_client, nova_backend.storage, nova_backend.model_scheduler = original
+
+
+@contextmanager
+def serve(app) -> Iterator[Tuple[str, int]]:
+    """Serve `app` on a free local port from a background thread"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, name='load-test-server', daemon=True)
+    thread.start()
+    try:
+        yield '127.0.0.1', server.server_port
+    finally:
+        server.shutdown()
+        thread.join()
+
+
+def send(host: str, port: int, method: str, path: str, body: Dict[str, Any], timeout: float) -> Tuple[int, float]:
+    """
+    One request on a fresh connection, read to the end; returns the status
+    (0 on a connection error) and its Retry-After in seconds (0 if none)
+    """
+    connection = http.client.HTTPConnection(host, port, timeout=timeout)
+    try:
+        connection.request(method, path, body=json.dumps(body),
+                           headers={'Content-Type': 'application/json', 'Accept-Encoding': 'gzip'})
+        response = connection.getresponse()
+        response.read()
+        retry_after = response.getheader('Retry-After', '0')
+        return response.status, float(retry_after) if retry_after.isdigit() else 0.0
+    except (OSError, http.client.HTTPException):
+        return 0, 0.0
+    finally:
+        connection.close()
+
+
+def summarize(samples: List[Tuple[str, int, float, bool]], seconds: float) -> Dict[str, Any]:
+    """
+    Per operation, from (operation, status, ms, finished in the window)
+    samples of requests sent in the window: latency percentiles and status
+    counts over all of them, throughput over those finished in it
+    """
+    endpoints: Dict[str, Any] = {}
+    for operation in OPERATIONS:
+        latencies = sorted(ms for op, _, ms, _ in samples if op == operation)
+        if not latencies:
+            continue
+        statuses: Dict[str, int] = {}
+        for op, status, _, _ in samples:
+            if op == operation:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        finished = sum(1 for op, _, _, in_window in samples if op == operation and in_window)
+        endpoints[operation] = {
+            'requests': len(latencies),
+            'rps': round(finished / seconds, 2),
+            **{f"p{q}_ms": round(percentile(latencies, q), 1) for q in PERCENTILES},
+            'max_ms': round(latencies[-1], 1),
+            'errors': sum(n for status, n in statuses.items() if not status.startswith('2')),
+            'statuses': statuses,
+        }
+    return {
+        'requests': len(samples),
+        'rps': round(sum(1 for sample in samples if sample[3]) / seconds, 2),
+        'errors': sum(e['errors'] for e in endpoints.values()),
+        'endpoints': endpoints,
+    }
+
+
+def goodput(samples: List[Tuple[str, int, float, bool]], seconds: float,
+            cost: Callable[[str], float]) -> Dict[str, float]:
+    """Model requests answered 200 within the window, per minute: counted, and weighted by cost(kind)"""
+    done = [MODEL_OPERATIONS[op] for op, status, _, in_window in samples
+            if op in MODEL_OPERATIONS and status == 200 and in_window]
+    per_minute = 60.0 / seconds
+    return {'model_requests_per_minute': round(len(done) * per_minute, 2),
+            'model_cost_per_minute': round(sum(cost(kind) for kind in done) * per_minute, 2)}
+
+
+def run_load_test(concurrency: int = 32, duration: float = 60.0, warmup: float = 3.0, users: int = 100,
+                  mix: Optional[Dict[str, float]] = None, bedrock: Optional[FakeBedrockRuntime] = None,
+                  supabase_latency_ms: float = 15.0, timeout: float = 120.0, seed: int = 7,
+                  log_level: Optional[int] = None) -> Dict[str, Any]:
+    """Drive the stubbed app for warmup + duration seconds; returns the report"""
+    mix = mix or parse_mix(DEFAULT_MIX)
+    bedrock = bedrock or FakeBedrockRuntime(seed=seed)
+    supabase = FakeSupabaseClient(latency=supabase_latency_ms / 1000)
+    workload = Workload(users, seed)
+    operations, weights = zip(*mix.items())
+    samples: List[Tuple[str, int, float, bool]] = []
+    samples_lock = threading.Lock()
+
+    with stubbed_app(bedrock, supabase) as backend:
+        if log_level is not None:
+            # After the import: nova_backend configures logging at INFO
+            logging.getLogger().setLevel(log_level)
+            logging.getLogger('werkzeug').setLevel(log_level)
+        workload.seed(backend.storage, random.Random(seed))
+        workload.sign_in(backend)
+        supabase.reset_counters()
+        with serve(backend.app) as (host, port):
+            started = time.monotonic()
+            measure_from, stop_at = started + warmup, started + warmup + duration
+
+            def client(number: int):
+                rng = random.Random(seed * 1000 + number)
+                while time.monotonic() < stop_at:
+                    operation = rng.choices(operations, weights)[0]
+                    method, path, body = workload.request(operation, rng)
+                    sent = time.monotonic()
+                    status, retry_after = send(host, port, method, path, body, timeout)
+                    done = time.monotonic()
+                    if sent >= measure_from:
+                        with samples_lock:
+                            samples.append((operation, status, (done - sent) * 1000, done <= stop_at))
+                    if status in (429, 503) and retry_after:
+                        # Clients back off as told, as the frontend's users would
+                        time.sleep(max(0.0, min(retry_after, stop_at - done)))
+
+            threads = [threading.Thread(target=client, args=(n,), name=f"load-client-{n}") for n in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+    report = summarize(samples, duration)
+    report['goodput'] = goodput(samples, duration, backend.model_scheduler.cost)
+    report['config'] = {
+        'concurrency': concurrency, 'duration_s': duration, 'warmup_s': warmup, 'users': users, 'mix': mix,
+        'bedrock': {'first_token_ms': bedrock.first_token_ms, 'ms_per_token': bedrock.ms_per_token,
+                    'tokens': {kind: repr(d) for kind, d in bedrock.tokens.items()},
+                    'error_rate': bedrock.error_rate},
+        'supabase_latency_ms': supabase_latency_ms,
+        'model_concurrency': backend.model_scheduler.settings.concurrency,
+    }
+    report['environment'] = environment()
+    report['bedrock'] = bedrock.get_stats()
+    report['supabase'] = {'round_trips': supabase.round_trips, 'bytes_fetched': supabase.bytes_fetched}
+    return report
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'commit': commit, 'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}
+
+
+def print_report(report: Dict[str, Any], out=sys.stdout):
+    config = report['config']
+    print(f"{config['concurrency']} clients, {config['duration_s']:g}s measured after {config['warmup_s']:g}s warm-up, "
+          f"{config['users']} users, MODEL_CONCURRENCY={config['model_concurrency']}", file=out)
+    print(f"{'operation':<12} {'requests':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'max ms':>9} {'errors':>7}", file=out)
+    for operation, e in report['endpoints'].items():
+        print(f"{operation:<12} {e['requests']:>8} {e['rps']:>8.2f} {e['p50_ms']:>9.1f} {e['p95_ms']:>9.1f} "
+              f"{e['p99_ms']:>9.1f} {e['max_ms']:>9.1f} {e['errors']:>7}", file=out)
+    print(f"{'total':<12} {report['requests']:>8} {report['rps']:>8.2f} {'':>39} {report['errors']:>7}", file=out)
+    model = report['goodput']
+    print(f"model goodput: {model['model_requests_per_minute']:.1f} requests/min, "
+          f"{model['model_cost_per_minute']:.1f} cost units/min", file=out)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.25) -> List[str]:
+    """Regressions against a baseline report: p95 up, or throughput down, by more than `tolerance`"""
+    regressions = []
+    for operation, base in baseline['endpoints'].items():
+        current = report['endpoints'].get(operation)
+        if current is None:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{operation}: p95 {base['p95_ms']:.1f} -> {current['p95_ms']:.1f} ms")
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f"{operation}: throughput {base['rps']:.2f} -> {current['rps']:.2f} req/s")
+    # Baselines from before goodput was reported have none to compare
+    if 'goodput' in baseline and 'goodput' in report:
+        base, current = baseline['goodput']['model_cost_per_minute'], report['goodput']['model_cost_per_minute']
+        if current < base * (1 - tolerance):
+            regressions.append(f"model goodput: {base:.1f} -> {current:.1f} cost units/min")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Load test nova_backend against fake Bedrock and Supabase")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=60.0, help="Seconds measured")
+    parser.add_argument('--warmup', type=float, default=3.0, help="Seconds run before measuring")
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Operation weights (default: %(default)s)")
+    parser.add_argument('--bedrock-first-token-ms', type=float, default=600.0)
+    parser.add_argument('--bedrock-ms-per-token', type=float, default=12.0)
+    parser.add_argument('--bedrock-tokens', default='chat=250:80,fridge=1400:300',
+                        help="Output tokens per call kind as mean:stddev (default: %(default)s)")
+    parser.add_argument('--bedrock-error-rate', type=float, default=0.0, help="Share of calls throttled")
+    parser.add_argument('--supabase-latency-ms', type=float, default=15.0, help="Per query")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--save', metavar='PATH', help="Write the report as JSON")
+    parser.add_argument('--compare', metavar='PATH', help="Baseline report to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.mix)
+        tokens = {kind: TokenDistribution.parse(spec) for kind, _, spec in
+                  (part.strip().partition('=') for part in args.bedrock_tokens.split(',') if part.strip())}
+    except ValueError as e:
+        parser.error(str(e))
+    bedrock = FakeBedrockRuntime(args.bedrock_first_token_ms, ms_per_token=args.bedrock_ms_per_token,
+                                 tokens=tokens, error_rate=args.bedrock_error_rate, seed=args.seed)
+    # Per-request INFO logs would dominate the measurement
+    report = run_load_test(args.concurrency, args.duration, args.warmup, args.users, mix, bedrock,
+                           args.supabase_latency_ms, seed=args.seed, log_level=logging.WARNING)
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f"Saved to {args.save}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,585 @@
+"""
+Prometheus metrics
+
+GET /metrics serves everything below in the Prometheus text exposition
+format (0.0.4):
+
+- chopchop_http_requests_total{route,method,status} and
+  chopchop_http_request_duration_seconds{route,method}: per URL rule, so
+  /send-email/<message_id> is one route; unmatched paths are `unmatched`
+- chopchop_http_requests_in_flight
+- chopchop_bedrock_call_duration_seconds{model} and
+  chopchop_bedrock_errors_total{model,code}: code is the AWS error code
+  (ThrottlingException, ...) or the exception type
+- chopchop_supabase_call_duration_seconds{method}, per SupabaseManager method
+- chopchop_image_bytes{direction}: uploaded photo bytes (`in`) and the
+  preprocessed bytes sent to Bedrock (`out`)
+- chopchop_sessions{store}: live stored sessions, read at scrape time
+- chopchop_fridge_jobs_total{outcome} and chopchop_fridge_job_wait_seconds:
+  background fridge analysis jobs (fridge_jobs.py) and their queueing delay
+- chopchop_requests_shed_total{route_class,reason} and
+  chopchop_admission_wait_seconds{route_class}: admission control (admission.py)
+- chopchop_model_queue_wait_seconds{kind} and
+  chopchop_model_rejections_total{kind,reason}: fair-share scheduling of
+  model calls (model_scheduler.py); reason is rate, queue or timeout
+
+Metrics are updated under a per-metric lock, so gthread threads can share
+them. Under gunicorn each worker has its own copy; with METRICS_DIR set
+(gunicorn.conf.py points it at a fresh directory on /dev/shm) every worker
+writes a snapshot to METRICS_DIR/worker-<pid>-<id>.json every
+METRICS_FLUSH_SECONDS and on exit, and /metrics adds up all the workers'
+snapshots, with its own worker's current values. When a worker exits the
+master folds its counters and histograms into METRICS_DIR/archive.json, so
+totals do not drop when workers recycle; its gauges are dropped. Values
+from other workers are at most METRICS_FLUSH_SECONDS old, and a worker
+killed without a chance to exit loses at most that much.
+
+prometheus_client is not needed; this is the small subset of it we use.
+"""
+import os
+import hmac
+import json
+import glob
+import math
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, g, request
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; API requests are mostly milliseconds, model calls tens of seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MODEL_BUCKETS = (0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 20.0, 30.0, 45.0, 60.0, 120.0)
+DATABASE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+IMAGE_BYTE_BUCKETS = (64 * 1024, 128 * 1024, 256 * 1024, 512 * 1024, 1024 * 1024, 2 * 1024 * 1024,
+                      3 * 1024 * 1024, 4 * 1024 * 1024, 8 * 1024 * 1024)
+
+ARCHIVE_FILE = 'archive.json'
+# Scrapers allowed without METRICS_TOKEN
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+class MetricsSettings:
+    """Metrics configuration, read from environment variables"""
+
+    def __init__(self):
+        self.enabled = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+        self.directory = os.getenv('METRICS_DIR') or os.getenv('PROMETHEUS_MULTIPROC_DIR') or None
+        self.flush_seconds = _env_float('METRICS_FLUSH_SECONDS', 1.0)
+        # Bearer token for /metrics; when unset, only direct loopback scrapes are served
+        self.token = os.getenv('METRICS_TOKEN') or None
+
+
+class Registry:
+    """Named metrics, snapshotted to JSON-safe dicts and merged across processes"""
+
+    def __init__(self):
+        self._metrics: Dict[str, '_Metric'] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric: '_Metric'):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+
+    def on_collect(self, collector: Callable[[], None]):
+        """Run `collector` before each scrape, e.g. to set a gauge from shared state"""
+        self._collectors.append(collector)
+
+    def collect(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {collector!r} failed: {e}")
+
+    def reset(self):
+        """Zero every metric (in a forked worker, whose copies hold the parent's values)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def snapshot(self, shared_only: bool = False) -> Dict[str, Dict[str, Any]]:
+        """{name: {'type', 'samples': [[label values, value], ...]}}; shared_only leaves out local gauges"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return {m.name: {'type': m.kind, 'samples': m.samples()} for m in metrics
+                if not (shared_only and m.local_only)}
+
+    def render(self, merged: Dict[str, Dict[Tuple, Any]]) -> str:
+        """Prometheus text exposition format"""
+        lines: List[str] = []
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda m: m.name)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for key, value in sorted(merged.get(metric.name, {}).items()):
+                lines.extend(metric.exposition(key, value))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def _add(kind: str, total: Any, value: Any) -> Any:
+    if kind == 'histogram':
+        return [[a + b for a, b in zip(total[0], value[0])], total[1] + value[1]]
+    return total + value
+
+
+def merge(snapshots: Sequence[Dict[str, Dict[str, Any]]], live: bool = True) -> Dict[str, Dict[Tuple, Any]]:
+    """
+    Add up snapshots per series; live=False drops gauges (an exited
+    worker's in-flight requests are over). Snapshots carry their types, so
+    the master can merge metrics it never imported.
+    """
+    merged: Dict[str, Dict[Tuple, Any]] = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            kind = metric['type']
+            if not live and kind == 'gauge':
+                continue
+            series = merged.setdefault(name, {})
+            for labels, value in metric['samples']:
+                key = tuple(labels)
+                series[key] = _add(kind, series[key], value) if key in series else value
+    return merged
+
+
+def to_snapshot(merged: Dict[str, Dict[Tuple, Any]], kinds: Dict[str, str]) -> Dict[str, Dict[str, Any]]:
+    return {name: {'type': kinds[name], 'samples': [[list(key), value] for key, value in series.items()]}
+            for name, series in merged.items()}
+
+
+def _escape_help(text: str) -> str:
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = ''
+    local_only = False
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], Any] = {}
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[Any]:
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def reset(self):
+        with self._lock:
+            self._values = {}
+
+    def exposition(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down
+
+    Summed across workers (in-flight requests); local=True gauges are set
+    from shared state at scrape time (session counts) and only the worker
+    serving the scrape reports them.
+    """
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY, local: bool = False):
+        super().__init__(name, documentation, labelnames, registry)
+        self.local_only = local
+
+    def inc(self, amount: float = 1.0, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram(_Metric):
+    """Observations counted into buckets; each series is [per-bucket counts (last is +Inf), sum]"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> List[Any]:
+        with self._lock:
+            return [[list(key), [list(counts), total]] for key, (counts, total) in self._values.items()]
+
+    def exposition(self, key: Tuple[str, ...], value: Any) -> List[str]:
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_format_value(cumulative)}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_format_value(cumulative)}")
+        return lines
+
+
+# Application metrics, updated where the work happens
+BEDROCK_CALL_SECONDS = Histogram('chopchop_bedrock_call_duration_seconds',
+                                 'Bedrock converse call latency, including failed calls', ['model'],
+                                 buckets=MODEL_BUCKETS)
+BEDROCK_ERRORS = Counter('chopchop_bedrock_errors_total', 'Failed Bedrock calls by AWS error code',
+                         ['model', 'code'])
+SUPABASE_CALL_SECONDS = Histogram('chopchop_supabase_call_duration_seconds',
+                                  'SupabaseManager call latency by method', ['method'], buckets=DATABASE_BUCKETS)
+IMAGE_BYTES = Histogram('chopchop_image_bytes', 'Photo sizes: uploaded (in) and sent to Bedrock (out)',
+                        ['direction'], buckets=IMAGE_BYTE_BUCKETS)
+SESSIONS = Gauge('chopchop_sessions', 'Live stored sign-in sessions', ['store'], local=True)
+FRIDGE_JOBS = Counter('chopchop_fridge_jobs_total',
+                      'Fridge analysis jobs by outcome (submitted, deduplicated, rejected, retried, deferred, '
+                      'succeeded, failed)', ['outcome'])
+FRIDGE_JOB_WAIT_SECONDS = Histogram('chopchop_fridge_job_wait_seconds',
+                                    'Time a fridge analysis job waited before its first attempt started',
+                                    buckets=MODEL_BUCKETS)
+REQUESTS_SHED = Counter('chopchop_requests_shed_total',
+                        'Requests refused with 503 by admission control, by route class and reason',
+                        ['route_class', 'reason'])
+ADMISSION_WAIT_SECONDS = Histogram('chopchop_admission_wait_seconds',
+                                   'Time admitted requests waited for an in-flight slot, by route class',
+                                   ['route_class'])
+MODEL_QUEUE_WAIT_SECONDS = Histogram('chopchop_model_queue_wait_seconds',
+                                     'Time admitted model calls waited in the fair-share queue, by kind', ['kind'])
+MODEL_REJECTIONS = Counter('chopchop_model_rejections_total',
+                           'Model calls refused with 429 by the fair-share scheduler, by kind and reason',
+                           ['kind', 'reason'])
+
+
+def error_code(error: BaseException) -> str:
+    """AWS error code of a botocore ClientError, else the exception type"""
+    response = getattr(error, 'response', None)
+    if isinstance(response, dict):
+        code = response.get('Error', {}).get('Code')
+        if code:
+            return str(code)
+    return type(error).__name__
+
+
+@contextmanager
+def bedrock_call(model: str) -> Iterator[None]:
+    """Time a Bedrock call, and count its failure by error code"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        BEDROCK_ERRORS.inc(model=model, code=error_code(e))
+        raise
+    finally:
+        BEDROCK_CALL_SECONDS.observe(time.perf_counter() - start, model=model)
+
+
+def timed_methods(histogram: Histogram, methods: Sequence[str]):
+    """Class decorator: time the named methods the class defines into `histogram`, labelled by method"""
+    def decorate(cls):
+        for name in methods:
+            # KeyError for a misspelt or inherited name rather than a silently missing series
+            setattr(cls, name, _timed(vars(cls)[name], histogram, name))
+        return cls
+    return decorate
+
+
+def _timed(method: Callable, histogram: Histogram, name: str) -> Callable:
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, method=name)
+    timed.__name__ = method.__name__
+    timed.__qualname__ = method.__qualname__
+    timed.__doc__ = method.__doc__
+    timed.__wrapped__ = method
+    return timed
+
+
+class WorkerFiles:
+    """Per-worker snapshot files in a directory shared by the gunicorn master and workers"""
+
+    def __init__(self, directory: str, registry: Registry = REGISTRY, flush_seconds: float = 1.0):
+        self.directory = directory
+        self.registry = registry
+        self.flush_seconds = flush_seconds
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+        self._id = f"{os.getpid()}-{os.urandom(4).hex()}"
+        self.stats = {'writes': 0, 'errors': 0}
+
+    @property
+    def worker_id(self) -> str:
+        # pid plus a random suffix, so a reused pid never inherits a folded worker's file
+        if not self._id.startswith(f"{os.getpid()}-"):
+            self._id = f"{os.getpid()}-{os.urandom(4).hex()}"
+        return self._id
+
+    def _path(self, worker_id: str) -> str:
+        return os.path.join(self.directory, f"worker-{worker_id}.json")
+
+    def ensure_writer(self):
+        if self._writer_pid == os.getpid() and self._writer is not None and self._writer.is_alive():
+            return
+        with self._lock:
+            # Threads do not survive fork; each gunicorn worker starts its own
+            if self._writer_pid == os.getpid() and self._writer is not None and self._writer.is_alive():
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._writer = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+            self._writer.start()
+            self._writer_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            self.write()
+
+    def write(self) -> bool:
+        """Write this process's snapshot; False on error"""
+        worker_id = self.worker_id
+        try:
+            _write_json(self._path(worker_id), {'id': worker_id, 'metrics': self.registry.snapshot(shared_only=True)})
+        except OSError as e:
+            logger.error(f"Failed to write metrics snapshot to {self.directory}: {e}")
+            with self._lock:
+                self.stats['errors'] += 1
+            return False
+        with self._lock:
+            self.stats['writes'] += 1
+        return True
+
+    def read_others(self) -> List[Dict[str, Dict[str, Any]]]:
+        """Snapshots of the other live workers and of exited ones, to merge with this worker's"""
+        own = self._path(self.worker_id)
+        workers = [_read_json(path) for path in glob.glob(os.path.join(self.directory, 'worker-*.json'))
+                   if path != own]
+        # Read the archive last: a worker folded in meanwhile is then skipped rather than counted twice
+        archive = _read_json(os.path.join(self.directory, ARCHIVE_FILE)) or {'folded': [], 'metrics': {}}
+        folded = set(archive['folded'])
+        return [w['metrics'] for w in workers if w and w['id'] not in folded] + [archive['metrics']]
+
+    def worker_count(self) -> int:
+        return len(glob.glob(os.path.join(self.directory, 'worker-*.json')))
+
+    def mark_process_dead(self, pid: int) -> int:
+        """Fold an exited worker's counters and histograms into the archive (master only); files folded"""
+        paths = glob.glob(os.path.join(self.directory, f"worker-{pid}-*.json"))
+        snapshots = [snapshot for snapshot in (_read_json(path) for path in paths) if snapshot]
+        if not paths:
+            return 0
+        archive_path = os.path.join(self.directory, ARCHIVE_FILE)
+        archive = _read_json(archive_path) or {'folded': [], 'metrics': {}}
+        sources = [archive['metrics']] + [s['metrics'] for s in snapshots]
+        kinds = {name: metric['type'] for source in sources for name, metric in source.items()}
+        # Readers only need a folded id until its file is gone
+        folded = [worker_id for worker_id in archive['folded'] if os.path.exists(self._path(worker_id))]
+        folded += [s['id'] for s in snapshots]
+        _write_json(archive_path, {'folded': folded, 'metrics': to_snapshot(merge(sources, live=False), kinds)})
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return len(paths)
+
+
+def _write_json(path: str, document: Dict[str, Any]):
+    # Written aside and renamed, so readers never see half a file
+    partial = f"{path}.{os.getpid()}.tmp"
+    with open(partial, 'w', encoding='utf-8') as f:
+        json.dump(document, f, separators=(',', ':'))
+    os.replace(partial, path)
+
+
+def _read_json(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Skipping unreadable metrics snapshot {path}: {e}")
+        return None
+
+
+class AppMetrics:
+    """Request metrics for a Flask app, and the /metrics scrape across workers"""
+
+    def __init__(self, settings: Optional[MetricsSettings] = None, registry: Registry = REGISTRY):
+        self.settings = settings or MetricsSettings()
+        self.registry = registry
+        self.requests = Counter('chopchop_http_requests_total', 'HTTP requests by route, method and status',
+                                ['route', 'method', 'status'], registry)
+        self.latency = Histogram('chopchop_http_request_duration_seconds', 'HTTP request latency by route',
+                                 ['route', 'method'], registry)
+        self.in_flight = Gauge('chopchop_http_requests_in_flight', 'HTTP requests being served', registry=registry)
+        self.files = (WorkerFiles(self.settings.directory, registry, self.settings.flush_seconds)
+                      if self.settings.directory else None)
+        if self.files is not None:
+            # Each worker's file holds only what it did itself, or the sum would count the parent's share twice
+            os.register_at_fork(after_in_child=registry.reset)
+        self.scrapes = 0
+
+    def start_request(self):
+        """before_request hook"""
+        if self.files is not None:
+            self.files.ensure_writer()
+        g.metrics_started = time.perf_counter()
+        self.in_flight.inc()
+
+    def finish_request(self, response: Response) -> Response:
+        """after_request hook"""
+        started = g.get('metrics_started')
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            self.requests.inc(route=route, method=request.method, status=response.status_code)
+            self.latency.observe(time.perf_counter() - started, route=route, method=request.method)
+        return response
+
+    def teardown_request(self, error: Optional[BaseException] = None):
+        if g.pop('metrics_started', None) is not None:
+            self.in_flight.dec()
+
+    def authorized(self) -> bool:
+        """True if the request carries METRICS_TOKEN or, with no token set, comes straight from this host"""
+        if not self.settings.token:
+            # A reverse proxy on the same host connects from loopback too, but adds X-Forwarded-For
+            return request.remote_addr in LOOPBACK_ADDRESSES and 'X-Forwarded-For' not in request.headers
+        header = request.headers.get('Authorization', '')
+        return header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], self.settings.token)
+
+    def render(self) -> str:
+        """Every worker's metrics, added up, in the text exposition format"""
+        self.registry.collect()
+        snapshots = self.files.read_others() if self.files is not None else []
+        snapshots.append(self.registry.snapshot())
+        self.scrapes += 1
+        return self.registry.render(merge(snapshots))
+
+    def response(self) -> Response:
+        return Response(self.render(), content_type=CONTENT_TYPE)
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = {'enabled': self.settings.enabled, 'directory': self.settings.directory, 'scrapes': self.scrapes}
+        if self.files is not None:
+            stats.update(self.files.stats, workers=self.files.worker_count())
+        return stats
+
+
+_app_metrics: Optional[AppMetrics] = None
+
+
+def configure_metrics(app: Flask, settings: Optional[MetricsSettings] = None,
+                      registry: Registry = REGISTRY) -> AppMetrics:
+    """
+    Count and time `app`'s requests; returns the AppMetrics that renders /metrics
+
+    Register before the other after_request hooks (they run in reverse
+    order), so the latency covers them.
+    """
+    global _app_metrics
+    metrics = AppMetrics(settings, registry)
+    if metrics.settings.enabled:
+        app.before_request(metrics.start_request)
+        app.after_request(metrics.finish_request)
+        app.teardown_request(metrics.teardown_request)
+    if registry is REGISTRY:
+        _app_metrics = metrics
+    return metrics
+
+
+def flush():
+    """Write this worker's final snapshot (gunicorn worker_exit)"""
+    if _app_metrics is not None and _app_metrics.files is not None:
+        _app_metrics.files.write()
+
+
+def mark_process_dead(pid: int, directory: Optional[str] = None) -> int:
+    """Keep an exited worker's totals (gunicorn child_exit, in the master)"""
+    directory = directory or MetricsSettings().directory
+    if not directory or not os.path.isdir(directory):
+        return 0
+    return WorkerFiles(directory).mark_process_dead(pid)
@@ -0,0 +1,209 @@
+"""
+Per-user fair-share scheduling of Bedrock model calls
+
+A fridge analysis holds a request thread for many seconds, so without a
+limit one user firing a burst of them can occupy every thread in a worker.
+Every model call therefore passes through a ModelScheduler, which enforces:
+
+- a per-user token bucket (MODEL_USER_RATE_PER_MINUTE cost units, burst
+  MODEL_USER_BURST); a call costs MODEL_COST_CHAT or MODEL_COST_FRIDGE units
+- a cap on each user's calls running at once (MODEL_MAX_IN_FLIGHT_PER_USER)
+  and waiting (MODEL_MAX_QUEUED_PER_USER)
+- MODEL_CONCURRENCY calls running per worker in total, handed out by a
+  weighted fair queue: start-time fair queueing over users, so a user's
+  place in line advances by the cost of each call they make and a heavy
+  user cannot push ahead of a light one
+
+A call that is over its rate, over its queue cap or still waiting after
+MODEL_QUEUE_TIMEOUT seconds raises ModelRateLimited with a retry-after
+hint, which the API turns into 429 + Retry-After. Limits are per gunicorn
+worker process.
+"""
+import os
+import math
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from metrics import MODEL_QUEUE_WAIT_SECONDS, MODEL_REJECTIONS
+from rate_limit import KeyedTokenBuckets
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class SchedulerSettings:
+    """Model call limits, read from environment variables"""
+
+    def __init__(self):
+        self.concurrency = _env_int('MODEL_CONCURRENCY', 4)
+        self.max_in_flight_per_user = _env_int('MODEL_MAX_IN_FLIGHT_PER_USER', 1)
+        self.max_queued_per_user = _env_int('MODEL_MAX_QUEUED_PER_USER', 2)
+        self.user_rate_per_minute = _env_float('MODEL_USER_RATE_PER_MINUTE', 30.0)
+        self.user_burst = _env_float('MODEL_USER_BURST', 10.0)
+        self.queue_timeout = _env_float('MODEL_QUEUE_TIMEOUT', 20.0)
+        self.costs = {'chat': _env_float('MODEL_COST_CHAT', 1.0), 'fridge': _env_float('MODEL_COST_FRIDGE', 4.0)}
+
+
+class ModelRateLimited(Exception):
+    """A model call was refused; retry_after is a whole number of seconds"""
+
+    def __init__(self, reason: str, retry_after: float):
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"{reason}; retry after {self.retry_after}s")
+
+
+class _Ticket:
+    __slots__ = ('user', 'start_tag', 'granted', 'enqueued_at')
+
+    def __init__(self, user: str, start_tag: float):
+        self.user = user
+        self.start_tag = start_tag
+        self.granted = threading.Event()
+        self.enqueued_at = time.perf_counter()
+
+
+class ModelScheduler:
+    """Admits model calls per user and runs them in weighted fair order"""
+
+    WAIT_SAMPLES = 1000
+
+    def __init__(self, settings: Optional[SchedulerSettings] = None):
+        self.settings = settings or SchedulerSettings()
+        s = self.settings
+        self.buckets = KeyedTokenBuckets(s.user_rate_per_minute / 60.0, burst=s.user_burst)
+        self._lock = threading.Lock()
+        self._queue: List[_Ticket] = []
+        self._in_flight: Dict[str, int] = {}
+        self._queued: Dict[str, int] = {}
+        self._finish_tags: Dict[str, float] = {}
+        self._virtual_time = 0.0
+        self._running = 0
+        self._wait_samples: Deque[float] = deque(maxlen=self.WAIT_SAMPLES)
+        self._call_seconds = 5.0
+        self.stats = {'admitted': 0, 'completed': 0, 'rejected_rate': 0, 'rejected_queue': 0, 'timed_out': 0,
+                      'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0}
+
+    def cost(self, kind: str) -> float:
+        return self.settings.costs.get(kind, 1.0)
+
+    def call(self, user: str, kind: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run func(*args, **kwargs) as `user`'s model call of the given kind
+
+        Raises:
+            ModelRateLimited: If the call is refused or waits too long
+        """
+        ticket = self._admit(user, kind)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._release(ticket, time.perf_counter() - started)
+
+    def _admit(self, user: str, kind: str) -> _Ticket:
+        s = self.settings
+        cost = self.cost(kind)
+        with self._lock:
+            if self._queued.get(user, 0) >= s.max_queued_per_user:
+                self.stats['rejected_queue'] += 1
+                MODEL_REJECTIONS.inc(kind=kind, reason='queue')
+                raise ModelRateLimited("Too many model requests waiting", self._call_seconds)
+            # Checked second so a call refused for queueing does not spend tokens
+            # A call dearer than the whole burst would otherwise never fit
+            wait = self.buckets.try_acquire(user, min(cost, s.user_burst))
+            if wait > 0:
+                self.stats['rejected_rate'] += 1
+                MODEL_REJECTIONS.inc(kind=kind, reason='rate')
+                raise ModelRateLimited("Too many model requests", wait)
+            start_tag = max(self._virtual_time, self._finish_tags.get(user, 0.0))
+            self._finish_tags[user] = start_tag + cost
+            ticket = _Ticket(user, start_tag)
+            self._queue.append(ticket)
+            self._queued[user] = self._queued.get(user, 0) + 1
+            self._dispatch()
+        if not ticket.granted.wait(s.queue_timeout):
+            with self._lock:
+                if not ticket.granted.is_set():
+                    self._queue.remove(ticket)
+                    self._unqueue(user)
+                    self.stats['timed_out'] += 1
+                    MODEL_REJECTIONS.inc(kind=kind, reason='timeout')
+                    raise ModelRateLimited("Model calls are busy", self._call_seconds)
+        waited = time.perf_counter() - ticket.enqueued_at
+        with self._lock:
+            self._wait_samples.append(waited)
+            self.stats['wait_seconds_total'] += waited
+            self.stats['wait_seconds_max'] = max(self.stats['wait_seconds_max'], waited)
+        MODEL_QUEUE_WAIT_SECONDS.observe(waited, kind=kind)
+        return ticket
+
+    def _dispatch(self):
+        """Grant queued tickets, smallest start tag first, while slots are free (lock held)"""
+        s = self.settings
+        while self._running < s.concurrency and self._queue:
+            eligible = [t for t in self._queue if self._in_flight.get(t.user, 0) < s.max_in_flight_per_user]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda t: t.start_tag)
+            self._queue.remove(ticket)
+            self._unqueue(ticket.user)
+            self._in_flight[ticket.user] = self._in_flight.get(ticket.user, 0) + 1
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, ticket.start_tag)
+            self.stats['admitted'] += 1
+            ticket.granted.set()
+
+    def _unqueue(self, user: str):
+        self._queued[user] -= 1
+        if not self._queued[user]:
+            del self._queued[user]
+
+    def _release(self, ticket: _Ticket, call_seconds: float):
+        with self._lock:
+            self._running -= 1
+            self._in_flight[ticket.user] -= 1
+            if not self._in_flight[ticket.user]:
+                del self._in_flight[ticket.user]
+                # An idle user whose tag is behind virtual time would restart from it anyway
+                if ticket.user not in self._queued and self._finish_tags.get(ticket.user, 0.0) <= self._virtual_time:
+                    self._finish_tags.pop(ticket.user, None)
+            self.stats['completed'] += 1
+            # Moving average of call duration, used for Retry-After hints
+            self._call_seconds = 0.9 * self._call_seconds + 0.1 * call_seconds
+            self._dispatch()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._wait_samples)
+            stats = dict(self.stats)
+            running, queued, users = self._running, len(self._queue), len(self._in_flight)
+
+        def percentile(p: float) -> Optional[float]:
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            'running': running, 'queued': queued, 'active_users': users,
+            'admitted': stats['admitted'], 'completed': stats['completed'],
+            'rejected_rate': stats['rejected_rate'], 'rejected_queue': stats['rejected_queue'],
+            'timed_out': stats['timed_out'],
+            'queue_wait_ms': {
+                'mean': round(stats['wait_seconds_total'] / stats['admitted'] * 1000, 2) if stats['admitted'] else None,
+                'p50': percentile(0.50), 'p95': percentile(0.95),
+                'max': round(stats['wait_seconds_max'] * 1000, 2),
+            },
+        }
+
+
+model_scheduler = ModelScheduler()
@@ -4,23 +4,37 @@ Flask backend server for ChopChop Frontend
 Integrates with Amazon Nova Lite model via AWS Bedrock
 """
 
-from flask import Flask, request, jsonify
+import coldstart
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import boto3
 import base64
+import json
 import os
-from botocore.exceptions import ClientError
+import sys
 import logging
-from PIL import Image
 import io
-from dotenv import load_dotenv
+from coldstart import lazy_import
+from json_provider import configure_json
+from response_compression import configure_compression
+from tracing import configure_tracing, span
+from admission import configure_admission
+from metrics import configure_metrics, bedrock_call, IMAGE_BYTES, SESSIONS, REGISTRY
 from supabase_config import supabase_manager
+from email_service import get_email_service
+from session_store import get_session_store
+from session_tokens import create_session_tokens, is_session_token
+from model_scheduler import model_scheduler, ModelRateLimited
+from fridge_jobs import FridgeJobQueue, JobRejected, JobFailed, JobDeferred
+from storage_backend import get_storage, VersionConflictError, UserNotFoundError
+from json_patch import JsonPatchError
+from bulk_transfer import iter_ndjson, BulkTransferError, DEFAULT_EXPORT_BATCH_SIZE
 from aws_config import setup_aws, get_bedrock_client, check_aws_status
-import uuid
 import time
+import hmac
+import hashlib
 
 # Load environment variables from .env file
-load_dotenv()
+coldstart.load_env_file()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -28,40 +42,85 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for frontend communication
+# orjson-backed request parsing and responses (JSON_PROVIDER=orjson|stdlib)
+json_provider = configure_json(app)
+# Prometheus request counts and latencies per route, added up across workers for /metrics
+metrics = configure_metrics(app)
+# Sampled per-stage timing: Server-Timing headers and OTLP/JSON trace records
+tracer = configure_tracing(app)
+# zstd/br/gzip by Accept-Encoding for large JSON and NDJSON bodies
+response_compressor = configure_compression(app)
+# Separate in-flight limits and short queues for model calls and everything else; overload is shed with 503
+admission = configure_admission(app, route_classes={'chat': 'model'},
+                                exempt=('health_check', 'prometheus_metrics', 'stream_fridge_job', 'admin_export'))
 
 # Initialize AWS configuration at startup
 logger.info("🚀 Starting ChopChop Backend...")
 aws_setup_success = setup_aws()
 
 if not aws_setup_success:
-    logger.error("❌ AWS setup failed - Bedrock features will be disabled")
-    logger.error("Please check your AWS credentials in environment variables")
+    logger.error("❌ AWS setup failed - Bedrock calls will fail until it is fixed")
+    logger.error("Please check your AWS credentials and region in environment variables")
 
-# Simple in-memory session store (in production, use Redis or database)
-user_sessions = {}
+# Persistence for user data and chat history (STORAGE_BACKEND=supabase|sqlite)
+storage = get_storage()
+
+# Pooled SMTP sessions and the background delivery queue
+email_service = get_email_service()
+
+# Sign-in sessions live in get_session_store(), shared by every worker (SESSION_STORE=sqlite|redis|memory)
+# and opened on first use rather than at import.
+# SESSION_MODE=token: stateless signed tokens; stored session ids keep working
+session_tokens = create_session_tokens(get_session_store)
+
+def count_sessions():
+    """Set the session gauge at scrape time (the store is shared, so one worker reports it)"""
+    session_store = get_session_store()
+    count = session_store.count()
+    if count is not None:
+        SESSIONS.set(count, store=session_store.backend_name)
+
+REGISTRY.on_collect(count_sessions)
 
 def create_user_session(email):
-    """Create a new user session"""
-    session_id = str(uuid.uuid4())
-    user_sessions[session_id] = {
-        'email': email,
-        'created_at': time.time(),
-        'last_activity': time.time()
-    }
-    return session_id
+    """Create a new user session; returns its id (or signed token), or None if the store failed"""
+    if session_tokens:
+        return session_tokens.issue(email)
+    return get_session_store().create(email)
 
 def validate_session(session_id):
     """Validate user session and return email if valid"""
-    if session_id in user_sessions:
-        session = user_sessions[session_id]
-        # Check if session is not expired (24 hours)
-        if time.time() - session['created_at'] < 86400:
-            session['last_activity'] = time.time()
-            return session['email']
-        else:
-            # Remove expired session
-            del user_sessions[session_id]
-    return None
+    if session_tokens and is_session_token(session_id):
+        claims = session_tokens.verify(session_id)
+        return claims['email'] if claims else None
+    session = get_session_store().get(session_id)
+    return session['email'] if session else None
+
+def end_user_session(session_id):
+    """Sign a session (or signed token) out; True if it was live"""
+    if session_tokens and is_session_token(session_id):
+        return session_tokens.revoke(session_id)
+    return get_session_store().delete(session_id)
+
+def rate_limited_response(error):
+    """429 with a Retry-After header for a refused model call"""
+    response = jsonify({"error": error.reason, "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
+def is_admin_request():
+    """True if the request carries the ADMIN_API_TOKEN bearer token (admin routes are off without one)"""
+    token = os.getenv('ADMIN_API_TOKEN')
+    if not token:
+        return False
+    header = request.headers.get('Authorization', '')
+    return header.startswith('Bearer ') and hmac.compare_digest(header[len('Bearer '):], token)
+
+def not_modified(etag):
+    """Build an empty 304 response for a conditional read whose ETag still matches"""
+    response = app.response_class(status=304)
+    response.set_etag(etag)
+    return response
 
 def preprocess_image(image_base64, max_size_mb=3, max_dimension=1024):
     """
@@ -75,9 +134,12 @@ def preprocess_image(image_base64, max_size_mb=3, max_dimension=1024):
     Returns:
         tuple: (processed_image_base64, format)
     """
+    Image = lazy_import('PIL.Image')
     try:
         # Decode base64 image
-        image_data = base64.b64decode(image_base64)
+        with span('base64_decode', base64_bytes=len(image_base64)):
+            image_data = base64.b64decode(image_base64)
+        IMAGE_BYTES.observe(len(image_data), direction='in')
         image = Image.open(io.BytesIO(image_data))
         
         # Convert to RGB if necessary (handles RGBA, P, etc.)
@@ -116,6 +178,7 @@ def preprocess_image(image_base64, max_size_mb=3, max_dimension=1024):
             
             if len(compressed_data) <= max_size_bytes:
                 logger.info(f"Image compressed to {len(compressed_data) / 1024 / 1024:.2f}MB with quality {quality}")
+                IMAGE_BYTES.observe(len(compressed_data), direction='out')
                 return compressed_data, 'jpeg'
         
         # If still too large, resize more aggressively
@@ -128,33 +191,15 @@ def preprocess_image(image_base64, max_size_mb=3, max_dimension=1024):
         compressed_data = output.getvalue()
         
         logger.info(f"Final image size: {len(compressed_data) / 1024 / 1024:.2f}MB")
+        IMAGE_BYTES.observe(len(compressed_data), direction='out')
         return compressed_data, 'jpeg'
         
     except Exception as e:
         logger.error(f"Error preprocessing image: {e}")
         raise Exception(f"Failed to preprocess image: {e}")
 
-def generate_recipes_from_fridge(message, image_bytes, image_format):
-    """
-    Generate recipes based on ingredients found in a fridge photo
-    
-    Args:
-        message (str): The user's message
-        image_bytes (bytes): Raw image bytes
-        image_format (str): Image format
-    
-    Returns:
-        str: Recipe suggestions based on ingredients
-    """
-    client = get_bedrock_client()
-    if client is None:
-        raise Exception("Bedrock client not initialized")
-    if client is None:
-        raise Exception("Bedrock client not initialized. Check AWS credentials/configuration.")
-    model_id = "us.amazon.nova-pro-v1:0"
-    
-    # Prepare specialized prompt for fridge analysis with structured output
-    fridge_prompt = """You are a professional chef and food expert. Analyze this fridge photo and return a JSON response with the following structure:
+# Fridge analysis prompt with structured output; built once at import (before fork under preload)
+FRIDGE_ANALYSIS_PROMPT = """You are a professional chef and food expert. Analyze this fridge photo and return a JSON response with the following structure:
 
 {
   "ingredients": [
@@ -198,10 +243,28 @@ def generate_recipes_from_fridge(message, image_bytes, image_format):
 }
 
 Analyze the fridge photo and provide this structured response. Be specific about quantities and cooking techniques."""
+
+def generate_recipes_from_fridge(message, image_bytes, image_format):
+    """
+    Generate recipes based on ingredients found in a fridge photo
+    
+    Args:
+        message (str): The user's message
+        image_bytes (bytes): Raw image bytes
+        image_format (str): Image format
+    
+    Returns:
+        str: Recipe suggestions based on ingredients
+    """
+    client = get_bedrock_client()
+    if client is None:
+        raise Exception("Bedrock client not initialized. Check AWS credentials/configuration.")
+    from botocore.exceptions import ClientError  # already loaded with the client
+    model_id = "us.amazon.nova-pro-v1:0"
     
     # Prepare the content
     content = [
-            {"text": fridge_prompt},
+            {"text": FRIDGE_ANALYSIS_PROMPT},
             {
                 "image": {
                     "format": image_format or "jpeg",
@@ -222,28 +285,29 @@ Analyze the fridge photo and provide this structured response. Be specific about
     
     try:
         # Send the message to the model with higher token limit for detailed recipes
-        response = client.converse(
-            modelId=model_id,
-            messages=conversation,
-            inferenceConfig={
-                "maxTokens": 2048,  # Increased for detailed structured output
-                "temperature": 0.3,  # Lower for more consistent JSON
-                "topP": 0.9
-            },
-        )
+        with span('bedrock', model=model_id, image_bytes=len(image_bytes)), bedrock_call(model_id):
+            response = client.converse(
+                modelId=model_id,
+                messages=conversation,
+                inferenceConfig={
+                    "maxTokens": 2048,  # Increased for detailed structured output
+                    "temperature": 0.3,  # Lower for more consistent JSON
+                    "topP": 0.9
+                },
+            )
         
         # Extract and parse the response text
         response_text = response["output"]["message"]["content"][0]["text"]
         
         # Try to parse as JSON, fallback to text if parsing fails
         try:
-            import json
             # Look for JSON in the response (sometimes Nova adds extra text)
             json_start = response_text.find('{')
             json_end = response_text.rfind('}') + 1
             if json_start != -1 and json_end > json_start:
                 json_str = response_text[json_start:json_end]
-                parsed_data = json.loads(json_str)
+                with span('parse_json', chars=len(json_str)):
+                    parsed_data = json.loads(json_str)
                 return {
                     "type": "structured",
                     "data": parsed_data
@@ -281,25 +345,25 @@ def send_message_to_nova(message, image_bytes=None, image_format=None):
         str: Response from the model
     """
     client = get_bedrock_client()
-    if client is None:
-        raise Exception("Bedrock client not initialized")
     if client is None:
         raise Exception("Bedrock client not initialized. Check AWS credentials/configuration.")
+    from botocore.exceptions import ClientError  # already loaded with the client
     model_id = "us.amazon.nova-pro-v1:0"
     
     try:
         # Text-only path uses converse API (not invoke_model)
         if not image_bytes:
             conversation = [{"role": "user", "content": [{"text": message}]}]
-            response = client.converse(
-                modelId=model_id,
-                messages=conversation,
-                inferenceConfig={
-                    "maxTokens": 2048,
-                    "temperature": 0.7,
-                    "topP": 0.9
-                }
-            )
+            with span('bedrock', model=model_id), bedrock_call(model_id):
+                response = client.converse(
+                    modelId=model_id,
+                    messages=conversation,
+                    inferenceConfig={
+                        "maxTokens": 2048,
+                        "temperature": 0.7,
+                        "topP": 0.9
+                    }
+                )
             response_text = response["output"]["message"]["content"][0]["text"]
             return response_text
         
@@ -314,15 +378,16 @@ def send_message_to_nova(message, image_bytes=None, image_format=None):
             }
         })
         conversation = [{"role": "user", "content": content}]
-        response = client.converse(
-            modelId=model_id,
-            messages=conversation,
-            inferenceConfig={
-                "maxTokens": 2048,
-                "temperature": 0.3,
-                "topP": 0.9
-            },
-        )
+        with span('bedrock', model=model_id, image_bytes=len(image_bytes)), bedrock_call(model_id):
+            response = client.converse(
+                modelId=model_id,
+                messages=conversation,
+                inferenceConfig={
+                    "maxTokens": 2048,
+                    "temperature": 0.3,
+                    "topP": 0.9
+                },
+            )
         response_text = response["output"]["message"]["content"][0]["text"]
         return response_text
         
@@ -333,6 +398,92 @@ def send_message_to_nova(message, image_bytes=None, image_format=None):
         logger.error(f"Error calling Nova model: {e}")
         raise Exception(f"Error calling Nova model: {e}")
 
+def save_chat_exchange(email, message, image_base64, image_format, response_text):
+    """Save a chat message and the model's answer (and any detected pantry items); failures are only logged"""
+    try:
+        # Save user message
+        with span('save_user_message'):
+            storage.save_chat_message(email, message, 'user', image_base64, image_format)
+        
+        # Save Nova response
+        if isinstance(response_text, dict) and response_text.get('type') == 'structured':
+            # For structured responses, save the full response
+            with span('save_model_message'):
+                storage.save_chat_message(email, str(response_text), 'nova')
+            
+            # Record detected ingredients in the normalized pantry table
+            ingredients = response_text['data'].get('ingredients') if isinstance(response_text['data'], dict) else None
+            if ingredients:
+                with span('upsert_pantry', items=len(ingredients)):
+                    storage.upsert_pantry_items(email, ingredients)
+        else:
+            # For text responses, save as text
+            response_text_str = response_text if isinstance(response_text, str) else str(response_text)
+            with span('save_model_message'):
+                storage.save_chat_message(email, response_text_str, 'nova')
+            
+    except Exception as e:
+        logger.warning(f"Failed to save chat message: {e}")
+        # Don't fail the request if saving fails
+
+def client_address():
+    """
+    The client's address as the proxy in front of the app saw it
+
+    X-Forwarded-For reads "<hops the client sent>, <address the proxy saw>":
+    only the last entry, appended by the proxy, is not up to the client.
+    """
+    route = request.access_route
+    return route[-1] if route else request.remote_addr
+
+def proxied_client():
+    """
+    The client address the Next.js API routes vouch for, or None
+
+    Requests relayed by the frontend's API routes all arrive from its own
+    address, so it names the browser's address in X-ChopChop-Client and
+    signs it in X-ChopChop-Client-Signature (hex HMAC-SHA256 under
+    PROXY_SHARED_SECRET). Unsigned or wrongly signed values are ignored.
+    """
+    secret = os.getenv('PROXY_SHARED_SECRET')
+    client = request.headers.get('X-ChopChop-Client')
+    if not secret or not client:
+        return None
+    expected = hmac.new(secret.encode('utf-8'), client.encode('utf-8'), hashlib.sha256).hexdigest()
+    signature = request.headers.get('X-ChopChop-Client-Signature', '')
+    return client if hmac.compare_digest(signature.encode('utf-8'), expected.encode('ascii')) else None
+
+def model_caller(session_id):
+    """
+    Fair-share identity for model calls: the signed-in user, else the client address
+
+    The address is the one the frontend proxy signed for, else the one the
+    load balancer appended. Never the email in the request body, which any
+    caller could change to get a fresh bucket.
+    """
+    email = validate_session(session_id) if isinstance(session_id, str) and session_id else None
+    return email or f"ip:{proxied_client() or client_address()}"
+
+def run_fridge_job(job):
+    """Background half of POST /chat/jobs: what /chat does for a fridge photo"""
+    try:
+        image_bytes, image_format = preprocess_image(job['image_base64'])
+    except Exception as e:
+        raise JobFailed(f"Failed to process image: {e}")
+    try:
+        result = model_scheduler.call(job['owner'], 'fridge', generate_recipes_from_fridge,
+                                      job['message'], image_bytes, image_format)
+    except ModelRateLimited as e:
+        raise JobDeferred(e.reason, e.retry_after)
+    if job['email'] and storage.enabled:
+        save_chat_exchange(job['email'], job['message'], job['image_base64'], image_format, result)
+    return result if isinstance(result, dict) else {"type": "text", "data": str(result)}
+
+# Fridge analyses submitted through /chat/jobs, persisted and run by background threads
+fridge_jobs = FridgeJobQueue(run_fridge_job)
+# Each worker process starts its own job threads (and so resumes jobs left by a restart)
+app.before_request(fridge_jobs.ensure_workers)
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -342,11 +493,35 @@ def health_check():
         "service": "chopchop-backend",
         "timestamp": time.time(),
         "supabase_enabled": supabase_manager.enabled,
+        "storage_backend": storage.backend_name,
+        "storage_enabled": storage.enabled,
         "aws_configured": aws_status["is_configured"],
         "aws_region": aws_status["region"],
-        "aws_client_ready": aws_status["client_ready"]
+        "aws_client_ready": aws_status["client_ready"],
+        "supabase_http": supabase_manager.get_http_pool_stats() if supabase_manager.enabled else None,
+        "json_column_encoding": supabase_manager.get_encoding_stats() if supabase_manager.enabled else None,
+        "email": email_service.get_stats() if email_service.configured else None,
+        "sessions": get_session_store().get_stats(),
+        "session_tokens": session_tokens.get_stats() if session_tokens else None,
+        "model_scheduler": model_scheduler.get_stats(),
+        "admission": admission.get_stats(),
+        "fridge_jobs": fridge_jobs.get_stats(),
+        "json_provider": json_provider,
+        "compression": response_compressor.get_stats(),
+        "tracing": tracer.get_stats(),
+        "metrics": metrics.get_stats(),
+        "startup": coldstart.get_startup_report()
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint (bearer METRICS_TOKEN, or local scrapes only when it is unset)"""
+    if not metrics.settings.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    if not metrics.authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+    return metrics.response()
+
 @app.route("/auth/signin", methods=["POST"])
 def signin():
     """Sign in with email"""
@@ -363,6 +538,8 @@ def signin():
         
         # Create user session
         session_id = create_user_session(email)
+        if not session_id:
+            return jsonify({"error": "Sign in failed"}), 500
         
         logger.info(f"User signed in: {email}")
         
@@ -410,8 +587,7 @@ def signout():
         data = request.get_json()
         session_id = data.get('session_id', '')
         
-        if session_id and session_id in user_sessions:
-            del user_sessions[session_id]
+        if session_id and end_user_session(session_id):
             logger.info(f"User signed out: {session_id}")
         
         return jsonify({
@@ -436,9 +612,15 @@ def chat():
         image_base64 = data.get('imageBase64')
         image_format = data.get('imageFormat')
         email = data.get('email')
+        # "object": return the model result as JSON ({"type", "data"}) instead of a JSON string
+        response_format = data.get('responseFormat', 'string')
         
         if not message:
             return jsonify({"error": "Message is required"}), 400
+        if response_format not in ('string', 'object'):
+            return jsonify({"error": "responseFormat must be 'string' or 'object'"}), 400
+        
+        caller = model_caller(data.get('session_id'))
         
         logger.info(f"Received message: {message[:50]}...")
         if image_base64:
@@ -453,7 +635,8 @@ def chat():
             # Preprocess image to meet AWS Bedrock requirements
             try:
                 logger.info("Preprocessing image for AWS Bedrock compatibility...")
-                processed_image_bytes, processed_format = preprocess_image(image_base64)
+                with span('preprocess_image'):
+                    processed_image_bytes, processed_format = preprocess_image(image_base64)
                 logger.info(f"Image preprocessing complete. New format: {processed_format}")
                 image_bytes = processed_image_bytes
                 image_format = processed_format
@@ -471,35 +654,30 @@ def chat():
                 return jsonify({
                     "error": f"Unsupported image format: {image_format}. Supported formats: JPEG, PNG, GIF, WebP"
                 }), 400
-            response_text = generate_recipes_from_fridge(message, image_bytes, image_format)
+            # Includes any wait for a model slot; the bedrock span inside is the call itself
+            with span('model', call='fridge'):
+                response_text = model_scheduler.call(caller, 'fridge', generate_recipes_from_fridge,
+                                                     message, image_bytes, image_format)
         else:
             # Send message to Nova Pro model (text only)
-            response_text = send_message_to_nova(message)
+            with span('model', call='chat'):
+                response_text = model_scheduler.call(caller, 'chat', send_message_to_nova, message)
         
         # Save chat message and response to database if user email is provided
-        if email and supabase_manager.enabled:
-            try:
-                # Save user message
-                supabase_manager.save_chat_message(email, message, 'user', image_base64, image_format)
-                
-                # Save Nova response
-                if isinstance(response_text, dict) and response_text.get('type') == 'structured':
-                    # For structured responses, save the full response
-                    supabase_manager.save_chat_message(email, str(response_text), 'nova')
-                else:
-                    # For text responses, save as text
-                    response_text_str = response_text if isinstance(response_text, str) else str(response_text)
-                    supabase_manager.save_chat_message(email, response_text_str, 'nova')
-                    
-            except Exception as e:
-                logger.warning(f"Failed to save chat message: {e}")
-                # Don't fail the request if saving fails
+        if email and storage.enabled:
+            save_chat_exchange(email, message, image_base64, image_format, response_text)
         
-        # Ensure frontend always receives a string to render
+        if response_format == 'object':
+            result = response_text if isinstance(response_text, dict) else {"type": "text", "data": str(response_text)}
+            return jsonify({
+                "success": True,
+                "response": result
+            })
+        
+        # Default shape: the frontend always receives a string to render
         try:
-            import json as _json
             if isinstance(response_text, dict):
-                safe_response = _json.dumps(response_text)
+                safe_response = app.json.dumps(response_text)
             else:
                 safe_response = str(response_text)
         except Exception:
@@ -510,6 +688,9 @@ def chat():
             "response": safe_response
         })
         
+    except ModelRateLimited as e:
+        logger.info(f"Model call refused for {caller}: {e}")
+        return rate_limited_response(e)
     except Exception as e:
         logger.error(f"Error in chat endpoint: {e}")
         err_str = str(e)
@@ -525,14 +706,120 @@ def chat():
                 "details": err_str
             }), 500
 
+@app.route('/chat/jobs', methods=['POST'])
+def submit_fridge_job():
+    """Queue a fridge photo analysis; 202 with the job id, or 200 with the earlier job for the same photo"""
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+    
+    message = data.get('message') or "Analyze my fridge and suggest recipes"
+    image_base64 = data.get('imageBase64')
+    image_format = data.get('imageFormat')
+    email = data.get('email')
+    
+    if not image_base64:
+        return jsonify({"error": "imageBase64 is required"}), 400
+    image_size_mb = len(image_base64) * 3 / 4 / 1024 / 1024
+    if image_size_mb > 4:
+        return jsonify({
+            "error": f"Image too large ({image_size_mb:.1f}MB). Maximum supported size is 4MB."
+        }), 400
+    if image_format and image_format.lower() not in ['jpeg', 'jpg', 'png', 'gif', 'webp']:
+        return jsonify({
+            "error": f"Unsupported image format: {image_format}. Supported formats: JPEG, PNG, GIF, WebP"
+        }), 400
+    
+    try:
+        job, created = fridge_jobs.submit(model_caller(data.get('session_id')), message, image_base64,
+                                          image_format, email)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except JobRejected as e:
+        response = jsonify({"error": e.reason, "retry_after": e.retry_after})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.status
+    except Exception as e:
+        logger.error(f"Error queueing fridge job: {e}")
+        return jsonify({"error": "Failed to queue fridge analysis", "details": str(e)}), 500
+    
+    status_url = f"/chat/jobs/{job['id']}"
+    response = jsonify({
+        "success": True,
+        "job_id": job['id'],
+        "status": job['status'],
+        "deduplicated": not created,
+        "status_url": status_url,
+        "events_url": f"{status_url}/events"
+    })
+    response.headers['Location'] = status_url
+    return response, 202 if created else 200
+
+@app.route('/chat/jobs/<job_id>', methods=['GET'])
+def get_fridge_job(job_id):
+    """Status of a fridge analysis job; `result` ({"type", "data"}) once it succeeded, `error` if it failed"""
+    job = fridge_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job id"}), 404
+    response = jsonify({"success": True, **job})
+    if job['status'] not in ('succeeded', 'failed'):
+        # How soon polling is worth it; SSE clients are told as things change
+        response.headers['Retry-After'] = '2'
+    return response
+
+@app.route('/chat/jobs/<job_id>/events', methods=['GET'])
+def stream_fridge_job(job_id):
+    """
+    Server-sent events for a fridge analysis job: a `status` event per
+    change and a final `result` event. The stream closes after
+    FRIDGE_JOB_STREAM_SECONDS; EventSource then reconnects on its own.
+    """
+    job = fridge_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "error": "Unknown job id"}), 404
+    if not fridge_jobs.open_stream():
+        response = jsonify({"error": "Too many open event streams; poll the status URL instead",
+                            "status_url": f"/chat/jobs/{job_id}"})
+        response.headers['Retry-After'] = '2'
+        return response, 429
+    
+    def event(job):
+        name = 'result' if job['status'] in ('succeeded', 'failed') else 'status'
+        return f"id: {job['version']}\nevent: {name}\ndata: {app.json.dumps(job)}\n\n"
+    
+    def generate():
+        current = job
+        yield "retry: 2000\n" + event(current)
+        deadline = time.monotonic() + fridge_jobs.settings.stream_seconds
+        while current['status'] not in ('succeeded', 'failed'):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            latest = fridge_jobs.wait_for_change(job_id, current['version'], min(remaining, 15.0))
+            if latest is None:
+                return
+            if latest['version'] == current['version']:
+                # Keeps proxies from closing a quiet connection
+                yield ": keep-alive\n\n"
+            else:
+                current = latest
+                yield event(current)
+    
+    # no-transform: compressing would buffer events until the stream ends
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={"Cache-Control": "no-cache, no-transform", "X-Accel-Buffering": "no"})
+    # Runs however the stream ends, including a client that left before the first event
+    response.call_on_close(fridge_jobs.close_stream)
+    return response
+
 @app.route('/recent-recipes/add', methods=['POST'])
 def add_recent_recipe():
     """Add a selected recipe to user's recent recipes (keep last 10)"""
     try:
-        if not supabase_manager.enabled:
+        if not storage.enabled:
             return jsonify({
                 "success": False,
-                "error": "Supabase is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables."
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
             }), 503
 
         data = request.get_json()
@@ -545,7 +832,7 @@ def add_recent_recipe():
         if not recipe or not isinstance(recipe, dict):
             return jsonify({"error": "Recipe object is required"}), 400
 
-        success = supabase_manager.add_recent_recipe(email, recipe)
+        success = storage.add_recent_recipe(email, recipe)
 
         if success:
             return jsonify({"success": True, "message": "Recent recipe added"})
@@ -561,10 +848,10 @@ def add_recent_recipe():
 def get_recent_recipes():
     """Get the user's recent recipes (up to 10)"""
     try:
-        if not supabase_manager.enabled:
+        if not storage.enabled:
             return jsonify({
                 "success": False,
-                "error": "Supabase is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables."
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
             }), 503
 
         data = request.get_json()
@@ -573,7 +860,7 @@ def get_recent_recipes():
         if not email:
             return jsonify({"error": "Email is required"}), 400
 
-        recent = supabase_manager.get_recent_recipes(email)
+        recent = storage.get_recent_recipes(email)
 
         if recent is None:
             return jsonify({"success": False, "error": "Failed to retrieve recent recipes"}), 500
@@ -584,14 +871,60 @@ def get_recent_recipes():
         logger.error(f"Error retrieving recent recipes: {e}")
         return jsonify({"success": False, "error": "Failed to retrieve recent recipes", "details": str(e)}), 500
 
+@app.route('/pantry', methods=['POST'])
+def get_pantry():
+    """Query the user's pantry inventory with optional filters and pagination"""
+    try:
+        if not storage.enabled:
+            return jsonify({
+                "success": False,
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
+            }), 503
+        
+        data = request.get_json()
+        email = data.get('email')
+        freshness = data.get('freshness')
+        category = data.get('category')
+        limit = data.get('limit')
+        cursor = data.get('cursor')
+        
+        if not email:
+            return jsonify({"error": "Email is required"}), 400
+        
+        if isinstance(freshness, str):
+            freshness = [freshness]
+        if freshness is not None and not (isinstance(freshness, list) and all(isinstance(f, str) for f in freshness)):
+            return jsonify({"error": "Freshness must be a string or a list of strings"}), 400
+        
+        if limit is not None and not isinstance(limit, int):
+            return jsonify({"error": "Limit must be an integer"}), 400
+        
+        try:
+            page = storage.query_pantry(email, freshness=freshness, category=category, limit=limit, cursor=cursor)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        if page is None:
+            return jsonify({"success": False, "error": "Failed to retrieve pantry"}), 500
+        
+        return jsonify({
+            "success": True,
+            "pantry": page["items"],
+            "next_cursor": page["next_cursor"]
+        })
+        
+    except Exception as e:
+        logger.error(f"Error retrieving pantry: {e}")
+        return jsonify({"success": False, "error": "Failed to retrieve pantry", "details": str(e)}), 500
+
 @app.route('/save-data', methods=['POST'])
 def save_data():
     """Save user's grocery items, recipes, and pantry to Supabase"""
     try:
-        if not supabase_manager.enabled:
+        if not storage.enabled:
             return jsonify({
                 "success": False,
-                "error": "Supabase is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables."
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
             }), 503
         
         data = request.get_json()
@@ -606,7 +939,7 @@ def save_data():
             }), 400
         
         # User is authenticated with email, save to database
-        record_id = supabase_manager.save_user_data(email, items, recipes)
+        record_id = storage.save_user_data(email, items, recipes)
         
         if record_id:
             return jsonify({
@@ -632,10 +965,10 @@ def save_data():
 def get_data():
     """Retrieve user's saved data from Supabase"""
     try:
-        if not supabase_manager.enabled:
+        if not storage.enabled:
             return jsonify({
                 "success": False,
-                "error": "Supabase is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables."
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
             }), 503
         
         data = request.get_json()
@@ -647,16 +980,19 @@ def get_data():
                 "error": "Email is required to retrieve data"
             }), 400
         
-        # User is authenticated with email, retrieve from database
-        user_data = supabase_manager.get_user_data(email)
+        # User is authenticated with email, retrieve from database (or the read cache)
+        user_data, etag = storage.get_user_data_with_etag(email)
+        
+        if etag and request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
         
         if user_data:
-            return jsonify({
+            response = jsonify({
                 "success": True,
                 "data": user_data
             })
         else:
-            return jsonify({
+            response = jsonify({
                 "success": True,
                 "data": {
                     "id": None,
@@ -664,6 +1000,9 @@ def get_data():
                     "recipes": []
                 }
             })
+        if etag:
+            response.set_etag(etag)
+        return response
             
     except Exception as e:
         logger.error(f"Error retrieving data: {e}")
@@ -677,10 +1016,10 @@ def get_data():
 def update_data():
     """Update user's existing data in Supabase"""
     try:
-        if not supabase_manager.enabled:
+        if not storage.enabled:
             return jsonify({
                 "success": False,
-                "error": "Supabase is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables."
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
             }), 503
         
         data = request.get_json()
@@ -691,7 +1030,7 @@ def update_data():
         if not email:
             return jsonify({"error": "Email is required"}), 400
         
-        success = supabase_manager.update_user_data(email, items, recipes)
+        success = storage.update_user_data(email, items, recipes)
         
         if success:
             return jsonify({
@@ -712,14 +1051,78 @@ def update_data():
             "details": str(e)
         }), 500
 
+@app.route('/update-data', methods=['PATCH'])
+def patch_data():
+    """Apply a JSON Patch (RFC 6902) to the user's items and recipes"""
+    try:
+        if not storage.enabled:
+            return jsonify({
+                "success": False,
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
+            }), 503
+        
+        data = request.get_json()
+        email = data.get('email')
+        operations = data.get('patch')
+        version = data.get('version')
+        
+        if not email:
+            return jsonify({"error": "Email is required"}), 400
+        
+        if not isinstance(operations, list):
+            return jsonify({"error": "A JSON Patch operation list is required"}), 400
+        
+        if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+            return jsonify({"error": "Version must be an integer"}), 400
+        
+        try:
+            new_version = storage.patch_user_data(email, operations, version)
+        except JsonPatchError as e:
+            return jsonify({
+                "success": False,
+                "error": "Invalid patch",
+                "details": str(e)
+            }), 422
+        except VersionConflictError as e:
+            return jsonify({
+                "success": False,
+                "error": "Data was modified by another request",
+                "current_version": e.current_version
+            }), 412
+        except UserNotFoundError:
+            return jsonify({
+                "success": False,
+                "error": "No saved data to patch for this user"
+            }), 404
+        
+        if new_version is not None:
+            return jsonify({
+                "success": True,
+                "message": "Data patched successfully",
+                "version": new_version
+            })
+        else:
+            return jsonify({
+                "success": False,
+                "error": "Failed to patch data"
+            }), 500
+            
+    except Exception as e:
+        logger.error(f"Error patching data: {e}")
+        return jsonify({
+            "success": False,
+            "error": "Failed to patch data",
+            "details": str(e)
+        }), 500
+
 @app.route('/send-email', methods=['POST'])
 def send_email():
-    """Send email with grocery list and recipes to user"""
+    """Queue an email with the grocery list and recipes; returns the message id immediately"""
     try:
-        if not supabase_manager.enabled:
+        if not email_service.configured:
             return jsonify({
                 "success": False,
-                "error": "Supabase is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables."
+                "error": "Email is not configured. Please set SMTP_HOST and EMAIL_FROM (or SMTP_USER) environment variables."
             }), 503
         
         data = request.get_json()
@@ -730,18 +1133,19 @@ def send_email():
         if not email:
             return jsonify({"error": "Email is required"}), 400
         
-        success = supabase_manager.send_grocery_list_email(email, items, recipes)
+        message_id = supabase_manager.queue_grocery_list_email(email, items, recipes)
         
-        if success:
+        if message_id:
             return jsonify({
                 "success": True,
-                "message": "Email sent successfully"
-            })
+                "message": "Email queued",
+                "message_id": message_id
+            }), 202
         else:
             return jsonify({
                 "success": False,
-                "error": "Failed to send email"
-            }), 500
+                "error": "Failed to queue email"
+            }), 503
             
     except Exception as e:
         logger.error(f"Error sending email: {e}")
@@ -751,14 +1155,23 @@ def send_email():
             "details": str(e)
         }), 500
 
+@app.route('/send-email/<message_id>', methods=['GET'])
+def get_email_status(message_id):
+    """Delivery status of a queued email (queued, sending, retrying, sent or failed)"""
+    status = email_service.get_status(message_id)
+    if status is None:
+        return jsonify({"success": False, "error": "Unknown message id"}), 404
+    status.pop('to', None)
+    return jsonify({"success": True, **status})
+
 @app.route('/chat-history', methods=['POST'])
 def get_chat_history():
     """Get user's chat history"""
     try:
-        if not supabase_manager.enabled:
+        if not storage.enabled:
             return jsonify({
                 "success": False,
-                "error": "Supabase is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables."
+                "error": "Storage is not configured. Please set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY environment variables, or STORAGE_BACKEND=sqlite."
             }), 503
         
         data = request.get_json()
@@ -770,19 +1183,32 @@ def get_chat_history():
                 "error": "Email is required to retrieve chat history"
             }), 400
         
-        # User is authenticated with email, retrieve chat history
-        chat_history = supabase_manager.get_chat_history(email)
+        limit = data.get('limit')
+        if limit is not None and (not isinstance(limit, int) or limit <= 0):
+            return jsonify({
+                "success": False,
+                "error": "Limit must be a positive integer"
+            }), 400
+        
+        # User is authenticated with email, retrieve chat history (or the read cache)
+        chat_history, etag = storage.get_chat_history_with_etag(email, limit)
+        
+        if etag and request.if_none_match.contains_weak(etag):
+            return not_modified(etag)
         
         if chat_history is not None:
-            return jsonify({
+            response = jsonify({
                 "success": True,
                 "chat_history": chat_history
             })
         else:
-            return jsonify({
+            response = jsonify({
                 "success": True,
                 "chat_history": []
             })
+        if etag:
+            response.set_etag(etag)
+        return response
             
     except Exception as e:
         logger.error(f"Error retrieving chat history: {e}")
@@ -792,6 +1218,28 @@ def get_chat_history():
             "details": str(e)
         }), 500
 
+@app.route('/admin/export', methods=['GET'])
+def admin_export():
+    """Stream every user's data as NDJSON (see bulk_transfer.py)"""
+    if not is_admin_request():
+        return jsonify({"success": False, "error": "Admin authorization required"}), 403
+    
+    if not storage.enabled:
+        return jsonify({"success": False, "error": "Storage is not configured"}), 503
+    
+    batch_size = request.args.get('batch_size', DEFAULT_EXPORT_BATCH_SIZE, type=int)
+    
+    def generate():
+        try:
+            yield from iter_ndjson(storage, max(1, batch_size))
+        except BulkTransferError as e:
+            # Headers are already sent; end with an error line the importer rejects
+            logger.error(f"Export aborted: {e}")
+            yield json.dumps({"error": str(e)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={"Content-Disposition": "attachment; filename=chopchop-users.ndjson"})
+
 @app.route('/', methods=['GET'])
 def root():
     """Root endpoint"""
@@ -799,19 +1247,32 @@ def root():
         "message": "ChopChop Backend API",
         "endpoints": {
             "/health": "GET - Health check",
-            "/chat": "POST - Send message to Nova Pro model",
+            "/metrics": "GET - Prometheus metrics, added up across workers",
+            "/chat": "POST - Send message to Nova Pro model (responseFormat: 'string' or 'object')",
+            "/chat/jobs": "POST - Queue a fridge photo analysis (returns job_id; duplicate photos return the same job)",
+            "/chat/jobs/<job_id>": "GET - Status and result of a fridge analysis job",
+            "/chat/jobs/<job_id>/events": "GET - Server-sent events for a fridge analysis job until it finishes",
             "/chat-history": "POST - Get user's chat history",
             "/save-data": "POST - Save user data to Supabase",
             "/get-data": "POST - Retrieve user data from Supabase",
-            "/update-data": "POST - Update user data in Supabase",
-            "/send-email": "POST - Send email with grocery list and recipes",
+            "/pantry": "POST - Query pantry inventory (filters: freshness, category; cursor pagination)",
+            "/update-data": "POST - Update user data in Supabase; PATCH - Apply a JSON Patch with a version precondition",
+            "/send-email": "POST - Queue email with grocery list and recipes (returns message_id)",
+            "/send-email/<message_id>": "GET - Delivery status of a queued email",
+            "/admin/export": "GET - Stream all user data as NDJSON (requires ADMIN_API_TOKEN)",
             "/auth/signin": "POST - Sign in with email",
             "/auth/verify": "POST - Verify session",
             "/auth/signout": "POST - Sign out user"
         }
     })
 
+logger.info(f"App loaded {coldstart.mark('app_loaded')} ms after process start")
+
 if __name__ == '__main__':
+    if '--profile-startup' in sys.argv:
+        # Profiles fresh interpreters; this one only hands over the remaining flags
+        sys.exit(coldstart.main([arg for arg in sys.argv[1:] if arg != '--profile-startup']))
+    
     port = int(os.getenv('PORT', 8000))
     debug = os.getenv('FLASK_DEBUG', 'False').lower() == 'true'
     
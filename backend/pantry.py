@@ -0,0 +1,111 @@
+"""
+Pantry inventory helpers: canonical ingredient names, row normalization and
+keyset pagination cursors shared by the storage backends
+"""
+import re
+import json
+import base64
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any, Tuple
+
+# Freshness values the fridge prompt asks the model for
+FRESHNESS_VALUES = ('fresh', 'good', 'needs_use_soon', 'expired')
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+_NON_WORD_RE = re.compile(r'[^a-z0-9 ]+')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def _singular(word: str) -> str:
+    if len(word) <= 3 or word.endswith('ss'):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+def canonical_ingredient_name(name: str) -> str:
+    """
+    Reduce an ingredient name to the key used for deduplication
+
+    "Cherry Tomatoes", "cherry tomato" and " cherry-tomatoes " all map to
+    "cherry tomato".
+    """
+    text = _NON_WORD_RE.sub(' ', (name or '').lower().replace('-', ' '))
+    words = _SPACE_RE.sub(' ', text).strip().split(' ')
+    return ' '.join(_singular(word) for word in words if word)
+
+
+def normalize_freshness(value: Any) -> str:
+    value = str(value or '').strip().lower().replace(' ', '_')
+    return value if value in FRESHNESS_VALUES else 'fresh'
+
+
+def pantry_rows(user_email: str, ingredients: List[Dict[str, Any]], detected_at: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Turn the model's ingredient list into pantry rows, one per canonical name
+
+    Later duplicates in the same analysis win, matching upsert semantics. An
+    ingredient's own detected_at (as in exported pantry items) is kept.
+    """
+    detected_at = detected_at or datetime.now(timezone.utc).isoformat()
+    rows: Dict[str, Dict[str, Any]] = {}
+    for ingredient in ingredients or []:
+        if not isinstance(ingredient, dict):
+            continue
+        name = str(ingredient.get('name') or '').strip()
+        canonical = canonical_ingredient_name(name)
+        if not canonical:
+            continue
+        rows[canonical] = {
+            'user_email': user_email,
+            'canonical_name': canonical,
+            'name': name,
+            'quantity': str(ingredient.get('quantity') or ''),
+            'category': str(ingredient.get('category') or 'general').strip().lower(),
+            'freshness': normalize_freshness(ingredient.get('freshness')),
+            'detected_at': ingredient.get('detected_at') or detected_at
+        }
+    return list(rows.values())
+
+
+def to_pantry_item(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a stored row like the frontend's PantryItem type"""
+    return {
+        'id': str(row['id']),
+        'name': row['name'],
+        'quantity': row.get('quantity') or '',
+        'category': row.get('category') or 'general',
+        'freshness': row['freshness'],
+        'detected_at': row['detected_at']
+    }
+
+
+def encode_cursor(detected_at: str, row_id: Any) -> str:
+    """Opaque keyset cursor for the position after (detected_at, id)"""
+    raw = json.dumps([detected_at, str(row_id)], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Inverse of encode_cursor; raises ValueError for a malformed cursor"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        detected_at, row_id = json.loads(raw)
+        return str(detected_at), str(row_id)
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+def clamp_page_size(limit: Optional[int]) -> int:
+    if not limit or limit <= 0:
+        return DEFAULT_PAGE_SIZE
+    return min(limit, MAX_PAGE_SIZE)
@@ -0,0 +1,96 @@
+"""
+Token-bucket rate limiting
+
+A bucket holds up to `burst` tokens and refills at `rate` tokens per
+second; each action spends one. KeyedTokenBuckets keeps one bucket per key
+(a mail domain, a user) in a bounded LRU so idle keys do not accumulate.
+"""
+import time
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket
+
+    A rate of zero or less means unlimited: every acquire succeeds at once.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        if now > self._updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Spend `tokens` if available
+
+        Returns:
+            0.0 if the tokens were spent, otherwise the seconds until they
+            will be available (nothing is spent)
+        """
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill(self._clock())
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            return (tokens - self.tokens) / self.rate
+
+    def acquire(self, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        """Block until `tokens` are spent; False if that would take longer than timeout"""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return True
+            if deadline is not None and self._clock() + wait > deadline:
+                return False
+            time.sleep(wait)
+
+
+class KeyedTokenBuckets:
+    """One TokenBucket per key, created on first use, at most max_keys kept"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None, max_keys: int = 10000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: 'OrderedDict[Hashable, TokenBucket]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, self._clock)
+                while len(self._buckets) > self.max_keys:
+                    # An evicted key starts again with a full bucket
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket
+
+    def try_acquire(self, key: Hashable, tokens: float = 1.0) -> float:
+        return self.bucket(key).try_acquire(tokens)
+
+    def acquire(self, key: Hashable, tokens: float = 1.0, timeout: Optional[float] = None) -> bool:
+        return self.bucket(key).acquire(tokens, timeout)
+
+    def get_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'keys': len(self._buckets)}
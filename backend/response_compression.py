@@ -0,0 +1,232 @@
+"""
+Negotiated compression of API responses
+
+/chat-history and /get-data can return hundreds of KB of JSON (chat
+history carries base64 photos), and /admin/export streams NDJSON. After
+each request, compress_response() picks the best encoding the client
+accepts (Accept-Encoding, honouring q-values) from RESPONSE_COMPRESSION_
+ENCODINGS, in server preference order: zstd (when `zstandard` is
+installed), br (when `brotli` or `brotlicffi` is installed), then gzip.
+
+A response is left alone when it is smaller than RESPONSE_COMPRESSION_
+MIN_BYTES, already has a Content-Encoding, is not a text/JSON type (photos
+and archives are already compressed), is a 206/204/304 or a HEAD, or sets
+Cache-Control: no-transform.
+
+Bodies up to RESPONSE_COMPRESSION_STREAM_BYTES are compressed in one go
+and keep a Content-Length. Larger bodies and streamed responses are
+compressed chunk by chunk as the server writes them, so the compressed
+copy never exists in full alongside the original.
+
+A compressed response's ETag becomes weak (W/"..."), since the bytes
+differ from the identity encoding; conditional reads must compare with
+If-None-Match weakly. Bytes before and after compression are counted per
+endpoint in get_stats().
+"""
+import os
+import zlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from flask import Flask, Response, request
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    try:
+        import brotlicffi as brotli
+        BROTLI_AVAILABLE = True
+    except ImportError:
+        brotli = None
+        BROTLI_AVAILABLE = False
+
+ENCODINGS = ('zstd', 'br', 'gzip')
+_AVAILABLE = {'zstd': ZSTD_AVAILABLE, 'br': BROTLI_AVAILABLE, 'gzip': True}
+_DEFAULT_LEVELS = {'zstd': 3, 'br': 4, 'gzip': 6}
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+CHUNK_BYTES = 64 * 1024
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class CompressionSettings:
+    """Response compression configuration, read from environment variables"""
+
+    def __init__(self):
+        self.enabled = os.getenv('RESPONSE_COMPRESSION', 'true').lower() == 'true'
+        self.min_bytes = _env_int('RESPONSE_COMPRESSION_MIN_BYTES', 1024)
+        self.stream_bytes = _env_int('RESPONSE_COMPRESSION_STREAM_BYTES', 256 * 1024)
+        preference = os.getenv('RESPONSE_COMPRESSION_ENCODINGS', ','.join(ENCODINGS))
+        self.encodings: List[str] = []
+        for encoding in (e.strip().lower() for e in preference.split(',') if e.strip()):
+            if encoding not in ENCODINGS:
+                logger.warning(f"Unknown response encoding {encoding!r} in RESPONSE_COMPRESSION_ENCODINGS")
+            elif _AVAILABLE[encoding]:
+                self.encodings.append(encoding)
+        self.levels = {encoding: _env_int(f"RESPONSE_COMPRESSION_{encoding.upper()}_LEVEL", level)
+                       for encoding, level in _DEFAULT_LEVELS.items()}
+
+
+class _Compressor:
+    """Incremental compressor with one interface over zlib, brotli and zstandard"""
+
+    def __init__(self, encoding: str, level: int):
+        if encoding == 'zstd':
+            self._stream = zstandard.ZstdCompressor(level=level).compressobj()
+            self._finish = self._stream.flush
+        elif encoding == 'br':
+            self._stream = brotli.Compressor(quality=level)
+            self.compress = self._stream.process
+            self._finish = self._stream.finish
+            return
+        else:
+            # wbits 16 + 15: gzip header and trailer around a 32 KB window
+            self._stream = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._finish = self._stream.flush
+        self.compress = self._stream.compress
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+def compress_bytes(encoding: str, data: bytes, level: int) -> bytes:
+    compressor = _Compressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+class ResponseCompressor:
+    """Compresses Flask responses after each request and counts the savings"""
+
+    def __init__(self, settings: Optional[CompressionSettings] = None):
+        self.settings = settings or CompressionSettings()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def negotiate(self) -> Optional[str]:
+        """Best encoding the client accepts, in server preference order; None for identity"""
+        if not self.settings.encodings or 'Accept-Encoding' not in request.headers:
+            return None
+        return request.accept_encodings.best_match(self.settings.encodings)
+
+    def _compressible(self, response: Response) -> bool:
+        mimetype = response.mimetype or ''
+        return mimetype.startswith('text/') or mimetype.endswith('+json') or mimetype in COMPRESSIBLE_TYPES
+
+    def compress_response(self, response: Response) -> Response:
+        """after_request hook"""
+        if response.status_code == 304:
+            return self._match_weak_etag(response)
+        if (not self.settings.enabled or request.method == 'HEAD' or response.status_code in (204, 206)
+                or not self._compressible(response)):
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or 'no-transform' in response.headers.get('Cache-Control', ''):
+            return response
+
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        streamed = response.is_streamed
+        body = None if streamed else response.get_data()
+        if body is not None and len(body) < self.settings.min_bytes:
+            self._count(endpoint, None, len(body), len(body))
+            return response
+        encoding = self.negotiate()
+        if encoding is None:
+            if body is not None:
+                self._count(endpoint, None, len(body), len(body))
+            return response
+
+        level = self.settings.levels[encoding]
+        if body is not None and len(body) <= self.settings.stream_bytes:
+            compressed = compress_bytes(encoding, body, level)
+            response.set_data(compressed)
+            self._count(endpoint, encoding, len(body), len(compressed))
+        else:
+            chunks = [body] if body is not None else response.response
+            response.response = self._stream(endpoint, encoding, level, chunks)
+            response.direct_passthrough = False
+            response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _stream(self, endpoint: str, encoding: str, level: int, chunks: Iterable[Any]) -> Iterator[bytes]:
+        compressor = _Compressor(encoding, level)
+        bytes_in = bytes_out = 0
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                # Slice large buffered bodies so each write is compressed and sent before the next
+                view = memoryview(chunk)
+                for start in range(0, len(view), CHUNK_BYTES):
+                    piece = view[start:start + CHUNK_BYTES]
+                    bytes_in += len(piece)
+                    out = compressor.compress(piece)
+                    if out:
+                        bytes_out += len(out)
+                        yield out
+            out = compressor.finish()
+            bytes_out += len(out)
+            yield out
+        finally:
+            close = getattr(chunks, 'close', None)
+            if close is not None:
+                close()
+            self._count(endpoint, encoding, bytes_in, bytes_out)
+
+    def _match_weak_etag(self, response: Response) -> Response:
+        """A client revalidating a compressed copy sent W/"..."; answer in kind"""
+        etag, weak = response.get_etag()
+        if etag and not weak and not request.if_none_match.contains(etag) \
+                and request.if_none_match.contains_weak(etag):
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _count(self, endpoint: str, encoding: Optional[str], bytes_in: int, bytes_out: int):
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, {'responses': 0, 'compressed': 0, 'bytes_in': 0, 'bytes_out': 0})
+            stats['responses'] += 1
+            stats['bytes_in'] += bytes_in
+            stats['bytes_out'] += bytes_out
+            if encoding is not None:
+                stats['compressed'] += 1
+                stats[encoding] = stats.get(encoding, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-endpoint counters for /health; ratio is bytes before / after compression"""
+        with self._lock:
+            endpoints = {endpoint: dict(stats) for endpoint, stats in self._stats.items()}
+        for stats in endpoints.values():
+            stats['ratio'] = round(stats['bytes_in'] / stats['bytes_out'], 2) if stats['bytes_out'] else None
+        return {
+            'enabled': self.settings.enabled,
+            'encodings': self.settings.encodings,
+            'min_bytes': self.settings.min_bytes,
+            'levels': {encoding: self.settings.levels[encoding] for encoding in self.settings.encodings},
+            'endpoints': endpoints,
+        }
+
+
+def configure_compression(app: Flask, settings: Optional[CompressionSettings] = None) -> ResponseCompressor:
+    """Compress `app`'s responses; returns the compressor for its stats"""
+    compressor = ResponseCompressor(settings)
+    app.after_request(compressor.compress_response)
+    return compressor
@@ -0,0 +1,453 @@
+"""
+Sign-in session storage shared by every gunicorn worker
+
+Selected with SESSION_STORE:
+
+- sqlite (default): a WAL-mode SQLite file (SESSION_SQLITE_PATH) that every
+  worker on the host opens, so a session created by one worker is seen by
+  all of them. Lookups use the primary key; an index on expires_at is the
+  TTL index the sweeper deletes from.
+- redis: any Redis-protocol server (REDIS_URL), for several hosts. Keys
+  carry a native TTL and a sorted set mirrors expiries for counting.
+  Needs the optional `redis` package.
+- memory: a dict in this process with a heap of expiries. Only correct with
+  a single worker; meant for tests and local runs.
+
+Sessions expire SESSION_TTL_SECONDS after sign-in (default 24 hours).
+Lookups never return an expired session, and a background thread in each
+worker removes expired ones every SESSION_SWEEP_INTERVAL seconds so the
+store does not grow without bound.
+
+The store also keeps the revocation list for signed session tokens (see
+session_tokens.py): token ids signed out before they expire.
+"""
+import os
+import json
+import time
+import uuid
+import heapq
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+DEFAULT_SESSION_TTL = float(os.getenv('SESSION_TTL_SECONDS', '86400'))
+DEFAULT_SWEEP_INTERVAL = float(os.getenv('SESSION_SWEEP_INTERVAL', '60'))
+
+SESSION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_sessions_expires_at ON sessions(expires_at);
+CREATE TABLE IF NOT EXISTS token_revocations (
+    token_id TEXT PRIMARY KEY,
+    expires_at REAL NOT NULL,
+    revoked_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_token_revocations_revoked_at ON token_revocations(revoked_at);
+"""
+INSERT_SESSION = "INSERT INTO sessions (id, email, created_at, expires_at) VALUES (?, ?, ?, ?)"
+SELECT_SESSION = "SELECT email, created_at, expires_at FROM sessions WHERE id = ? AND expires_at > ?"
+DELETE_SESSION = "DELETE FROM sessions WHERE id = ?"
+# Batched so a large backlog never holds the write lock for long
+SWEEP_SESSIONS = """
+    DELETE FROM sessions WHERE id IN (
+        SELECT id FROM sessions WHERE expires_at <= ? ORDER BY expires_at LIMIT ?
+    )
+"""
+COUNT_SESSIONS = "SELECT COUNT(*) FROM sessions WHERE expires_at > ?"
+INSERT_REVOCATION = "INSERT OR REPLACE INTO token_revocations (token_id, expires_at, revoked_at) VALUES (?, ?, ?)"
+SELECT_REVOCATIONS = """
+    SELECT token_id, expires_at, revoked_at FROM token_revocations
+    WHERE revoked_at > ? AND expires_at > ? ORDER BY revoked_at
+"""
+SWEEP_REVOCATIONS = "DELETE FROM token_revocations WHERE expires_at <= ?"
+
+SWEEP_BATCH_SIZE = 1000
+
+
+class SessionStore(ABC):
+    """
+    Base class for session stores
+
+    Methods log and return None/False on errors rather than raising, like
+    the storage backends. Each session is {'email', 'created_at',
+    'expires_at'} (epoch seconds).
+    """
+
+    backend_name = 'base'
+
+    def __init__(self, ttl: float = DEFAULT_SESSION_TTL, sweep_interval: float = DEFAULT_SWEEP_INTERVAL):
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._sweeper: Optional[threading.Thread] = None
+        self._sweeper_pid: Optional[int] = None
+        self._sweeper_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.sweep_stats = {'sweeps': 0, 'swept': 0, 'last_sweep_at': None, 'last_sweep_ms': None}
+
+    # ------------------------------------------------------------------
+    # Backend operations
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def _put(self, session_id: str, session: Dict[str, Any]):
+        """Store a new session (raises on error)"""
+
+    @abstractmethod
+    def _get(self, session_id: str, now: float) -> Optional[Dict[str, Any]]:
+        """Return the session if it exists and has not expired (raises on error)"""
+
+    @abstractmethod
+    def _delete(self, session_id: str) -> bool:
+        """Remove a session; True if it existed (raises on error)"""
+
+    @abstractmethod
+    def _sweep(self, now: float) -> int:
+        """Remove sessions expired at `now`; returns how many (raises on error)"""
+
+    @abstractmethod
+    def _count(self, now: float) -> int:
+        """Number of live sessions (raises on error)"""
+
+    @abstractmethod
+    def _revoke_token(self, token_id: str, expires_at: float, now: float):
+        """Record a revoked token id until expires_at (raises on error)"""
+
+    @abstractmethod
+    def _get_revocations(self, since: float, now: float) -> List[Tuple[str, float, float]]:
+        """(token_id, expires_at, revoked_at) revoked after `since` and not yet expired (raises on error)"""
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+    def create(self, email: str) -> Optional[str]:
+        """Start a session for `email`; returns its id, or None on error"""
+        self._ensure_sweeper()
+        session_id = str(uuid.uuid4())
+        now = time.time()
+        try:
+            self._put(session_id, {'email': email, 'created_at': now, 'expires_at': now + self.ttl})
+            return session_id
+        except Exception as e:
+            logger.error(f"Error creating session: {e}")
+            return None
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the live session for `session_id`, or None if unknown, expired or on error"""
+        self._ensure_sweeper()
+        try:
+            return self._get(session_id, time.time())
+        except Exception as e:
+            logger.error(f"Error reading session: {e}")
+            return None
+
+    def delete(self, session_id: str) -> bool:
+        """End a session; True if it existed"""
+        try:
+            return self._delete(session_id)
+        except Exception as e:
+            logger.error(f"Error deleting session: {e}")
+            return False
+
+    def sweep(self) -> Optional[int]:
+        """Remove expired sessions now; returns how many, or None on error"""
+        start = time.perf_counter()
+        try:
+            removed = self._sweep(time.time())
+        except Exception as e:
+            logger.error(f"Error sweeping expired sessions: {e}")
+            return None
+        with self._sweeper_lock:
+            self.sweep_stats['sweeps'] += 1
+            self.sweep_stats['swept'] += removed
+            self.sweep_stats['last_sweep_at'] = time.time()
+            self.sweep_stats['last_sweep_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return removed
+
+    def count(self) -> Optional[int]:
+        """Number of live sessions, or None on error"""
+        try:
+            return self._count(time.time())
+        except Exception as e:
+            logger.error(f"Error counting sessions: {e}")
+            return None
+
+    def revoke_token(self, token_id: str, expires_at: float) -> bool:
+        """Add a signed token's id to the revocation list until it would have expired"""
+        try:
+            self._revoke_token(token_id, expires_at, time.time())
+            return True
+        except Exception as e:
+            logger.error(f"Error revoking session token: {e}")
+            return False
+
+    def get_revocations(self, since: float = 0.0) -> Optional[List[Tuple[str, float, float]]]:
+        """Unexpired revocations recorded after `since`, oldest first, or None on error"""
+        try:
+            return self._get_revocations(since, time.time())
+        except Exception as e:
+            logger.error(f"Error reading token revocations: {e}")
+            return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._sweeper_lock:
+            sweep_stats = dict(self.sweep_stats)
+        return {'backend': self.backend_name, 'sessions': self.count(), 'ttl_seconds': self.ttl, **sweep_stats}
+
+    # ------------------------------------------------------------------
+    # Expiry sweeper
+    # ------------------------------------------------------------------
+    def _ensure_sweeper(self):
+        if self.sweep_interval <= 0:
+            return
+        if self._sweeper_pid == os.getpid() and self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self._sweeper_lock:
+            # Threads do not survive fork; each gunicorn worker starts its own
+            if self._sweeper_pid == os.getpid() and self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._stop.clear()
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='session-sweeper', daemon=True)
+            self._sweeper.start()
+            self._sweeper_pid = os.getpid()
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            removed = self.sweep()
+            if removed:
+                logger.info(f"Swept {removed} expired sessions")
+
+    def close(self):
+        """Stop this process's sweeper"""
+        self._stop.set()
+
+
+class MemorySessionStore(SessionStore):
+    """Sessions in a dict of this process, with a heap of (expires_at, id) as the TTL index"""
+
+    backend_name = 'memory'
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._expiries: List[Tuple[float, str]] = []
+        self._revocations: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def _put(self, session_id, session):
+        with self._lock:
+            self._sessions[session_id] = session
+            heapq.heappush(self._expiries, (session['expires_at'], session_id))
+
+    def _get(self, session_id, now):
+        session = self._sessions.get(session_id)
+        return dict(session) if session is not None and session['expires_at'] > now else None
+
+    def _delete(self, session_id):
+        # Its heap entry is dropped when the sweeper reaches it
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _sweep(self, now):
+        removed = 0
+        with self._lock:
+            while self._expiries and self._expiries[0][0] <= now:
+                expires_at, session_id = heapq.heappop(self._expiries)
+                session = self._sessions.get(session_id)
+                if session is not None and session['expires_at'] == expires_at:
+                    del self._sessions[session_id]
+                    removed += 1
+            self._revocations = {token_id: entry for token_id, entry in self._revocations.items() if entry[0] > now}
+        return removed
+
+    def _count(self, now):
+        with self._lock:
+            return sum(1 for session in self._sessions.values() if session['expires_at'] > now)
+
+    def _revoke_token(self, token_id, expires_at, now):
+        with self._lock:
+            self._revocations[token_id] = (expires_at, now)
+
+    def _get_revocations(self, since, now):
+        with self._lock:
+            return sorted(((token_id, expires_at, revoked_at) for token_id, (expires_at, revoked_at) in self._revocations.items()
+                           if revoked_at > since and expires_at > now), key=lambda entry: entry[2])
+
+
+class SQLiteSessionStore(SessionStore):
+    """Sessions in a SQLite file shared by every worker on the host"""
+
+    backend_name = 'sqlite'
+
+    def __init__(self, path: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path or os.getenv('SESSION_SQLITE_PATH', 'sessions.sqlite3')
+        self.busy_timeout_ms = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        self._local = threading.local()
+        try:
+            self._connection().executescript(SESSION_SCHEMA)
+            self.enabled = True
+        except sqlite3.Error as e:
+            logger.error(f"Failed to initialize SQLite session store at {self.path}: {e}")
+            self.enabled = False
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use (and after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000, isolation_level=None,
+                               check_same_thread=True)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def _put(self, session_id, session):
+        self._connection().execute(INSERT_SESSION, (session_id, session['email'], session['created_at'], session['expires_at']))
+
+    def _get(self, session_id, now):
+        row = self._connection().execute(SELECT_SESSION, (session_id, now)).fetchone()
+        return {'email': row[0], 'created_at': row[1], 'expires_at': row[2]} if row else None
+
+    def _delete(self, session_id):
+        return self._connection().execute(DELETE_SESSION, (session_id,)).rowcount > 0
+
+    def _sweep(self, now):
+        removed = 0
+        conn = self._connection()
+        while True:
+            batch = conn.execute(SWEEP_SESSIONS, (now, SWEEP_BATCH_SIZE)).rowcount
+            removed += batch
+            if batch < SWEEP_BATCH_SIZE:
+                break
+        conn.execute(SWEEP_REVOCATIONS, (now,))
+        return removed
+
+    def _count(self, now):
+        return self._connection().execute(COUNT_SESSIONS, (now,)).fetchone()[0]
+
+    def _revoke_token(self, token_id, expires_at, now):
+        self._connection().execute(INSERT_REVOCATION, (token_id, expires_at, now))
+
+    def _get_revocations(self, since, now):
+        return [tuple(row) for row in self._connection().execute(SELECT_REVOCATIONS, (since, now))]
+
+
+class RedisSessionStore(SessionStore):
+    """
+    Sessions in a Redis-protocol server
+
+    Each session is a string key with a native TTL, so expiry needs no
+    sweeping; a sorted set of id -> expires_at is kept alongside so the
+    session count is one ZCOUNT, and the sweeper trims it. Token
+    revocations are a sorted set of 'token_id|expires_at' scored by when
+    they were revoked.
+    """
+
+    backend_name = 'redis'
+
+    def __init__(self, client=None, url: Optional[str] = None, prefix: Optional[str] = None, **kwargs):
+        super().__init__(**kwargs)
+        if client is None:
+            if not REDIS_AVAILABLE:
+                raise RuntimeError("SESSION_STORE=redis needs the redis package (pip install redis)")
+            client = redis.Redis.from_url(url or os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+        self.client = client
+        self.prefix = prefix if prefix is not None else os.getenv('SESSION_REDIS_PREFIX', 'chopchop:session:')
+        self.index_key = f"{self.prefix}expiries"
+        self.revocations_key = f"{self.prefix}revocations"
+
+    def _put(self, session_id, session):
+        pipe = self.client.pipeline()
+        pipe.set(self.prefix + session_id, json.dumps(session), ex=max(1, int(self.ttl)))
+        pipe.zadd(self.index_key, {session_id: session['expires_at']})
+        pipe.execute()
+
+    def _get(self, session_id, now):
+        raw = self.client.get(self.prefix + session_id)
+        if raw is None:
+            return None
+        session = json.loads(raw)
+        return session if session['expires_at'] > now else None
+
+    def _delete(self, session_id):
+        pipe = self.client.pipeline()
+        pipe.delete(self.prefix + session_id)
+        pipe.zrem(self.index_key, session_id)
+        return bool(pipe.execute()[0])
+
+    def _sweep(self, now):
+        # A token cannot outlive the TTL, so neither can its revocation
+        self.client.zremrangebyscore(self.revocations_key, '-inf', now - self.ttl)
+        return int(self.client.zremrangebyscore(self.index_key, '-inf', now))
+
+    def _count(self, now):
+        return int(self.client.zcount(self.index_key, f"({now}", '+inf'))
+
+    def _revoke_token(self, token_id, expires_at, now):
+        self.client.zadd(self.revocations_key, {f"{token_id}|{expires_at}": now})
+
+    def _get_revocations(self, since, now):
+        revocations = []
+        for member, revoked_at in self.client.zrangebyscore(self.revocations_key, f"({since}", '+inf', withscores=True):
+            if isinstance(member, bytes):
+                member = member.decode('utf-8')
+            token_id, expires_at = member.rsplit('|', 1)
+            if float(expires_at) > now:
+                revocations.append((token_id, float(expires_at), float(revoked_at)))
+        return revocations
+
+
+def create_session_store(name: Optional[str] = None) -> SessionStore:
+    """
+    Build the session store named by `name` or the SESSION_STORE variable
+
+    Args:
+        name: 'sqlite' (default), 'redis' or 'memory'
+    """
+    name = (name or os.getenv('SESSION_STORE', 'sqlite')).lower()
+    if name == 'redis':
+        if REDIS_AVAILABLE:
+            return RedisSessionStore()
+        logger.warning("redis is not installed; falling back to the SQLite session store")
+        name = 'sqlite'
+    if name == 'memory':
+        return MemorySessionStore()
+    if name != 'sqlite':
+        logger.warning(f"Unknown SESSION_STORE {name!r}; using sqlite")
+    store = SQLiteSessionStore()
+    if not store.enabled:
+        # Keep the app up; sign-ins then only hold within one worker until the file is fixed
+        logger.error("Falling back to the in-memory session store; sessions are not shared between workers")
+        return MemorySessionStore()
+    return store
+
+
+_session_store: Optional[SessionStore] = None
+_session_store_lock = threading.Lock()
+
+
+def get_session_store() -> SessionStore:
+    """Return the process-wide session store, creating it on first use"""
+    global _session_store
+    if _session_store is None:
+        with _session_store_lock:
+            if _session_store is None:
+                _session_store = create_session_store()
+    return _session_store
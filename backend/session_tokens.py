@@ -0,0 +1,242 @@
+"""
+Stateless signed session tokens
+
+With SESSION_MODE=token, /auth/signin issues a token instead of a stored
+session id:
+
+    <key id>.<payload>.<signature>
+
+The payload is base64url compact JSON {"sub": email, "iat": issued at,
+"exp": expires at, "jti": token id}; the signature is the base64url
+HMAC-SHA256 of "<key id>.<payload>". Verifying is a hash and a JSON parse
+in this process, with no store round trip.
+
+Keys come from SESSION_TOKEN_KEYS as comma-separated "key_id:secret" pairs,
+newest first. The first key signs; every listed key verifies. To rotate,
+put a new key in front, deploy, and remove the old key once
+SESSION_TTL_SECONDS have passed.
+
+Signing out adds the token id to the session store's revocation list. Each
+worker keeps the unexpired revocations in memory and pulls new ones every
+SESSION_REVOCATION_SYNC_SECONDS on a background thread, so a signout is
+honoured at once by the worker that handled it and within that interval
+by the others.
+"""
+import os
+import hmac
+import json
+import time
+import uuid
+import base64
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Any, Optional, List, Tuple, Union
+
+from session_store import SessionStore, DEFAULT_SESSION_TTL
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REVOCATION_SYNC_INTERVAL = float(os.getenv('SESSION_REVOCATION_SYNC_SECONDS', '2'))
+# Allowed clock difference between the workers that issue and verify a token
+CLOCK_SKEW_SECONDS = 30
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def parse_keys(spec: Optional[str]) -> List[Tuple[str, bytes]]:
+    """
+    Parse "key_id:secret,key_id:secret" into (key_id, secret) pairs
+
+    Raises:
+        ValueError: On an entry without a key id or secret, or a repeated key id
+    """
+    keys: List[Tuple[str, bytes]] = []
+    # Errors name an entry by its position only: any part of it may be a secret
+    for position, entry in enumerate((spec or '').split(','), start=1):
+        entry = entry.strip()
+        if not entry:
+            continue
+        key_id, _, secret = entry.partition(':')
+        if not key_id or not secret or '.' in key_id:
+            raise ValueError(f"Session token key #{position} must look like key_id:secret")
+        if any(key_id == existing for existing, _ in keys):
+            raise ValueError(f"Session token key #{position} repeats an earlier key id")
+        keys.append((key_id, secret.encode('utf-8')))
+    return keys
+
+
+def is_session_token(value: Any) -> bool:
+    """True if `value` has the shape of a signed token rather than a stored session id"""
+    return isinstance(value, str) and value.isascii() and value.count('.') == 2
+
+
+class SessionTokens:
+    """Issues, verifies and revokes signed session tokens"""
+
+    def __init__(self, keys: List[Tuple[str, bytes]], ttl: float = DEFAULT_SESSION_TTL,
+                 revocation_store: Union[SessionStore, Callable[[], SessionStore], None] = None,
+                 sync_interval: float = DEFAULT_REVOCATION_SYNC_INTERVAL):
+        if not keys:
+            raise ValueError("At least one session token key is required")
+        self.signing_key_id = keys[0][0]
+        self._keys = dict(keys)
+        self.ttl = ttl
+        self._revocation_store = revocation_store
+        self.sync_interval = sync_interval
+        self._revoked: Dict[str, float] = {}   # token id -> expires at
+        self._synced_through = 0.0
+        self._lock = threading.Lock()
+        self._syncer: Optional[threading.Thread] = None
+        self._syncer_pid: Optional[int] = None
+        self.stats = {'issued': 0, 'verified': 0, 'revoked': 0, 'malformed': 0,
+                      'unknown_key': 0, 'bad_signature': 0, 'expired': 0, 'rejected_revoked': 0}
+
+    @property
+    def revocation_store(self) -> Optional[SessionStore]:
+        """The shared store; a factory such as get_session_store is called on first use"""
+        if callable(self._revocation_store):
+            self._revocation_store = self._revocation_store()
+        return self._revocation_store
+
+    def _count(self, key: str):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _sign(self, key: bytes, signing_input: str) -> str:
+        return _b64encode(hmac.new(key, signing_input.encode('ascii'), hashlib.sha256).digest())
+
+    def issue(self, email: str) -> str:
+        """Return a token for `email` valid for ttl seconds"""
+        now = int(time.time())
+        claims = {'sub': email, 'iat': now, 'exp': now + int(self.ttl), 'jti': uuid.uuid4().hex}
+        payload = _b64encode(json.dumps(claims, separators=(',', ':')).encode('utf-8'))
+        signing_input = f"{self.signing_key_id}.{payload}"
+        self._count('issued')
+        return f"{signing_input}.{self._sign(self._keys[self.signing_key_id], signing_input)}"
+
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """
+        Check a token's signature, lifetime and revocation
+
+        Returns:
+            {'email', 'issued_at', 'expires_at', 'token_id'}, or None if the
+            token is malformed, signed with an unknown key, tampered with,
+            expired or revoked
+        """
+        self._ensure_syncer()
+        # Tokens are ASCII; compare_digest refuses non-ASCII str
+        if not isinstance(token, str) or not token.isascii():
+            self._count('malformed')
+            return None
+        try:
+            key_id, payload, signature = token.split('.')
+        except ValueError:
+            self._count('malformed')
+            return None
+        key = self._keys.get(key_id)
+        if key is None:
+            self._count('unknown_key')
+            return None
+        if not hmac.compare_digest(signature, self._sign(key, f"{key_id}.{payload}")):
+            self._count('bad_signature')
+            return None
+        try:
+            claims = json.loads(_b64decode(payload))
+            email, issued_at, expires_at, token_id = claims['sub'], claims['iat'], claims['exp'], claims['jti']
+        except (ValueError, KeyError, TypeError):
+            self._count('malformed')
+            return None
+        now = time.time()
+        if expires_at <= now or issued_at > now + CLOCK_SKEW_SECONDS:
+            self._count('expired')
+            return None
+        if token_id in self._revoked:
+            self._count('rejected_revoked')
+            return None
+        self._count('verified')
+        return {'email': email, 'issued_at': issued_at, 'expires_at': expires_at, 'token_id': token_id}
+
+    def revoke(self, token: str) -> bool:
+        """Sign a token out; False if it was not valid to begin with or the store failed"""
+        claims = self.verify(token)
+        if claims is None:
+            return False
+        with self._lock:
+            self._revoked[claims['token_id']] = claims['expires_at']
+            self.stats['revoked'] += 1
+        if self.revocation_store is None:
+            return True
+        return self.revocation_store.revoke_token(claims['token_id'], claims['expires_at'])
+
+    # ------------------------------------------------------------------
+    # Revocation sync
+    # ------------------------------------------------------------------
+    def sync_revocations(self) -> bool:
+        """Pull revocations recorded by other workers and drop expired ones; False on store error"""
+        if self.revocation_store is None:
+            return True
+        # Re-read a little before the last revocation seen, in case another
+        # worker's clock is slightly behind; merging the same entry twice is harmless
+        since = max(0.0, self._synced_through - CLOCK_SKEW_SECONDS)
+        revocations = self.revocation_store.get_revocations(since)
+        if revocations is None:
+            return False
+        now = time.time()
+        with self._lock:
+            for token_id, expires_at, revoked_at in revocations:
+                self._revoked[token_id] = expires_at
+                self._synced_through = max(self._synced_through, revoked_at)
+            self._revoked = {token_id: expires_at for token_id, expires_at in self._revoked.items() if expires_at > now}
+        return True
+
+    def _ensure_syncer(self):
+        if self.revocation_store is None or self.sync_interval <= 0:
+            return
+        if self._syncer_pid == os.getpid() and self._syncer is not None and self._syncer.is_alive():
+            return
+        with self._lock:
+            # Threads do not survive fork; each gunicorn worker starts its own
+            if self._syncer_pid == os.getpid() and self._syncer is not None and self._syncer.is_alive():
+                return
+            self._syncer = threading.Thread(target=self._sync_loop, name='session-revocation-sync', daemon=True)
+            self._syncer.start()
+            self._syncer_pid = os.getpid()
+
+    def _sync_loop(self):
+        self.sync_revocations()
+        while True:
+            time.sleep(self.sync_interval)
+            self.sync_revocations()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self.stats, 'revocations': len(self._revoked), 'signing_key': self.signing_key_id,
+                    'keys': len(self._keys)}
+
+
+def create_session_tokens(revocation_store: Union[SessionStore, Callable[[], SessionStore], None]) -> Optional[SessionTokens]:
+    """
+    Build SessionTokens if SESSION_MODE=token
+
+    Returns None in the default store mode, and (after logging an error)
+    when SESSION_TOKEN_KEYS is missing or malformed, so sign-in falls back
+    to stored sessions rather than failing.
+    """
+    if os.getenv('SESSION_MODE', 'store').lower() != 'token':
+        return None
+    try:
+        keys = parse_keys(os.getenv('SESSION_TOKEN_KEYS'))
+    except ValueError as e:
+        logger.error(f"Invalid SESSION_TOKEN_KEYS ({e}); using stored sessions")
+        return None
+    if not keys:
+        logger.error("SESSION_MODE=token needs SESSION_TOKEN_KEYS; using stored sessions")
+        return None
+    return SessionTokens(keys, revocation_store=revocation_store)
@@ -0,0 +1,529 @@
+"""
+Embedded SQLite storage backend for ChopChop
+
+Selected with STORAGE_BACKEND=sqlite. Intended for single-node deployments,
+local benchmarking and tests: no network service, WAL journaling so reads
+never block the writer, one connection per thread with a prepared-statement
+cache, JSON1-validated payload columns and a JSON1 partial index on users
+that have a grocery list or recipes.
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any, Tuple, Iterator
+
+from json_patch import apply_patch, JsonPatchError
+from storage_backend import (
+    StorageBackend, VersionConflictError, UserNotFoundError, PATCHABLE_COLUMNS, MAX_CHAT_HISTORY, MAX_RECENT_RECIPES, recipe_identity
+)
+from pantry import pantry_rows, to_pantry_item, encode_cursor, decode_cursor, clamp_page_size
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    email TEXT NOT NULL UNIQUE,
+    items TEXT NOT NULL DEFAULT '[]' CHECK (json_valid(items)),
+    recipes TEXT NOT NULL DEFAULT '[]' CHECK (json_valid(recipes)),
+    data_version INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now'))
+);
+-- JSON1 partial index: the digest job pages through users with a list or recipes, not every user
+CREATE INDEX IF NOT EXISTS idx_users_with_lists ON users(email)
+    WHERE json_array_length(items) > 0 OR json_array_length(recipes) > 0;
+
+CREATE TABLE IF NOT EXISTS chat_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_email TEXT NOT NULL,
+    message TEXT NOT NULL,
+    sender TEXT NOT NULL,
+    image_data TEXT,
+    image_format TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_chat_messages_user ON chat_messages(user_email, id);
+
+CREATE TABLE IF NOT EXISTS pantry_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_email TEXT NOT NULL,
+    canonical_name TEXT NOT NULL,
+    name TEXT NOT NULL,
+    quantity TEXT NOT NULL DEFAULT '',
+    category TEXT NOT NULL DEFAULT 'general',
+    freshness TEXT NOT NULL DEFAULT 'fresh',
+    detected_at TEXT NOT NULL,
+    UNIQUE (user_email, canonical_name)
+);
+CREATE INDEX IF NOT EXISTS idx_pantry_items_freshness ON pantry_items(user_email, freshness, detected_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_pantry_items_detected_at ON pantry_items(user_email, detected_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS recent_recipes (
+    user_email TEXT NOT NULL,
+    recipe_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    recipe TEXT NOT NULL CHECK (json_valid(recipe)),
+    used_at TEXT NOT NULL,
+    PRIMARY KEY (user_email, recipe_key)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_recent_recipes_position ON recent_recipes(user_email, position DESC);
+"""
+
+# Statements are module constants so sqlite3's per-connection statement
+# cache reuses the prepared form on every call.
+SELECT_USER = "SELECT id, items, recipes, data_version FROM users WHERE email = ?"
+UPSERT_USER = """
+    INSERT INTO users (id, email, items, recipes) VALUES (?, ?, json(?), json(?))
+    ON CONFLICT(email) DO UPDATE SET
+        items = excluded.items,
+        recipes = excluded.recipes,
+        data_version = data_version + (users.items IS NOT excluded.items OR users.recipes IS NOT excluded.recipes),
+        updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    RETURNING id
+"""
+UPDATE_USER = """
+    UPDATE users SET
+        items = json(?),
+        recipes = json(?),
+        data_version = data_version + (items IS NOT json(?) OR recipes IS NOT json(?)),
+        updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE email = ?
+"""
+UPDATE_USER_VERSIONED = """
+    UPDATE users SET
+        items = json(?),
+        recipes = json(?),
+        data_version = data_version + 1,
+        updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+    WHERE email = ? AND data_version = ?
+"""
+INSERT_CHAT_MESSAGE = """
+    INSERT INTO chat_messages (user_email, message, sender, image_data, image_format, created_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+"""
+TRIM_CHAT_MESSAGES = """
+    DELETE FROM chat_messages WHERE user_email = ? AND id <= (
+        SELECT id FROM chat_messages WHERE user_email = ? ORDER BY id DESC LIMIT 1 OFFSET ?
+    )
+"""
+SELECT_CHAT_MESSAGES = """
+    SELECT message, sender, created_at, image_data, image_format
+    FROM chat_messages WHERE user_email = ? ORDER BY id DESC LIMIT ?
+"""
+UPSERT_PANTRY_ITEM = """
+    INSERT INTO pantry_items (user_email, canonical_name, name, quantity, category, freshness, detected_at)
+    VALUES (:user_email, :canonical_name, :name, :quantity, :category, :freshness, :detected_at)
+    ON CONFLICT(user_email, canonical_name) DO UPDATE SET
+        name = excluded.name,
+        quantity = excluded.quantity,
+        category = excluded.category,
+        freshness = excluded.freshness,
+        detected_at = excluded.detected_at
+"""
+PUSH_RECENT_RECIPE = """
+    INSERT INTO recent_recipes (user_email, recipe_key, position, recipe, used_at)
+    VALUES (?, ?, (SELECT COALESCE(MAX(position), 0) + 1 FROM recent_recipes WHERE user_email = ?), json(?), ?)
+    ON CONFLICT(user_email, recipe_key) DO UPDATE SET
+        position = excluded.position,
+        recipe = excluded.recipe,
+        used_at = excluded.used_at
+"""
+TRIM_RECENT_RECIPES = """
+    DELETE FROM recent_recipes WHERE user_email = ? AND position <= (
+        SELECT position FROM recent_recipes WHERE user_email = ? ORDER BY position DESC LIMIT 1 OFFSET ?
+    )
+"""
+SELECT_RECENT_RECIPES = "SELECT recipe FROM recent_recipes WHERE user_email = ? ORDER BY position DESC LIMIT ?"
+
+# Bulk export: every email with any stored data, keyset-paged
+SELECT_EXPORT_EMAILS = """
+    SELECT email FROM (
+        SELECT email FROM users
+        UNION SELECT user_email FROM chat_messages
+        UNION SELECT user_email FROM pantry_items
+        UNION SELECT user_email FROM recent_recipes
+    ) WHERE email > ? ORDER BY email LIMIT ?
+"""
+# The WHERE clause repeats idx_users_with_lists' so the planner can use that index
+SELECT_USER_LISTS = """
+    SELECT email, items, recipes FROM users
+    WHERE email > ? AND (json_array_length(items) > 0 OR json_array_length(recipes) > 0)
+    ORDER BY email LIMIT ?
+"""
+IMPORT_USER = """
+    INSERT INTO users (id, email, items, recipes) VALUES (?, ?, json(?), json(?))
+    ON CONFLICT(email) DO UPDATE SET
+        items = excluded.items,
+        recipes = excluded.recipes,
+        data_version = data_version + (users.items IS NOT excluded.items OR users.recipes IS NOT excluded.recipes),
+        updated_at = strftime('%Y-%m-%dT%H:%M:%fZ', 'now')
+"""
+DELETE_CHAT_MESSAGES = "DELETE FROM chat_messages WHERE user_email = ?"
+DELETE_RECENT_RECIPES = "DELETE FROM recent_recipes WHERE user_email = ?"
+INSERT_RECENT_RECIPE = """
+    INSERT OR REPLACE INTO recent_recipes (user_email, recipe_key, position, recipe, used_at)
+    VALUES (?, ?, ?, json(?), ?)
+"""
+
+
+def _utcnow() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, separators=(',', ':'))
+
+
+class SQLiteStorage(StorageBackend):
+    """StorageBackend backed by a local SQLite database file"""
+
+    backend_name = 'sqlite'
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Open (and if needed create) the database
+
+        Args:
+            path: Database file; defaults to SQLITE_PATH or chopchop.sqlite3.
+                ':memory:' is not supported because every thread opens its
+                own connection.
+        """
+        self.path = path or os.getenv('SQLITE_PATH', 'chopchop.sqlite3')
+        self.busy_timeout_ms = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000'))
+        self._local = threading.local()
+        try:
+            # executescript manages its own transaction
+            self._connection().executescript(SCHEMA)
+            self.enabled = True
+            logger.info(f"SQLite storage ready at {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to initialize SQLite storage: {e}")
+            self.enabled = False
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use (and after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,  # explicit BEGIN/COMMIT below
+            cached_statements=256,
+            check_same_thread=True,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA cache_size = -16000")
+        conn.execute("PRAGMA mmap_size = 134217728")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+        """
+        Run a block in one transaction
+
+        BEGIN IMMEDIATE takes the write lock up front, so a read-modify-write
+        inside the block cannot interleave with another writer.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self):
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------------------------------------------------------
+    # User data
+    # ------------------------------------------------------------------
+    def save_user_data(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> Optional[str]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot save data.")
+            return None
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(UPSERT_USER, (str(uuid.uuid4()), user_email, _dumps(items), _dumps(recipes))).fetchone()
+            logger.info(f"Successfully saved data for user {user_email} with ID {row['id']}")
+            return row['id']
+        except Exception as e:
+            logger.error(f"Error saving user data: {e}")
+            return None
+
+    def get_user_data_with_etag(self, user_email: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot retrieve data.")
+            return None, None
+        try:
+            row = self._connection().execute(SELECT_USER, (user_email,)).fetchone()
+            user_data = None
+            if row is not None:
+                user_data = {
+                    'id': row['id'],
+                    'items': json.loads(row['items']),
+                    'recipes': json.loads(row['recipes']),
+                    'version': row['data_version']
+                }
+            return user_data, self.compute_etag(user_data)
+        except Exception as e:
+            logger.error(f"Error retrieving user data: {e}")
+            return None, None
+
+    def update_user_data(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> bool:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot update data.")
+            return False
+        try:
+            items_json, recipes_json = _dumps(items), _dumps(recipes)
+            with self._transaction() as conn:
+                cursor = conn.execute(UPDATE_USER, (items_json, recipes_json, items_json, recipes_json, user_email))
+            if cursor.rowcount:
+                logger.info(f"Successfully updated data for user {user_email}")
+                return True
+            logger.error(f"Failed to update data for user {user_email}")
+            return False
+        except Exception as e:
+            logger.error(f"Error updating user data: {e}")
+            return False
+
+    def patch_user_data(self, user_email: str, operations: List[Dict], expected_version: Optional[int] = None) -> Optional[int]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot patch data.")
+            return None
+        roots = self._patch_roots(operations)
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(SELECT_USER, (user_email,)).fetchone()
+                if row is None:
+                    raise UserNotFoundError(user_email)
+                current_version = row['data_version']
+                if expected_version is not None and expected_version != current_version:
+                    raise VersionConflictError(current_version)
+                document = {column: json.loads(row[column]) for column in PATCHABLE_COLUMNS}
+                patched = apply_patch(document, operations)
+                if not roots:
+                    return current_version
+                conn.execute(UPDATE_USER_VERSIONED, (
+                    _dumps(patched['items']), _dumps(patched['recipes']), user_email, current_version
+                ))
+            logger.info(f"Patched {', '.join(roots)} for user {user_email} (version {current_version + 1})")
+            return current_version + 1
+        except (JsonPatchError, VersionConflictError, UserNotFoundError):
+            raise
+        except Exception as e:
+            logger.error(f"Error patching user data: {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # Chat messages
+    # ------------------------------------------------------------------
+    def save_chat_message(self, user_email: str, message: str, sender: str, image_base64: str = None, image_format: str = None) -> bool:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot save chat message.")
+            return False
+        try:
+            with self._transaction() as conn:
+                conn.execute(INSERT_CHAT_MESSAGE, (user_email, message, sender, image_base64, image_format, _utcnow()))
+                conn.execute(TRIM_CHAT_MESSAGES, (user_email, user_email, MAX_CHAT_HISTORY))
+            logger.info(f"Saved chat message for user {user_email}")
+            return True
+        except Exception as e:
+            logger.error(f"Error saving chat message: {e}")
+            return False
+
+    def get_chat_history_with_etag(self, user_email: str, limit: Optional[int] = None) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot retrieve chat history.")
+            return None, None
+        try:
+            count = min(limit, MAX_CHAT_HISTORY) if limit else MAX_CHAT_HISTORY
+            rows = self._connection().execute(SELECT_CHAT_MESSAGES, (user_email, count)).fetchall()
+            chat_history = [
+                self._new_chat_message(row['message'], row['sender'], row['image_data'], row['image_format'],
+                                       timestamp=row['created_at'])
+                for row in reversed(rows)
+            ]
+            return chat_history, self.compute_etag(chat_history)
+        except Exception as e:
+            logger.error(f"Error retrieving chat history: {e}")
+            return None, None
+
+    # ------------------------------------------------------------------
+    # Pantry inventory
+    # ------------------------------------------------------------------
+    def upsert_pantry_items(self, user_email: str, ingredients: List[Dict]) -> Optional[int]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot update pantry.")
+            return None
+        try:
+            rows = pantry_rows(user_email, ingredients)
+            if rows:
+                with self._transaction() as conn:
+                    conn.executemany(UPSERT_PANTRY_ITEM, rows)
+            logger.info(f"Upserted {len(rows)} pantry items for user {user_email}")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error upserting pantry items: {e}")
+            return None
+
+    def query_pantry(self, user_email: str, freshness: Optional[List[str]] = None, category: Optional[str] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot query pantry.")
+            return None
+        position = decode_cursor(cursor)
+        page_size = clamp_page_size(limit)
+        sql = "SELECT id, name, quantity, category, freshness, detected_at FROM pantry_items WHERE user_email = ?"
+        params: List[Any] = [user_email]
+        if freshness:
+            sql += f" AND freshness IN ({', '.join('?' for _ in freshness)})"
+            params.extend(freshness)
+        if category:
+            sql += " AND category = ?"
+            params.append(category.lower())
+        if position:
+            sql += " AND (detected_at < ? OR (detected_at = ? AND id < ?))"
+            params.extend([position[0], position[0], int(position[1])])
+        sql += " ORDER BY detected_at DESC, id DESC LIMIT ?"
+        params.append(page_size + 1)
+        try:
+            rows = [dict(row) for row in self._connection().execute(sql, params).fetchall()]
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                next_cursor = encode_cursor(rows[-1]['detected_at'], rows[-1]['id'])
+            return {'items': [to_pantry_item(row) for row in rows], 'next_cursor': next_cursor}
+        except Exception as e:
+            logger.error(f"Error querying pantry: {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # Recent recipes
+    # ------------------------------------------------------------------
+    def add_recent_recipe(self, user_email: str, recipe: Dict) -> bool:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot add recent recipe.")
+            return False
+        try:
+            # Push (or move to front) and trim in one transaction
+            with self._transaction() as conn:
+                conn.execute(PUSH_RECENT_RECIPE, (user_email, recipe_identity(recipe), user_email, _dumps(recipe), _utcnow()))
+                conn.execute(TRIM_RECENT_RECIPES, (user_email, user_email, MAX_RECENT_RECIPES))
+            return True
+        except Exception as e:
+            logger.error(f"Error adding recent recipe: {e}")
+            return False
+
+    def get_recent_recipes(self, user_email: str) -> Optional[List[Dict]]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot retrieve recent recipes.")
+            return None
+        try:
+            rows = self._connection().execute(SELECT_RECENT_RECIPES, (user_email, MAX_RECENT_RECIPES)).fetchall()
+            return [json.loads(row['recipe']) for row in rows]
+        except Exception as e:
+            logger.error(f"Error retrieving recent recipes: {e}")
+            return None
+
+    # ------------------------------------------------------------------
+    # Bulk export / import
+    # ------------------------------------------------------------------
+    def export_user_records(self, after_email: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot export data.")
+            return None
+        try:
+            conn = self._connection()
+            # One read transaction so the page is a consistent snapshot
+            conn.execute("BEGIN")
+            try:
+                emails = [row['email'] for row in conn.execute(SELECT_EXPORT_EMAILS, (after_email or '', limit))]
+                records = {email: {
+                    'email': email, 'items': [], 'recipes': [], 'chat_history': [], 'recent_recipes': [], 'pantry': []
+                } for email in emails}
+                if emails:
+                    placeholders = ', '.join('?' for _ in emails)
+                    for row in conn.execute(f"SELECT email, items, recipes FROM users WHERE email IN ({placeholders})", emails):
+                        records[row['email']].update(items=json.loads(row['items']), recipes=json.loads(row['recipes']))
+                    for row in conn.execute(
+                            "SELECT user_email, message, sender, created_at, image_data, image_format FROM chat_messages "
+                            f"WHERE user_email IN ({placeholders}) ORDER BY user_email, id", emails):
+                        records[row['user_email']]['chat_history'].append(self._new_chat_message(
+                            row['message'], row['sender'], row['image_data'], row['image_format'], timestamp=row['created_at']))
+                    for row in conn.execute(
+                            "SELECT user_email, recipe FROM recent_recipes "
+                            f"WHERE user_email IN ({placeholders}) ORDER BY user_email, position DESC", emails):
+                        records[row['user_email']]['recent_recipes'].append(json.loads(row['recipe']))
+                    for row in conn.execute(
+                            "SELECT user_email, name, quantity, category, freshness, detected_at FROM pantry_items "
+                            f"WHERE user_email IN ({placeholders}) ORDER BY user_email, detected_at DESC, id DESC", emails):
+                        item = dict(row)
+                        records[item.pop('user_email')]['pantry'].append(item)
+            finally:
+                conn.execute("COMMIT")
+            return list(records.values())
+        except Exception as e:
+            logger.error(f"Error exporting user records: {e}")
+            return None
+
+    def list_user_lists(self, after_email: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot list user data.")
+            return None
+        try:
+            rows = self._connection().execute(SELECT_USER_LISTS, (after_email or '', limit)).fetchall()
+            return [{'email': row['email'], 'items': json.loads(row['items']), 'recipes': json.loads(row['recipes'])}
+                    for row in rows]
+        except Exception as e:
+            logger.error(f"Error listing user data: {e}")
+            return None
+
+    def import_user_records(self, records: List[Dict[str, Any]]) -> Optional[int]:
+        if not self.enabled:
+            logger.warning("SQLite storage is not enabled. Cannot import data.")
+            return None
+        try:
+            with self._transaction() as conn:
+                for record in records:
+                    email = record['email']
+                    conn.execute(IMPORT_USER, (str(uuid.uuid4()), email,
+                                               _dumps(record.get('items') or []), _dumps(record.get('recipes') or [])))
+                    conn.execute(DELETE_CHAT_MESSAGES, (email,))
+                    conn.executemany(INSERT_CHAT_MESSAGE, [
+                        (email, message.get('message') or '', message.get('sender') or 'user', message.get('image_data'),
+                         message.get('image_format'), message.get('timestamp') or _utcnow())
+                        for message in (record.get('chat_history') or [])[-MAX_CHAT_HISTORY:]
+                    ])
+                    recent = (record.get('recent_recipes') or [])[:MAX_RECENT_RECIPES]
+                    conn.execute(DELETE_RECENT_RECIPES, (email,))
+                    conn.executemany(INSERT_RECENT_RECIPE, [
+                        (email, recipe_identity(recipe), len(recent) - index, _dumps(recipe), _utcnow())
+                        for index, recipe in enumerate(recent)
+                    ])
+                    conn.executemany(UPSERT_PANTRY_ITEM, pantry_rows(email, record.get('pantry') or []))
+            return len(records)
+        except Exception as e:
+            logger.error(f"Error importing user records: {e}")
+            return None
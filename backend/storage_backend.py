@@ -0,0 +1,285 @@
+"""
+Storage interface for ChopChop user data, chat messages, pantry and recent recipes
+
+SupabaseManager (supabase_config.py) and SQLiteStorage (sqlite_storage.py)
+implement it; STORAGE_BACKEND selects which one the API uses.
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Any, Tuple
+
+from json_patch import touched_roots, JsonPatchError
+from json_codec import decode_json_column
+
+logger = logging.getLogger(__name__)
+
+# Top-level members of the user document that delta updates may touch
+PATCHABLE_COLUMNS = ('items', 'recipes')
+
+# Chat messages kept per user
+MAX_CHAT_HISTORY = 100
+
+# Recent recipes kept per user
+MAX_RECENT_RECIPES = 10
+
+
+def recipe_identity(recipe: Dict[str, Any]) -> str:
+    """
+    Key used to dedupe recent recipes
+
+    An explicit id wins; otherwise the case- and whitespace-insensitive name;
+    otherwise a hash of the recipe content.
+    """
+    if recipe.get('id') not in (None, ''):
+        return f"id:{recipe['id']}"
+    name = re.sub(r'\s+', ' ', str(recipe.get('name') or '')).strip().lower()
+    if name:
+        return f"name:{name}"
+    payload = json.dumps(recipe, sort_keys=True, separators=(',', ':'), default=str)
+    return f"hash:{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]}"
+
+
+class VersionConflictError(Exception):
+    """Raised when a conditional write finds a different data version than expected"""
+
+    def __init__(self, current_version: Optional[int]):
+        super().__init__(f"Data version conflict (current version: {current_version})")
+        self.current_version = current_version
+
+
+class UserNotFoundError(LookupError):
+    """Raised when a write that needs an existing user finds no row for the email"""
+
+    def __init__(self, user_email: str):
+        super().__init__(f"No data found for user {user_email}")
+        self.user_email = user_email
+
+
+class StorageBackend(ABC):
+    """
+    Persistence operations used by the API endpoints
+
+    Methods never raise for database failures: they log and return None or
+    False, matching the endpoints' error handling. The only exceptions are
+    the client errors raised by patch_user_data.
+    """
+
+    backend_name = 'abstract'
+    enabled = False
+
+    # ------------------------------------------------------------------
+    # Shared helpers
+    # ------------------------------------------------------------------
+    @staticmethod
+    def compute_etag(value: Any) -> str:
+        """Return a content hash of a JSON-serializable value, for use as an ETag"""
+        payload = json.dumps(value, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def _decode_json_column(value: Any, default: Any) -> Any:
+        """
+        Decode a JSON column value
+
+        Rows written before the switch to native JSONB values hold a JSON
+        string instead of an array, and rows written with a compact
+        JSON_COLUMN_ENCODING hold a tagged compressed string; all are accepted.
+        """
+        return decode_json_column(value, default)
+
+    @staticmethod
+    def _patch_roots(operations: List[Dict]) -> List[str]:
+        """Return the columns a patch writes to, rejecting paths outside them"""
+        roots = touched_roots(operations)
+        for root in roots:
+            if root not in PATCHABLE_COLUMNS:
+                raise JsonPatchError(f"Path root must be one of {', '.join(PATCHABLE_COLUMNS)}: {root!r}")
+        return roots
+
+    @staticmethod
+    def _new_chat_message(message: str, sender: str, image_base64: Optional[str], image_format: Optional[str],
+                          timestamp: str = 'now()') -> Dict[str, Any]:
+        return {
+            'message': message,
+            'sender': sender,
+            'timestamp': timestamp,
+            'image_data': image_base64,
+            'image_format': image_format
+        }
+
+    # ------------------------------------------------------------------
+    # User data
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def save_user_data(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> Optional[str]:
+        """Insert or replace a user's items and recipes; returns the record id"""
+
+    def get_user_data(self, user_email: str) -> Optional[Dict[str, Any]]:
+        """Return {'id', 'items', 'recipes', 'version'} or None if not found"""
+        user_data, _ = self.get_user_data_with_etag(user_email)
+        return user_data
+
+    @abstractmethod
+    def get_user_data_with_etag(self, user_email: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        """Return (user data or None, content etag); the etag is None on error"""
+
+    @abstractmethod
+    def update_user_data(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> bool:
+        """Replace an existing user's items and recipes"""
+
+    @abstractmethod
+    def patch_user_data(self, user_email: str, operations: List[Dict], expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        Apply a JSON Patch to items/recipes atomically; returns the new version
+
+        Raises:
+            JsonPatchError: If the patch is malformed or does not apply
+            VersionConflictError: If the stored version differs from expected_version
+            UserNotFoundError: If the user has no saved data to patch
+        """
+
+    # ------------------------------------------------------------------
+    # Chat messages
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def save_chat_message(self, user_email: str, message: str, sender: str, image_base64: str = None, image_format: str = None) -> bool:
+        """Append a message to the user's chat history (keeps the last 100)"""
+
+    def get_chat_history(self, user_email: str, limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """Return the chat history, oldest first, or None on error"""
+        chat_history, _ = self.get_chat_history_with_etag(user_email, limit)
+        return chat_history
+
+    @abstractmethod
+    def get_chat_history_with_etag(self, user_email: str, limit: Optional[int] = None) -> Tuple[Optional[List[Dict]], Optional[str]]:
+        """Return (chat history or None on error, content etag or None on error)"""
+
+    # ------------------------------------------------------------------
+    # Pantry inventory
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def upsert_pantry_items(self, user_email: str, ingredients: List[Dict]) -> Optional[int]:
+        """
+        Bulk upsert detected ingredients keyed by (user, canonical name)
+
+        Returns:
+            Number of pantry rows written, or None on error
+        """
+
+    @abstractmethod
+    def query_pantry(self, user_email: str, freshness: Optional[List[str]] = None, category: Optional[str] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Filter a user's pantry server-side, newest detections first
+
+        Args:
+            freshness: Only return items with one of these freshness values
+            category: Only return items in this category
+            limit: Page size (clamped to pantry.MAX_PAGE_SIZE)
+            cursor: next_cursor from the previous page
+
+        Returns:
+            {'items': [PantryItem...], 'next_cursor': str or None}, or None on error
+
+        Raises:
+            ValueError: If the cursor is malformed
+        """
+
+    # ------------------------------------------------------------------
+    # Recent recipes
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def add_recent_recipe(self, user_email: str, recipe: Dict) -> bool:
+        """
+        Push a recipe onto the user's recent list in one atomic step
+
+        An entry with the same recipe_identity moves to the front instead of
+        being duplicated, and the list is trimmed to MAX_RECENT_RECIPES.
+        """
+
+    @abstractmethod
+    def get_recent_recipes(self, user_email: str) -> Optional[List[Dict]]:
+        """Return recent recipes, most recent first, or None on error"""
+
+    # ------------------------------------------------------------------
+    # Bulk export / import (see bulk_transfer.py)
+    # ------------------------------------------------------------------
+    @abstractmethod
+    def export_user_records(self, after_email: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return one keyset page of complete user records, ordered by email
+
+        Each record is {'email', 'items', 'recipes', 'chat_history' (oldest
+        first), 'recent_recipes' (newest first), 'pantry' (PantryItems
+        without ids)}.
+
+        Args:
+            after_email: Email of the last record of the previous page, or None
+            limit: Maximum records to return
+
+        Returns:
+            The records (fewer than limit on the last page), or None on error
+        """
+
+    @abstractmethod
+    def list_user_lists(self, after_email: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return one keyset page of {'email', 'items', 'recipes'}, ordered by email
+
+        A lighter read than export_user_records for jobs that only need the
+        grocery list and recipes (see digest_job.py). Backends may leave out
+        users whose items and recipes are both empty.
+
+        Returns:
+            The rows (fewer than limit on the last page), or None on error
+        """
+
+    @abstractmethod
+    def import_user_records(self, records: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Upsert a batch of exported user records
+
+        Items, recipes, chat history and recent recipes replace what is
+        stored and pantry items are upserted, so importing the same batch
+        twice is harmless (which is what makes resuming an import safe).
+
+        Returns:
+            Number of records written, or None on error
+        """
+
+
+_storage: Optional[StorageBackend] = None
+_storage_lock = threading.Lock()
+
+
+def create_storage_backend(name: Optional[str] = None) -> StorageBackend:
+    """
+    Build the storage backend named by `name` or the STORAGE_BACKEND variable
+
+    Args:
+        name: 'supabase' (default) or 'sqlite'
+    """
+    name = (name or os.getenv('STORAGE_BACKEND', 'supabase')).lower()
+    if name == 'sqlite':
+        from sqlite_storage import SQLiteStorage
+        return SQLiteStorage()
+    if name != 'supabase':
+        logger.warning(f"Unknown STORAGE_BACKEND {name!r}; falling back to supabase")
+    from supabase_config import supabase_manager
+    return supabase_manager
+
+
+def get_storage() -> StorageBackend:
+    """Return the process-wide storage backend, creating it on first use"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = create_storage_backend()
+                logger.info(f"Using {_storage.backend_name} storage backend")
+    return _storage
@@ -2,52 +2,233 @@
 Supabase configuration and database operations for ChopChop
 """
 import os
+import copy
 import json
+import time
 import logging
-from typing import Dict, List, Optional, Any
-from supabase import create_client, Client
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-import smtplib
-from dotenv import load_dotenv
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Any, Callable, Tuple, TYPE_CHECKING
+from coldstart import lazy_import, first_use, load_env_file
+from json_patch import apply_patch, JsonPatchError
+from storage_backend import (
+    StorageBackend, VersionConflictError, UserNotFoundError, PATCHABLE_COLUMNS, MAX_CHAT_HISTORY, MAX_RECENT_RECIPES, recipe_identity
+)
+from json_codec import JsonColumnCodec
+from email_service import get_email_service
+from email_templates import render_grocery_email
+from supabase_http import HttpPoolSettings, create_http_client, get_pool_stats
+from pantry import pantry_rows, to_pantry_item, encode_cursor, decode_cursor, clamp_page_size
+from metrics import SUPABASE_CALL_SECONDS, timed_methods
+
+if TYPE_CHECKING:
+    from supabase import Client
 
 # Load environment variables from .env file
-load_dotenv()
+load_env_file()
 
 logger = logging.getLogger(__name__)
 
-class SupabaseManager:
-    def __init__(self):
-        """Initialize Supabase client with environment variables"""
+# Columns each read needs from the Users table. Reads never use select('*'):
+# chat_history carries base64 images and dwarfs everything else in the row.
+USER_DATA_COLUMNS = 'id, items, recipes, data_version'
+CHAT_HISTORY_COLUMNS = 'chat_history'
+
+PANTRY_COLUMNS = 'id, name, quantity, category, freshness, detected_at'
+
+# Bulk export reads whole rows, one keyset page at a time
+EXPORT_USER_COLUMNS = 'email, items, recipes, chat_history, recent_recipes'
+EXPORT_PANTRY_COLUMNS = 'id, user_email, name, quantity, category, freshness, detected_at'
+EXPORT_PANTRY_PAGE_SIZE = 1000
+LIST_USER_COLUMNS = 'email, items, recipes'
+
+# Reads and writes an unconditional patch makes before giving up to concurrent writers
+PATCH_ATTEMPTS = 3
+
+# Largest "last N messages" read served by server-side JSON path extraction
+MAX_CHAT_HISTORY_PATH_LIMIT = 50
+
+# Latency per method that queries Supabase, for /metrics; email and local bookkeeping are left out
+@timed_methods(SUPABASE_CALL_SECONDS, ('save_user_data', 'get_user_data_with_etag', 'upsert_pantry_items', 'query_pantry',
+                                       'add_recent_recipe', 'get_recent_recipes', 'export_user_records',
+                                       'list_user_lists', 'import_user_records', 'update_user_data', 'patch_user_data',
+                                       'save_chat_message', 'get_chat_history_with_etag'))
+class SupabaseManager(StorageBackend):
+    backend_name = 'supabase'
+    
+    def __init__(self, client: Optional[Any] = None):
+        """
+        Initialize Supabase client with environment variables
+        
+        Args:
+            client: Pre-built client to use instead of create_client (e.g. the
+                in-memory stand-in from fake_supabase for tests)
+        """
         self.supabase_url = os.getenv('SUPABASE_URL')
         # Try service role key first, then fall back to anon key
         self.supabase_key = os.getenv('SUPABASE_SERVICE_ROLE_KEY') or os.getenv('SUPABASE_API_KEY')
         
-        if not self.supabase_url or not self.supabase_key:
+        self.http_settings = HttpPoolSettings()
+        self.json_codec = JsonColumnCodec()
+        self._http_client = None
+        self._client_lock = threading.Lock()
+        self._client_pid = os.getpid()
+        self._owns_client = client is None
+        
+        if client is not None:
+            self._client = client
+            self.enabled = True
+        elif not self.supabase_url or not self.supabase_key:
             logger.warning("Supabase credentials not found. Supabase features will be disabled.")
             logger.warning("To enable Supabase features, set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (or SUPABASE_API_KEY) environment variables")
-            self.supabase = None
+            self._client = None
             self.enabled = False
         else:
+            # Built on first use (see the supabase property)
+            self._client = None
+            self.enabled = True
+            if os.getenv('SUPABASE_SERVICE_ROLE_KEY'):
+                logger.info("Using service role key (full access)")
+            else:
+                logger.warning("Using anon key (limited access - some operations may fail)")
+        
+        self._read_cache: 'OrderedDict[Tuple[str, str], Tuple[float, Any, str, Any]]' = OrderedDict()
+        self._read_cache_lock = threading.Lock()
+        self.configure_read_cache()
+    
+    def configure_read_cache(self):
+        """
+        (Re)read the read cache settings; gunicorn's post_fork calls this once the worker count is known
+        
+        The cache is per user, keyed by (kind, email). Writes made through this
+        manager invalidate it immediately. Other gunicorn workers keep their
+        own caches, so a cached user data read is revalidated against the
+        row's data_version on every hit. Chat history has no version: it is
+        only cached when this is the only worker, unless configured.
+        """
+        self.read_cache_ttl = float(os.getenv('SUPABASE_READ_CACHE_TTL', '5'))
+        single_worker = int(os.getenv('GUNICORN_WORKERS', '1')) <= 1
+        self.unversioned_cache_ttl = min(self.read_cache_ttl, float(
+            os.getenv('SUPABASE_CHAT_CACHE_TTL', str(self.read_cache_ttl) if single_worker else '0')))
+        self.read_cache_max_entries = int(os.getenv('SUPABASE_READ_CACHE_MAX_ENTRIES', '1024'))
+    
+    def _create_client(self) -> 'Client':
+        """Create a Supabase client backed by this process's pooled HTTP client"""
+        supabase = lazy_import('supabase')
+        self._http_client = create_http_client(self.http_settings)
+        options = supabase.ClientOptions(
+            httpx_client=self._http_client,
+            postgrest_client_timeout=self.http_settings.timeout()
+        )
+        return supabase.create_client(self.supabase_url, self.supabase_key, options=options)
+    
+    @property
+    def supabase(self) -> Optional['Client']:
+        """
+        The Supabase client for the current process
+        
+        Built on first use, so starting the app does not pay for importing
+        supabase-py. Pooled connections must not be shared across fork(), so
+        a gunicorn worker that inherited the client from a preloading master
+        rebuilds it on first use.
+        """
+        if self._owns_client and self.enabled and (self._client is None or self._client_pid != os.getpid()):
+            self._build_client()
+        return self._client
+    
+    def _build_client(self):
+        with self._client_lock:
+            if self._client is not None and self._client_pid == os.getpid():
+                return
             try:
-                self.supabase: Client = create_client(self.supabase_url, self.supabase_key)
-                self.enabled = True
-                logger.info("Supabase client initialized successfully")
-                if os.getenv('SUPABASE_SERVICE_ROLE_KEY'):
-                    logger.info("Using service role key (full access)")
-                else:
-                    logger.warning("Using anon key (limited access - some operations may fail)")
+                # The inherited pool's sockets belong to the parent; drop them unclosed
+                with first_use('supabase client'):
+                    self._client = self._create_client()
+                self._client_pid = os.getpid()
+                logger.info(f"Supabase client initialized in process {self._client_pid}")
             except Exception as e:
                 logger.error(f"Failed to initialize Supabase client: {e}")
-                self.supabase = None
+                self._client = None
                 self.enabled = False
+    
+    @supabase.setter
+    def supabase(self, client: Optional[Any]):
+        self._client = client
+        self._owns_client = False
+    
+    def reinitialize_client(self):
+        """Rebuild the client and its connection pool (call after fork); a client not built yet stays lazy"""
+        if not self._owns_client or not self.enabled or self._client is None:
+            return
+        self._build_client()
+    
+    def get_http_pool_stats(self) -> Dict[str, Any]:
+        """Return HTTP pool settings and utilization for this process"""
+        return {
+            'settings': self.http_settings.as_dict(),
+            'pool': get_pool_stats(self._http_client),
+        }
+    
+    def get_encoding_stats(self) -> Dict[str, Any]:
+        """Bytes written and read through the JSON column encoding"""
+        return self.json_codec.get_stats()
+    
+    def _decode_json_column(self, value: Any, default: Any) -> Any:
+        """Decode a Users column in any stored format, counting encoded bytes"""
+        return self.json_codec.decode(value, default)
+    
+    def _cached_read(self, kind: str, user_email: str, loader: Callable[[str], Any],
+                     current_version: Optional[Callable[[str], Any]] = None,
+                     version_of: Optional[Callable[[Any], Any]] = None) -> Tuple[Any, str]:
+        """
+        Read-through cache lookup
+        
+        Args:
+            kind: Cache namespace ('user_data' or 'chat_history')
+            user_email: User's email address
+            loader: Fetches the value from Supabase; exceptions propagate and
+                are never cached
+            current_version: Cheaply reads the row's version from Supabase; a
+                cached entry is then served only while it still matches, so
+                writes from other workers are seen at once
+            version_of: The version of a value returned by loader
+            
+        Returns:
+            Tuple of (value, etag); the value is the caller's own copy, so
+            changing it cannot corrupt the cached entry or its etag
+        """
+        key = (kind, user_email)
+        ttl = self.read_cache_ttl if current_version else self.unversioned_cache_ttl
+        now = time.monotonic()
+        with self._read_cache_lock:
+            entry = self._read_cache.get(key)
+            if entry is not None and now - entry[0] >= ttl:
+                del self._read_cache[key]
+                entry = None
+        
+        if entry is not None and (current_version is None or current_version(user_email) == entry[3]):
+            with self._read_cache_lock:
+                if key in self._read_cache:
+                    self._read_cache.move_to_end(key)
+            return copy.deepcopy(entry[1]), entry[2]
         
-        # Email configuration
-        self.smtp_host = os.getenv('SMTP_HOST', 'smtp.gmail.com')
-        self.smtp_port = int(os.getenv('SMTP_PORT', '587'))
-        self.smtp_user = os.getenv('SMTP_USER')
-        self.smtp_password = os.getenv('SMTP_PASSWORD')
+        value = loader(user_email)
+        etag = self.compute_etag(value)
+        
+        if ttl > 0:
+            with self._read_cache_lock:
+                self._read_cache[key] = (now, copy.deepcopy(value), etag, version_of(value) if version_of else None)
+                self._read_cache.move_to_end(key)
+                while len(self._read_cache) > self.read_cache_max_entries:
+                    self._read_cache.popitem(last=False)
+        return value, etag
     
+    def invalidate_user_cache(self, user_email: str):
+        """Drop every cached read for a user after a write"""
+        with self._read_cache_lock:
+            for key in [k for k in self._read_cache if k[1] == user_email]:
+                del self._read_cache[key]
     
     def save_user_data(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> Optional[str]:
         """
@@ -66,25 +247,13 @@ class SupabaseManager:
             return None
             
         try:
-            # First check if user exists
-            existing_result = self.supabase.table('Users').select('id').eq('email', user_email).execute()
-            
-            data = {
-                'email': user_email,
-                'items': json.dumps(items),
-                'recipes': json.dumps(recipes)
-            }
+            record_id = self._upsert_user(user_email, self.json_codec.encode_columns({
+                'items': items,
+                'recipes': recipes
+            }))
+            self.invalidate_user_cache(user_email)
             
-            if existing_result.data:
-                # Update existing user
-                result = self.supabase.table('Users').update(data).eq('email', user_email).execute()
-                record_id = existing_result.data[0]['id']
-            else:
-                # Insert new user
-                result = self.supabase.table('Users').insert(data).execute()
-                record_id = result.data[0]['id']
-            
-            if result.data:
+            if record_id:
                 logger.info(f"Successfully saved data for user {user_email} with ID {record_id}")
                 return record_id
             else:
@@ -95,42 +264,175 @@ class SupabaseManager:
             logger.error(f"Error saving user data: {e}")
             return None
     
-    def get_user_data(self, user_email: str) -> Optional[Dict[str, Any]]:
+    def _upsert_user(self, user_email: str, fields: Dict[str, Any]) -> Optional[str]:
+        """
+        Insert or update the Users row for an email in a single round trip
+        
+        Relies on the unique constraint on `email`, so concurrent first saves
+        for the same user converge on one row instead of racing a select
+        against an insert.
+        
+        Args:
+            user_email: User's email address
+            fields: Column values to write (native JSON values, not strings)
+            
+        Returns:
+            UUID of the upserted record or None if nothing was returned
+        """
+        data = {'email': user_email, **fields}
+        result = self.supabase.table('Users').upsert(data, on_conflict='email').select('id').execute()
+        if result.data:
+            return result.data[0]['id']
+        return None
+    
+    def get_user_data_with_etag(self, user_email: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
         """
-        Retrieve user's saved data from Supabase
+        Retrieve user's saved data along with its content ETag
+        
+        Served from the per-user read cache when possible, so repeated polls
+        of unchanged data do not query Supabase.
         
         Args:
             user_email: User's email address
             
         Returns:
-            Dictionary containing items and recipes or None if not found
+            Tuple of (user data or None if not found, etag); the etag is None on error
         """
         if not self.enabled:
             logger.warning("Supabase is not enabled. Cannot retrieve data.")
-            return None
+            return None, None
             
         try:
-            result = self.supabase.table('Users').select('*').eq('email', user_email).execute()
-            
-            if result.data:
-                record = result.data[0]
-                return {
-                    'id': record['id'],
-                    'items': json.loads(record['items']) if record.get('items') else [],
-                    'recipes': json.loads(record['recipes']) if record.get('recipes') else [],
-                    'recent_recipes': []  # Using recipes column instead
-                }
-            else:
-                logger.info(f"No data found for user {user_email}")
-                return None
-                
+            return self._cached_read('user_data', user_email, self._fetch_user_data,
+                                     self._fetch_user_data_version, self._user_data_version)
         except Exception as e:
             logger.error(f"Error retrieving user data: {e}")
+            return None, None
+    
+    def _fetch_user_data_version(self, user_email: str) -> Optional[Tuple[str, int]]:
+        """
+        Query only the row id and data_version for an email; raises on database errors
+        
+        The users_bump_data_version trigger bumps data_version on every change
+        to items or recipes, so an unchanged (id, version) means cached user
+        data is still current, whichever worker wrote last.
+        """
+        result = self.supabase.table('Users').select('id, data_version').eq('email', user_email).execute()
+        if not result.data:
+            return None
+        return result.data[0]['id'], result.data[0].get('data_version')
+    
+    @staticmethod
+    def _user_data_version(data: Optional[Dict[str, Any]]) -> Optional[Tuple[str, int]]:
+        """The (id, data_version) a _fetch_user_data result was read at"""
+        return (data['id'], data['version']) if data is not None else None
+    
+    def _fetch_user_data(self, user_email: str) -> Optional[Dict[str, Any]]:
+        """Query the Users row for an email; raises on database errors"""
+        result = self.supabase.table('Users').select(USER_DATA_COLUMNS).eq('email', user_email).execute()
+        
+        if result.data:
+            record = result.data[0]
+            return {
+                'id': record['id'],
+                'items': self._decode_json_column(record.get('items'), []),
+                'recipes': self._decode_json_column(record.get('recipes'), []),
+                'version': record.get('data_version')
+            }
+        else:
+            logger.info(f"No data found for user {user_email}")
             return None
 
+    def upsert_pantry_items(self, user_email: str, ingredients: List[Dict]) -> Optional[int]:
+        """
+        Bulk upsert detected ingredients into the normalized pantry_items table
+        
+        All rows go out in one request, keyed by (user_email, canonical_name).
+        
+        Args:
+            user_email: User's email address
+            ingredients: Ingredient dicts from a fridge analysis
+            
+        Returns:
+            Number of pantry rows written, or None on error
+        """
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot update pantry.")
+            return None
+            
+        try:
+            rows = pantry_rows(user_email, ingredients)
+            if rows:
+                self.supabase.table('pantry_items').upsert(rows, on_conflict='user_email,canonical_name').select('id').execute()
+            logger.info(f"Upserted {len(rows)} pantry items for user {user_email}")
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error upserting pantry items: {e}")
+            return None
+    
+    def query_pantry(self, user_email: str, freshness: Optional[List[str]] = None, category: Optional[str] = None,
+                     limit: Optional[int] = None, cursor: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Filter a user's pantry server-side, newest detections first
+        
+        Pages with a keyset on (detected_at, id), served by the
+        idx_pantry_items_* indexes, so deep pages cost the same as the first.
+        
+        Args:
+            user_email: User's email address
+            freshness: Only return items with one of these freshness values
+            category: Only return items in this category
+            limit: Page size
+            cursor: next_cursor from the previous page
+            
+        Returns:
+            {'items': [...], 'next_cursor': ...} or None on error
+        """
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot query pantry.")
+            return None
+        
+        position = decode_cursor(cursor)
+        page_size = clamp_page_size(limit)
+        if position:
+            # The cursor comes from the client and is spliced into the or_() filter text
+            try:
+                position = (datetime.fromisoformat(position[0]).isoformat(), int(position[1]))
+            except ValueError:
+                raise ValueError("Invalid pagination cursor")
+            
+        try:
+            query = self.supabase.table('pantry_items').select(PANTRY_COLUMNS).eq('user_email', user_email)
+            if freshness:
+                query = query.in_('freshness', list(freshness))
+            if category:
+                query = query.eq('category', category.lower())
+            if position:
+                detected_at, row_id = position
+                query = query.or_(f'detected_at.lt."{detected_at}",and(detected_at.eq."{detected_at}",id.lt.{row_id})')
+            result = (
+                query.order('detected_at', desc=True)
+                .order('id', desc=True)
+                .limit(page_size + 1)
+                .execute()
+            )
+            rows = result.data or []
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                next_cursor = encode_cursor(rows[-1]['detected_at'], rows[-1]['id'])
+            return {'items': [to_pantry_item(row) for row in rows], 'next_cursor': next_cursor}
+        except Exception as e:
+            logger.error(f"Error querying pantry: {e}")
+            return None
+    
     def add_recent_recipe(self, user_email: str, recipe: Dict) -> bool:
         """
         Add a recipe to the user's recent selections (keeps most recent 10).
+        
+        Calls the push_recent_recipe database function, which prepends the
+        recipe, drops any older entry with the same identity and trims the
+        list in a single statement, so concurrent pushes cannot lose entries.
 
         Args:
             user_email: User's email address
@@ -139,9 +441,23 @@ class SupabaseManager:
         Returns:
             True if successful, False otherwise
         """
-        # Recent recipes functionality disabled - column not available in current schema
-        logger.info(f"Recent recipe not saved (recent_recipes column not available) for user: {user_email}")
-        return True  # Return True to not break the flow
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot add recent recipe.")
+            return False
+        
+        try:
+            self.supabase.rpc('push_recent_recipe', {
+                'p_email': user_email,
+                'p_key': recipe_identity(recipe),
+                'p_recipe': recipe,
+                'p_capacity': MAX_RECENT_RECIPES
+            }).execute()
+            self.invalidate_user_cache(user_email)
+            logger.info(f"Added recent recipe for user {user_email}")
+            return True
+        except Exception as e:
+            logger.error(f"Error adding recent recipe: {e}")
+            return False
 
     def get_recent_recipes(self, user_email: str) -> Optional[List[Dict]]:
         """
@@ -153,9 +469,153 @@ class SupabaseManager:
         Returns:
             List of recent recipe dicts, or None on error
         """
-        # Recent recipes functionality disabled - column not available in current schema
-        logger.info(f"Recent recipes not available (recent_recipes column not available) for user: {user_email}")
-        return []  # Return empty list to not break the flow
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot retrieve recent recipes.")
+            return None
+        
+        try:
+            result = self.supabase.table('Users').select('recent_recipes').eq('email', user_email).execute()
+            if not result.data:
+                return []
+            entries = self._decode_json_column(result.data[0].get('recent_recipes'), [])
+            # Entries are {"key", "recipe", "used_at"}; tolerate bare recipes from older rows
+            return [entry['recipe'] if isinstance(entry, dict) and 'recipe' in entry else entry for entry in entries]
+        except Exception as e:
+            logger.error(f"Error retrieving recent recipes: {e}")
+            return None
+    
+    def export_user_records(self, after_email: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return one page of complete user records, ordered by email
+        
+        Users are paged with a keyset on the unique email column; the page's
+        pantry rows follow in id-ordered pages of EXPORT_PANTRY_PAGE_SIZE, so
+        PostgREST's row cap never truncates them.
+        
+        Args:
+            after_email: Email of the last record of the previous page, or None
+            limit: Maximum records to return
+            
+        Returns:
+            List of records, or None on error
+        """
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot export data.")
+            return None
+        
+        try:
+            query = self.supabase.table('Users').select(EXPORT_USER_COLUMNS)
+            if after_email:
+                query = query.gt('email', after_email)
+            rows = query.order('email').limit(limit).execute().data or []
+            
+            records = {}
+            for row in rows:
+                records[row['email']] = {
+                    'email': row['email'],
+                    'items': self._decode_json_column(row.get('items'), []),
+                    'recipes': self._decode_json_column(row.get('recipes'), []),
+                    'chat_history': self._decode_json_column(row.get('chat_history'), []),
+                    'recent_recipes': [
+                        entry['recipe'] if isinstance(entry, dict) and 'recipe' in entry else entry
+                        for entry in self._decode_json_column(row.get('recent_recipes'), [])
+                    ],
+                    'pantry': []
+                }
+            
+            last_id = None
+            while records:
+                query = self.supabase.table('pantry_items').select(EXPORT_PANTRY_COLUMNS).in_('user_email', list(records))
+                if last_id is not None:
+                    query = query.gt('id', last_id)
+                pantry = query.order('id').limit(EXPORT_PANTRY_PAGE_SIZE).execute().data or []
+                for item in pantry:
+                    item = dict(item)
+                    item.pop('id')
+                    records[item.pop('user_email')]['pantry'].append(item)
+                if len(pantry) < EXPORT_PANTRY_PAGE_SIZE:
+                    break
+                last_id = pantry[-1]['id']
+            
+            for record in records.values():
+                record['pantry'].sort(key=lambda item: item['detected_at'], reverse=True)
+            return list(records.values())
+        except Exception as e:
+            logger.error(f"Error exporting user records: {e}")
+            return None
+    
+    def list_user_lists(self, after_email: Optional[str], limit: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        Return one page of {'email', 'items', 'recipes'}, ordered by email
+        
+        Args:
+            after_email: Email of the last row of the previous page, or None
+            limit: Maximum rows to return
+            
+        Returns:
+            List of rows, or None on error
+        """
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot list user data.")
+            return None
+        
+        try:
+            query = self.supabase.table('Users').select(LIST_USER_COLUMNS)
+            if after_email:
+                query = query.gt('email', after_email)
+            rows = query.order('email').limit(limit).execute().data or []
+            return [{
+                'email': row['email'],
+                'items': self._decode_json_column(row.get('items'), []),
+                'recipes': self._decode_json_column(row.get('recipes'), [])
+            } for row in rows]
+        except Exception as e:
+            logger.error(f"Error listing user data: {e}")
+            return None
+    
+    def import_user_records(self, records: List[Dict[str, Any]]) -> Optional[int]:
+        """
+        Upsert a batch of exported user records in two requests
+        
+        One bulk upsert of the Users rows (keyed on email) and one of the
+        batch's pantry rows (keyed on user and canonical name).
+        
+        Args:
+            records: Records as produced by export_user_records
+            
+        Returns:
+            Number of records written, or None on error
+        """
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot import data.")
+            return None
+        
+        try:
+            used_at = datetime.now(timezone.utc).isoformat()
+            users, pantry = [], []
+            for record in records:
+                users.append({'email': record['email'], **self.json_codec.encode_columns({
+                    'items': record.get('items') or [],
+                    'recipes': record.get('recipes') or [],
+                    'chat_history': (record.get('chat_history') or [])[-MAX_CHAT_HISTORY:],
+                }), 'recent_recipes': [
+                    {'key': recipe_identity(recipe), 'recipe': recipe, 'used_at': used_at}
+                    for recipe in (record.get('recent_recipes') or [])[:MAX_RECENT_RECIPES]
+                ]})
+                pantry.extend(pantry_rows(record['email'], record.get('pantry') or []))
+            
+            if users:
+                self.supabase.table('Users').upsert(users, on_conflict='email').select('id').execute()
+            if pantry:
+                self.supabase.table('pantry_items').upsert(pantry, on_conflict='user_email,canonical_name').select('id').execute()
+            for record in records:
+                self.invalidate_user_cache(record['email'])
+            
+            logger.info(f"Imported {len(users)} user records ({len(pantry)} pantry items)")
+            return len(users)
+        except Exception as e:
+            logger.error(f"Error importing user records: {e}")
+            return None
     
     def update_user_data(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> bool:
         """
@@ -174,12 +634,13 @@ class SupabaseManager:
             return False
             
         try:
-            data = {
-                'items': json.dumps(items),
-                'recipes': json.dumps(recipes)
-            }
+            data = self.json_codec.encode_columns({
+                'items': items,
+                'recipes': recipes
+            })
             
-            result = self.supabase.table('Users').update(data).eq('email', user_email).execute()
+            result = self.supabase.table('Users').update(data).eq('email', user_email).select('id').execute()
+            self.invalidate_user_cache(user_email)
             
             if result.data:
                 logger.info(f"Successfully updated data for user {user_email}")
@@ -192,10 +653,88 @@ class SupabaseManager:
             logger.error(f"Error updating user data: {e}")
             return False
     
+    def patch_user_data(self, user_email: str, operations: List[Dict], expected_version: Optional[int] = None) -> Optional[int]:
+        """
+        Apply a JSON Patch (RFC 6902) to the user's items and recipes
+        
+        The patch is applied to the current document and written back with a
+        compare-and-swap on `data_version`, so a concurrent writer is never
+        silently overwritten: a conditional patch fails, and an unconditional
+        one is re-applied to the newer document (up to PATCH_ATTEMPTS times).
+        Only the columns the patch touches are sent.
+        
+        Args:
+            user_email: User's email address
+            operations: JSON Patch operations with paths rooted at /items or /recipes
+            expected_version: Version the client last read; None skips the precondition
+            
+        Returns:
+            The new data version, or None if the update failed
+            
+        Raises:
+            JsonPatchError: If the patch is malformed or does not apply
+            VersionConflictError: If the stored version differs from expected_version
+            UserNotFoundError: If the user has no saved data to patch
+        """
+        if not self.enabled:
+            logger.warning("Supabase is not enabled. Cannot patch data.")
+            return None
+        
+        roots = self._patch_roots(operations)
+            
+        try:
+            # Without a precondition a lost compare-and-swap is not the client's
+            # conflict: re-read and apply the patch to the newer document
+            for _ in range(PATCH_ATTEMPTS):
+                result = self.supabase.table('Users').select('items, recipes, data_version').eq('email', user_email).execute()
+                if not result.data:
+                    raise UserNotFoundError(user_email)
+                
+                record = result.data[0]
+                current_version = record.get('data_version') or 0
+                if expected_version is not None and expected_version != current_version:
+                    raise VersionConflictError(current_version)
+                
+                document = {column: self._decode_json_column(record.get(column), []) for column in PATCHABLE_COLUMNS}
+                patched = apply_patch(document, operations)
+                
+                if not roots:
+                    return current_version
+                
+                # The users_bump_data_version trigger increments data_version on write
+                data = self.json_codec.encode_columns({column: patched[column] for column in roots})
+                update_result = (
+                    self.supabase.table('Users')
+                    .update(data)
+                    .eq('email', user_email)
+                    .eq('data_version', current_version)
+                    .select('data_version')
+                    .execute()
+                )
+                self.invalidate_user_cache(user_email)
+                
+                if update_result.data:
+                    new_version = update_result.data[0].get('data_version', current_version + 1)
+                    logger.info(f"Patched {', '.join(roots)} for user {user_email} (version {new_version})")
+                    return new_version
+                if expected_version is not None:
+                    raise VersionConflictError(None)
+            
+            logger.error(f"Gave up patching data for user {user_email}: {PATCH_ATTEMPTS} concurrent writes won")
+            return None
+        
+        except (JsonPatchError, VersionConflictError, UserNotFoundError):
+            raise
+        except Exception as e:
+            logger.error(f"Error patching user data: {e}")
+            return None
+    
     def send_email(self, to_email: str, subject: str, body: str, is_html: bool = False) -> bool:
         """
         Send email to user with their grocery list and recipes
         
+        Delivers synchronously over a pooled SMTP session (see email_service).
+        
         Args:
             to_email: Recipient's email address
             subject: Email subject
@@ -205,32 +744,7 @@ class SupabaseManager:
         Returns:
             True if email sent successfully, False otherwise
         """
-        if not all([self.smtp_user, self.smtp_password]):
-            logger.error("SMTP credentials not configured")
-            return False
-        
-        try:
-            msg = MIMEMultipart('alternative')
-            msg['From'] = self.smtp_user
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            if is_html:
-                msg.attach(MIMEText(body, 'html'))
-            else:
-                msg.attach(MIMEText(body, 'plain'))
-            
-            with smtplib.SMTP(self.smtp_host, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_user, self.smtp_password)
-                server.send_message(msg)
-            
-            logger.info(f"Email sent successfully to {to_email}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Error sending email: {e}")
-            return False
+        return get_email_service().send(to_email, subject, body, is_html)
     
     def send_grocery_list_email(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> bool:
         """
@@ -251,100 +765,25 @@ class SupabaseManager:
         
         return self.send_email(user_email, subject, html_body, is_html=True)
     
-    def _create_html_email_body(self, items: List[Dict], recipes: List[Dict]) -> str:
-        """Create HTML formatted email body"""
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 20px; }
-                .header { background-color: #3b82f6; color: white; padding: 20px; border-radius: 8px; }
-                .section { margin: 20px 0; }
-                .item { background-color: #f8fafc; padding: 10px; margin: 5px 0; border-radius: 4px; border-left: 4px solid #3b82f6; }
-                .recipe { background-color: #fef3c7; padding: 15px; margin: 10px 0; border-radius: 8px; }
-                .priority-high { border-left-color: #ef4444; }
-                .priority-medium { border-left-color: #f59e0b; }
-                .priority-low { border-left-color: #10b981; }
-                .checked { text-decoration: line-through; opacity: 0.6; }
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>🛒 Your ChopChop Grocery List & Recipes</h1>
-                <p>Generated by your Kitchen Assistant</p>
-            </div>
-        """
-        
-        # Add grocery list section
-        if items:
-            html += """
-            <div class="section">
-                <h2>🛒 Grocery List</h2>
-            """
-            for item in items:
-                priority_class = f"priority-{item.get('priority', 'medium')}"
-                checked_class = "checked" if item.get('checked', False) else ""
-                html += f"""
-                <div class="item {priority_class} {checked_class}">
-                    <strong>{item.get('item', 'Unknown Item')}</strong>
-                    <span style="float: right; background-color: #e5e7eb; padding: 2px 8px; border-radius: 12px; font-size: 12px;">
-                        {item.get('priority', 'medium').upper()}
-                    </span>
-                    <br>
-                    <small>Category: {item.get('category', 'general')} | Needed for: {item.get('needed_for', 'General use')}</small>
-                </div>
-                """
-            html += "</div>"
-        
-        # Add recipes section
-        if recipes:
-            html += """
-            <div class="section">
-                <h2>👨‍🍳 Recipes</h2>
-            """
-            for recipe in recipes:
-                html += f"""
-                <div class="recipe">
-                    <h3>{recipe.get('name', 'Untitled Recipe')}</h3>
-                    <p><strong>Description:</strong> {recipe.get('description', 'No description')}</p>
-                    <p><strong>Cooking Time:</strong> {recipe.get('cooking_time', 'Not specified')} | 
-                       <strong>Difficulty:</strong> {recipe.get('difficulty', 'Not specified')} | 
-                       <strong>Servings:</strong> {recipe.get('servings', 'Not specified')}</p>
-                """
-                
-                # Add ingredients
-                if recipe.get('ingredients_needed'):
-                    html += "<p><strong>Ingredients:</strong></p><ul>"
-                    for ingredient in recipe['ingredients_needed']:
-                        available = "✅" if ingredient.get('available', False) else "❌"
-                        html += f"<li>{available} {ingredient.get('amount', '')} {ingredient.get('name', '')}</li>"
-                    html += "</ul>"
-                
-                # Add instructions
-                if recipe.get('instructions'):
-                    html += "<p><strong>Instructions:</strong></p><ol>"
-                    for instruction in recipe['instructions']:
-                        html += f"<li>{instruction}</li>"
-                    html += "</ol>"
-                
-                # Add tips
-                if recipe.get('tips'):
-                    html += f"<p><strong>Tips:</strong> {recipe['tips']}</p>"
-                
-                html += "</div>"
-            html += "</div>"
-        
-        html += """
-            <div style="margin-top: 30px; padding: 15px; background-color: #f3f4f6; border-radius: 8px; text-align: center;">
-                <p>Generated by <strong>ChopChop</strong> - Your Kitchen Assistant</p>
-                <p>Visit <a href="http://localhost:3000">ChopChop App</a> to manage your lists and discover more recipes!</p>
-            </div>
-        </body>
-        </html>
+    def queue_grocery_list_email(self, user_email: str, items: List[Dict], recipes: List[Dict]) -> Optional[str]:
         """
+        Queue the grocery list email for background delivery
         
-        return html
+        Args:
+            user_email: User's email address
+            items: List of grocery items
+            recipes: List of recipes
+            
+        Returns:
+            Message id to poll with get_email_service().get_status, or None if it could not be queued
+        """
+        subject = "Your ChopChop Grocery List & Recipes"
+        html_body = self._create_html_email_body(items, recipes)
+        return get_email_service().enqueue(user_email, subject, html_body, is_html=True)
+    
+    def _create_html_email_body(self, items: List[Dict], recipes: List[Dict]) -> str:
+        """Create HTML formatted email body (see email_templates)"""
+        return render_grocery_email(items, recipes)
     
     def save_chat_message(self, user_email: str, message: str, sender: str, image_base64: str = None, image_format: str = None) -> bool:
         """
@@ -366,50 +805,36 @@ class SupabaseManager:
             
         try:
             # First get existing user data
-            result = self.supabase.table('Users').select('*').eq('email', user_email).execute()
+            result = self.supabase.table('Users').select(CHAT_HISTORY_COLUMNS).eq('email', user_email).execute()
             
             if result.data:
                 # Update existing user with chat message
                 user_record = result.data[0]
-                chat_history = json.loads(user_record.get('chat_history', '[]'))
+                chat_history = self._decode_json_column(user_record.get('chat_history'), [])
                 
                 # Add new message to chat history
-                chat_history.append({
-                    'message': message,
-                    'sender': sender,
-                    'timestamp': 'now()',
-                    'image_data': image_base64,
-                    'image_format': image_format
-                })
+                chat_history.append(self._new_chat_message(message, sender, image_base64, image_format))
                 
                 # Keep only last 100 messages to prevent database bloat
-                chat_history = chat_history[-100:]
+                chat_history = chat_history[-MAX_CHAT_HISTORY:]
                 
-                update_data = {
-                    'chat_history': json.dumps(chat_history)
-                }
+                update_data = self.json_codec.encode_columns({
+                    'chat_history': chat_history
+                })
                 
-                self.supabase.table('Users').update(update_data).eq('email', user_email).execute()
+                self.supabase.table('Users').update(update_data).eq('email', user_email).select('id').execute()
             else:
                 # Create new user record with chat message
-                chat_history = [{
-                    'message': message,
-                    'sender': sender,
-                    'timestamp': 'now()',
-                    'image_data': image_base64,
-                    'image_format': image_format
-                }]
+                chat_history = [self._new_chat_message(message, sender, image_base64, image_format)]
                 
-                new_user_data = {
-                    'email': user_email,
-                    'items': '[]',
-                    'recipes': '[]',
-                    'grocery_list': '[]',
-                    'chat_history': json.dumps(chat_history)
-                }
-                
-                self.supabase.table('Users').insert(new_user_data).execute()
+                self._upsert_user(user_email, self.json_codec.encode_columns({
+                    'items': [],
+                    'recipes': [],
+                    'grocery_list': [],
+                    'chat_history': chat_history
+                }))
             
+            self.invalidate_user_cache(user_email)
             logger.info(f"Saved chat message for user {user_email}")
             return True
                 
@@ -417,36 +842,63 @@ class SupabaseManager:
             logger.error(f"Error saving chat message: {e}")
             return False
     
-    def get_chat_history(self, user_email: str) -> Optional[List[Dict]]:
+    def get_chat_history_with_etag(self, user_email: str, limit: Optional[int] = None) -> Tuple[Optional[List[Dict]], Optional[str]]:
         """
-        Get user's chat history
+        Get user's chat history along with its content ETag
         
         Args:
             user_email: User's email address
+            limit: Only return the most recent N messages (optional)
             
         Returns:
-            List of chat messages or None if error
+            Tuple of (list of chat messages or None if error, etag or None if error)
         """
         if not self.enabled:
             logger.warning("Supabase is not enabled. Cannot retrieve chat history.")
-            return None
+            return None, None
             
         try:
-            result = self.supabase.table('Users').select('chat_history').eq('email', user_email).execute()
-            
-            if result.data and len(result.data) > 0:
-                chat_history_raw = result.data[0].get('chat_history')
-                if chat_history_raw:
-                    chat_history = json.loads(chat_history_raw)
-                    return chat_history
-                else:
-                    return []
-            else:
-                return []
-                
+            # JSON paths cannot see inside an encoded column, so encoded
+            # histories are sliced after a full read
+            if limit is not None and 0 < limit <= MAX_CHAT_HISTORY_PATH_LIMIT and not self.json_codec.enabled:
+                return self._cached_read(f'chat_history:last{limit}', user_email,
+                                         lambda email: self._fetch_recent_chat_messages(email, limit))
+            if limit is not None and limit > 0:
+                return self._cached_read(f'chat_history:last{limit}', user_email,
+                                         lambda email: self._fetch_chat_history(email)[-limit:])
+            return self._cached_read('chat_history', user_email, self._fetch_chat_history)
         except Exception as e:
             logger.error(f"Error retrieving chat history: {e}")
-            return None
+            return None, None
+    
+    def _fetch_chat_history(self, user_email: str) -> List[Dict]:
+        """Query the chat history column for an email; raises on database errors"""
+        result = self.supabase.table('Users').select(CHAT_HISTORY_COLUMNS).eq('email', user_email).execute()
+        
+        if result.data and len(result.data) > 0:
+            return self._decode_json_column(result.data[0].get('chat_history'), [])
+        else:
+            return []
+    
+    def _fetch_recent_chat_messages(self, user_email: str, limit: int) -> List[Dict]:
+        """
+        Query only the last `limit` chat messages for an email
+        
+        Each message is extracted server-side with a negative-index JSON path
+        (chat_history->-1, ->-2, ...), so older messages never leave the database.
+        Paths yield NULL for a history stored encoded, so a missing last
+        message falls back to a full read.
+        """
+        columns = ', '.join(f'm{i}:chat_history->-{i}' for i in range(limit, 0, -1))
+        result = self.supabase.table('Users').select(columns).eq('email', user_email).execute()
+        
+        if not result.data:
+            return []
+        record = result.data[0]
+        if record.get('m1') is None:
+            return self._fetch_chat_history(user_email)[-limit:]
+        messages = [record.get(f'm{i}') for i in range(limit, 0, -1)]
+        return [message for message in messages if message is not None]
 
 # Global instance
 supabase_manager = SupabaseManager()
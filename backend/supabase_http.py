@@ -0,0 +1,216 @@
+"""
+Pooled HTTP layer for the Supabase client
+
+supabase-py builds its own httpx client with a 120 s timeout and default
+pool limits. This module builds one shared, thread-safe httpx client per
+process instead: pool limits sized to the gunicorn thread count, HTTP/2
+multiplexing when `h2` is installed, keepalive, bounded timeouts and pool
+utilization stats.
+
+httpx is imported when the first client is built rather than with this
+module, so it stays off the cold-start path of workers that never reach
+Supabase.
+"""
+import os
+import logging
+import threading
+import contextvars
+import importlib.util
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, TYPE_CHECKING
+
+from coldstart import lazy_import
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# Presence of h2 enables HTTP/2 in httpx; checked without importing it
+HTTP2_AVAILABLE = importlib.util.find_spec('h2') is not None
+
+# Per-call timeout override, set with call_timeout()
+_call_timeout: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('supabase_call_timeout', default=None)
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class HttpPoolSettings:
+    """HTTP pool configuration, read from environment variables"""
+
+    def __init__(self):
+        # Every gunicorn thread may hold one connection; default to that.
+        threads = _env_int('GUNICORN_THREADS', 8)
+        self.max_connections = _env_int('SUPABASE_HTTP_MAX_CONNECTIONS', max(threads, 4))
+        self.max_keepalive_connections = _env_int('SUPABASE_HTTP_MAX_KEEPALIVE', self.max_connections)
+        self.keepalive_expiry = _env_float('SUPABASE_HTTP_KEEPALIVE_EXPIRY', 30.0)
+        self.http2 = os.getenv('SUPABASE_HTTP2', 'true').lower() == 'true' and HTTP2_AVAILABLE
+        self.connect_timeout = _env_float('SUPABASE_HTTP_CONNECT_TIMEOUT', 5.0)
+        self.read_timeout = _env_float('SUPABASE_HTTP_READ_TIMEOUT', 15.0)
+        self.write_timeout = _env_float('SUPABASE_HTTP_WRITE_TIMEOUT', 15.0)
+        self.pool_timeout = _env_float('SUPABASE_HTTP_POOL_TIMEOUT', 5.0)
+        self.retries = _env_int('SUPABASE_HTTP_CONNECT_RETRIES', 1)
+
+    def limits(self) -> 'httpx.Limits':
+        return lazy_import('httpx').Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self) -> 'httpx.Timeout':
+        return lazy_import('httpx').Timeout(
+            connect=self.connect_timeout,
+            read=self.read_timeout,
+            write=self.write_timeout,
+            pool=self.pool_timeout,
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'max_connections': self.max_connections,
+            'max_keepalive_connections': self.max_keepalive_connections,
+            'keepalive_expiry': self.keepalive_expiry,
+            'http2': self.http2,
+            'timeouts': {
+                'connect': self.connect_timeout,
+                'read': self.read_timeout,
+                'write': self.write_timeout,
+                'pool': self.pool_timeout,
+            },
+        }
+
+
+@contextmanager
+def call_timeout(seconds: float):
+    """
+    Override the read/write timeout for Supabase calls made inside the block
+
+    Example:
+        with call_timeout(2.0):
+            supabase_manager.get_user_data(email)
+    """
+    token = _call_timeout.set(seconds)
+    try:
+        yield
+    finally:
+        _call_timeout.reset(token)
+
+
+def negotiated_http2(connection: Any) -> bool:
+    """
+    True if a pooled httpcore connection negotiated HTTP/2
+
+    info() is httpcore's introspection API: "<origin>, <protocol>, <state>,
+    ..." once connected, "CONNECTING" before.
+    """
+    return 'HTTP/2' in connection.info().split(', ')
+
+
+_transport_class = None
+_transport_class_lock = threading.Lock()
+
+
+def instrumented_transport_class():
+    """InstrumentedTransport, defined on first use because it subclasses an httpx class"""
+    global _transport_class
+    with _transport_class_lock:
+        if _transport_class is not None:
+            return _transport_class
+        httpx = lazy_import('httpx')
+
+        class InstrumentedTransport(httpx.HTTPTransport):
+            """HTTP transport that applies per-call timeouts and tracks pool utilization"""
+
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+                self._stats_lock = threading.Lock()
+                self.in_flight = 0
+                self.peak_in_flight = 0
+                self.requests_total = 0
+                self.errors_total = 0
+                self.responses_by_version: Dict[str, int] = {}
+
+            def handle_request(self, request: httpx.Request) -> httpx.Response:
+                override = _call_timeout.get()
+                if override is not None:
+                    timeout = dict(request.extensions.get('timeout', {}))
+                    timeout.update({'read': override, 'write': override})
+                    request.extensions['timeout'] = timeout
+
+                with self._stats_lock:
+                    self.in_flight += 1
+                    self.requests_total += 1
+                    self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                try:
+                    response = super().handle_request(request)
+                except Exception:
+                    with self._stats_lock:
+                        self.errors_total += 1
+                    raise
+                finally:
+                    with self._stats_lock:
+                        self.in_flight -= 1
+                # The protocol the server actually agreed to, e.g. b"HTTP/2"
+                version = response.extensions.get('http_version', b'HTTP/1.1').decode('ascii')
+                with self._stats_lock:
+                    self.responses_by_version[version] = self.responses_by_version.get(version, 0) + 1
+                return response
+
+            def stats(self) -> Dict[str, Any]:
+                connections = list(self._pool.connections)
+                with self._stats_lock:
+                    return {
+                        'connections_open': len(connections),
+                        'connections_idle': sum(1 for c in connections if c.is_idle()),
+                        'connections_http2': sum(1 for c in connections if negotiated_http2(c)),
+                        'in_flight': self.in_flight,
+                        'peak_in_flight': self.peak_in_flight,
+                        'requests_total': self.requests_total,
+                        'errors_total': self.errors_total,
+                        'responses_by_version': dict(self.responses_by_version),
+                    }
+
+        _transport_class = InstrumentedTransport
+        return _transport_class
+
+
+def create_http_client(settings: Optional[HttpPoolSettings] = None) -> 'httpx.Client':
+    """
+    Build a pooled httpx client for supabase-py
+
+    httpx clients are safe to share across threads but not across fork(),
+    so each process (gunicorn worker) must build its own.
+    """
+    settings = settings or HttpPoolSettings()
+    transport = instrumented_transport_class()(
+        http2=settings.http2,
+        limits=settings.limits(),
+        retries=settings.retries,
+    )
+    client = lazy_import('httpx').Client(
+        transport=transport,
+        timeout=settings.timeout(),
+        follow_redirects=True,
+    )
+    logger.info(
+        f"Supabase HTTP pool ready (max_connections={settings.max_connections}, "
+        f"http2={settings.http2}, keepalive={settings.keepalive_expiry}s)"
+    )
+    return client
+
+
+def get_pool_stats(client: Optional['httpx.Client']) -> Dict[str, Any]:
+    """Return utilization stats for a client built by create_http_client"""
+    transport = getattr(client, '_transport', None)
+    if _transport_class is None or not isinstance(transport, _transport_class):
+        return {}
+    return transport.stats()
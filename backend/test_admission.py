@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Tests for per-route-class admission control and CoDel-style load shedding
+"""
+
+import threading
+import time
+
+from flask import Flask
+
+from admission import AdmissionSettings, ClassLimiter, ClassLimits, RequestShed, configure_admission
+
+def acquire_in_thread(limiter, outcomes):
+    def run():
+        try:
+            outcomes.append(("admitted", limiter.acquire()))
+        except RequestShed as e:
+            outcomes.append(("shed", e))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+def wait_for_queue(limiter, length):
+    while limiter.get_stats()["queued"] != length:
+        time.sleep(0.001)
+
+def test_slots_are_handed_on_in_arrival_order():
+    limiter = ClassLimiter("model", ClassLimits(concurrency=2, queue_size=2, target=1.0, interval=5.0))
+    assert limiter.acquire() == 0.0 and limiter.acquire() == 0.0
+    outcomes = []
+    first = acquire_in_thread(limiter, outcomes)
+    wait_for_queue(limiter, 1)
+    second = acquire_in_thread(limiter, outcomes)
+    wait_for_queue(limiter, 2)
+    # The queue is full: the next request is shed at once
+    started = time.perf_counter()
+    try:
+        limiter.acquire()
+        assert False, "expected the request to be shed"
+    except RequestShed as e:
+        assert e.reason == "queue is full" and e.retry_after == 1
+    assert time.perf_counter() - started < 0.1
+    limiter.release()
+    first.join(1)
+    assert outcomes[0][0] == "admitted" and outcomes[0][1] > 0 and len(outcomes) == 1
+    limiter.release()
+    second.join(1)
+    stats = limiter.get_stats()
+    assert stats["running"] == 2 and stats["queued"] == 0
+    assert stats["admitted"] == 4 and stats["shed_queue_full"] == 1
+
+def test_standing_queue_sheds_after_the_target():
+    limiter = ClassLimiter("model", ClassLimits(concurrency=1, queue_size=4, target=0.05, interval=0.3))
+    limiter.acquire()
+    outcomes = []
+    # The slot was free a moment ago, so the first waiter may wait the whole interval
+    patient = acquire_in_thread(limiter, outcomes)
+    patient.join(1)
+    assert outcomes[0][0] == "shed" and outcomes[0][1].reason == "waited too long"
+    assert limiter.get_stats()["standing_queue"]
+    # Every slot has now been busy for an interval: later waiters only get the target
+    started = time.perf_counter()
+    try:
+        limiter.acquire()
+        assert False, "expected the request to be shed"
+    except RequestShed as e:
+        assert e.reason == "waited too long"
+    assert time.perf_counter() - started < 0.2
+    # Once the slot frees up, requests start without waiting again
+    limiter.release()
+    assert limiter.acquire() == 0.0 and not limiter.get_stats()["standing_queue"]
+    assert limiter.get_stats()["shed_queue_delay"] == 2
+
+def test_retry_after_follows_observed_queue_wait():
+    limiter = ClassLimiter("data", ClassLimits(concurrency=1, queue_size=0, target=0.05, interval=0.5),
+                           max_retry_after=4)
+    limiter.acquire()
+
+    def retry_after():
+        try:
+            limiter.acquire()
+        except RequestShed as e:
+            return e.retry_after
+        raise AssertionError("expected the request to be shed")
+
+    # At least a second, more when requests have been waiting longer, never past the cap
+    assert retry_after() == 1
+    limiter._wait_seconds = 2.4
+    assert retry_after() == 3
+    limiter._wait_seconds = 60.0
+    assert retry_after() == 4
+
+def test_requests_are_not_shed_before_a_service_time():
+    limiter = ClassLimiter("model", ClassLimits(concurrency=1, queue_size=1, target=0.01, interval=0.02))
+    limiter.acquire()
+    limiter.release(0.2)
+    limiter.acquire()
+    stats = limiter.get_stats()
+    assert stats["service_ms"] == 200.0 and stats["target_ms"] == 200.0 and stats["interval_ms"] == 400.0
+    # The slot has been busy longer than the configured interval, but not than the observed one
+    outcomes = []
+    waiter = acquire_in_thread(limiter, outcomes)
+    wait_for_queue(limiter, 1)
+    time.sleep(0.1)
+    limiter.release(0.15)
+    waiter.join(1)
+    assert outcomes[0][0] == "admitted" and outcomes[0][1] >= 0.1
+    # The moving average follows later requests
+    assert limiter.get_stats()["service_ms"] == 195.0
+
+def make_app():
+    settings = AdmissionSettings()
+    settings.classes = {"model": ClassLimits(1, 0, 0.05, 0.5), "data": ClassLimits(4, 4, 0.05, 0.5)}
+    app = Flask(__name__)
+    release = threading.Event()
+
+    @app.route("/chat", methods=["POST"])
+    def chat():
+        release.wait(5)
+        return {"ok": True}
+
+    @app.route("/get-data", methods=["POST"])
+    def get_data():
+        return {"ok": True}
+
+    @app.route("/health")
+    def health_check():
+        return {"ok": True}
+
+    admission = configure_admission(app, route_classes={"chat": "model"}, exempt=("health_check",),
+                                    settings=settings)
+    return app, admission, release
+
+def test_model_overload_is_shed_while_data_routes_stay_fast():
+    app, admission, release = make_app()
+    statuses = []
+    busy = threading.Thread(target=lambda: statuses.append(app.test_client().post("/chat").status_code))
+    busy.start()
+    while admission.limiters["model"].get_stats()["running"] != 1:
+        time.sleep(0.001)
+    client = app.test_client()
+    shed = client.post("/chat")
+    assert shed.status_code == 503 and shed.headers["Retry-After"] == "1"
+    assert shed.json["route_class"] == "model"
+    started = time.perf_counter()
+    for _ in range(20):
+        assert client.post("/get-data").status_code == 200
+    assert time.perf_counter() - started < 1.0
+    assert client.get("/health").status_code == 200
+    release.set()
+    busy.join(5)
+    assert statuses == [200]
+    # Slots are returned when each request ends
+    stats = admission.get_stats()["classes"]
+    assert stats["model"]["running"] == 0 and stats["data"]["running"] == 0
+    assert stats["model"]["shed_queue_full"] == 1 and stats["data"]["admitted"] == 20
+
+def test_nova_backend_reports_admission():
+    import nova_backend
+    client = nova_backend.app.test_client()
+    health = client.get("/health").json
+    assert set(health["admission"]["classes"]) == {"model", "data"}
+    assert nova_backend.admission.route_class("chat") == "model"
+    assert nova_backend.admission.route_class("verify_session") == "data"
+    assert nova_backend.admission.route_class("stream_fridge_job") is None
+    # /chat only queues in the model scheduler, with room for two calls waiting there
+    model = nova_backend.admission.settings.classes["model"]
+    assert model.concurrency == nova_backend.model_scheduler.settings.concurrency + 2 and model.queue_size == 0
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
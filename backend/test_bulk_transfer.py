@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the streaming NDJSON export and checkpointed import
+"""
+
+import io
+import json
+import os
+import tempfile
+
+os.environ['SUPABASE_READ_CACHE_TTL'] = '0'
+
+from bulk_transfer import iter_user_records, export_ndjson, import_ndjson, BulkTransferError
+from fake_supabase import FakeSupabaseClient
+from sqlite_storage import SQLiteStorage
+from supabase_config import SupabaseManager
+
+USERS = 25
+
+def make_sqlite():
+    return SQLiteStorage(os.path.join(tempfile.mkdtemp(), "bulk.sqlite3"))
+
+def fill(storage):
+    for i in range(USERS):
+        email = f"user{i:02d}@example.com"
+        storage.save_user_data(email, [{"item": f"Milk {i}"}], [{"name": f"Recipe {i}"}])
+        storage.save_chat_message(email, f"hello {i}", "user")
+        storage.save_chat_message(email, f"hi {i}", "nova")
+        storage.upsert_pantry_items(email, [{"name": "Eggs", "freshness": "good"}, {"name": "Kale"}])
+        storage.add_recent_recipe(email, {"name": f"Recipe {i}"})
+
+def comparable(line):
+    record = json.loads(line)
+    record["pantry"].sort(key=lambda item: item["name"])
+    return record
+
+def export_lines(storage, batch_size=7):
+    out = io.StringIO()
+    assert export_ndjson(storage, out, batch_size) == USERS
+    return out.getvalue().splitlines(keepends=True)
+
+def test_export_pages_cover_every_user_once():
+    storage = make_sqlite()
+    fill(storage)
+    emails = [record["email"] for record in iter_user_records(storage, batch_size=4)]
+    assert emails == sorted(set(emails)) and len(emails) == USERS
+    record = json.loads(export_lines(storage)[3])
+    assert record["items"] == [{"item": "Milk 3"}]
+    assert [m["message"] for m in record["chat_history"]] == ["hello 3", "hi 3"]
+    assert sorted(item["name"] for item in record["pantry"]) == ["Eggs", "Kale"]
+    assert record["recent_recipes"] == [{"name": "Recipe 3"}]
+
+def test_round_trip_between_backends():
+    source = make_sqlite()
+    fill(source)
+    lines = export_lines(source)
+    client = FakeSupabaseClient()
+    target = SupabaseManager(client=client)
+    result = import_ndjson(target, lines, batch_size=4, workers=3)
+    assert result["records"] == USERS
+    assert len(client.tables["Users"]) == USERS and len(client.tables["pantry_items"]) == 2 * USERS
+    # Export from the imported copy matches the original
+    assert [comparable(line) for line in export_lines(target)] == [comparable(line) for line in lines]
+
+def test_import_resumes_from_checkpoint():
+    source = make_sqlite()
+    fill(source)
+    lines = export_lines(source)
+    checkpoint = os.path.join(tempfile.mkdtemp(), "import.checkpoint")
+    target = make_sqlite()
+    broken = lines[:10] + ["{not json\n"] + lines[10:]
+    try:
+        import_ndjson(target, broken, batch_size=3, workers=2, checkpoint_path=checkpoint)
+    except BulkTransferError:
+        pass
+    else:
+        raise AssertionError("Expected the malformed line to stop the import")
+    with open(checkpoint) as f:
+        done = int(f.read())
+    assert 0 < done <= 10
+    # Fix the line and resume: only lines after the checkpoint are read
+    fixed = lines[:10] + ["\n"] + lines[10:]
+    result = import_ndjson(target, fixed, batch_size=3, workers=2, checkpoint_path=checkpoint)
+    assert result["skipped_lines"] == done
+    assert result["records"] == len(fixed) - 1 - done
+    assert len(list(iter_user_records(target))) == USERS
+    assert target.get_chat_history("user24@example.com")[-1]["message"] == "hi 24"
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Tests for lazy imports, lazy clients and the cold-start profile
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import coldstart
+from aws_config import aws_config, setup_aws
+from supabase_config import SupabaseManager
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       200 |        200 |   encodings
+import time:       100 |        300 | site
+import time:      4000 |       4000 |       werkzeug.routing
+import time:      1000 |       5000 |     werkzeug
+import time:      2000 |       7000 |   flask
+import time:       500 |        500 |   aws_config
+import time:      1500 |       9000 | nova_backend
+"""
+
+def test_importing_the_app_leaves_heavy_modules_lazy():
+    directory = tempfile.mkdtemp()
+    env = dict(os.environ, STORAGE_BACKEND="sqlite", SESSION_STORE="memory",
+               SQLITE_PATH=os.path.join(directory, "app.sqlite3"))
+    script = ("import json, sys, nova_backend; "
+              "print(json.dumps(sorted({m.split('.')[0] for m in sys.modules})))")
+    completed = subprocess.run([sys.executable, "-c", script], cwd=BACKEND_DIR, env=env,
+                               capture_output=True, text=True, check=True)
+    loaded = set(json.loads(completed.stdout.strip().splitlines()[-1]))
+    assert "flask" in loaded
+    assert not loaded & set(coldstart.LAZY_MODULES)
+
+def test_importing_the_app_opens_no_session_or_job_files():
+    working_directory, data_directory = tempfile.mkdtemp(), tempfile.mkdtemp()
+    env = {key: value for key, value in os.environ.items()
+           if key not in ("SESSION_STORE", "SESSION_SQLITE_PATH", "FRIDGE_JOBS_SQLITE_PATH")}
+    env.update(STORAGE_BACKEND="sqlite", SQLITE_PATH=os.path.join(data_directory, "app.sqlite3"),
+               PYTHONPATH=BACKEND_DIR)
+    subprocess.run([sys.executable, "-c", "import nova_backend"], cwd=working_directory, env=env,
+                   capture_output=True, check=True)
+    # sessions.sqlite3 and fridge_jobs.sqlite3 are created by the first request, not the import
+    assert os.listdir(working_directory) == []
+
+def test_importtime_is_attributed_to_packages_under_the_root():
+    total, packages = coldstart.parse_importtime(IMPORTTIME, "nova_backend")
+    assert total == 9.0
+    # Interpreter start-up imports (site) are not part of the app's import
+    assert dict(packages) == {"werkzeug": 5.0, "flask": 2.0, "nova_backend": 1.5, "aws_config": 0.5}
+    assert sum(ms for _, ms in packages) == total
+
+def test_lazy_import_records_the_first_import_only():
+    sys.modules.pop("tabnanny", None)
+    module = coldstart.lazy_import("tabnanny")
+    assert module is sys.modules["tabnanny"]
+    first = coldstart.get_startup_report()["first_use_ms"]["import tabnanny"]
+    assert coldstart.lazy_import("tabnanny") is module
+    assert coldstart.get_startup_report()["first_use_ms"]["import tabnanny"] == first
+
+def test_supabase_client_is_built_on_first_use():
+    os.environ.update(SUPABASE_URL="https://example.supabase.co", SUPABASE_SERVICE_ROLE_KEY="key")
+    try:
+        manager = SupabaseManager()
+    finally:
+        del os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"]
+    built = []
+    manager._create_client = lambda: built.append(object()) or built[-1]
+    assert manager.enabled and manager._client is None
+    # A forked worker has nothing to rebuild until the client exists
+    manager.reinitialize_client()
+    assert not built
+    assert manager.supabase is built[0] and manager.supabase is built[0]
+    assert len(built) == 1
+
+def test_failed_client_build_disables_supabase():
+    os.environ.update(SUPABASE_URL="https://example.supabase.co", SUPABASE_SERVICE_ROLE_KEY="key")
+    try:
+        manager = SupabaseManager()
+    finally:
+        del os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_ROLE_KEY"]
+
+    def fail():
+        raise ValueError("bad url")
+
+    manager._create_client = fail
+    assert manager.supabase is None and not manager.enabled
+
+def test_setup_aws_checks_credentials_and_region_without_building_the_client():
+    saved = {key: os.environ.get(key) for key in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "BEDROCK_EAGER_INIT")}
+    region = aws_config.region
+    os.environ.pop("BEDROCK_EAGER_INIT", None)
+    try:
+        os.environ.pop("AWS_ACCESS_KEY_ID", None)
+        assert setup_aws() is False
+        os.environ.update(AWS_ACCESS_KEY_ID="AKIDEXAMPLE", AWS_SECRET_ACCESS_KEY="secret")
+        assert setup_aws() is True
+        aws_config.region = "nowhere"
+        assert setup_aws() is False
+        assert aws_config.bedrock_client is None
+    finally:
+        aws_config.region = region
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
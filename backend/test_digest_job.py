@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Tests for the weekly digest job and the token-bucket rate limits
+
+Runs against SQLite storage and the local SMTP stand-in from fake_smtp.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from digest_job import DigestJob, DigestSettings
+from fake_smtp import FakeSmtpServer
+from rate_limit import TokenBucket, KeyedTokenBuckets
+from sqlite_storage import SQLiteStorage
+from test_email_service import make_service
+
+USERS = 12
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+def make_job(server, **overrides):
+    directory = tempfile.mkdtemp()
+    storage = SQLiteStorage(os.path.join(directory, "digest.sqlite3"))
+    for i in range(USERS):
+        storage.save_user_data(f"user{i:02d}@{('a.com', 'b.com', 'c.com')[i % 3]}.test",
+                               [{"item": f"Milk {i}"}, {"item": "Bread", "checked": True}], [{"name": "Soup"}])
+    storage.save_user_data("empty@a.com.test", [{"item": "Done", "checked": True}], [])
+    settings = DigestSettings()
+    settings.batch_size, settings.senders = 5, 2
+    settings.rate = settings.domain_rate = 0
+    settings.retry_backoff = 0.01
+    settings.checkpoint_path = os.path.join(directory, "digest.checkpoint.json")
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    return DigestJob(storage, make_service(server), settings, run_id="2026-W42")
+
+def recipients(server):
+    return [message["to"][0] for message in server.messages]
+
+def test_every_user_gets_one_digest_over_pooled_sessions():
+    server = FakeSmtpServer().start()
+    try:
+        job = make_job(server)
+        result = job.run()
+        assert result["sent"] == USERS and result["skipped"] == 1 and result["completed"]
+        assert sorted(recipients(server)) == sorted(set(recipients(server)))
+        assert server.sessions <= 2
+        body = server.messages[0]["message"].get_payload()[0].get_payload(decode=True).decode()
+        assert "Milk" in body and "Bread" not in body and "Soup" in body
+        assert result["emails_per_second"] > 0
+    finally:
+        server.stop()
+
+def test_interrupted_run_resumes_without_resending():
+    server = FakeSmtpServer().start()
+    try:
+        job = make_job(server)
+        # empty@ sorts first and is skipped, so the first five users include four sends
+        first = job.run(limit=5)
+        assert first["sent"] == 4 and first["skipped"] == 1 and not first["completed"]
+        with open(job.settings.checkpoint_path) as f:
+            assert json.load(f)["after_email"] == "user03@a.com.test"
+        second = job.run()
+        assert second["resumed_after"] == "user03@a.com.test" and second["sent"] == USERS - 4
+        assert len(recipients(server)) == len(set(recipients(server))) == USERS
+        # A finished run is not repeated; the next week's run starts over
+        assert job.run()["sent"] == 0
+        job.run_id = "2026-W43"
+        assert job.run()["sent"] == USERS
+    finally:
+        server.stop()
+
+def test_finished_digests_past_the_watermark_are_skipped_on_resume():
+    server = FakeSmtpServer().start()
+    try:
+        job = make_job(server)
+        # As if user01 finished while user00 was still sending when the job died
+        with open(job.settings.checkpoint_path, "w") as f:
+            json.dump({"run_id": "2026-W42", "after_email": None, "done": ["user01@b.com.test"],
+                       "sent": 1, "failed": 0, "skipped": 0, "completed": False}, f)
+        result = job.run()
+        assert result["sent"] == USERS - 1
+        assert "user01@b.com.test" not in recipients(server)
+    finally:
+        server.stop()
+
+def test_permanent_failures_are_counted_and_skipped():
+    server = FakeSmtpServer().start()
+    try:
+        job = make_job(server)
+        server.reject["user03@a.com.test"] = 550
+        server.fail_next = [451]
+        result = job.run()
+        assert result["failed"] == 1 and result["sent"] == USERS - 1 and result["completed"]
+    finally:
+        server.stop()
+
+def test_global_rate_limit_paces_delivery():
+    server = FakeSmtpServer().start()
+    try:
+        job = make_job(server, rate=40.0)
+        job.rate_limit = TokenBucket(40.0, burst=1)
+        start = time.perf_counter()
+        job.run()
+        # 12 sends at 40/s with no burst take at least 11/40 s
+        assert time.perf_counter() - start >= 0.25
+    finally:
+        server.stop()
+
+def test_token_bucket_refills_at_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(2.0, burst=2, clock=clock)
+    assert bucket.try_acquire() == 0 and bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0.5
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0
+    assert TokenBucket(0).try_acquire() == 0
+
+def test_keyed_buckets_are_independent_and_bounded():
+    clock = FakeClock()
+    buckets = KeyedTokenBuckets(1.0, burst=1, max_keys=2, clock=clock)
+    assert buckets.try_acquire("a.com") == 0 and buckets.try_acquire("b.com") == 0
+    assert buckets.try_acquire("a.com") > 0
+    buckets.try_acquire("c.com")
+    assert buckets.get_stats()["keys"] == 2
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for pooled SMTP delivery and the background email queue
+
+Runs against the local SMTP stand-in from fake_smtp.
+"""
+
+import os
+import socket
+import tempfile
+import time
+
+from email_service import EmailService, SmtpSettings
+from fake_smtp import FakeSmtpServer
+
+_directory = tempfile.mkdtemp()
+
+def make_service(server, **overrides):
+    settings = SmtpSettings()
+    settings.queue_path = tempfile.mktemp(suffix=".sqlite3", dir=_directory)
+    settings.host, settings.port = server.host, server.port
+    settings.user, settings.password, settings.sender = None, None, "chopchop@example.com"
+    settings.starttls = False
+    settings.pool_size = settings.workers = 2
+    settings.retry_backoff, settings.poll_seconds = 0.05, 0.02
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    return EmailService(settings)
+
+def test_sessions_are_reused():
+    server = FakeSmtpServer().start()
+    try:
+        service = make_service(server)
+        for i in range(10):
+            assert service.send(f"user{i}@example.com", "Hello", "<p>Hi</p>", is_html=True)
+        assert len(server.messages) == 10
+        assert server.sessions == 1
+        assert server.messages[0]["message"]["From"] == "chopchop@example.com"
+        assert service.pool.get_stats()["reused"] == 9
+    finally:
+        server.stop()
+
+def test_dead_session_is_replaced():
+    server = FakeSmtpServer().start()
+    try:
+        service = make_service(server)
+        assert service.send("a@example.com", "One", "body")
+        # Simulate the server dropping the idle session
+        service.pool._idle[0].smtp.sock.shutdown(socket.SHUT_RDWR)
+        service.pool._idle[0].last_used -= 5
+        assert service.send("b@example.com", "Two", "body")
+        assert server.sessions == 2
+        assert service.pool.get_stats()["health_check_failures"] == 1
+    finally:
+        server.stop()
+
+def test_queue_returns_immediately_and_delivers():
+    server = FakeSmtpServer().start()
+    try:
+        service = make_service(server)
+        start = time.perf_counter()
+        ids = [service.enqueue(f"user{i}@example.com", "Queued", "body") for i in range(20)]
+        assert time.perf_counter() - start < 0.5
+        assert all(ids) and len(set(ids)) == 20
+        assert service.flush(10)
+        assert len(server.messages) == 20
+        assert service.get_status(ids[0])["status"] == "sent"
+        assert server.sessions <= 2
+    finally:
+        server.stop()
+
+def test_transient_failures_are_retried_and_permanent_ones_are_not():
+    server = FakeSmtpServer().start()
+    try:
+        service = make_service(server)
+        server.fail_next = [451, 451]
+        server.reject["nobody@example.com"] = 550
+        retried = service.enqueue("retry@example.com", "Retry", "body")
+        rejected = service.enqueue("nobody@example.com", "Reject", "body")
+        assert service.flush(10)
+        assert service.get_status(retried)["status"] == "sent"
+        assert service.get_status(retried)["attempts"] == 3
+        assert service.get_status(rejected)["status"] == "failed"
+        assert service.get_status(rejected)["attempts"] == 1
+        assert service.get_stats()["retried"] == 2
+    finally:
+        server.stop()
+
+def test_queue_is_shared_by_every_worker_process():
+    server = FakeSmtpServer().start()
+    try:
+        first = make_service(server)
+        # A worker that queues mail and dies before delivering it
+        first._workers_pid, first._workers = os.getpid(), []
+        message_id = first.enqueue("shared@example.com", "Shared", "body")
+        assert first.get_status(message_id)["status"] == "queued"
+        assert first.get_stats()["queue_depth"] == 1 and not server.messages
+        # Another worker on the same queue file delivers it, and either can report it
+        second = make_service(server, queue_path=first.settings.queue_path)
+        second._ensure_workers()
+        assert second.flush(10)
+        assert len(server.messages) == 1
+        assert first.get_status(message_id)["status"] == "sent"
+        assert second.get_status(message_id)["to"] == "shared@example.com"
+        assert first.get_stats()["queue_depth"] == 0
+    finally:
+        server.stop()
+
+def test_unusable_queue_file_disables_the_queue_only():
+    server = FakeSmtpServer().start()
+    try:
+        service = make_service(server, queue_path=os.path.join(_directory, "missing", "queue.sqlite3"))
+        assert not service.queue_enabled
+        assert service.enqueue("a@example.com", "Queued", "body") is None
+        assert service.get_status("anything") is None
+        assert service.send("a@example.com", "Direct", "body")
+    finally:
+        server.stop()
+
+def test_queue_size_limits_pending_messages():
+    server = FakeSmtpServer().start()
+    try:
+        service = make_service(server, queue_size=2)
+        service._workers_pid, service._workers = os.getpid(), []
+        assert service.enqueue("a@example.com", "One", "body")
+        assert service.enqueue("b@example.com", "Two", "body")
+        assert service.enqueue("c@example.com", "Three", "body") is None
+    finally:
+        server.stop()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the grocery email renderer
+
+Run directly for a microbenchmark against the previous string-concatenation
+renderer on large lists.
+"""
+
+import time
+
+from email_templates import render_grocery_email, recipe_fragments
+
+def make_lists(item_count, recipe_count, steps=12):
+    items = [{"item": f"Item {i}", "category": "produce", "priority": ("high", "medium", "low")[i % 3],
+              "checked": i % 4 == 0, "needed_for": f"Recipe {i % 7}"} for i in range(item_count)]
+    recipes = [{"name": f"Recipe {r}", "description": "A weeknight favourite", "cooking_time": "30 minutes",
+                "difficulty": "Easy", "servings": 4,
+                "ingredients_needed": [{"name": f"Ingredient {j}", "amount": "1 cup", "available": j % 2 == 0} for j in range(steps)],
+                "instructions": [f"Step {j + 1}: keep stirring" for j in range(steps)],
+                "tips": "Serve warm"} for r in range(recipe_count)]
+    return items, recipes
+
+def test_fields_are_escaped():
+    page = render_grocery_email(
+        [{"item": "<script>alert(1)</script>", "priority": "urgent\" onclick=\"x", "category": "a & b"}],
+        [{"name": "Mac & <b>Cheese</b>", "instructions": ["Heat to >100°"], "ingredients_needed": ["salt"]}]
+    )
+    assert "<script>" not in page and "&lt;script&gt;" in page
+    assert 'onclick="x' not in page and "priority-medium" in page
+    assert "a &amp; b" in page and "Mac &amp; &lt;b&gt;Cheese&lt;/b&gt;" in page
+    assert "Heat to &gt;100°" in page and "salt" in page
+
+def test_sections_and_empty_lists():
+    items, recipes = make_lists(3, 2)
+    page = render_grocery_email(items, recipes)
+    assert page.count('class="item ') == 3 and page.count('class="recipe"') == 2
+    assert "Step 12: keep stirring" in page and "checked" in page
+    assert "Grocery List</h2>" not in render_grocery_email([], recipes)
+    assert page.startswith("<!DOCTYPE html>") and page.rstrip().endswith("</html>")
+
+def test_unchanged_recipes_come_from_the_cache():
+    recipe_fragments.clear()
+    items, recipes = make_lists(5, 10)
+    first = render_grocery_email(items, recipes)
+    recipes[3] = dict(recipes[3], tips="Serve cold")
+    second = render_grocery_email(items, recipes)
+    stats = recipe_fragments.get_stats()
+    assert stats["misses"] == 11 and stats["hits"] == 9
+    assert "Serve cold" in second and first != second
+
+def legacy_render(items, recipes):
+    """The previous SupabaseManager._create_html_email_body, verbatim: html += per field, unescaped"""
+    html = """
+    <!DOCTYPE html>
+    <html>
+    <head>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 20px; }
+            .header { background-color: #3b82f6; color: white; padding: 20px; border-radius: 8px; }
+            .section { margin: 20px 0; }
+            .item { background-color: #f8fafc; padding: 10px; margin: 5px 0; border-radius: 4px; border-left: 4px solid #3b82f6; }
+            .recipe { background-color: #fef3c7; padding: 15px; margin: 10px 0; border-radius: 8px; }
+            .priority-high { border-left-color: #ef4444; }
+            .priority-medium { border-left-color: #f59e0b; }
+            .priority-low { border-left-color: #10b981; }
+            .checked { text-decoration: line-through; opacity: 0.6; }
+        </style>
+    </head>
+    <body>
+        <div class="header">
+            <h1>🛒 Your ChopChop Grocery List & Recipes</h1>
+            <p>Generated by your Kitchen Assistant</p>
+        </div>
+    """
+
+    # Add grocery list section
+    if items:
+        html += """
+        <div class="section">
+            <h2>🛒 Grocery List</h2>
+        """
+        for item in items:
+            priority_class = f"priority-{item.get('priority', 'medium')}"
+            checked_class = "checked" if item.get('checked', False) else ""
+            html += f"""
+            <div class="item {priority_class} {checked_class}">
+                <strong>{item.get('item', 'Unknown Item')}</strong>
+                <span style="float: right; background-color: #e5e7eb; padding: 2px 8px; border-radius: 12px; font-size: 12px;">
+                    {item.get('priority', 'medium').upper()}
+                </span>
+                <br>
+                <small>Category: {item.get('category', 'general')} | Needed for: {item.get('needed_for', 'General use')}</small>
+            </div>
+            """
+        html += "</div>"
+
+    # Add recipes section
+    if recipes:
+        html += """
+        <div class="section">
+            <h2>👨‍🍳 Recipes</h2>
+        """
+        for recipe in recipes:
+            html += f"""
+            <div class="recipe">
+                <h3>{recipe.get('name', 'Untitled Recipe')}</h3>
+                <p><strong>Description:</strong> {recipe.get('description', 'No description')}</p>
+                <p><strong>Cooking Time:</strong> {recipe.get('cooking_time', 'Not specified')} | 
+                   <strong>Difficulty:</strong> {recipe.get('difficulty', 'Not specified')} | 
+                   <strong>Servings:</strong> {recipe.get('servings', 'Not specified')}</p>
+            """
+
+            # Add ingredients
+            if recipe.get('ingredients_needed'):
+                html += "<p><strong>Ingredients:</strong></p><ul>"
+                for ingredient in recipe['ingredients_needed']:
+                    available = "✅" if ingredient.get('available', False) else "❌"
+                    html += f"<li>{available} {ingredient.get('amount', '')} {ingredient.get('name', '')}</li>"
+                html += "</ul>"
+
+            # Add instructions
+            if recipe.get('instructions'):
+                html += "<p><strong>Instructions:</strong></p><ol>"
+                for instruction in recipe['instructions']:
+                    html += f"<li>{instruction}</li>"
+                html += "</ol>"
+
+            # Add tips
+            if recipe.get('tips'):
+                html += f"<p><strong>Tips:</strong> {recipe['tips']}</p>"
+
+            html += "</div>"
+        html += "</div>"
+
+    html += """
+        <div style="margin-top: 30px; padding: 15px; background-color: #f3f4f6; border-radius: 8px; text-align: center;">
+            <p>Generated by <strong>ChopChop</strong> - Your Kitchen Assistant</p>
+            <p>Visit <a href="http://localhost:3000">ChopChop App</a> to manage your lists and discover more recipes!</p>
+        </div>
+    </body>
+    </html>
+    """
+
+    return html
+
+def benchmark(label, render, items, recipes, rounds=20):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        render(items, recipes)
+    elapsed = (time.perf_counter() - start) / rounds * 1000
+    print(f"   {label:<34} {elapsed:>8.2f} ms/render")
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    for item_count, recipe_count, steps in ((50, 5, 10), (2000, 200, 40)):
+        items, recipes = make_lists(item_count, recipe_count, steps)
+        print(f"\n⏱️  {item_count} items, {recipe_count} recipes x {steps} steps")
+        benchmark("legacy (html +=, unescaped)", legacy_render, items, recipes)
+        recipe_fragments.max_entries = 0
+        benchmark("templates, no fragment cache", render_grocery_email, items, recipes)
+        recipe_fragments.max_entries = 1024
+        recipe_fragments.clear()
+        render_grocery_email(items, recipes)
+        benchmark("templates, warm fragment cache", render_grocery_email, items, recipes)
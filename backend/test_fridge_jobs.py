@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+Tests for the background fridge analysis jobs and the /chat/jobs endpoints
+"""
+
+import base64
+import io
+import os
+import tempfile
+import threading
+import time
+
+from fridge_jobs import FridgeJobQueue, JobDeferred, JobFailed, JobRejected, JobSettings
+
+_directory = tempfile.mkdtemp()
+
+def make_settings(**overrides):
+    settings = JobSettings()
+    settings.path = tempfile.mktemp(suffix=".sqlite3", dir=_directory)
+    settings.poll_seconds, settings.retry_backoff = 0.02, 0.01
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    return settings
+
+def photo(seed=0):
+    return base64.b64encode(bytes([seed]) * 64).decode("ascii")
+
+def wait_until_finished(queue, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in ("succeeded", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish: {queue.get(job_id)}")
+
+def test_submitted_job_runs_in_the_background():
+    seen = []
+
+    def runner(job):
+        seen.append(job)
+        return {"type": "structured", "data": {"ingredients": [job["message"]]}}
+
+    queue = FridgeJobQueue(runner, make_settings())
+    job, created = queue.submit("cook@example.com", "fridge", photo(), "png", "cook@example.com")
+    assert created and job["status"] == "queued" and job["attempts"] == 0
+    finished = wait_until_finished(queue, job["id"])
+    assert finished["status"] == "succeeded" and finished["attempts"] == 1
+    assert finished["result"] == {"type": "structured", "data": {"ingredients": ["fridge"]}}
+    assert seen[0]["image_base64"] == photo() and seen[0]["email"] == "cook@example.com"
+    # The photo is not kept once the job is done
+    row = queue._connection().execute("SELECT image_base64 FROM fridge_jobs WHERE id = ?", (job["id"],)).fetchone()
+    assert row == (None,)
+    assert queue.get("no-such-job") is None
+    assert queue.get_stats()["jobs"] == {"succeeded": 1}
+
+def test_same_photo_from_the_same_user_is_deduplicated():
+    outcomes = iter([JobFailed("unreadable photo"), {"type": "text", "data": "ok"}])
+
+    def runner(job):
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    queue = FridgeJobQueue(runner, make_settings())
+    first, _ = queue.submit("a@example.com", "fridge", photo(1))
+    assert wait_until_finished(queue, first["id"])["error"] == "unreadable photo"
+    # A failed job is not reused, a queued or succeeded one is
+    second, created = queue.submit("a@example.com", "fridge", photo(1))
+    assert created and second["id"] != first["id"]
+    wait_until_finished(queue, second["id"])
+    again, created = queue.submit("a@example.com", "different words", photo(1))
+    assert not created and again["id"] == second["id"] and again["result"]["data"] == "ok"
+    # Re-encoding the same bytes still matches; another user gets a job of their own
+    padded = photo(1).replace("=", "") + "=" * (-len(photo(1).replace("=", "")) % 4)
+    assert queue.submit("a@example.com", "fridge", padded)[0]["id"] == second["id"]
+    assert queue.submit("b@example.com", "fridge", photo(1))[1]
+    try:
+        queue.submit("a@example.com", "fridge", "not base64!")
+        assert False, "expected a ValueError"
+    except ValueError:
+        pass
+    assert queue.get_stats()["deduplicated"] == 2
+
+def test_retries_deferrals_and_permanent_failures():
+    calls = {"flaky": 0, "busy": 0}
+
+    def runner(job):
+        kind = job["message"]
+        if kind == "flaky":
+            calls["flaky"] += 1
+            if calls["flaky"] < 3:
+                raise RuntimeError("Bedrock timed out")
+        elif kind == "busy":
+            calls["busy"] += 1
+            if calls["busy"] == 1:
+                raise JobDeferred("Model capacity is busy", 0.05)
+        elif kind == "broken":
+            raise RuntimeError("always fails")
+        return {"type": "text", "data": kind}
+
+    queue = FridgeJobQueue(runner, make_settings(max_attempts=3))
+    jobs = {kind: queue.submit(kind, kind, photo(n))[0] for n, kind in enumerate(("flaky", "busy", "broken"))}
+    flaky = wait_until_finished(queue, jobs["flaky"]["id"])
+    assert flaky["status"] == "succeeded" and flaky["attempts"] == 3
+    # A refused model call waits without using up an attempt
+    busy = wait_until_finished(queue, jobs["busy"]["id"])
+    assert busy["status"] == "succeeded" and busy["attempts"] == 1 and calls["busy"] == 2
+    broken = wait_until_finished(queue, jobs["broken"]["id"])
+    assert broken["status"] == "failed" and broken["attempts"] == 3 and broken["error"] == "always fails"
+    stats = queue.get_stats()
+    assert stats["retried"] == 4 and stats["deferred"] == 1 and stats["failed"] == 1
+
+def test_jobs_survive_a_worker_that_dies_or_exits():
+    settings = make_settings(lease_seconds=0.3, workers=1)
+    stuck = threading.Event()
+
+    def hangs(job):
+        stuck.wait(5)
+        return {"type": "text", "data": "too late"}
+
+    dead = FridgeJobQueue(hangs, settings)
+    job, _ = dead.submit("cook", "fridge", photo(7))
+    while dead.get(job["id"])["status"] != "running":
+        time.sleep(0.01)
+    # Another process on the same file takes the job over once the lease runs out
+    survivor = FridgeJobQueue(lambda job: {"type": "text", "data": "recovered"}, settings)
+    survivor.ensure_workers()
+    finished = wait_until_finished(survivor, job["id"])
+    assert finished["result"]["data"] == "recovered" and finished["attempts"] == 2
+    # The first worker's late answer does not overwrite it
+    stuck.set()
+    time.sleep(0.1)
+    assert survivor.get(job["id"])["result"]["data"] == "recovered"
+    assert dead.get_stats()["succeeded"] == 0
+
+    # A worker that exits cleanly hands its running job straight back
+    release = threading.Event()
+    exiting = FridgeJobQueue(lambda job: release.wait(5), make_settings(workers=1))
+    job, _ = exiting.submit("cook", "fridge", photo(8))
+    while exiting.get(job["id"])["status"] != "running":
+        time.sleep(0.01)
+    assert exiting.release() == 1
+    assert exiting.get(job["id"])["status"] == "queued" and exiting.get(job["id"])["attempts"] == 0
+    release.set()
+
+def test_submissions_over_the_limits_are_refused():
+    release = threading.Event()
+    queue = FridgeJobQueue(lambda job: release.wait(5), make_settings(workers=1, max_queued=2, max_per_user=2))
+    running, _ = queue.submit("a", "fridge", photo(1))
+    while queue.get(running["id"])["status"] != "running":
+        time.sleep(0.01)
+    queue.submit("a", "fridge", photo(2))
+    try:
+        queue.submit("a", "fridge", photo(3))
+        assert False, "expected the per-user limit"
+    except JobRejected as e:
+        assert e.status == 429 and e.retry_after >= 1
+    queue.submit("b", "fridge", photo(3))
+    try:
+        queue.submit("c", "fridge", photo(4))
+        assert False, "expected the queue limit"
+    except JobRejected as e:
+        assert e.status == 503 and e.retry_after >= 1
+    # A duplicate is still answered when the queue is full
+    assert queue.submit("b", "fridge", photo(3))[1] is False
+    release.set()
+
+def test_unusable_job_file_disables_jobs_without_failing():
+    queue = FridgeJobQueue(lambda job: None, make_settings(path=os.path.join(_directory, "missing", "jobs.sqlite3")))
+    assert not queue.enabled
+    try:
+        queue.submit("cook", "fridge", photo())
+        assert False, "expected the submission to be refused"
+    except JobRejected as e:
+        assert e.status == 503
+    queue.ensure_workers()
+    assert queue.get("anything") is None and not queue._workers
+    assert queue.get_stats()["enabled"] is False
+
+def test_job_endpoints_poll_and_stream():
+    import nova_backend
+    from PIL import Image
+
+    class FakeBedrock:
+        def converse(self, **kwargs):
+            time.sleep(0.05)
+            return {"output": {"message": {"content": [{"text": '{"ingredients": [{"name": "eggs"}], "recipes": []}'}]}}}
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (20, 200, 40)).save(buffer, format="PNG")
+    image = base64.b64encode(buffer.getvalue()).decode("ascii")
+    original_client = nova_backend.get_bedrock_client
+    nova_backend.get_bedrock_client = lambda: FakeBedrock()
+    try:
+        client = nova_backend.app.test_client()
+        assert client.post("/chat/jobs", json={"message": "Analyze"}).status_code == 400
+        assert client.post("/chat/jobs", json={"imageBase64": "%%%"}).status_code == 400
+        response = client.post("/chat/jobs", json={"imageBase64": image, "imageFormat": "png",
+                                                   "email": "jobs@example.com"})
+        assert response.status_code == 202 and response.json["deduplicated"] is False
+        job_id = response.json["job_id"]
+        assert response.headers["Location"] == f"/chat/jobs/{job_id}"
+
+        stream = client.get(f"/chat/jobs/{job_id}/events")
+        assert stream.headers["Content-Type"].startswith("text/event-stream")
+        body = stream.get_data(as_text=True)
+        assert body.startswith("retry: 2000\n") and "event: result\n" in body
+        assert '"status":"succeeded"' in body.replace(" ", "")
+
+        status = client.get(f"/chat/jobs/{job_id}")
+        assert status.json["status"] == "succeeded" and "Retry-After" not in status.headers
+        assert status.json["result"]["type"] == "structured"
+        assert status.json["result"]["data"]["ingredients"] == [{"name": "eggs"}]
+        again = client.post("/chat/jobs", json={"imageBase64": image, "email": "jobs@example.com"})
+        assert again.status_code == 200 and again.json["job_id"] == job_id and again.json["deduplicated"]
+        assert client.get("/chat/jobs/unknown").status_code == 404
+        assert client.get("/health").json["fridge_jobs"]["succeeded"] >= 1
+    finally:
+        nova_backend.get_bedrock_client = original_client
+    # Saved like a /chat fridge analysis
+    pantry = nova_backend.storage.query_pantry("jobs@example.com")
+    assert [item["name"] for item in pantry["items"]] == ["eggs"]
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the compact JSON column encoding
+
+Run directly to print stored and fetched bytes per encoding for a user with
+a full chat history.
+"""
+
+import json
+import os
+
+os.environ['SUPABASE_READ_CACHE_TTL'] = '0'  # every call must reach the database
+
+from fake_supabase import FakeSupabaseClient
+from json_codec import JsonColumnCodec, decode_json_column, ZSTD_AVAILABLE
+from supabase_config import SupabaseManager
+
+TEST_EMAIL = "codec@example.com"
+
+ITEMS = [{"item": f"Item {i}", "category": "produce", "priority": "medium", "checked": False} for i in range(40)]
+
+def make_manager(encoding):
+    client = FakeSupabaseClient()
+    manager = SupabaseManager(client=client)
+    manager.json_codec = JsonColumnCodec(encoding=encoding)
+    return client, manager
+
+def fill(manager):
+    manager.save_user_data(TEST_EMAIL, ITEMS, [{"name": "Soup", "instructions": ["Chop", "Simmer"]}])
+    for i in range(100):
+        sender = "user" if i % 2 == 0 else "nova"
+        manager.save_chat_message(TEST_EMAIL, f"What can I cook with carrots and onions? ({i})", sender)
+
+def stored_bytes(client):
+    row = client.tables['Users'][0]
+    return sum(len(json.dumps(row[column], separators=(',', ':'))) for column in ('items', 'recipes', 'chat_history'))
+
+def test_round_trip_and_small_values_stay_plain():
+    codec = JsonColumnCodec(encoding='gzip', min_bytes=256)
+    encoded = codec.encode(ITEMS)
+    assert isinstance(encoded, str) and encoded.startswith('gz1:')
+    assert codec.decode(encoded, []) == ITEMS
+    assert codec.encode([{"item": "Milk"}]) == [{"item": "Milk"}]
+    stats = codec.get_stats()
+    assert stats['encoded_writes'] == 1 and stats['plain_writes'] == 1
+    assert stats['write_ratio'] > 1
+
+def test_reads_every_stored_format():
+    assert decode_json_column(None, []) == []
+    assert decode_json_column(ITEMS, []) == ITEMS
+    assert decode_json_column(json.dumps(ITEMS), []) == ITEMS
+    assert decode_json_column(JsonColumnCodec(encoding='gzip', min_bytes=0).encode(ITEMS), []) == ITEMS
+
+def test_lazy_migration_of_plain_rows():
+    client, manager = make_manager('json')
+    fill(manager)
+    assert isinstance(client.tables['Users'][0]['chat_history'], list)
+    # Switching the encoding on leaves existing rows readable ...
+    manager.json_codec = JsonColumnCodec(encoding='gzip')
+    assert manager.get_user_data(TEST_EMAIL)["items"] == ITEMS
+    assert len(manager.get_chat_history(TEST_EMAIL)) == 100
+    # ... and the next write stores the encoded form
+    assert manager.save_chat_message(TEST_EMAIL, "latest", "user")
+    assert client.tables['Users'][0]['chat_history'].startswith('gz1:')
+    assert client.tables['Users'][0]['items'] == ITEMS
+    assert manager.get_chat_history(TEST_EMAIL, limit=2)[-1]["message"] == "latest"
+
+def test_encoded_history_with_path_reads_disabled():
+    client, manager = make_manager('gzip')
+    fill(manager)
+    # Encoding switched back off: path extraction finds nothing and falls back
+    manager.json_codec = JsonColumnCodec(encoding='json')
+    recent = manager.get_chat_history(TEST_EMAIL, limit=3)
+    assert [m["message"] for m in recent] == [f"What can I cook with carrots and onions? ({i})" for i in (97, 98, 99)]
+    version = manager.get_user_data(TEST_EMAIL)["version"]
+    assert manager.patch_user_data(TEST_EMAIL, [{"op": "remove", "path": "/items/0"}], version) == version + 1
+    assert len(manager.get_user_data(TEST_EMAIL)["items"]) == 39
+
+def test_encoding_shrinks_stored_and_fetched_bytes():
+    sizes = report_bytes()
+    assert sizes['gzip']['stored'] < sizes['json']['stored'] / 3
+    assert sizes['gzip']['fetched'] < sizes['json']['fetched'] / 3
+
+def report_bytes():
+    sizes = {}
+    for encoding in ('json', 'gzip', 'zstd') if ZSTD_AVAILABLE else ('json', 'gzip'):
+        client, manager = make_manager(encoding)
+        fill(manager)
+        client.reset_counters()
+        manager.get_user_data(TEST_EMAIL)
+        manager.get_chat_history(TEST_EMAIL)
+        sizes[encoding] = {'stored': stored_bytes(client), 'fetched': client.bytes_fetched}
+    return sizes
+
+if __name__ == "__main__":
+    print("📦 Users row bytes per JSON_COLUMN_ENCODING (40 items, 100 chat messages)")
+    print("=" * 60)
+    for encoding, size in report_bytes().items():
+        print(f"   {encoding:<6} stored {size['stored']:>9,} bytes   fetched {size['fetched']:>9,} bytes")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Tests for the JSON Patch helper used by PATCH /update-data
+"""
+
+from fake_supabase import FakeSupabaseClient
+from json_patch import apply_patch, json_equal, touched_roots, JsonPatchError
+from storage_backend import UserNotFoundError, VersionConflictError
+from supabase_config import SupabaseManager
+
+def sample_document():
+    return {
+        "items": [
+            {"item": "Milk", "checked": False},
+            {"item": "Eggs", "checked": False}
+        ],
+        "recipes": [{"name": "Omelette"}]
+    }
+
+def test_replace_checks_off_item():
+    document = sample_document()
+    patched = apply_patch(document, [{"op": "replace", "path": "/items/1/checked", "value": True}])
+    assert patched["items"][1]["checked"] is True
+    # The input document is never mutated
+    assert document["items"][1]["checked"] is False
+
+def test_add_append_and_remove():
+    patched = apply_patch(sample_document(), [
+        {"op": "add", "path": "/items/-", "value": {"item": "Butter", "checked": False}},
+        {"op": "remove", "path": "/items/0"}
+    ])
+    assert [item["item"] for item in patched["items"]] == ["Eggs", "Butter"]
+
+def test_move_copy_and_escaped_pointer():
+    document = {"items": [], "recipes": [{"name": "a/b", "tips": {"x~y": 1}}]}
+    patched = apply_patch(document, [
+        {"op": "copy", "from": "/recipes/0/tips/x~0y", "path": "/recipes/0/servings"},
+        {"op": "move", "from": "/recipes/0", "path": "/recipes/-"}
+    ])
+    assert patched["recipes"][0]["servings"] == 1
+
+def test_failed_test_op_is_atomic():
+    document = sample_document()
+    try:
+        apply_patch(document, [
+            {"op": "replace", "path": "/items/0/checked", "value": True},
+            {"op": "test", "path": "/items/1/item", "value": "Bread"}
+        ])
+    except JsonPatchError:
+        pass
+    else:
+        raise AssertionError("Expected the test operation to fail")
+    assert document["items"][0]["checked"] is False
+
+def test_test_op_compares_json_types():
+    document = {"items": [{"item": "Milk", "checked": True, "count": 1, "tags": ["a"]}], "recipes": []}
+    for path, value in (("/items/0/checked", 1), ("/items/0/count", True), ("/items/0/count", "1"),
+                        ("/items/0/tags", {"0": "a"}), ("/items/0", {"item": "Milk", "checked": 1, "count": 1,
+                                                                      "tags": ["a"]})):
+        try:
+            apply_patch(document, [{"op": "test", "path": path, "value": value}])
+        except JsonPatchError:
+            continue
+        raise AssertionError(f"Expected {value!r} not to match {path}")
+    # Numbers compare by value: 1 and 1.0 are the same JSON number
+    apply_patch(document, [{"op": "test", "path": "/items/0/count", "value": 1.0},
+                           {"op": "test", "path": "/items", "value": document["items"]}])
+    assert json_equal(None, None) and not json_equal(None, False) and not json_equal([], {})
+
+def test_invalid_operations_are_rejected():
+    for operations in (
+        [{"op": "replace", "path": "/items/9", "value": 1}],
+        [{"op": "remove", "path": "/items/01"}],
+        [{"op": "add", "path": "items/0", "value": 1}],
+        [{"op": "frobnicate", "path": "/items"}],
+        [{"op": "add", "path": "/items/0"}],
+        [{"op": "move", "from": 3, "path": "/items/0"}],
+        [{"op": 1, "path": "/items/0"}],
+        ["oops"],
+        {"op": "add"},
+    ):
+        try:
+            apply_patch(sample_document(), operations)
+        except JsonPatchError:
+            continue
+        raise AssertionError(f"Expected {operations!r} to be rejected")
+
+def test_touched_roots_ignores_reads():
+    assert touched_roots([
+        {"op": "test", "path": "/recipes/0/name", "value": "Omelette"},
+        {"op": "copy", "from": "/recipes/0", "path": "/items/-"},
+        {"op": "replace", "path": "/items/0/checked", "value": True}
+    ]) == ["items"]
+
+def test_touched_roots_rejects_malformed_operations():
+    for operations in (["oops"], [{"op": "remove"}], [{"op": "remove", "path": 7}], [None], "oops"):
+        try:
+            touched_roots(operations)
+        except JsonPatchError:
+            continue
+        raise AssertionError(f"Expected {operations!r} to be rejected")
+
+def test_patch_endpoint_rejects_bad_operations_and_versions():
+    import nova_backend
+    client = nova_backend.app.test_client()
+    email = "patcher@example.com"
+    assert client.post("/save-data", json={"email": email, "items": [{"item": "Milk"}], "recipes": []}).status_code == 200
+    response = client.patch("/update-data", json={"email": email, "patch": ["oops"]})
+    assert response.status_code == 422 and response.json["error"] == "Invalid patch"
+    # true is an int to Python, but not a version
+    response = client.patch("/update-data", json={"email": email, "version": True,
+                                                  "patch": [{"op": "replace", "path": "/items/0/item", "value": "Oat milk"}]})
+    assert response.status_code == 400
+    assert nova_backend.storage.get_user_data(email)["items"][0]["item"] == "Milk"
+
+def test_unconditional_patch_is_reapplied_after_a_concurrent_write():
+    email = "racer@example.com"
+    client = FakeSupabaseClient()
+    manager = SupabaseManager(client=client)
+    manager.save_user_data(email, [{"item": "Milk"}], [])
+    table, raced = client.table, []
+
+    def racing_table(name):
+        query = table(name)
+        update = query.update
+
+        def update_after_another_write(values, **kwargs):
+            if not raced:
+                # Another worker's write lands between the patch's read and its write
+                raced.append(True)
+                table("Users").update({"items": [{"item": "Bread"}]}).eq("email", email).execute()
+            return update(values, **kwargs)
+
+        query.update = update_after_another_write
+        return query
+
+    client.table = racing_table
+    add_eggs = [{"op": "add", "path": "/items/-", "value": {"item": "Eggs"}}]
+    version = manager.patch_user_data(email, add_eggs)
+    assert [item["item"] for item in manager.get_user_data(email)["items"]] == ["Bread", "Eggs"]
+    # With a precondition, the same race is the client's conflict
+    raced.clear()
+    try:
+        manager.patch_user_data(email, add_eggs, version)
+        raise AssertionError("Expected a version conflict")
+    except VersionConflictError:
+        pass
+    try:
+        manager.patch_user_data("nobody@example.com", add_eggs)
+        raise AssertionError("Expected a missing user")
+    except UserNotFoundError:
+        pass
+
+def test_patching_a_user_without_data_is_not_found():
+    import nova_backend
+    client = nova_backend.app.test_client()
+    response = client.patch("/update-data", json={"email": "nobody@example.com",
+                                                  "patch": [{"op": "add", "path": "/items/-", "value": {}}]})
+    assert response.status_code == 404 and response.json["success"] is False
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    print("\n🎉 All JSON Patch tests passed!")
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Tests for the orjson-backed Flask JSON provider and the /chat response shapes
+"""
+
+import dataclasses
+import datetime
+import decimal
+import json
+import uuid
+
+from flask import Flask, request
+
+from json_provider import configure_json, FastJSONProvider, StdlibJSONProvider
+
+@dataclasses.dataclass
+class Item:
+    item: str
+    quantity: int
+
+PAYLOAD = {
+    "zeta": [1, 2.5, None, True],
+    "items": [Item("Crème fraîche", 2)],
+    "when": datetime.datetime(2026, 10, 19, 8, 30, tzinfo=datetime.timezone.utc),
+    "day": datetime.date(2026, 10, 19),
+    "id": uuid.UUID("12345678-1234-5678-1234-567812345678"),
+    "price": decimal.Decimal("3.10"),
+    "alpha": {"b": "🥕", "a": ""},
+}
+
+def make_app():
+    app = Flask(__name__)
+    assert configure_json(app, "orjson") == "orjson"
+
+    @app.route("/echo", methods=["POST"])
+    def echo():
+        return {"received": request.get_json()}
+
+    return app
+
+def test_output_matches_the_stdlib_provider():
+    fast, stdlib = FastJSONProvider(Flask("fast")), StdlibJSONProvider(Flask("stdlib"))
+    assert json.loads(fast.dumps(PAYLOAD)) == json.loads(stdlib.dumps(PAYLOAD))
+    # Keys stay sorted, dates stay RFC 822, non-ASCII is written as UTF-8
+    text = fast.dumps(PAYLOAD)
+    assert text.index('"alpha"') < text.index('"zeta"')
+    assert '"Mon, 19 Oct 2026 08:30:00 GMT"' in text and "🥕" in text
+
+def test_values_orjson_refuses_fall_back_to_the_stdlib():
+    fast = FastJSONProvider(Flask("fast"))
+    assert json.loads(fast.dumps({"big": 2 ** 70})) == {"big": 2 ** 70}
+    assert json.loads(fast.dumps({1: "a", 2: "b"})) == {"1": "a", "2": "b"}
+    assert fast.dumps([1], cls=json.JSONEncoder) == "[1]"
+    assert fast.loads("[NaN]")[0] != fast.loads("[NaN]")[0]
+    try:
+        fast.dumps({"x": object()})
+        assert False, "unserializable values must still raise"
+    except TypeError:
+        pass
+
+def test_requests_and_responses_go_through_the_provider():
+    client = make_app().test_client()
+    response = client.post("/echo", data='{"b": 1, "a": "ü"}', content_type="application/json")
+    assert response.status_code == 200
+    assert response.data == '{"received":{"a":"ü","b":1}}\n'.encode("utf-8")
+    assert client.post("/echo", data="{not json", content_type="application/json").status_code == 400
+
+def test_unknown_provider_falls_back_to_orjson():
+    app = Flask(__name__)
+    assert configure_json(app, "simdjson") == "orjson"
+    assert configure_json(app, "stdlib") == "stdlib" and isinstance(app.json, StdlibJSONProvider)
+
+def test_chat_returns_structured_results_as_objects_on_request():
+    import nova_backend
+    structured = {"type": "structured", "data": {"ingredients": [{"name": "Milk"}], "recipes": []}}
+    original = nova_backend.send_message_to_nova
+    nova_backend.send_message_to_nova = lambda message: structured
+    try:
+        client = nova_backend.app.test_client()
+        legacy = client.post("/chat", json={"message": "hi"}).get_json()
+        assert json.loads(legacy["response"]) == structured
+        native = client.post("/chat", json={"message": "hi", "responseFormat": "object"}).get_json()
+        assert native["response"] == structured
+        nova_backend.send_message_to_nova = lambda message: "Plain text"
+        text = client.post("/chat", json={"message": "hi", "responseFormat": "object"}).get_json()
+        assert text["response"] == {"type": "text", "data": "Plain text"}
+        assert client.post("/chat", json={"message": "hi", "responseFormat": "xml"}).status_code == 400
+    finally:
+        nova_backend.send_message_to_nova = original
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
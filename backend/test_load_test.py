@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Tests for the load-test harness and its fake Bedrock runtime
+"""
+
+import json
+import time
+
+from fake_bedrock import FakeBedrockRuntime, TokenDistribution
+from load_test import compare, goodput, parse_mix, percentile, run_load_test
+
+PHOTO = {"image": {"format": "jpeg", "source": {"bytes": b"\xff\xd8"}}}
+
+def test_fake_bedrock_answers_like_nova():
+    bedrock = FakeBedrockRuntime(first_token_ms=5, ms_per_token=0.1, seed=1,
+                                 tokens={"chat": TokenDistribution(50), "fridge": TokenDistribution(900, 100)})
+    started = time.monotonic()
+    chat = bedrock.converse(modelId="m", messages=[{"role": "user", "content": [{"text": "hi"}]}],
+                            inferenceConfig={"maxTokens": 20})
+    assert chat["usage"]["outputTokens"] == 20 and chat["stopReason"] == "max_tokens"
+    assert time.monotonic() - started >= 0.002
+    fridge = bedrock.converse(modelId="m", messages=[{"role": "user", "content": [{"text": "Analyze"}, PHOTO]}])
+    text = fridge["output"]["message"]["content"][0]["text"]
+    analysis = json.loads(text[text.find("{"):text.rfind("}") + 1])
+    assert analysis["ingredients"] and analysis["recipes"]
+    assert fridge["usage"]["inputTokens"] > 1000
+    assert bedrock.get_stats()["calls"] == {"chat": 1, "fridge": 1}
+
+def test_fake_bedrock_throttles_at_the_error_rate():
+    from botocore.exceptions import ClientError
+    bedrock = FakeBedrockRuntime(first_token_ms=1, ms_per_token=0, error_rate=1.0)
+    try:
+        bedrock.converse(modelId="m", messages=[{"role": "user", "content": [{"text": "hi"}]}])
+        assert False, "expected a throttling error"
+    except ClientError as e:
+        assert e.response["Error"]["Code"] == "ThrottlingException"
+    assert bedrock.get_stats()["errors"] == 1
+
+def test_percentiles_and_mix_parsing():
+    ordered = list(range(1, 101))
+    assert [percentile(ordered, q) for q in (50, 95, 99, 100)] == [50, 95, 99, 100]
+    assert percentile([7.0], 99) == 7.0 and percentile([], 50) is None
+    assert parse_mix("chat=3, history") == {"chat": 3.0, "history": 1.0}
+    for bad in ("lunch=1", "chat=0"):
+        try:
+            parse_mix(bad)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+
+def test_short_run_covers_every_operation():
+    import nova_backend
+    storage = nova_backend.storage
+    bedrock = FakeBedrockRuntime(first_token_ms=2, ms_per_token=0.01, seed=3)
+    report = run_load_test(concurrency=4, duration=1.5, warmup=0.2, users=5, bedrock=bedrock,
+                           supabase_latency_ms=0, timeout=10, seed=3)
+    # The fakes are only swapped in for the run
+    assert nova_backend.storage is storage
+    endpoints = report["endpoints"]
+    assert set(endpoints) == {"chat", "fridge", "get-data", "update-data", "history"}
+    for operation, stats in endpoints.items():
+        assert stats["errors"] == 0, (operation, stats["statuses"])
+        assert stats["p50_ms"] <= stats["p95_ms"] <= stats["p99_ms"] <= stats["max_ms"]
+    # Warm-up calls reach the fake too but are not measured
+    assert report["rps"] > 0 and report["bedrock"]["calls"]["fridge"] >= endpoints["fridge"]["requests"]
+    assert report["config"]["concurrency"] == 4 and report["supabase"]["round_trips"] > 0
+    assert report["goodput"]["model_requests_per_minute"] > 0
+
+def test_compare_flags_slower_or_lower_throughput():
+    baseline = {"endpoints": {"chat": {"p95_ms": 100.0, "rps": 10.0}, "history": {"p95_ms": 20.0, "rps": 50.0}}}
+    report = {"endpoints": {"chat": {"p95_ms": 150.0, "rps": 10.0}, "history": {"p95_ms": 21.0, "rps": 30.0}}}
+    regressions = compare(report, baseline, tolerance=0.25)
+    assert regressions == ["chat: p95 100.0 -> 150.0 ms", "history: throughput 50.00 -> 30.00 req/s"]
+    assert compare(baseline, baseline) == []
+    baseline["goodput"] = {"model_requests_per_minute": 40.0, "model_cost_per_minute": 60.0}
+    report["goodput"] = {"model_requests_per_minute": 44.0, "model_cost_per_minute": 40.0}
+    assert compare(report, baseline)[-1] == "model goodput: 60.0 -> 40.0 cost units/min"
+
+def test_goodput_counts_model_answers_finished_in_the_window():
+    samples = [("chat", 200, 3600.0, True), ("chat", 503, 1.0, True), ("fridge", 200, 17000.0, True),
+               ("fridge", 200, 17000.0, False), ("get-data", 200, 17.0, True)]
+    assert goodput(samples, 30.0, {"chat": 1.0, "fridge": 4.0}.get) == {
+        "model_requests_per_minute": 4.0, "model_cost_per_minute": 10.0}
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
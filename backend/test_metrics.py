@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Tests for the Prometheus metrics registry, /metrics and cross-worker aggregation
+"""
+
+import base64
+import io
+import os
+import tempfile
+import threading
+
+from flask import Flask
+
+from metrics import (Counter, Gauge, Histogram, MetricsSettings, Registry, WorkerFiles, bedrock_call,
+                     configure_metrics, merge, timed_methods)
+
+def make_app(directory=None, token=None):
+    settings = MetricsSettings()
+    settings.directory, settings.token, settings.flush_seconds = directory, token, 60
+    registry = Registry()
+    app = Flask(__name__)
+    metrics = configure_metrics(app, settings, registry)
+
+    @app.route("/items/<item_id>")
+    def item(item_id):
+        return {"in_flight": metrics.in_flight.samples()[0][1]}
+
+    @app.route("/metrics")
+    def scrape():
+        return metrics.response() if metrics.authorized() else ("", 401)
+
+    return app.test_client(), metrics, registry
+
+def sample(text, series):
+    """Value of one series (name plus labels, as rendered) in the exposition text"""
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+def test_exposition_format():
+    registry = Registry()
+    counter = Counter("jobs_total", "Jobs done\nby kind", ["kind"], registry)
+    gauge = Gauge("queue_depth", "Queued jobs", registry=registry)
+    histogram = Histogram("job_seconds", "Job time", ["kind"], registry, buckets=(0.1, 1.0))
+    counter.inc(kind='say "hi"\\')
+    counter.inc(2, kind='say "hi"\\')
+    gauge.set(4)
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, kind="a")
+    text = registry.render(merge([registry.snapshot()]))
+    assert "# HELP jobs_total Jobs done\\nby kind\n# TYPE jobs_total counter\n" in text
+    assert 'jobs_total{kind="say \\"hi\\"\\\\"} 3.0\n' in text
+    assert "queue_depth 4.0\n" in text
+    assert sample(text, 'job_seconds_bucket{kind="a",le="0.1"}') == 2
+    assert sample(text, 'job_seconds_bucket{kind="a",le="1.0"}') == 3
+    assert sample(text, 'job_seconds_bucket{kind="a",le="+Inf"}') == 4
+    assert sample(text, 'job_seconds_count{kind="a"}') == 4 and sample(text, 'job_seconds_sum{kind="a"}') == 3.65
+
+def test_requests_are_counted_and_timed_per_route():
+    client, metrics, registry = make_app()
+    assert client.get("/items/1").json == {"in_flight": 1.0}
+    client.get("/items/2")
+    client.get("/nowhere")
+    text = client.get("/metrics").get_data(as_text=True)
+    assert sample(text, 'chopchop_http_requests_total{route="/items/<item_id>",method="GET",status="200"}') == 2
+    assert sample(text, 'chopchop_http_requests_total{route="unmatched",method="GET",status="404"}') == 1
+    assert sample(text, 'chopchop_http_request_duration_seconds_count{route="/items/<item_id>",method="GET"}') == 2
+    # The scrape itself is in flight
+    assert sample(text, "chopchop_http_requests_in_flight") == 1
+
+def test_updates_from_many_threads_are_not_lost():
+    registry = Registry()
+    counter = Counter("hits_total", "Hits", ["route"], registry)
+    histogram = Histogram("hit_seconds", "Hit time", registry=registry)
+
+    def work():
+        for _ in range(2000):
+            counter.inc(route="/chat")
+            histogram.observe(0.01)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.samples() == [[["/chat"], 16000.0]]
+    assert sum(histogram.samples()[0][1][0]) == 16000
+
+def test_scrape_adds_up_workers_and_keeps_exited_workers_totals():
+    directory = tempfile.mkdtemp()
+    client, metrics, registry = make_app(directory)
+    client.get("/items/1")
+    pid = os.fork()
+    if pid == 0:
+        # A second worker: serves two requests, writes its snapshot and exits mid-request
+        try:
+            client.get("/items/2")
+            client.get("/items/3")
+            metrics.in_flight.inc()
+            metrics.files.write()
+        finally:
+            os._exit(0)
+    os.waitpid(pid, 0)
+    series = 'chopchop_http_requests_total{route="/items/<item_id>",method="GET",status="200"}'
+    text = metrics.render()
+    assert sample(text, series) == 3 and sample(text, "chopchop_http_requests_in_flight") == 1
+    assert metrics.get_stats()["workers"] == 1
+    assert WorkerFiles(directory).mark_process_dead(pid) == 1
+    text = metrics.render()
+    assert sample(text, series) == 3 and sample(text, "chopchop_http_requests_in_flight") == 0
+    assert metrics.get_stats()["workers"] == 0
+
+def test_bedrock_errors_and_method_latency():
+    registry = Registry()
+
+    class ClientError(Exception):
+        response = {"Error": {"Code": "ThrottlingException"}}
+
+    try:
+        with bedrock_call("nova-test"):
+            raise ClientError("slow down")
+    except ClientError:
+        pass
+    with bedrock_call("nova-test"):
+        pass
+    from metrics import REGISTRY
+    text = REGISTRY.render(merge([REGISTRY.snapshot()]))
+    assert sample(text, 'chopchop_bedrock_errors_total{model="nova-test",code="ThrottlingException"}') == 1
+    assert sample(text, 'chopchop_bedrock_call_duration_seconds_count{model="nova-test"}') == 2
+
+    histogram = Histogram("call_seconds", "Call time", ["method"], registry)
+
+    @timed_methods(histogram, ("save",))
+    class Store:
+        def save(self, value):
+            """Save a value"""
+            return value * 2
+
+        def stats(self):
+            return {}
+
+    assert Store().save(21) == 42 and Store.save.__doc__ == "Save a value"
+    Store().stats()
+    assert [labels for labels, _ in histogram.samples()] == [["save"]]
+
+def test_metrics_endpoint_reports_app_metrics():
+    import nova_backend
+    from PIL import Image
+
+    class FakeBedrock:
+        def converse(self, **kwargs):
+            return {"output": {"message": {"content": [{"text": '{"ingredients": [], "recipes": []}'}]}}}
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (1600, 1200), (200, 40, 40)).save(buffer, format="PNG")
+    photo = base64.b64encode(buffer.getvalue()).decode("ascii")
+    original_client = nova_backend.get_bedrock_client
+    nova_backend.get_bedrock_client = lambda: FakeBedrock()
+    try:
+        client = nova_backend.app.test_client()
+        client.post("/auth/signin", json={"email": "metrics@example.com"})
+        response = client.post("/chat", json={"message": "Analyze my fridge", "imageBase64": photo,
+                                               "imageFormat": "png"})
+        assert response.status_code == 200
+    finally:
+        nova_backend.get_bedrock_client = original_client
+    scrape = client.get("/metrics")
+    assert scrape.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+    text = scrape.get_data(as_text=True)
+    assert sample(text, 'chopchop_http_requests_total{route="/chat",method="POST",status="200"}') >= 1
+    assert sample(text, 'chopchop_bedrock_call_duration_seconds_count{model="us.amazon.nova-pro-v1:0"}') >= 1
+    assert sample(text, 'chopchop_image_bytes_sum{direction="in"}') >= len(buffer.getvalue())
+    assert sample(text, 'chopchop_image_bytes_count{direction="out"}') >= 1
+    assert sample(text, 'chopchop_sessions{store="memory"}') >= 1
+
+def test_supabase_manager_times_only_database_methods():
+    from supabase_config import SupabaseManager
+    assert hasattr(SupabaseManager.get_user_data_with_etag, "__wrapped__")
+    assert hasattr(SupabaseManager.patch_user_data, "__wrapped__")
+    for name in ("send_email", "queue_grocery_list_email", "get_http_pool_stats", "configure_read_cache"):
+        assert not hasattr(getattr(SupabaseManager, name), "__wrapped__"), name
+
+def test_without_a_token_only_direct_local_scrapes_are_served():
+    client, metrics, registry = make_app()
+    assert client.get("/metrics").status_code == 200
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "::1"}).status_code == 200
+    assert client.get("/metrics", environ_base={"REMOTE_ADDR": "203.0.113.7"}).status_code == 401
+    assert client.get("/metrics", headers={"X-Forwarded-For": "203.0.113.7"}).status_code == 401
+
+def test_metrics_token_is_required_when_set():
+    client, metrics, registry = make_app(token="scrape-secret")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer wrong"}).status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-secret"}).status_code == 200
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
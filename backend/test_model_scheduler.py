@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Tests for per-user fair-share scheduling of model calls
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from metrics import MODEL_QUEUE_WAIT_SECONDS, MODEL_REJECTIONS
+from model_scheduler import ModelScheduler, ModelRateLimited, SchedulerSettings
+
+def make_scheduler(**overrides):
+    settings = SchedulerSettings()
+    settings.concurrency, settings.max_in_flight_per_user, settings.max_queued_per_user = 1, 1, 2
+    settings.user_rate_per_minute, settings.user_burst = 6000, 100
+    settings.queue_timeout = 5
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    return ModelScheduler(settings)
+
+def wait_for(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.005)
+    assert predicate()
+
+def test_token_bucket_refuses_with_retry_after():
+    scheduler = make_scheduler(user_rate_per_minute=6, user_burst=2)
+    assert scheduler.call("a@example.com", "chat", lambda: "ok") == "ok"
+    assert scheduler.call("a@example.com", "chat", lambda: "ok") == "ok"
+    with pytest.raises(ModelRateLimited) as refused:
+        scheduler.call("a@example.com", "chat", lambda: "ok")
+    assert refused.value.retry_after == 10
+    assert scheduler.call("b@example.com", "chat", lambda: "ok") == "ok"
+    # A fridge analysis costs more than the one token left (capped at the burst of 2)
+    with pytest.raises(ModelRateLimited):
+        scheduler.call("b@example.com", "fridge", lambda: "ok")
+    assert scheduler.get_stats()["rejected_rate"] == 2
+
+def test_light_user_is_not_stuck_behind_a_heavy_one():
+    scheduler = make_scheduler()
+    release = threading.Event()
+    order = []
+
+    def model_call(label):
+        order.append(label)
+        release.wait(5)
+
+    def run(user, label):
+        threading.Thread(target=scheduler.call, args=(user, "chat", model_call, label), daemon=True).start()
+
+    run("heavy@example.com", "heavy-1")
+    wait_for(lambda: order == ["heavy-1"])
+    run("heavy@example.com", "heavy-2")
+    run("heavy@example.com", "heavy-3")
+    wait_for(lambda: scheduler.get_stats()["queued"] == 2)
+    run("light@example.com", "light-1")
+    wait_for(lambda: scheduler.get_stats()["queued"] == 3)
+    release.set()
+    wait_for(lambda: scheduler.get_stats()["completed"] == 4)
+    assert order == ["heavy-1", "light-1", "heavy-2", "heavy-3"]
+    stats = scheduler.get_stats()
+    assert stats["queue_wait_ms"]["max"] > 0 and stats["queue_wait_ms"]["p95"] is not None
+
+def test_queue_cap_and_timeout_refuse_with_429_hints():
+    scheduler = make_scheduler(max_queued_per_user=1, queue_timeout=0.1)
+    release = threading.Event()
+    threading.Thread(target=scheduler.call, args=("a@example.com", "chat", release.wait, 5), daemon=True).start()
+    wait_for(lambda: scheduler.get_stats()["running"] == 1)
+    errors = []
+    queued = threading.Thread(target=lambda: errors.append(pytest.raises(ModelRateLimited, scheduler.call,
+                                                                          "a@example.com", "chat", lambda: None)))
+    queued.start()
+    wait_for(lambda: scheduler.get_stats()["queued"] == 1)
+    with pytest.raises(ModelRateLimited) as refused:
+        scheduler.call("a@example.com", "chat", lambda: None)
+    assert refused.value.retry_after >= 1
+    queued.join(5)
+    release.set()
+    stats = scheduler.get_stats()
+    assert stats["rejected_queue"] == 1 and stats["timed_out"] == 1 and errors
+
+def test_queue_wait_and_refusals_are_exported_as_metrics():
+    MODEL_QUEUE_WAIT_SECONDS.reset()
+    MODEL_REJECTIONS.reset()
+    scheduler = make_scheduler(user_rate_per_minute=6, user_burst=5)
+    scheduler.call("a@example.com", "chat", lambda: None)
+    scheduler.call("a@example.com", "fridge", lambda: None)
+    with pytest.raises(ModelRateLimited):
+        scheduler.call("a@example.com", "chat", lambda: None)
+    # Every call goes through the queue, so a cap of 0 refuses them all
+    with pytest.raises(ModelRateLimited):
+        make_scheduler(max_queued_per_user=0).call("b@example.com", "chat", lambda: None)
+    waits = {tuple(labels): sum(counts) for labels, (counts, _) in MODEL_QUEUE_WAIT_SECONDS.samples()}
+    assert waits == {("chat",): 1, ("fridge",): 1}
+    refusals = {tuple(labels): value for labels, value in MODEL_REJECTIONS.samples()}
+    assert refusals == {("chat", "rate"): 1, ("chat", "queue"): 1}
+
+def test_callers_are_keyed_on_their_session_or_proxy_address():
+    import nova_backend
+    session_id = nova_backend.create_user_session("cook@example.com")
+    app = nova_backend.app
+    forwarded = {"X-Forwarded-For": "1.2.3.4, 203.0.113.9"}
+    with app.test_request_context("/chat", method="POST", headers=forwarded, json={"email": "any@example.com"}):
+        # The client-supplied hop and the body's email are both ignored
+        assert nova_backend.model_caller(None) == "ip:203.0.113.9"
+        assert nova_backend.model_caller("not-a-session") == "ip:203.0.113.9"
+        assert nova_backend.model_caller(session_id) == "cook@example.com"
+    with app.test_request_context("/chat", method="POST", environ_base={"REMOTE_ADDR": "198.51.100.7"}):
+        assert nova_backend.model_caller(None) == "ip:198.51.100.7"
+
+def test_users_relayed_by_the_frontend_proxy_get_separate_buckets():
+    import hashlib
+    import hmac
+    import nova_backend
+
+    class FakeBedrock:
+        def converse(self, **kwargs):
+            return {"output": {"message": {"content": [{"text": "Try an omelette"}]}}}
+
+    def proxy_headers(client, secret="proxy-secret"):
+        # What nova-chat-frontend/src/lib/backendHeaders.ts sends; the load balancer appends the proxy's address
+        return {"Content-Type": "application/json", "X-Forwarded-For": f"{client}, 198.51.100.1",
+                "X-ChopChop-Client": client,
+                "X-ChopChop-Client-Signature": hmac.new(secret.encode(), client.encode(), hashlib.sha256).hexdigest()}
+
+    def chat(client, address, **headers):
+        # The body src/app/api/chat/route.ts relays, without a session_id
+        body = {"message": "What can I cook?", "email": "cook@example.com", "imageBase64": None, "imageFormat": None}
+        return client.post("/chat", json=body, headers=proxy_headers(address, **headers))
+
+    original = nova_backend.model_scheduler, nova_backend.get_bedrock_client, os.environ.get("PROXY_SHARED_SECRET")
+    nova_backend.model_scheduler = make_scheduler(user_rate_per_minute=1, user_burst=1)
+    nova_backend.get_bedrock_client = lambda: FakeBedrock()
+    os.environ["PROXY_SHARED_SECRET"] = "proxy-secret"
+    try:
+        client = nova_backend.app.test_client()
+        assert chat(client, "203.0.113.5").status_code == 200
+        assert chat(client, "203.0.113.5").status_code == 429
+        # Another visitor behind the same proxy still has a bucket of their own
+        assert chat(client, "203.0.113.6").status_code == 200
+        # A forged signature falls back to the address that reached the load balancer
+        assert chat(client, "203.0.113.7", secret="guess").status_code == 200
+        assert chat(client, "203.0.113.8", secret="guess").status_code == 429
+    finally:
+        nova_backend.model_scheduler, nova_backend.get_bedrock_client, secret = original
+        if secret is None:
+            del os.environ["PROXY_SHARED_SECRET"]
+        else:
+            os.environ["PROXY_SHARED_SECRET"] = secret
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Tests for the normalized pantry inventory
+"""
+
+import os
+import tempfile
+
+from pantry import canonical_ingredient_name, pantry_rows, decode_cursor, encode_cursor
+from sqlite_storage import SQLiteStorage
+
+TEST_EMAIL = "pantry@example.com"
+
+def make_storage():
+    return SQLiteStorage(os.path.join(tempfile.mkdtemp(), "pantry.sqlite3"))
+
+def test_canonical_names():
+    assert canonical_ingredient_name("Cherry Tomatoes") == "cherry tomato"
+    assert canonical_ingredient_name(" cherry-tomato ") == "cherry tomato"
+    assert canonical_ingredient_name("Berries") == "berry"
+    assert canonical_ingredient_name("Swiss cheese") == "swiss cheese"
+    assert canonical_ingredient_name("Eggs (dozen)") == "egg dozen"
+
+def test_rows_dedupe_and_normalize():
+    rows = pantry_rows(TEST_EMAIL, [
+        {"name": "Carrots", "quantity": "3", "category": "Vegetables", "freshness": "Needs Use Soon"},
+        {"name": "carrot", "quantity": "5", "category": "vegetables", "freshness": "rotten"},
+        {"name": ""},
+        "not an ingredient"
+    ])
+    assert len(rows) == 1
+    assert rows[0]["quantity"] == "5" and rows[0]["freshness"] == "fresh"
+    assert rows[0]["category"] == "vegetables"
+
+def test_upsert_and_filter():
+    storage = make_storage()
+    assert storage.upsert_pantry_items(TEST_EMAIL, [
+        {"name": "Milk", "quantity": "1 l", "category": "dairy", "freshness": "needs_use_soon"},
+        {"name": "Spinach", "quantity": "1 bag", "category": "vegetables", "freshness": "expired"},
+        {"name": "Butter", "quantity": "200 g", "category": "dairy", "freshness": "fresh"}
+    ]) == 3
+    # A later analysis updates the existing row instead of adding a duplicate
+    assert storage.upsert_pantry_items(TEST_EMAIL, [{"name": "milk", "quantity": "2 l", "freshness": "fresh", "category": "dairy"}]) == 1
+
+    soon = storage.query_pantry(TEST_EMAIL, freshness=["needs_use_soon", "expired"])
+    assert [item["name"] for item in soon["items"]] == ["Spinach"]
+
+    dairy = storage.query_pantry(TEST_EMAIL, category="Dairy")
+    assert sorted(item["name"] for item in dairy["items"]) == ["Butter", "milk"]
+    assert set(dairy["items"][0]) == {"id", "name", "quantity", "category", "freshness", "detected_at"}
+    assert storage.query_pantry("other@example.com")["items"] == []
+
+def test_keyset_pagination_visits_every_item_once():
+    storage = make_storage()
+    storage.upsert_pantry_items(TEST_EMAIL, [{"name": f"Item {i}"} for i in range(7)])
+    storage.upsert_pantry_items(TEST_EMAIL, [{"name": f"Extra {i}"} for i in range(5)])
+    seen, cursor = [], None
+    while True:
+        page = storage.query_pantry(TEST_EMAIL, limit=5, cursor=cursor)
+        seen.extend(item["name"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == 12 and len(set(seen)) == 12
+    # Newest detections come first
+    assert seen[0].startswith("Extra")
+
+def test_malformed_cursor_is_rejected():
+    try:
+        decode_cursor("not-a-cursor")
+    except ValueError:
+        return
+    raise AssertionError("Expected a ValueError")
+
+class RecordingQuery:
+    """Chains any PostgREST builder call, recording the or_() filters it is given"""
+
+    def __init__(self):
+        self.filters = []
+
+    def table(self, _name):
+        return self
+
+    def or_(self, text):
+        self.filters.append(text)
+        return self
+
+    def execute(self):
+        return type("Result", (), {"data": []})()
+
+    def __getattr__(self, _name):
+        return lambda *args, **kwargs: self
+
+def test_supabase_cursor_is_checked_before_it_reaches_the_filter():
+    from supabase_config import SupabaseManager
+    client = RecordingQuery()
+    manager = SupabaseManager(client=client)
+    cursor = encode_cursor("2025-03-01T10:00:00.123456+00:00", 42)
+    assert manager.query_pantry(TEST_EMAIL, cursor=cursor) == {"items": [], "next_cursor": None}
+    assert client.filters == ['detected_at.lt."2025-03-01T10:00:00.123456+00:00",'
+                              'and(detected_at.eq."2025-03-01T10:00:00.123456+00:00",id.lt.42)']
+    for detected_at, row_id in (("2025-03-01T10:00:00+00:00", "1),user_email.neq.x"),
+                                ('2025-03-01",id.gt.0,detected_at.gt."2000-01-01', 1),
+                                ("yesterday", 1)):
+        try:
+            manager.query_pantry(TEST_EMAIL, cursor=encode_cursor(detected_at, row_id))
+        except ValueError:
+            continue
+        raise AssertionError(f"Expected the cursor ({detected_at!r}, {row_id!r}) to be rejected")
+    assert len(client.filters) == 1
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
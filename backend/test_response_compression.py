@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Tests for negotiated response compression
+"""
+
+import gzip
+import json
+import os
+
+from flask import Flask, Response, jsonify
+
+from response_compression import CompressionSettings, configure_compression, ZSTD_AVAILABLE, BROTLI_AVAILABLE
+
+ROWS = [{"item": f"Tomato {i}", "quantity": i, "category": "produce"} for i in range(400)]
+
+def make_app(**overrides):
+    settings = CompressionSettings()
+    settings.encodings = ["gzip"]
+    for name, value in overrides.items():
+        setattr(settings, name, value)
+    app = Flask(__name__)
+
+    @app.route("/rows")
+    def rows():
+        response = jsonify(ROWS)
+        response.set_etag("v1")
+        return response
+
+    @app.route("/small")
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route("/photo")
+    def photo():
+        return Response(os.urandom(4096), mimetype="image/jpeg")
+
+    @app.route("/export")
+    def export():
+        return Response((json.dumps(row) + "\n" for row in ROWS), mimetype="application/x-ndjson")
+
+    compressor = configure_compression(app, settings)
+    return app.test_client(), compressor
+
+def test_large_json_is_gzipped_for_clients_that_accept_it():
+    client, compressor = make_app()
+    response = client.get("/rows", headers={"Accept-Encoding": "br;q=1.0, gzip;q=0.8"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["Vary"]
+    assert int(response.headers["Content-Length"]) == len(response.data)
+    assert json.loads(gzip.decompress(response.data)) == ROWS
+    # The compressed bytes are a different representation, so the ETag is weak
+    assert response.headers["ETag"] == 'W/"v1"'
+    stats = compressor.get_stats()["endpoints"]["/rows"]
+    assert stats["compressed"] == 1 and stats["bytes_out"] == len(response.data) and stats["ratio"] > 5
+
+def test_identity_when_refused_small_or_already_compressed():
+    client, compressor = make_app()
+    for headers in ({}, {"Accept-Encoding": "gzip;q=0, identity"}):
+        response = client.get("/rows", headers=headers)
+        assert "Content-Encoding" not in response.headers and json.loads(response.data) == ROWS
+    small = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in small.headers and small.headers["Vary"] == "Accept-Encoding"
+    photo = client.get("/photo", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in photo.headers and "Vary" not in photo.headers
+    assert compressor.get_stats()["endpoints"]["/small"] == {
+        "responses": 1, "compressed": 0, "bytes_in": len(small.data), "bytes_out": len(small.data), "ratio": 1.0}
+
+def test_large_and_streamed_bodies_are_compressed_in_chunks():
+    client, compressor = make_app(stream_bytes=1024)
+    response = client.get("/rows", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Length" not in response.headers
+    assert json.loads(gzip.decompress(response.data)) == ROWS
+    export = client.get("/export", headers={"Accept-Encoding": "gzip"})
+    lines = gzip.decompress(export.data).decode().splitlines()
+    assert [json.loads(line) for line in lines] == ROWS
+    stats = compressor.get_stats()["endpoints"]["/export"]
+    assert stats["bytes_in"] == sum(len(line) + 1 for line in lines) and stats["bytes_out"] == len(export.data)
+
+def test_unavailable_encodings_are_not_offered():
+    os.environ["RESPONSE_COMPRESSION_ENCODINGS"] = "zstd, br, gzip, deflate"
+    try:
+        encodings = CompressionSettings().encodings
+    finally:
+        del os.environ["RESPONSE_COMPRESSION_ENCODINGS"]
+    assert encodings == [e for e, ok in (("zstd", ZSTD_AVAILABLE), ("br", BROTLI_AVAILABLE), ("gzip", True)) if ok]
+
+def test_conditional_read_of_a_compressed_copy_revalidates():
+    import nova_backend
+    email = "compress@example.com"
+    nova_backend.storage.save_user_data(email, ROWS, [])
+    client = nova_backend.app.test_client()
+    first = client.post("/get-data", json={"email": email}, headers={"Accept-Encoding": "gzip"})
+    assert first.headers["Content-Encoding"] == "gzip"
+    etag = first.headers["ETag"]
+    assert etag.startswith("W/")
+    again = client.post("/get-data", json={"email": email},
+                        headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert again.status_code == 304 and again.headers["ETag"] == etag
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared session stores and their expiry sweeper
+"""
+
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+
+from session_store import MemorySessionStore, SQLiteSessionStore, RedisSessionStore, create_session_store
+
+class FakeRedis:
+    """Just the Redis commands RedisSessionStore uses, with key expiry"""
+
+    def __init__(self):
+        self.values, self.expiry, self.zsets = {}, {}, {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def set(self, key, value, ex=None):
+        self.values[key] = value
+        self.expiry[key] = time.time() + ex if ex else None
+        return True
+
+    def get(self, key):
+        if key in self.expiry and self.expiry[key] is not None and self.expiry[key] <= time.time():
+            self.values.pop(key, None)
+        return self.values.get(key)
+
+    def delete(self, key):
+        return 1 if self.values.pop(key, None) is not None else 0
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, member):
+        return 1 if self.zsets.get(key, {}).pop(member, None) is not None else 0
+
+    def zremrangebyscore(self, key, low, high):
+        zset = self.zsets.get(key, {})
+        doomed = [member for member, score in zset.items() if score <= high]
+        for member in doomed:
+            del zset[member]
+        return len(doomed)
+
+    def zrangebyscore(self, key, low, high, withscores=False):
+        low = float(low.lstrip('('))
+        entries = sorted(((m, s) for m, s in self.zsets.get(key, {}).items() if s > low), key=lambda e: e[1])
+        return entries if withscores else [m for m, _ in entries]
+
+    def zcount(self, key, low, high):
+        low = float(low.lstrip('('))
+        return sum(1 for score in self.zsets.get(key, {}).values() if score > low)
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client, self.calls = client, []
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+def make_stores(ttl=60.0):
+    path = os.path.join(tempfile.mkdtemp(), "sessions.sqlite3")
+    return [MemorySessionStore(ttl=ttl, sweep_interval=0), SQLiteSessionStore(path, ttl=ttl, sweep_interval=0),
+            RedisSessionStore(client=FakeRedis(), ttl=ttl, sweep_interval=0)]
+
+def test_create_get_delete():
+    for store in make_stores():
+        session_id = store.create("cook@example.com")
+        session = store.get(session_id)
+        assert session["email"] == "cook@example.com", store.backend_name
+        assert session["expires_at"] - session["created_at"] == 60.0
+        assert store.get("missing") is None
+        assert store.count() == 1
+        assert store.delete(session_id) and not store.delete(session_id)
+        assert store.get(session_id) is None and store.count() == 0
+
+def test_expired_sessions_are_hidden_then_swept():
+    for store in make_stores(ttl=1.0):
+        old = [store.create(f"user{i}@example.com") for i in range(3)]
+        time.sleep(1.1)
+        fresh = store.create("fresh@example.com")
+        assert all(store.get(session_id) is None for session_id in old), store.backend_name
+        assert store.count() == 1
+        assert store.sweep() == 3
+        assert store.get(fresh)["email"] == "fresh@example.com"
+        stats = store.get_stats()
+        assert stats["sessions"] == 1 and stats["sweeps"] == 1 and stats["swept"] == 3
+
+def test_token_revocations_are_listed_until_they_expire():
+    for store in make_stores():
+        now = time.time()
+        assert store.revoke_token("gone", now + 0.5) and store.revoke_token("kept", now + 60)
+        assert [entry[0] for entry in store.get_revocations(0)] == ["gone", "kept"], store.backend_name
+        assert store.get_revocations(time.time()) == []
+        time.sleep(0.6)
+        store.sweep()
+        assert [entry[0] for entry in store.get_revocations(0)] == ["kept"]
+
+def test_background_sweeper_runs():
+    store = MemorySessionStore(ttl=0.05, sweep_interval=0.05)
+    store.create("cook@example.com")
+    deadline = time.time() + 2
+    while store.get_stats()["swept"] == 0 and time.time() < deadline:
+        time.sleep(0.02)
+    store.close()
+    assert store.get_stats()["swept"] == 1 and not store._sessions
+
+def _create_in_child(path, queue):
+    queue.put(SQLiteSessionStore(path, sweep_interval=0).create("worker@example.com"))
+
+def test_sqlite_sessions_are_shared_across_processes():
+    path = os.path.join(tempfile.mkdtemp(), "sessions.sqlite3")
+    parent = SQLiteSessionStore(path, sweep_interval=0)
+    queue = multiprocessing.Queue()
+    child = multiprocessing.Process(target=_create_in_child, args=(path, queue))
+    child.start()
+    session_id = queue.get(timeout=10)
+    child.join(10)
+    assert parent.get(session_id)["email"] == "worker@example.com"
+
+def test_unusable_sqlite_file_falls_back_instead_of_failing_startup():
+    directory = tempfile.mkdtemp()
+    locked_path = os.path.join(directory, "locked.sqlite3")
+    holder = sqlite3.connect(locked_path, isolation_level=None)
+    holder.execute("BEGIN EXCLUSIVE")
+    original = {name: os.environ.get(name) for name in ("SESSION_SQLITE_PATH", "SQLITE_BUSY_TIMEOUT_MS")}
+    os.environ["SQLITE_BUSY_TIMEOUT_MS"] = "50"
+    try:
+        for path in (os.path.join(directory, "missing", "sessions.sqlite3"), locked_path):
+            store = SQLiteSessionStore(path, sweep_interval=0)
+            assert not store.enabled
+            # Operations keep to the log-and-return contract
+            assert store.create("cook@example.com") is None and store.count() is None
+            os.environ["SESSION_SQLITE_PATH"] = path
+            fallback = create_session_store("sqlite")
+            assert fallback.backend_name == "memory"
+            fallback.sweep_interval = 0
+            assert fallback.get(fallback.create("cook@example.com"))["email"] == "cook@example.com"
+    finally:
+        holder.execute("ROLLBACK")
+        for name, value in original.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Tests for stateless signed session tokens
+
+Run directly for a verification microbenchmark.
+"""
+
+import os
+import tempfile
+import time
+
+import pytest
+
+from session_store import SQLiteSessionStore
+from session_tokens import SessionTokens, parse_keys, is_session_token
+
+KEYS = [("k2", b"new-secret"), ("k1", b"old-secret")]
+
+def test_issued_token_verifies():
+    tokens = SessionTokens(KEYS, ttl=60)
+    token = tokens.issue("cook@example.com")
+    assert is_session_token(token) and token.startswith("k2.")
+    claims = tokens.verify(token)
+    assert claims["email"] == "cook@example.com"
+    assert claims["expires_at"] - claims["issued_at"] == 60
+
+def test_tampered_expired_and_unknown_tokens_are_rejected():
+    tokens = SessionTokens(KEYS, ttl=60)
+    key_id, payload, signature = tokens.issue("cook@example.com").split(".")
+    forged = SessionTokens([("k2", b"guess")]).issue("admin@example.com").split(".")[1]
+    assert tokens.verify(f"{key_id}.{forged}.{signature}") is None
+    assert tokens.verify(f"{key_id}.{payload}.{signature[:-2]}AA") is None
+    assert tokens.verify(f"k9.{payload}.{signature}") is None
+    assert tokens.verify("not-a-token") is None
+    assert SessionTokens(KEYS, ttl=0).verify(SessionTokens(KEYS, ttl=0).issue("cook@example.com")) is None
+    stats = tokens.get_stats()
+    assert stats["bad_signature"] == 2 and stats["unknown_key"] == 1 and stats["malformed"] == 1
+
+def test_key_rotation():
+    old = SessionTokens([("k1", b"old-secret")], ttl=60).issue("cook@example.com")
+    rotated = SessionTokens(KEYS, ttl=60)
+    assert rotated.verify(old)["email"] == "cook@example.com"
+    assert rotated.issue("cook@example.com").startswith("k2.")
+    assert SessionTokens(KEYS[:1], ttl=60).verify(old) is None
+
+def test_signout_revokes_across_workers():
+    store = SQLiteSessionStore(os.path.join(tempfile.mkdtemp(), "sessions.sqlite3"), sweep_interval=0)
+    worker_a = SessionTokens(KEYS, ttl=60, revocation_store=store, sync_interval=0)
+    worker_b = SessionTokens(KEYS, ttl=60, revocation_store=store, sync_interval=0)
+    token = worker_a.issue("cook@example.com")
+    assert worker_b.verify(token)
+    assert worker_a.revoke(token) and not worker_a.revoke(token)
+    assert worker_a.verify(token) is None
+    assert worker_b.sync_revocations() and worker_b.verify(token) is None
+    assert worker_b.get_stats()["revocations"] == 1
+
+def test_key_parsing():
+    assert parse_keys(" k2:abc , k1:def:ghi ") == [("k2", b"abc"), ("k1", b"def:ghi")]
+    assert parse_keys(None) == []
+    for bad in ("nosecret", "k1:a,k1:b", ":secret"):
+        with pytest.raises(ValueError):
+            parse_keys(bad)
+    # Errors point at the entry without quoting any of it
+    with pytest.raises(ValueError) as error:
+        parse_keys("k1:first-secret, :hunter2-secret")
+    assert "#2" in str(error.value) and "hunter" not in str(error.value)
+    with pytest.raises(ValueError) as error:
+        parse_keys("topsecretvalue")
+    assert "topsecret" not in str(error.value)
+
+def test_non_string_and_non_ascii_tokens_are_malformed():
+    tokens = SessionTokens(KEYS, ttl=60)
+    assert not is_session_token(123) and not is_session_token(None) and not is_session_token("k1.b.\u00e9")
+    assert tokens.verify("k2.b.\u00e9") is None and tokens.verify(123) is None
+    assert tokens.get_stats()["malformed"] == 2
+
+def test_auth_routes_answer_401_for_odd_session_ids_in_token_mode():
+    import nova_backend
+    original = nova_backend.session_tokens
+    nova_backend.session_tokens = SessionTokens(KEYS, ttl=60)
+    try:
+        client = nova_backend.app.test_client()
+        for session_id in ("k1.b.\u00e9", 123):
+            assert client.post("/auth/verify", json={"session_id": session_id}).status_code == 401
+            assert client.post("/auth/signout", json={"session_id": session_id}).status_code == 200
+    finally:
+        nova_backend.session_tokens = original
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    tokens = SessionTokens(KEYS, ttl=3600)
+    token = tokens.issue("cook@example.com")
+    rounds = 100000
+    start = time.perf_counter()
+    for _ in range(rounds):
+        tokens.verify(token)
+    print(f"\n⏱️  verify: {(time.perf_counter() - start) / rounds * 1e6:.2f} µs/token")
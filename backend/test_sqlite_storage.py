@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Tests for the embedded SQLite storage backend
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+from json_patch import JsonPatchError
+from sqlite_storage import SELECT_USER_LISTS, SQLiteStorage
+from storage_backend import VersionConflictError
+
+TEST_EMAIL = "sqlite@example.com"
+
+def make_storage():
+    directory = tempfile.mkdtemp()
+    return SQLiteStorage(os.path.join(directory, "test.sqlite3"))
+
+def test_save_get_and_update_user_data():
+    storage = make_storage()
+    assert storage.get_user_data(TEST_EMAIL) is None
+    record_id = storage.save_user_data(TEST_EMAIL, [{"item": "Milk"}], [{"name": "Pancakes"}])
+    assert record_id
+    # Saving again upserts the same row
+    assert storage.save_user_data(TEST_EMAIL, [{"item": "Eggs"}], []) == record_id
+    data = storage.get_user_data(TEST_EMAIL)
+    assert data["items"] == [{"item": "Eggs"}] and data["version"] == 1
+    assert storage.update_user_data(TEST_EMAIL, [], [])
+    assert not storage.update_user_data("missing@example.com", [], [])
+
+def test_patch_is_versioned():
+    storage = make_storage()
+    storage.save_user_data(TEST_EMAIL, [{"item": "Milk", "checked": False}], [])
+    version = storage.get_user_data(TEST_EMAIL)["version"]
+    new_version = storage.patch_user_data(
+        TEST_EMAIL, [{"op": "replace", "path": "/items/0/checked", "value": True}], version)
+    assert new_version == version + 1
+    assert storage.get_user_data(TEST_EMAIL)["items"][0]["checked"] is True
+    try:
+        storage.patch_user_data(TEST_EMAIL, [{"op": "remove", "path": "/items/0"}], version)
+    except VersionConflictError as e:
+        assert e.current_version == new_version
+    else:
+        raise AssertionError("Expected a version conflict")
+    try:
+        storage.patch_user_data(TEST_EMAIL, [{"op": "remove", "path": "/items/5"}])
+    except JsonPatchError:
+        pass
+    else:
+        raise AssertionError("Expected an invalid patch")
+    assert len(storage.get_user_data(TEST_EMAIL)["items"]) == 1
+
+def test_chat_history_is_capped_and_ordered():
+    storage = make_storage()
+    for i in range(105):
+        assert storage.save_chat_message(TEST_EMAIL, f"message {i}", "user")
+    history = storage.get_chat_history(TEST_EMAIL)
+    assert len(history) == 100
+    assert history[0]["message"] == "message 5" and history[-1]["message"] == "message 104"
+    assert [m["message"] for m in storage.get_chat_history(TEST_EMAIL, limit=2)] == ["message 103", "message 104"]
+
+def test_recent_recipes_dedupe_and_cap():
+    storage = make_storage()
+    for i in range(12):
+        assert storage.add_recent_recipe(TEST_EMAIL, {"name": f"Recipe {i}"})
+    assert storage.add_recent_recipe(TEST_EMAIL, {"name": "recipe 5"})
+    names = [r["name"] for r in storage.get_recent_recipes(TEST_EMAIL)]
+    assert len(names) == 10
+    assert names[0] == "recipe 5" and names.count("Recipe 5") == 0
+
+def test_user_lists_skip_empty_users_through_the_json_index():
+    storage = make_storage()
+    storage.save_user_data("a@example.com", [{"item": "Milk"}], [])
+    storage.save_user_data("b@example.com", [], [])
+    storage.save_user_data("c@example.com", [], [{"name": "Soup"}])
+    assert [row["email"] for row in storage.list_user_lists(None, 10)] == ["a@example.com", "c@example.com"]
+    assert [row["email"] for row in storage.list_user_lists("a@example.com", 10)] == ["c@example.com"]
+    # Emptying a list takes the user out of the index
+    storage.update_user_data("a@example.com", [], [])
+    assert [row["email"] for row in storage.list_user_lists(None, 10)] == ["c@example.com"]
+    plan = storage._connection().execute(f"EXPLAIN QUERY PLAN {SELECT_USER_LISTS}", ("", 10)).fetchall()
+    assert any("idx_users_with_lists" in row[-1] for row in plan)
+
+def test_concurrent_writers():
+    storage = make_storage()
+    storage.save_user_data(TEST_EMAIL, [], [])
+
+    def append(n):
+        for i in range(20):
+            while True:
+                try:
+                    storage.patch_user_data(TEST_EMAIL, [{"op": "add", "path": "/items/-", "value": {"item": f"{n}-{i}"}}])
+                    break
+                except VersionConflictError:
+                    continue
+
+    threads = [threading.Thread(target=append, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(storage.get_user_data(TEST_EMAIL)["items"]) == 80
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
+    storage = make_storage()
+    storage.save_user_data(TEST_EMAIL, [{"item": "Milk"}], [])
+    start = time.perf_counter()
+    for _ in range(1000):
+        storage.get_user_data(TEST_EMAIL)
+    print(f"\n⏱️  get_user_data: {(time.perf_counter() - start) * 1000:.3f} µs/op")
+    start = time.perf_counter()
+    for i in range(1000):
+        storage.save_chat_message(TEST_EMAIL, f"message {i}", "user")
+    print(f"⏱️  save_chat_message: {(time.perf_counter() - start) * 1000:.3f} µs/op")
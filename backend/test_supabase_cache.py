@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for SupabaseManager's per-user read cache and the ETags it serves
+
+Runs against the in-memory stand-in from fake_supabase.
+"""
+
+import multiprocessing
+import time
+from multiprocessing.managers import BaseManager
+
+from fake_supabase import FakeSupabaseClient
+from supabase_config import SupabaseManager
+
+TEST_EMAIL = "cache@example.com"
+ITEMS = [{"item": "Milk", "category": "dairy", "priority": "high", "checked": False}]
+
+def make_manager(ttl=60.0):
+    client = FakeSupabaseClient()
+    manager = SupabaseManager(client=client)
+    # Other test modules turn the cache off through the environment
+    manager.read_cache_ttl = ttl
+    manager.save_user_data(TEST_EMAIL, ITEMS, [{"name": "Toast", "instructions": ["Toast it"]}])
+    return client, manager
+
+def test_repeated_reads_are_served_from_the_cache():
+    client, manager = make_manager()
+    client.reset_counters()
+    first, etag = manager.get_user_data_with_etag(TEST_EMAIL)
+    assert client.round_trips == 1 and first["items"] == ITEMS
+    full_read = client.bytes_fetched
+    # A hit only reads the row's id and data_version to check the entry is current
+    second, again = manager.get_user_data_with_etag(TEST_EMAIL)
+    assert client.round_trips == 2 and second == first and again == etag
+    assert client.bytes_fetched - full_read < full_read
+
+def test_callers_cannot_change_the_cached_value():
+    client, manager = make_manager()
+    data, etag = manager.get_user_data_with_etag(TEST_EMAIL)
+    data["items"].append({"item": "Changed by the caller"})
+    data["recipes"] = []
+    cached, cached_etag = manager.get_user_data_with_etag(TEST_EMAIL)
+    assert cached["items"] == ITEMS and len(cached["recipes"]) == 1
+    assert cached_etag == etag == manager.compute_etag(cached)
+    cached["items"].clear()
+    assert manager.get_user_data_with_etag(TEST_EMAIL)[0]["items"] == ITEMS
+
+def test_writes_invalidate_the_cache():
+    client, manager = make_manager()
+    _, etag = manager.get_user_data_with_etag(TEST_EMAIL)
+    assert manager.update_user_data(TEST_EMAIL, ITEMS + [{"item": "Eggs"}], [])
+    client.reset_counters()
+    data, new_etag = manager.get_user_data_with_etag(TEST_EMAIL)
+    assert client.round_trips == 1 and len(data["items"]) == 2 and new_etag != etag
+
+def test_entries_expire_after_the_ttl():
+    client, manager = make_manager(ttl=0.05)
+    manager.get_user_data_with_etag(TEST_EMAIL)
+    # A write made behind the manager's back, like one from another worker
+    client.tables["Users"][0]["items"] = []
+    assert manager.get_user_data_with_etag(TEST_EMAIL)[0]["items"] == ITEMS
+    time.sleep(0.06)
+    client.reset_counters()
+    assert manager.get_user_data_with_etag(TEST_EMAIL)[0]["items"] == []
+    assert client.round_trips == 1
+
+def test_get_data_answers_304_to_a_matching_etag():
+    import nova_backend
+    client, manager = make_manager()
+    original = nova_backend.storage
+    nova_backend.storage = manager
+    try:
+        app = nova_backend.app.test_client()
+        first = app.post("/get-data", json={"email": TEST_EMAIL})
+        etag = first.headers["ETag"].strip('"')
+        assert first.status_code == 200 and first.json["data"]["items"] == ITEMS
+        client.reset_counters()
+        again = app.post("/get-data", json={"email": TEST_EMAIL}, headers={"If-None-Match": f'"{etag}"'})
+        assert again.status_code == 304 and not again.data and client.round_trips == 1
+        stale = app.post("/get-data", json={"email": TEST_EMAIL}, headers={"If-None-Match": '"other"'})
+        assert stale.status_code == 200 and stale.headers["ETag"].strip('"') == etag
+    finally:
+        nova_backend.storage = original
+
+class SharedDatabase(BaseManager):
+    """Serves one FakeSupabaseClient to several processes, as Supabase serves every gunicorn worker"""
+
+_shared_client = None
+
+def shared_client():
+    """The database, created in the manager's server process on first use"""
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = FakeSupabaseClient()
+    return _shared_client
+
+QUERY_METHODS = ("select", "insert", "update", "upsert", "eq", "gt", "in_", "order", "limit")
+SharedDatabase.register("Client", shared_client, exposed=("table",), method_to_typeid={"table": "Query"})
+SharedDatabase.register("Query", exposed=QUERY_METHODS + ("execute",),
+                        method_to_typeid={method: "Query" for method in QUERY_METHODS})
+
+def write_from_another_worker(address, items):
+    database = SharedDatabase(address)
+    database.connect()
+    manager = SupabaseManager(client=database.Client())
+    assert manager.update_user_data(TEST_EMAIL, items, [])
+    assert manager.save_chat_message(TEST_EMAIL, "Written by the other worker", "user")
+
+def test_writes_from_another_worker_are_seen_at_once(monkeypatch):
+    monkeypatch.setenv("GUNICORN_WORKERS", "2")
+    monkeypatch.setenv("SUPABASE_READ_CACHE_TTL", "60")
+    monkeypatch.delenv("SUPABASE_CHAT_CACHE_TTL", raising=False)
+    context = multiprocessing.get_context("spawn")
+    with SharedDatabase(ctx=context) as database:
+        manager = SupabaseManager(client=database.Client())
+        assert manager.unversioned_cache_ttl == 0 and manager.read_cache_ttl == 60
+        manager.save_user_data(TEST_EMAIL, ITEMS, [])
+        data, etag = manager.get_user_data_with_etag(TEST_EMAIL)
+        history, _ = manager.get_chat_history_with_etag(TEST_EMAIL)
+        assert data["items"] == ITEMS and history == []
+        worker = context.Process(target=write_from_another_worker, args=(database.address, ITEMS * 2))
+        worker.start()
+        worker.join(30)
+        assert worker.exitcode == 0
+        # Well within the TTL, the other worker's writes are served with new ETags
+        data, new_etag = manager.get_user_data_with_etag(TEST_EMAIL)
+        assert data["items"] == ITEMS * 2 and new_etag != etag
+        history, _ = manager.get_chat_history_with_etag(TEST_EMAIL)
+        assert [message["message"] for message in history] == ["Written by the other worker"]
+
+def test_a_lone_worker_caches_chat_history_for_the_ttl(monkeypatch):
+    monkeypatch.setenv("GUNICORN_WORKERS", "1")
+    monkeypatch.setenv("SUPABASE_READ_CACHE_TTL", "60")
+    monkeypatch.delenv("SUPABASE_CHAT_CACHE_TTL", raising=False)
+    client, manager = make_manager()
+    manager.configure_read_cache()
+    assert manager.unversioned_cache_ttl == 60
+    manager.save_chat_message(TEST_EMAIL, "Hello", "user")
+    client.reset_counters()
+    assert len(manager.get_chat_history_with_etag(TEST_EMAIL)[0]) == 1
+    assert len(manager.get_chat_history_with_etag(TEST_EMAIL)[0]) == 1
+    assert client.round_trips == 1
+    monkeypatch.setenv("SUPABASE_CHAT_CACHE_TTL", "0")
+    manager.configure_read_cache()
+    assert manager.unversioned_cache_ttl == 0
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
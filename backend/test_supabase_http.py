@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Tests for the pooled Supabase HTTP layer: pool sizing, per-call timeouts,
+protocol stats and rebuilding the client after fork
+
+Runs against a local HTTP server, so no Supabase project is needed.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from supabase_config import SupabaseManager
+from supabase_http import HttpPoolSettings, call_timeout, create_http_client, get_pool_stats, negotiated_http2
+
+class SlowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(0.3)
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def with_env(values, build):
+    original = {name: os.environ.get(name) for name in values}
+    os.environ.update(values)
+    try:
+        return build()
+    finally:
+        for name, value in original.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+def test_pool_is_sized_to_the_gunicorn_threads():
+    settings = with_env({"GUNICORN_THREADS": "12"}, HttpPoolSettings)
+    assert settings.max_connections == 12 and settings.max_keepalive_connections == 12
+    # Never fewer than four connections, and an explicit size wins
+    assert with_env({"GUNICORN_THREADS": "1"}, HttpPoolSettings).max_connections == 4
+    explicit = with_env({"GUNICORN_THREADS": "12", "SUPABASE_HTTP_MAX_CONNECTIONS": "3"}, HttpPoolSettings)
+    assert explicit.max_connections == 3
+    limits = settings.limits()
+    assert limits.max_connections == 12 and limits.keepalive_expiry == settings.keepalive_expiry
+    timeout = settings.timeout()
+    assert (timeout.connect, timeout.read, timeout.pool) == (5.0, 15.0, 5.0)
+
+def test_call_timeout_overrides_the_read_timeout_for_the_block():
+    server, url = start_server()
+    client = create_http_client(HttpPoolSettings())
+    try:
+        assert client.get(f"{url}/slow").text == "ok"
+        started = time.perf_counter()
+        with call_timeout(0.05):
+            try:
+                client.get(f"{url}/slow")
+                assert False, "expected a read timeout"
+            except httpx.ReadTimeout:
+                pass
+        assert time.perf_counter() - started < 0.25
+        # The override ends with the block
+        assert client.get(f"{url}/slow").status_code == 200
+        stats = get_pool_stats(client)
+        assert stats["requests_total"] == 3 and stats["errors_total"] == 1 and stats["in_flight"] == 0
+    finally:
+        client.close()
+        server.shutdown()
+
+def test_protocol_stats_come_from_the_negotiated_version():
+    server, url = start_server()
+    client = create_http_client(HttpPoolSettings())
+    try:
+        for _ in range(3):
+            assert client.get(f"{url}/").extensions["http_version"] == b"HTTP/1.1"
+        stats = get_pool_stats(client)
+        assert stats["responses_by_version"] == {"HTTP/1.1": 3}
+        assert stats["connections_open"] == 1 and stats["connections_http2"] == 0
+    finally:
+        client.close()
+        server.shutdown()
+
+    class Connection:
+        def __init__(self, info):
+            self.info = lambda: info
+
+    assert negotiated_http2(Connection("https://db.example.supabase.co:443, HTTP/2, IDLE, Stream count: 0"))
+    assert not negotiated_http2(Connection("CONNECTING"))
+
+class PooledManager(SupabaseManager):
+    """SupabaseManager whose client is just the pooled HTTP client, so supabase-py is not needed"""
+
+    def _create_client(self):
+        self._http_client = create_http_client(self.http_settings)
+        return self._http_client
+
+def _report_client_in_child(manager, queue):
+    client = manager.supabase
+    queue.put((manager._client_pid == os.getpid(), get_pool_stats(client)["requests_total"]))
+
+def test_client_is_rebuilt_after_fork():
+    server, url = start_server()
+    manager = PooledManager()
+    manager.enabled, manager._owns_client = True, True
+    try:
+        parent_client = manager.supabase
+        assert manager.supabase is parent_client
+        parent_client.get(f"{url}/")
+        queue = multiprocessing.get_context("fork").Queue()
+        child = multiprocessing.get_context("fork").Process(target=_report_client_in_child, args=(manager, queue))
+        child.start()
+        rebuilt, child_requests = queue.get(timeout=10)
+        child.join(10)
+        # The child built a fresh pool; the parent keeps its own
+        assert rebuilt and child_requests == 0
+        assert manager.supabase is parent_client and get_pool_stats(parent_client)["requests_total"] == 1
+    finally:
+        manager._http_client.close()
+        server.shutdown()
+
+if __name__ == "__main__":
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
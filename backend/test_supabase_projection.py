@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Counts the bytes each SupabaseManager method fetches from the Users table
+
+Runs against the in-memory stand-in from fake_supabase, so no Supabase
+project is needed. A user with a large chat history (embedded base64
+images) must not make grocery-list reads or chat writes pull that history.
+"""
+
+import base64
+import os
+
+os.environ['SUPABASE_READ_CACHE_TTL'] = '0'  # every call must reach the database
+
+from fake_supabase import FakeSupabaseClient
+from supabase_config import SupabaseManager
+
+TEST_EMAIL = "projection@example.com"
+
+def make_manager():
+    client = FakeSupabaseClient()
+    manager = SupabaseManager(client=client)
+    image = base64.b64encode(os.urandom(30000)).decode('ascii')
+    manager.save_user_data(
+        TEST_EMAIL,
+        [{"item": f"Item {i}", "category": "test", "priority": "low", "checked": False} for i in range(20)],
+        [{"name": "Test Recipe", "instructions": ["Step 1: Test"]}]
+    )
+    client.tables['Users'][0]['chat_history'] = [
+        {"message": f"message {i}", "sender": "user", "image_data": image if i % 5 == 0 else None}
+        for i in range(40)
+    ]
+    return client, manager
+
+def measure(client, call):
+    client.reset_counters()
+    call()
+    return client.bytes_fetched
+
+def report_bytes_per_method():
+    client, manager = make_manager()
+    history_bytes = measure(client, lambda: manager.get_chat_history(TEST_EMAIL))
+    return history_bytes, {
+        "save_user_data": measure(client, lambda: manager.save_user_data(TEST_EMAIL, [], [])),
+        "get_user_data": measure(client, lambda: manager.get_user_data(TEST_EMAIL)),
+        "update_user_data": measure(client, lambda: manager.update_user_data(TEST_EMAIL, [], [])),
+        "patch_user_data": measure(client, lambda: manager.patch_user_data(
+            TEST_EMAIL, [{"op": "add", "path": "/items/-", "value": {"item": "Milk"}}])),
+        "get_chat_history(limit=3)": measure(client, lambda: manager.get_chat_history(TEST_EMAIL, limit=3)),
+        "get_chat_history": history_bytes,
+    }
+
+def test_reads_do_not_fetch_chat_history():
+    history_bytes, fetched = report_bytes_per_method()
+    for method in ("save_user_data", "get_user_data", "update_user_data", "patch_user_data"):
+        assert fetched[method] < 4096, f"{method} fetched {fetched[method]} bytes"
+    assert fetched["get_chat_history(limit=3)"] < history_bytes / 5
+
+def test_save_chat_message_only_fetches_history():
+    client, manager = make_manager()
+    client.reset_counters()
+    assert manager.save_chat_message(TEST_EMAIL, "hello", "user")
+    history = client.tables['Users'][0]['chat_history']
+    # One read of the history plus a write that returns only the id
+    assert client.round_trips == 2
+    assert client.bytes_fetched < len(str(history)) * 1.1
+
+def test_recent_messages_are_extracted_in_order():
+    _, manager = make_manager()
+    recent = manager.get_chat_history(TEST_EMAIL, limit=3)
+    assert [m["message"] for m in recent] == ["message 37", "message 38", "message 39"]
+    assert manager.get_chat_history(TEST_EMAIL, limit=100)[0]["message"] == "message 0"
+
+def test_save_user_data_is_one_upsert_on_email():
+    client = FakeSupabaseClient()
+    manager = SupabaseManager(client=client)
+    queries = []
+    table = client.table
+
+    def recording_table(name):
+        queries.append(table(name))
+        return queries[-1]
+
+    client.table = recording_table
+    items = [{"item": "Milk", "checked": False}]
+    recipes = [{"name": "Pancakes"}]
+    record_id = manager.save_user_data(TEST_EMAIL, items, recipes)
+    assert record_id and client.round_trips == 1
+    query = queries[0]
+    assert (query.table_name, query.method, query.on_conflict, query.columns) == ("Users", "upsert", "email", "id")
+    assert query.payload == {"email": TEST_EMAIL, "items": items, "recipes": recipes}
+    # Only the id comes back
+    assert client.bytes_fetched < 100
+    # Saving again updates the same row in one more round trip
+    assert manager.save_user_data(TEST_EMAIL, [], recipes) == record_id
+    assert client.round_trips == 2 and len(client.tables["Users"]) == 1
+    assert client.tables["Users"][0]["items"] == [] and client.tables["Users"][0]["email"] == TEST_EMAIL
+
+def test_get_user_data_shape():
+    _, manager = make_manager()
+    data = manager.get_user_data(TEST_EMAIL)
+    assert set(data) == {"id", "items", "recipes", "version"}
+    assert len(data["items"]) == 20
+
+if __name__ == "__main__":
+    print("📦 Bytes fetched per SupabaseManager method")
+    print("=" * 50)
+    _, fetched = report_bytes_per_method()
+    for method, size in fetched.items():
+        print(f"   {method:<28} {size:>10,} bytes")
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
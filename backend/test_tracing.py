@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Tests for per-stage request tracing, Server-Timing and the OTLP/JSON exporter
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from flask import Flask
+
+from tracing import TraceExporter, TraceSettings, configure_tracing, parse_traceparent, span
+
+PARENT = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+def make_app(sample_rate=1.0, trust_parent=False):
+    settings = TraceSettings()
+    settings.sample_rate, settings.trust_parent, settings.server_timing = sample_rate, trust_parent, True
+    path = os.path.join(tempfile.mkdtemp(), "traces.jsonl")
+    exporter = TraceExporter(path)
+    app = Flask(__name__)
+    tracer = configure_tracing(app, settings, exporter)
+
+    @app.route("/work")
+    def work():
+        with span("decode", size=3):
+            with span("inner"):
+                time.sleep(0.002)
+        with span("save"):
+            pass
+        return {"ok": True}
+
+    @app.route("/fail")
+    def fail():
+        with span("bedrock"):
+            raise ValueError("throttled")
+
+    return app.test_client(), tracer, path
+
+def read_traces(tracer, path):
+    assert tracer.exporter.flush()
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+def test_sampled_requests_report_stages_in_server_timing():
+    client, tracer, path = make_app()
+    response = client.get("/work")
+    timing = response.headers["Server-Timing"]
+    names = [entry.split(";")[0] for entry in timing.split(", ")]
+    assert names == ["decode", "inner", "save", "total"]
+    assert float(timing.split("inner;dur=")[1].split(",")[0]) >= 2.0
+    assert len(response.headers["X-Trace-Id"]) == 32
+
+def test_traces_are_exported_as_otlp_json():
+    client, tracer, path = make_app()
+    trace_id = client.get("/work").headers["X-Trace-Id"]
+    [record] = read_traces(tracer, path)
+    spans = {s["name"]: s for s in record["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    root = spans["GET /work"]
+    assert root["kind"] == 2 and "parentSpanId" not in root and root["traceId"] == trace_id
+    assert spans["decode"]["parentSpanId"] == root["spanId"]
+    assert spans["inner"]["parentSpanId"] == spans["decode"]["spanId"]
+    assert {"key": "size", "value": {"intValue": "3"}} in spans["decode"]["attributes"]
+    assert int(root["endTimeUnixNano"]) >= int(spans["inner"]["endTimeUnixNano"])
+
+def test_failed_stages_are_marked_as_errors():
+    client, tracer, path = make_app()
+    client.application.config["PROPAGATE_EXCEPTIONS"] = False
+    assert client.get("/fail").status_code == 500
+    spans = {s["name"]: s for s in read_traces(tracer, path)[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]}
+    assert spans["bedrock"]["status"]["code"] == 2 and spans["GET /fail"]["status"]["code"] == 2
+
+def test_sampling_follows_rate_and_trusted_traceparent():
+    client, tracer, path = make_app(sample_rate=0.0, trust_parent=True)
+    assert "Server-Timing" not in client.get("/work").headers
+    joined = client.get("/work", headers={"traceparent": PARENT})
+    assert joined.headers["X-Trace-Id"] == "4bf92f3577b34da6a3ce929d0e0e4736"
+    root = [s for s in read_traces(tracer, path)[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            if s["name"] == "GET /work"][0]
+    assert root["parentSpanId"] == "00f067aa0ba902b7"
+    client, tracer, path = make_app(sample_rate=1.0, trust_parent=True)
+    assert "Server-Timing" not in client.get("/work", headers={"traceparent": PARENT[:-2] + "00"}).headers
+    assert tracer.get_stats()["requests"] == 1 and tracer.get_stats()["sampled"] == 0
+
+def test_untrusted_traceparent_cannot_force_sampling():
+    client, tracer, path = make_app(sample_rate=0.0)
+    for _ in range(5):
+        assert "Server-Timing" not in client.get("/work", headers={"traceparent": PARENT}).headers
+    assert tracer.get_stats()["sampled"] == 0
+    # Sampled locally, the request still joins the caller's trace
+    client, tracer, path = make_app(sample_rate=1.0)
+    joined = client.get("/work", headers={"traceparent": PARENT[:-2] + "00"})
+    assert joined.headers["X-Trace-Id"] == "4bf92f3577b34da6a3ce929d0e0e4736"
+    root = [s for s in read_traces(tracer, path)[0]["resourceSpans"][0]["scopeSpans"][0]["spans"]
+            if s["name"] == "GET /work"][0]
+    assert root["parentSpanId"] == "00f067aa0ba902b7"
+
+def test_traceparent_parsing_rejects_invalid_headers():
+    assert parse_traceparent(PARENT) == ("4bf92f3577b34da6a3ce929d0e0e4736", "00f067aa0ba902b7", True)
+    for header in (None, "", "00-xyz-00f067aa0ba902b7-01", "ff" + PARENT[2:], "00-" + "0" * 32 + "-00f067aa0ba902b7-01"):
+        assert parse_traceparent(header) is None
+
+def test_spans_outside_a_sampled_request_are_no_ops():
+    client, tracer, path = make_app()
+    client.get("/work")
+    with span("background") as s:
+        s.set_attribute("ignored", True)
+
+def test_headers_and_export_are_off_by_default():
+    settings = TraceSettings()
+    assert not settings.server_timing and settings.exporter == "none"
+    settings.sample_rate = 1.0
+    app = Flask(__name__)
+    tracer = configure_tracing(app, settings)
+    app.route("/work")(lambda: {"ok": True})
+    response = app.test_client().get("/work")
+    assert "Server-Timing" not in response.headers and "X-Trace-Id" not in response.headers
+    assert tracer.exporter is None and tracer.get_stats()["sampled"] == 1
+
+def test_chat_stages_are_traced():
+    import nova_backend
+
+    class FakeBedrock:
+        def converse(self, **kwargs):
+            time.sleep(0.005)
+            return {"output": {"message": {"content": [{"text": "Try a frittata"}]}}}
+
+    original_client, original_exporter = nova_backend.get_bedrock_client, nova_backend.tracer.exporter
+    settings = nova_backend.tracer.settings
+    original_rate, original_timing = settings.sample_rate, settings.server_timing
+    nova_backend.get_bedrock_client = lambda: FakeBedrock()
+    nova_backend.tracer.exporter, settings.sample_rate, settings.server_timing = None, 1.0, True
+    try:
+        response = nova_backend.app.test_client().post("/chat", json={"message": "eggs?", "email": "trace@example.com"})
+        assert response.status_code == 200
+        names = [entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")]
+        assert names == ["model", "bedrock", "save_user_message", "save_model_message", "total"]
+    finally:
+        nova_backend.get_bedrock_client, nova_backend.tracer.exporter = original_client, original_exporter
+        settings.sample_rate, settings.server_timing = original_rate, original_timing
+
+if __name__ == "__main__":
+    import conftest  # noqa: F401  (pytest loads it automatically)
+    for name, test in list(globals().items()):
+        if name.startswith("test_") and callable(test):
+            test()
+            print(f"✅ {name}")
@@ -0,0 +1,360 @@
+"""
+Lightweight per-stage request tracing
+
+configure_tracing(app) starts a trace for a sampled request, and code
+marks its stages with
+
+    with span('bedrock', model=model_id):
+        response = client.converse(...)
+
+Spans nest (the current span lives in a context variable) and cost a
+context-variable lookup when the request is not sampled. When a sampled
+request finishes, its spans can be
+
+- sent back in a Server-Timing header (`bedrock;dur=2401.3, ...`, shown
+  in the browser's network panel), with the trace id in X-Trace-Id
+- exported as one OTLP/JSON line ({"resourceSpans": [...]}, the format
+  the OpenTelemetry Collector's file exporter writes and its otlpjsonfile
+  receiver reads) to a file or stdout, from a background thread
+
+Sampling: requests are sampled with probability TRACE_SAMPLE_RATE
+(default 0.01). A sampled request carrying a W3C traceparent header
+joins the caller's trace. The caller's sampled flag is followed only
+with TRACE_TRUST_PARENT=true (for callers behind the same proxy);
+otherwise any client could force every request to be traced.
+Both are opt-in. TRACE_EXPORTER is `none` (default), `file` (TRACE_FILE)
+or `stdout`, which interleaves traces with the app log and so suits only
+a collector reading the process output. TRACE_SERVER_TIMING=true adds the
+response headers; they show any client the timing of internal stages, so
+enable it only where the callers are trusted.
+"""
+import os
+import sys
+import time
+import json
+import queue
+import random
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import Flask, Response, g, request
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = 'chopchop-backend'
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+# OTLP status codes
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+class TraceSettings:
+    """Tracing configuration, read from environment variables"""
+
+    def __init__(self):
+        self.sample_rate = _env_float('TRACE_SAMPLE_RATE', 0.01)
+        self.trust_parent = os.getenv('TRACE_TRUST_PARENT', 'false').lower() == 'true'
+        self.exporter = os.getenv('TRACE_EXPORTER', 'none').lower()
+        self.file = os.getenv('TRACE_FILE', 'traces.jsonl')
+        self.server_timing = os.getenv('TRACE_SERVER_TIMING', 'false').lower() == 'true'
+        self.queue_size = _env_int('TRACE_QUEUE_SIZE', 1000)
+
+
+class Trace:
+    __slots__ = ('trace_id', 'spans')
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List['Span'] = []
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns', 'attributes', 'status',
+                 '_started')
+
+    def __init__(self, trace: Trace, name: str, parent_id: Optional[str] = None, kind: int = SPAN_KIND_INTERNAL,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = attributes or {}
+        self.status = STATUS_UNSET
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._started = time.perf_counter_ns()
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def end(self):
+        # Durations come from the monotonic clock; start_ns only anchors them
+        self.end_ns = self.start_ns + time.perf_counter_ns() - self._started
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or self.start_ns) - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Stands in for a span on unsampled requests"""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar('trace_span', default=None)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Time the block as a child of the current span; a no-op outside a sampled request"""
+    parent = _current_span.get()
+    if parent is None:
+        yield _NOOP_SPAN
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes=attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.status = STATUS_ERROR
+        child.attributes.setdefault('exception.type', type(e).__name__)
+        raise
+    finally:
+        child.end()
+        _current_span.reset(token)
+        parent.trace.spans.append(child)
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header, or None if absent or invalid"""
+    if not header:
+        return None
+    parts = header.strip().split('-')
+    if len(parts) < 4 or len(parts[0]) != 2 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    version, trace_id, span_id, flags = parts[:4]
+    try:
+        int(trace_id, 16), int(span_id, 16)
+        sampled = bool(int(flags, 16) & 1)
+    except ValueError:
+        return None
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return trace_id.lower(), span_id.lower(), sampled
+
+
+def server_timing(root: Span) -> str:
+    """Server-Timing header value: each stage, then the whole request as `total`"""
+    entries = [f"{s.name};dur={s.duration_ms:.1f}" for s in sorted(root.trace.spans, key=lambda s: s.start_ns)
+               if s is not root]
+    entries.append(f"total;dur={root.duration_ms:.1f}")
+    return ', '.join(entries)
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """OTLP/JSON ExportTraceServiceRequest for one trace"""
+    spans = []
+    for s in trace.spans:
+        record = {
+            'traceId': trace.trace_id,
+            'spanId': s.span_id,
+            'name': s.name,
+            'kind': s.kind,
+            'startTimeUnixNano': str(s.start_ns),
+            'endTimeUnixNano': str(s.end_ns or s.start_ns),
+            'attributes': [{'key': key, 'value': _otlp_value(value)} for key, value in s.attributes.items()],
+            'status': {'code': s.status},
+        }
+        if s.parent_id:
+            record['parentSpanId'] = s.parent_id
+        spans.append(record)
+    return {'resourceSpans': [{
+        'resource': {'attributes': [
+            {'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}},
+            {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+        ]},
+        'scopeSpans': [{'scope': {'name': 'chopchop.tracing'}, 'spans': spans}],
+    }]}
+
+
+class TraceExporter:
+    """Writes finished traces as OTLP/JSON lines from a background thread"""
+
+    def __init__(self, target: str, queue_size: int = 1000):
+        # target: 'stdout' or a file path
+        self.target = target
+        self.queue_size = queue_size
+        self._queue: 'queue.Queue[Trace]' = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self.stats = {'exported': 0, 'dropped': 0, 'errors': 0}
+
+    def export(self, trace: Trace):
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            with self._lock:
+                self.stats['dropped'] += 1
+
+    def _ensure_worker(self):
+        if self._worker_pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            # Threads do not survive fork; each gunicorn worker starts its own
+            if self._worker_pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+                return
+            if self._worker_pid != os.getpid():
+                # A queue inherited across fork may hold the parent's traces and lock state
+                self._queue = queue.Queue(maxsize=self.queue_size)
+            self._worker = threading.Thread(target=self._run, name='trace-exporter', daemon=True)
+            self._worker.start()
+            self._worker_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < 100:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch: List[Trace]):
+        lines = ''.join(json.dumps(to_otlp(trace), separators=(',', ':')) + '\n' for trace in batch)
+        try:
+            if self.target == 'stdout':
+                sys.stdout.write(lines)
+                sys.stdout.flush()
+            else:
+                with open(self.target, 'a', encoding='utf-8') as f:
+                    f.write(lines)
+            with self._lock:
+                self.stats['exported'] += len(batch)
+        except OSError as e:
+            logger.error(f"Failed to export {len(batch)} traces to {self.target}: {e}")
+            with self._lock:
+                self.stats['errors'] += len(batch)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Wait until queued traces are written; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+
+class Tracer:
+    """Samples requests, collects their spans and hands finished traces to the exporter"""
+
+    def __init__(self, settings: Optional[TraceSettings] = None, exporter: Optional[TraceExporter] = None):
+        self.settings = settings or TraceSettings()
+        s = self.settings
+        if exporter is None and s.exporter in ('stdout', 'file'):
+            exporter = TraceExporter('stdout' if s.exporter == 'stdout' else s.file, s.queue_size)
+        elif exporter is None and s.exporter != 'none':
+            logger.warning(f"Unknown TRACE_EXPORTER {s.exporter!r}; traces will not be exported")
+        self.exporter = exporter
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'sampled': 0}
+
+    def start_request(self):
+        """before_request hook"""
+        parent = parse_traceparent(request.headers.get('traceparent'))
+        if parent and self.settings.trust_parent:
+            sampled = parent[2]
+        else:
+            sampled = random.random() < self.settings.sample_rate
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['sampled'] += sampled
+        if not sampled:
+            return
+        trace = Trace(parent[0] if parent else os.urandom(16).hex())
+        rule = request.url_rule.rule if request.url_rule else request.path
+        root = Span(trace, f"{request.method} {rule}", parent[1] if parent else None, kind=SPAN_KIND_SERVER,
+                    attributes={'http.method': request.method, 'http.route': rule})
+        g.trace_root = root
+        g.trace_token = _current_span.set(root)
+
+    def finish_request(self, response: Response) -> Response:
+        """after_request hook"""
+        root: Optional[Span] = g.pop('trace_root', None)
+        if root is None:
+            return response
+        root.end()
+        root.set_attribute('http.status_code', response.status_code)
+        if response.status_code >= 500:
+            root.status = STATUS_ERROR
+        root.trace.spans.append(root)
+        if self.settings.server_timing:
+            response.headers.add('Server-Timing', server_timing(root))
+            response.headers['X-Trace-Id'] = root.trace.trace_id
+        if self.exporter is not None:
+            self.exporter.export(root.trace)
+        return response
+
+    def teardown_request(self, error: Optional[BaseException] = None):
+        """Detach the trace from this thread, which will serve other requests"""
+        token = g.pop('trace_token', None)
+        if token is not None:
+            _current_span.reset(token)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update(sample_rate=self.settings.sample_rate, exporter=self.settings.exporter)
+        if self.exporter is not None:
+            with self.exporter._lock:
+                stats.update(self.exporter.stats)
+        return stats
+
+
+def configure_tracing(app: Flask, settings: Optional[TraceSettings] = None,
+                      exporter: Optional[TraceExporter] = None) -> Tracer:
+    """
+    Trace `app`'s requests; returns the tracer for its stats
+
+    Register before other after_request hooks (they run in reverse order),
+    so the request span also covers them.
+    """
+    tracer = Tracer(settings, exporter)
+    app.before_request(tracer.start_request)
+    app.after_request(tracer.finish_request)
+    app.teardown_request(tracer.teardown_request)
+    return tracer
@@ -1,4 +1,5 @@
 import { NextRequest, NextResponse } from 'next/server';
+import { backendHeaders } from '@/lib/backendHeaders';
 
 // Configure for larger request bodies
 export const config = {
@@ -26,9 +27,7 @@ export async function POST(request: NextRequest) {
     
     const response = await fetch(`${pythonBackendUrl}/chat`, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers: backendHeaders(request),
       body: JSON.stringify({
         message,
         email,
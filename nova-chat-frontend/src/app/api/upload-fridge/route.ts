@@ -1,4 +1,5 @@
 import { NextRequest, NextResponse } from 'next/server';
+import { backendHeaders } from '@/lib/backendHeaders';
 
 // Configure for larger request bodies
 export const config = {
@@ -26,9 +27,7 @@ export async function POST(request: NextRequest) {
     
     const response = await fetch(`${pythonBackendUrl}/chat`, {
       method: 'POST',
-      headers: {
-        'Content-Type': 'application/json',
-      },
+      headers: backendHeaders(request),
       body: JSON.stringify({
         message: "Analyze this fridge photo and suggest recipes based on the ingredients you can see. List the ingredients first, then provide 2-3 recipe suggestions with cooking instructions.",
         imageBase64: imageBase64,
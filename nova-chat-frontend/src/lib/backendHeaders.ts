@@ -0,0 +1,41 @@
+import { createHmac } from 'crypto';
+import type { NextRequest } from 'next/server';
+
+/**
+ * Headers for a request that an API route relays to the Python backend
+ *
+ * Relayed requests all reach the backend from this server's address, so
+ * the backend's per-caller model limits would put every user in one bucket.
+ * The browser's address is therefore passed on in X-Forwarded-For and,
+ * signed with PROXY_SHARED_SECRET (set the same secret on the backend),
+ * in X-ChopChop-Client, which the backend trusts.
+ */
+export function backendHeaders(request: NextRequest): Record<string, string> {
+  const headers: Record<string, string> = {
+    'Content-Type': 'application/json',
+  };
+  const client = clientAddress(request);
+  if (!client) {
+    return headers;
+  }
+  headers['X-Forwarded-For'] = client;
+  const secret = process.env.PROXY_SHARED_SECRET;
+  if (secret) {
+    headers['X-ChopChop-Client'] = client;
+    headers['X-ChopChop-Client-Signature'] = createHmac('sha256', secret).update(client).digest('hex');
+  }
+  return headers;
+}
+
+/**
+ * The browser's address, as set by the hosting platform's edge (Vercel
+ * overwrites both headers, so the browser cannot choose them)
+ */
+function clientAddress(request: NextRequest): string | null {
+  const realIp = request.headers.get('x-real-ip');
+  if (realIp) {
+    return realIp.trim();
+  }
+  const forwarded = request.headers.get('x-forwarded-for');
+  return forwarded ? forwarded.split(',')[0].trim() || null : null;
+}